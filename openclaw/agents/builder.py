@@ -17,7 +17,7 @@ import subprocess
 import time
 from pathlib import Path
 
-from compartido import log, logger, enviar_whatsapp
+from compartido import CONFIG, log, logger, enviar_whatsapp, worker_id, lease_perdido
 from db.connection import get_connection
 from db import queries
 
@@ -380,22 +380,31 @@ def _registrar_proyecto(db, idea_id, task, project_dir, run_result):
 def ciclo():
     """Un ciclo del BUILDER: toma una tarea developed y la construye/valida.
 
+    La idea sigue en 'developed' durante todo el build: el lease (claim_next)
+    es lo que impide que otro BUILDER la tome, y se renueva entre pasos.
+
     Returns:
         1 si proceso algo, 0 si no.
     """
     db = get_connection()
-    tasks = queries.get_ideas_in_status(db, 'developed')
-    if not tasks:
+    worker = worker_id(NOMBRE)
+    task = queries.claim_next(db, 'developed', worker, CONFIG["lease_seconds"])
+    if not task:
         return 0
+    try:
+        return _procesar(db, task, worker)
+    finally:
+        queries.release_claim(db, task['id'], worker)
+
 
-    task = tasks[0]
+def _procesar(db, task, worker):
+    """Construye y valida una tarea ya reservada por `worker`."""
     idea_id = task['id']
     text = task['text'] or ''
-    execution_output = task['execution_output'] or ''
+    execution_output, _ = queries.get_execution_output(db, idea_id)
 
     # Check for max build failures
-    error_previo = task['execution_error'] or ''
-    build_fails = error_previo.count('BUILDER RECHAZADO')
+    build_fails = queries.count_execution_events(db, idea_id, 'rejected', agent=NOMBRE)
     if build_fails >= MAX_BUILD_FAILURES:
         queries.update_execution_status(
             db, idea_id, 'blocked',
@@ -406,6 +415,7 @@ def ciclo():
         return 0
 
     log(NOMBRE, f"#{idea_id}: {text[:60]}...", ">")
+    inicio = time.monotonic()
 
     # Step 1: Extract files
     archivos = _extraer_archivos(execution_output)
@@ -419,7 +429,7 @@ def ciclo():
                 "=== FILE: nombre.py ===\n<codigo>\n=== ENDFILE ===\n"
                 "IMPORTANTE: Incluye requirements.txt y un main.py como entrypoint."
             ),
-            agent_name=NOMBRE
+            agent_name=NOMBRE, outcome='rejected', duration=time.monotonic() - inicio
         )
         log(NOMBRE, f"#{idea_id} no files found -> back to DEV", "~")
         return 0
@@ -430,7 +440,7 @@ def ciclo():
         queries.update_execution_status(
             db, idea_id, 'queued_software',
             error=f"BUILDER RECHAZADO:\n{err}",
-            agent_name=NOMBRE
+            agent_name=NOMBRE, outcome='rejected', duration=time.monotonic() - inicio
         )
         log(NOMBRE, f"#{idea_id} write failed: {err}", "!")
         return 0
@@ -443,13 +453,15 @@ def ciclo():
         queries.update_execution_status(
             db, idea_id, 'queued_software',
             error=f"BUILDER RECHAZADO:\nvenv creation failed:\n{err}",
-            agent_name=NOMBRE
+            agent_name=NOMBRE, outcome='rejected', duration=time.monotonic() - inicio
         )
         log(NOMBRE, f"#{idea_id} venv failed: {err}", "!")
         return 0
 
     python_path, pip_path = paths
     log(NOMBRE, f"#{idea_id} venv OK", "+")
+    if lease_perdido(db, idea_id, worker):
+        return 0
 
     # Step 4: Install dependencies
     ok, err = _instalar_dependencias(pip_path, project_dir)
@@ -457,12 +469,14 @@ def ciclo():
         queries.update_execution_status(
             db, idea_id, 'queued_software',
             error=f"BUILDER RECHAZADO:\n{err}\n\nCorrige las dependencias en requirements.txt.",
-            agent_name=NOMBRE
+            agent_name=NOMBRE, outcome='rejected', duration=time.monotonic() - inicio
         )
         log(NOMBRE, f"#{idea_id} pip install failed", "!")
         return 0
 
     log(NOMBRE, f"#{idea_id} dependencias instaladas", "+")
+    if lease_perdido(db, idea_id, worker):
+        return 0
 
     # Step 5: Syntax check
     ok, err = _validar_sintaxis(python_path, project_dir)
@@ -470,7 +484,7 @@ def ciclo():
         queries.update_execution_status(
             db, idea_id, 'queued_software',
             error=f"BUILDER RECHAZADO:\n{err}\n\nCorrige los errores de sintaxis.",
-            agent_name=NOMBRE
+            agent_name=NOMBRE, outcome='rejected', duration=time.monotonic() - inicio
         )
         log(NOMBRE, f"#{idea_id} syntax errors", "!")
         return 0
@@ -479,23 +493,23 @@ def ciclo():
 
     # Step 6: Try to run
     ok, result = _intentar_ejecucion(python_path, project_dir, idea_id)
+    if lease_perdido(db, idea_id, worker):
+        return 0
     if not ok:
         queries.update_execution_status(
             db, idea_id, 'queued_software',
             error=f"BUILDER RECHAZADO:\nRuntime error:\n{result}\n\nCorrige el codigo para que ejecute sin errores.",
-            agent_name=NOMBRE
+            agent_name=NOMBRE, outcome='rejected', duration=time.monotonic() - inicio
         )
         log(NOMBRE, f"#{idea_id} runtime error", "!")
         return 0
 
     # SUCCESS
     build_info = _build_report(project_dir, archivos, result)
-    full_output = f"{execution_output}\n\n---\n### Build Report (BUILDER)\n{build_info}"
-
     queries.update_execution_status(
         db, idea_id, 'built',
-        output=full_output,
-        agent_name=NOMBRE
+        append=("Build Report (BUILDER)", build_info),
+        agent_name=NOMBRE, duration=time.monotonic() - inicio
     )
 
     # Register in dashboard's Proyectos page
@@ -10,10 +10,12 @@ Marca como 'reviewing' para que el Reviewer lo valide.
 Replica la logica de ai.js executeWithAgent() pero autonomamente.
 """
 import json
+import time
 
-from compartido import CONFIG, log, logger, pensar, enviar_whatsapp
+from compartido import CONFIG, log, logger, pensar_streaming, enviar_whatsapp, worker_id, lease_perdido
 from db.connection import get_connection
 from db import queries
+from llm.streaming import Cancelado
 from skills.loader import load_skill, load_skills
 
 NOMBRE = "CONSULTING"
@@ -48,19 +50,24 @@ AGENT_SKILLS_MAP = {
 
 
 def _build_prompt(agent_key, agent_config, skill_contents, idea_text, context):
-    """Construye el prompt del sistema + usuario para el agente consultor."""
+    """Construye el prompt del sistema + usuario para el agente consultor.
+
+    Orden de mas estable a menos: instrucciones comunes a todos los agentes,
+    luego identidad + SOPs del agente (system), y al final contexto e idea
+    (user). Asi Ollama/Claude/Gemini reusan el prefijo cacheado entre ideas.
+    """
 
     # Bloque de skills como SOPs
     skills_block = ""
     for i, content in enumerate(skill_contents):
         skills_block += f"\n\n=== SKILL {i+1} ===\n{content}\n=== FIN SKILL {i+1} ==="
 
-    system_prompt = f"""ERES EL AGENTE: {agent_config['name']}
+    system_prompt = f"""{_CONSULTING_INSTRUCTIONS}
 
-TU CONOCIMIENTO PRINCIPAL (SOPs):
-{skills_block}
+ERES EL AGENTE: {agent_config['name']}
 
-{_CONSULTING_INSTRUCTIONS}"""
+TU CONOCIMIENTO PRINCIPAL (SOPs):
+{skills_block}"""
 
     user_prompt = f"""CONTEXTO ORGANIZACIONAL:
 {context}
@@ -95,21 +102,30 @@ def _get_skill_paths(task):
 def ciclo():
     """Un ciclo del Consulting: toma una tarea y genera un documento.
 
+    La tarea se reserva con un lease (claim_next) mientras se genera.
+
     Returns:
         1 si proceso algo, 0 si no.
     """
     db = get_connection()
-    tasks = queries.get_ideas_in_status(db, 'queued_consulting')
-    if not tasks:
+    worker = worker_id(NOMBRE)
+    task = queries.claim_next(db, 'queued_consulting', worker, CONFIG["lease_seconds"])
+    if not task:
         return 0
+    try:
+        return _procesar(db, task, worker)
+    finally:
+        queries.release_claim(db, task['id'], worker)
 
-    task = tasks[0]  # FIFO por prioridad (ya ordenado por query)
+
+def _procesar(db, task, worker):
+    """Procesa una tarea ya reservada por `worker`."""
     idea_id = task['id']
     idea_text = task['text'] or ''
     agent_key = task['suggested_agent'] or 'gtd'
 
-    # Verificar si es re-ejecucion (rechazado por Reviewer)
-    error_previo = task['execution_error'] or ''
+    # Verificar si es re-ejecucion: feedback de los ultimos rechazos del Reviewer
+    error_previo = queries.get_recent_feedback(db, idea_id)
 
     # Obtener skills
     skill_paths = _get_skill_paths(task)
@@ -148,16 +164,31 @@ def ciclo():
     agent_config = AGENT_SKILLS_MAP.get(agent_key, {'name': f'Agente {agent_key}', 'skills': skill_paths})
     system_prompt, user_prompt = _build_prompt(agent_key, agent_config, skill_contents, idea_text, context)
 
-    # Ollama primario -> Gemini fallback
-    output = pensar(user_prompt, sistema=system_prompt, fallback="gemini")
+    # Ollama primario -> Gemini fallback, en streaming con progreso visible
     motor = CONFIG["local_model"] + " / cloud"
+    header = f"**Agente:** {agent_config['name']}\n**Motor:** {motor}\n\n---\n\n"
+
+    def _progreso(parcial):
+        if lease_perdido(db, idea_id, worker):
+            raise Cancelado(f"lease de #{idea_id} perdido")
+        queries.update_execution_progress(db, idea_id, header + parcial)
+
+    inicio = time.monotonic()
+    try:
+        output = pensar_streaming(user_prompt, sistema=system_prompt, fallback="gemini",
+                                  agente=NOMBRE, idea_id=idea_id, skills=agent_key,
+                                  on_progress=_progreso)
+    except Cancelado:
+        return 0
+    if lease_perdido(db, idea_id, worker):
+        return 0
 
     if output:
-        header = f"**Agente:** {agent_config['name']}\n**Motor:** {motor}\n\n---\n\n"
         full_output = header + output
         queries.update_execution_status(
             db, idea_id, 'reviewing',
-            output=full_output, agent_name=f'{NOMBRE}-{agent_key}'
+            output=full_output, agent_name=f'{NOMBRE}-{agent_key}',
+            duration=time.monotonic() - inicio
         )
         # Guardar como recurso en context_items
         queries.save_context_item(
@@ -178,7 +209,7 @@ def ciclo():
         queries.update_execution_status(
             db, idea_id, 'failed',
             error="Ninguno de los modelos de IA genero una respuesta.",
-            agent_name=f'{NOMBRE}-{agent_key}'
+            agent_name=f'{NOMBRE}-{agent_key}', duration=time.monotonic() - inicio
         )
         log(NOMBRE, f"#{idea_id} FAILED — sin respuesta de IA", "!")
         return 0
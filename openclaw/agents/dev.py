@@ -10,15 +10,20 @@ Adaptado de Sistema-OpenClaw/agents/customizable/execution/programador.py (v7.6)
 import re
 import time
 
-from compartido import CONFIG, log, logger, pensar, pensar_con_local, enviar_whatsapp
+from compartido import (CONFIG, log, logger, pensar_streaming, pensar_con_local, enviar_whatsapp, worker_id,
+                        lease_perdido)
 from db.connection import get_connection
 from db import queries
 from skills.loader import load_skill
+from llm.streaming import FIN_ARCHIVOS, Cancelado, hasta_fin_archivos
 
 NOMBRE = "DEV"
 
 # Loaded from core/skills/core/generate-python-code.md (editable SOP)
 _DEV_SKILL = load_skill('core/generate-python-code.md') or ""
+# El marcador final le dice al stream que ya no vienen mas archivos (ver hasta_fin_archivos)
+_SISTEMA = (f"{_DEV_SKILL}\n\nCuando hayas escrito el ultimo archivo, escribe una linea con "
+            f"{FIN_ARCHIVOS} y termina la respuesta.")
 MAX_INTENTOS_GEMINI = 5
 MAX_INTENTOS_CORRECCION = 3
 ESPERA_ENTRE_INTENTOS = 3
@@ -30,6 +35,8 @@ def _extraer_codigo(respuesta_ia):
     Busca patron === FILE: nombre.py === ... === ENDFILE ===
     Fallback: bloques markdown ```python ... ```
     """
+    respuesta_ia = respuesta_ia.replace(FIN_ARCHIVOS, "")
+
     # Patron principal: === FILE: nombre.py ===
     patron = r'===\s*FILE:\s*(.*?)\s*===(.*?)===\s*ENDFILE\s*==='
     archivos = re.findall(patron, respuesta_ia, re.DOTALL | re.IGNORECASE)
@@ -48,35 +55,37 @@ def _extraer_codigo(respuesta_ia):
     return respuesta_ia.strip()
 
 
-def _programar_con_ia(requerimiento, error_previo="", es_correccion=False):
+def _programar_con_ia(requerimiento, error_previo="", es_correccion=False, on_progress=None,
+                      idea_id=None):
     """Genera codigo usando Gemini con reintentos + fallback a Ollama.
 
+    La generacion normal va en streaming: `on_progress` recibe el texto parcial
+    y se corta en la linea === END === que el system prompt pide tras el ultimo archivo.
+
     Returns:
         Tuple (codigo: str, es_offline: bool)
     """
+    # El SOP va como system prompt fijo: los backends reusan ese prefijo entre tareas
     if error_previo:
         prompt = (
-            f"{_DEV_SKILL}\n\n"
             f"MODO CORRECCION: Tu codigo anterior fue RECHAZADO. Corrigelo.\n\n"
             f"REQUERIMIENTO ORIGINAL:\n{requerimiento}\n\n"
             f"ERROR O CRITICA:\n{error_previo}\n\n"
             "Genera el codigo corregido completo."
         )
     else:
-        prompt = (
-            f"{_DEV_SKILL}\n\n"
-            f"TAREA:\n{requerimiento}"
-        )
+        prompt = f"TAREA:\n{requerimiento}"
 
     # Correcciones: directo a local
     if es_correccion:
         log(NOMBRE, "Modo CORRECCION — modelo local", ">")
-        respuesta = pensar_con_local(prompt)
+        respuesta = pensar_con_local(prompt, sistema=_SISTEMA)
         return (respuesta, True) if respuesta else ("", True)
 
     # Ollama primario -> Gemini fallback
     log(NOMBRE, "Generando codigo (Ollama -> Gemini)...", "~")
-    respuesta = pensar(prompt, fallback="gemini")
+    respuesta = pensar_streaming(prompt, sistema=_SISTEMA, fallback="gemini", agente=NOMBRE,
+                                 idea_id=idea_id, parar=hasta_fin_archivos(), on_progress=on_progress)
     if respuesta:
         # Detectar si fue local u online
         es_offline = not CONFIG.get("gemini_api_key")  # aproximacion
@@ -86,39 +95,38 @@ def _programar_con_ia(requerimiento, error_previo="", es_correccion=False):
     return ("", True)
 
 
-def _elegir_tarea(tasks):
-    """Elige la tarea con mayor prioridad.
-
-    Orden: alta > media > baja (ya ordenadas por la query).
-    """
-    return tasks[0] if tasks else None
-
-
 def ciclo():
     """Un ciclo del DEV: toma una tarea queued_software y genera codigo.
 
+    La tarea se reserva con un lease (claim_next), asi varios DEV pueden
+    correr a la vez sin procesar dos veces la misma idea.
+
     Returns:
         1 si proceso algo, 0 si no.
     """
     db = get_connection()
-    tasks = queries.get_ideas_in_status(db, 'queued_software')
-    if not tasks:
-        return 0
-
-    task = _elegir_tarea(tasks)
+    worker = worker_id(NOMBRE)
+    task = queries.claim_next(db, 'queued_software', worker, CONFIG["lease_seconds"])
     if not task:
         return 0
+    try:
+        return _procesar(db, task, worker)
+    finally:
+        queries.release_claim(db, task['id'], worker)
 
+
+def _procesar(db, task, worker):
+    """Procesa una tarea ya reservada por `worker`."""
     idea_id = task['id']
     text = task['text'] or ''
 
-    # Verificar si es correccion (tiene error previo de QA)
-    error_previo = task['execution_error'] or ''
-    es_correccion = 'RECHAZADO' in error_previo or 'REJECTED' in error_previo
+    # Verificar si es correccion: feedback de los ultimos rechazos (QA / BUILDER)
+    error_previo = queries.get_recent_feedback(db, idea_id)
+    es_correccion = bool(error_previo)
 
     # Verificar limite de correcciones
     if es_correccion:
-        fallos = queries.count_previous_failures(db, idea_id)
+        fallos = task['rejection_count']
         if fallos >= MAX_INTENTOS_CORRECCION:
             queries.update_execution_status(
                 db, idea_id, 'blocked',
@@ -132,14 +140,28 @@ def ciclo():
     queries.update_execution_status(db, idea_id, 'in_progress', agent_name=NOMBRE)
     log(NOMBRE, f"#{idea_id}: {text[:60]}...", ">")
 
-    # Generar codigo
-    codigo_raw, es_offline = _programar_con_ia(text, error_previo, es_correccion)
+    # Generar codigo (el parcial se ve en el dashboard mientras se genera);
+    # si otro worker tomo la idea se corta la generacion
+    def _progreso(parcial):
+        if lease_perdido(db, idea_id, worker):
+            raise Cancelado(f"lease de #{idea_id} perdido")
+        queries.update_execution_progress(db, idea_id, f"**Generando...**\n\n{parcial}")
+
+    inicio = time.monotonic()
+    try:
+        codigo_raw, es_offline = _programar_con_ia(text, error_previo, es_correccion, on_progress=_progreso,
+                                                  idea_id=idea_id)
+    except Cancelado:
+        return 0
+    if lease_perdido(db, idea_id, worker):
+        return 0
 
     if codigo_raw:
         codigo_formateado = _extraer_codigo(codigo_raw)
         motor = "Ollama local" if es_offline else CONFIG["gemini_model"]
         output = f"**Motor:** {motor}\n\n### Codigo Generado\n\n{codigo_formateado}"
-        queries.update_execution_status(db, idea_id, 'developed', output=output, agent_name=NOMBRE)
+        queries.update_execution_status(db, idea_id, 'developed', output=output, agent_name=NOMBRE,
+                                        duration=time.monotonic() - inicio)
         log(NOMBRE, f"#{idea_id} -> Developed OK", "+")
         enviar_whatsapp(
             f"✅ *Proyecto SecondBrain — Código Generado*\n"
@@ -152,7 +174,7 @@ def ciclo():
         queries.update_execution_status(
             db, idea_id, 'failed',
             error="No se pudo generar codigo con ninguno de los modelos.",
-            agent_name=NOMBRE
+            agent_name=NOMBRE, duration=time.monotonic() - inicio
         )
         log(NOMBRE, f"#{idea_id} FAILED — sin respuesta de IA", "!")
         return 0
@@ -72,83 +72,73 @@ def _is_software_task(idea):
     return any(kw in text for kw in SOFTWARE_KEYWORDS)
 
 
-def ciclo():
-    """Un ciclo del PM: rutea ideas pendientes al pipeline correcto.
+def _decidir_ruta(idea):
+    """Decide a que cola va una idea organizada.
 
     Returns:
-        Numero de ideas ruteadas.
+        (cola, suggested_agent a guardar o None, motivo para el log),
+        o None si necesita ruteo manual desde el dashboard.
     """
-    db = get_connection()
-    ideas = queries.get_routable_ideas(db)
-    routed = 0
+    agent = idea['suggested_agent']
+    skills = idea['suggested_skills']
 
-    for idea in ideas:
-        idea_id = idea['id']
-        agent = idea['suggested_agent']
-        skills = idea['suggested_skills']
+    # 1. Consulting: tiene agente sugerido explicitamente
+    if agent and agent in CONSULTING_AGENTS:
+        return 'queued_consulting', None, f"Consulting ({agent})"
 
-        # 1. Consulting: tiene agente sugerido explicitamente
-        if agent and agent in CONSULTING_AGENTS:
-            queries.update_execution_status(db, idea_id, 'queued_consulting', agent_name=NOMBRE)
-            log(NOMBRE, f"#{idea_id} -> Consulting ({agent})", ">")
-            routed += 1
-            continue
+    # 2. Consulting: detectado por ai_category
+    detected = _detect_agent_from_category(idea)
+    if detected:
+        return 'queued_consulting', detected, f"Consulting ({detected}, por categoria)"
 
-        # 2. Consulting: detectado por ai_category
-        detected = _detect_agent_from_category(idea)
-        if detected:
-            db.execute("UPDATE ideas SET suggested_agent = ? WHERE id = ?", [detected, idea_id])
-            db.commit()
-            queries.update_execution_status(db, idea_id, 'queued_consulting', agent_name=NOMBRE)
-            log(NOMBRE, f"#{idea_id} -> Consulting ({detected}, por categoria)", ">")
-            routed += 1
-            continue
+    # 3. Consulting: ai_type o ai_category es explicitamente 'Consulting'
+    ai_type = (idea['ai_type'] or '').lower()
+    ai_cat = (idea['ai_category'] or '').lower()
+    if ai_type == 'consulting' or ai_cat == 'consulting':
+        detected_kw = _detect_agent_from_keywords(idea)
+        return 'queued_consulting', detected_kw, f"Consulting ({detected_kw or 'generic'}, tipo explicito)"
 
-        # 3. Consulting: ai_type o ai_category es explicitamente 'Consulting'
-        ai_type = (idea['ai_type'] or '').lower()
-        ai_cat = (idea['ai_category'] or '').lower()
-        if ai_type == 'consulting' or ai_cat == 'consulting':
-            detected_kw = _detect_agent_from_keywords(idea)
-            if detected_kw:
-                db.execute("UPDATE ideas SET suggested_agent = ? WHERE id = ?", [detected_kw, idea_id])
-                db.commit()
-            queries.update_execution_status(db, idea_id, 'queued_consulting', agent_name=NOMBRE)
-            log(NOMBRE, f"#{idea_id} -> Consulting ({detected_kw or 'generic'}, tipo explicito)", ">")
-            routed += 1
-            continue
+    # 4. Software: detectado por tipo o keywords
+    if _is_software_task(idea):
+        return 'queued_software', None, "Software Pipeline"
 
-        # 4. Software: detectado por tipo o keywords
-        if _is_software_task(idea):
-            queries.update_execution_status(db, idea_id, 'queued_software', agent_name=NOMBRE)
-            log(NOMBRE, f"#{idea_id} -> Software Pipeline", ">")
-            routed += 1
-            continue
+    # 5. Consulting: detectado por keywords en texto libre
+    detected = _detect_agent_from_keywords(idea)
+    if detected:
+        return 'queued_consulting', detected, f"Consulting ({detected}, por keywords)"
 
-        # 5. Consulting: detectado por keywords en texto libre
-        detected = _detect_agent_from_keywords(idea)
-        if detected:
-            db.execute("UPDATE ideas SET suggested_agent = ? WHERE id = ?", [detected, idea_id])
-            db.commit()
-            queries.update_execution_status(db, idea_id, 'queued_consulting', agent_name=NOMBRE)
-            log(NOMBRE, f"#{idea_id} -> Consulting ({detected}, por keywords)", ">")
-            routed += 1
-            continue
+    # 6. Consulting: tiene skills sugeridas pero no agente explicito
+    if skills and skills.strip() and skills.strip() != '[]':
+        return 'queued_consulting', None, "Consulting (skills detectadas)"
 
-        # 6. Consulting: tiene skills sugeridas pero no agente explicito
-        if skills and skills.strip() and skills.strip() != '[]':
-            queries.update_execution_status(db, idea_id, 'queued_consulting', agent_name=NOMBRE)
-            log(NOMBRE, f"#{idea_id} -> Consulting (skills detectadas)", ">")
-            routed += 1
-            continue
+    # Else: skip, necesita ruteo manual desde el dashboard
+    return None
+
+
+def ciclo():
+    """Un ciclo del PM: rutea ideas pendientes al pipeline correcto.
+
+    Todas las decisiones se calculan en memoria y se aplican juntas en una
+    sola transaccion (un commit), en vez de un commit por idea compitiendo
+    con el dashboard por el lock de escritura.
 
-        # Else: skip, necesita ruteo manual desde el dashboard
+    Returns:
+        Numero de ideas ruteadas.
+    """
+    db = get_connection()
+    cambios = []    # (idea_id, cola, suggested_agent, error, outcome)
+    mensajes = []   # (mensaje, simbolo), se loguean tras el commit
+
+    for idea in queries.get_routable_ideas(db):
+        ruta = _decidir_ruta(idea)
+        if ruta:
+            cola, agente, motivo = ruta
+            cambios.append((idea['id'], cola, agente, None, None))
+            mensajes.append((f"#{idea['id']} -> {motivo}", ">"))
 
     # 7. Retry: re-encolar ideas fallidas que se pueden reintentar
-    failed = queries.get_retryable_failed_ideas(db)
-    for idea in failed:
-        idea_id = idea['id']
+    for idea in queries.get_retryable_failed_ideas(db):
         agent = idea['suggested_agent']
-        error = idea['execution_error'] or ''
 
         # Determinar a que cola reenviar
         if agent and agent in CONSULTING_AGENTS:
@@ -158,14 +148,13 @@ def ciclo():
         else:
             continue
 
-        # Marcar retry en el error para tracking
-        new_error = f"{error}\n[RETRY] Re-encolada por PM"
-        queries.update_execution_status(
-            db, idea_id, queue,
-            error=new_error, agent_name=NOMBRE
-        )
-        log(NOMBRE, f"#{idea_id} RETRY -> {queue}", "~")
-        routed += 1
+        # El reintento queda en retry_count y en el historial; el error se conserva
+        cambios.append((idea['id'], queue, None, idea['execution_error'], 'retried'))
+        mensajes.append((f"#{idea['id']} RETRY -> {queue}", "~"))
+
+    routed = queries.update_execution_status_batch(db, cambios, agent_name=NOMBRE)
+    for mensaje, simbolo in mensajes:
+        log(NOMBRE, mensaje, simbolo)
 
     if routed > 0:
         logger.info("[PM] Ruteadas %d ideas en este ciclo", routed)
@@ -8,10 +8,13 @@ revisa codigo con Claude, y:
 
 Adaptado de Sistema-OpenClaw/revisor.py
 """
-from compartido import log, logger, pensar, enviar_whatsapp
+import time
+
+from compartido import log, logger, pensar_streaming, enviar_whatsapp
 from db.connection import get_connection
 from db import queries
 from skills.loader import load_skill
+from llm.streaming import hasta_veredicto
 
 NOMBRE = "QA"
 
@@ -28,7 +31,8 @@ def ciclo():
         Numero de ideas revisadas.
     """
     db = get_connection()
-    tasks = queries.get_ideas_in_status(db, 'built')
+    # Ids de la cola primero; (id, text) y el output se cargan por id al revisarlo
+    tasks = queries.iter_ideas_in_status(db, 'built')
     reviewed = 0
 
     MAX_CODE_CHARS = 6000  # ~1500 tokens — truncate large outputs to save tokens
@@ -36,22 +40,25 @@ def ciclo():
     for task in tasks:
         idea_id = task['id']
         text = task['text'] or ''
-        code_output = task['execution_output'] or ''
+        code_output, total = queries.get_execution_output(db, idea_id, max_chars=MAX_CODE_CHARS)
 
-        if len(code_output) > MAX_CODE_CHARS:
-            logger.info("Truncating code for review #%d: %d -> %d chars", idea_id, len(code_output), MAX_CODE_CHARS)
-            code_output = code_output[:MAX_CODE_CHARS] + "\n\n[... TRUNCADO para review ...]"
+        if total > MAX_CODE_CHARS:
+            logger.info("Truncating code for review #%d: %d -> %d chars", idea_id, total, MAX_CODE_CHARS)
+            code_output += "\n\n[... TRUNCADO para review ...]"
 
         log(NOMBRE, f"Revisando #{idea_id}: {text[:50]}...", ">")
 
         try:
+            inicio = time.monotonic()
             prompt = (
                 f"Revisa el siguiente trabajo:\n\n"
                 f"REQUERIMIENTO: {text}\n\n"
                 f"CODIGO GENERADO:\n{code_output}"
             )
             # Ollama primario -> Claude fallback -> Gemini fallback
-            review = pensar(prompt, sistema=SISTEMA_QA, max_tokens=2048, fallback="claude")
+            # Un APROBADO corta la generacion apenas se parsea el veredicto
+            review = pensar_streaming(prompt, sistema=SISTEMA_QA, max_tokens=2048, fallback="claude",
+                                      agente=NOMBRE, idea_id=idea_id, parar=hasta_veredicto())
             motor_review = "Ollama/Cloud"
 
             if not review:
@@ -60,7 +67,7 @@ def ciclo():
                 queries.update_execution_status(
                     db, idea_id, 'failed',
                     error="QA: Ningún modelo de IA respondió (Claude sin key, Gemini quota, Local apagado).",
-                    agent_name=NOMBRE
+                    agent_name=NOMBRE, duration=time.monotonic() - inicio
                 )
                 continue
 
@@ -72,10 +79,10 @@ def ciclo():
             )
 
             if aprobado:
-                full_output = f"{code_output}\n\n---\n### Code Review (QA — {motor_review})\n{review}"
                 queries.update_execution_status(
                     db, idea_id, 'completed',
-                    output=full_output, agent_name=NOMBRE
+                    append=(f"Code Review (QA — {motor_review})", review),
+                    agent_name=NOMBRE, duration=time.monotonic() - inicio
                 )
                 log(NOMBRE, f"#{idea_id} APROBADO", "+")
                 logger.info("APROBADO: #%d", idea_id)
@@ -90,7 +97,8 @@ def ciclo():
                 error_msg = f"QA RECHAZADO:\n{review}"
                 queries.update_execution_status(
                     db, idea_id, 'queued_software',
-                    error=error_msg, agent_name=NOMBRE
+                    error=error_msg, agent_name=NOMBRE,
+                    outcome='rejected', duration=time.monotonic() - inicio
                 )
                 log(NOMBRE, f"#{idea_id} RECHAZADO -> back to DEV", "~")
                 logger.warning("RECHAZADO: #%d", idea_id)
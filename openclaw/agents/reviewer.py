@@ -6,10 +6,13 @@ revisa la calidad del documento generado con Claude, y:
   - Aprobado  -> execution_status='completed', code_stage='expressed'
   - Rechazado -> execution_status='queued_consulting' (vuelve a Consulting con feedback)
 """
-from compartido import log, logger, pensar, enviar_whatsapp
+import time
+
+from compartido import log, logger, pensar_streaming, enviar_whatsapp
 from db.connection import get_connection
 from db import queries
 from skills.loader import load_skill
+from llm.streaming import hasta_veredicto
 
 NOMBRE = "REVIEWER"
 
@@ -26,7 +29,8 @@ def ciclo():
         Numero de documentos revisados.
     """
     db = get_connection()
-    tasks = queries.get_ideas_in_status(db, 'reviewing')
+    # Ids de la cola primero; (id, text) y el output se cargan por id al revisarlo
+    tasks = queries.iter_ideas_in_status(db, 'reviewing')
     reviewed = 0
 
     MAX_DOC_CHARS = 8000  # ~2000 tokens — truncate large docs to save tokens
@@ -34,22 +38,25 @@ def ciclo():
     for task in tasks:
         idea_id = task['id']
         text = task['text'] or ''
-        doc_output = task['execution_output'] or ''
+        doc_output, total = queries.get_execution_output(db, idea_id, max_chars=MAX_DOC_CHARS)
 
-        if len(doc_output) > MAX_DOC_CHARS:
-            logger.info("Truncating doc for review #%d: %d -> %d chars", idea_id, len(doc_output), MAX_DOC_CHARS)
-            doc_output = doc_output[:MAX_DOC_CHARS] + "\n\n[... TRUNCADO para review ...]"
+        if total > MAX_DOC_CHARS:
+            logger.info("Truncating doc for review #%d: %d -> %d chars", idea_id, total, MAX_DOC_CHARS)
+            doc_output += "\n\n[... TRUNCADO para review ...]"
 
         log(NOMBRE, f"Revisando #{idea_id}: {text[:50]}...", ">")
 
         try:
+            inicio = time.monotonic()
             prompt = (
                 f"Revisa el siguiente documento generado por un agente consultor:\n\n"
                 f"SOLICITUD ORIGINAL: {text}\n\n"
                 f"DOCUMENTO GENERADO:\n{doc_output}"
             )
             # Ollama primario -> Claude fallback -> Gemini fallback
-            review = pensar(prompt, sistema=SISTEMA_REVIEWER, max_tokens=2048, fallback="claude")
+            # Un APROBADO corta la generacion apenas se parsea el veredicto
+            review = pensar_streaming(prompt, sistema=SISTEMA_REVIEWER, max_tokens=2048, fallback="claude",
+                                      agente=NOMBRE, idea_id=idea_id, parar=hasta_veredicto())
             motor_review = "Ollama/Cloud"
 
             if not review:
@@ -58,7 +65,7 @@ def ciclo():
                 queries.update_execution_status(
                     db, idea_id, 'failed',
                     error="REVIEWER: Ningún modelo de IA respondió (Claude sin key, Gemini quota, Local apagado).",
-                    agent_name=NOMBRE
+                    agent_name=NOMBRE, duration=time.monotonic() - inicio
                 )
                 continue
 
@@ -69,10 +76,10 @@ def ciclo():
             )
 
             if aprobado:
-                full_output = f"{doc_output}\n\n---\n### Quality Review (Reviewer — {motor_review})\n{review}"
                 queries.update_execution_status(
                     db, idea_id, 'completed',
-                    output=full_output, agent_name=NOMBRE
+                    append=(f"Quality Review (Reviewer — {motor_review})", review),
+                    agent_name=NOMBRE, duration=time.monotonic() - inicio
                 )
                 log(NOMBRE, f"#{idea_id} APROBADO", "+")
                 logger.info("APROBADO: #%d (consulting)", idea_id)
@@ -86,7 +93,8 @@ def ciclo():
                 error_msg = f"REVIEWER RECHAZADO:\n{review}"
                 queries.update_execution_status(
                     db, idea_id, 'queued_consulting',
-                    error=error_msg, agent_name=NOMBRE
+                    error=error_msg, agent_name=NOMBRE,
+                    outcome='rejected', duration=time.monotonic() - inicio
                 )
                 log(NOMBRE, f"#{idea_id} RECHAZADO -> back to Consulting", "~")
                 logger.warning("RECHAZADO: #%d (consulting)", idea_id)
@@ -0,0 +1,163 @@
+"""
+Benchmark de poll y claim: SQLite vs PostgreSQL.
+
+Siembra la misma BD sintetica que bench_queue.py en cada backend (SQLite en
+un archivo WAL temporal; PostgreSQL en un schema temporal de PG_BENCH_DSN o
+PG_TEST_DSN, que se borra al terminar) y mide:
+
+  poll:       latencia media de las consultas de cola de cada ciclo
+  claim:      p50/p95 de claim_next + release_claim con un worker
+  drenado:    `--workers` hilos, cada uno con su conexion, vaciando una cola
+              de `--cola` ideas con claim_next; ideas/s y esperas por lock.
+              SQLite serializa los claims con BEGIN IMMEDIATE; PostgreSQL
+              los reparte con FOR UPDATE SKIP LOCKED.
+
+Uso:
+  PG_BENCH_DSN=postgresql://postgres@localhost/postgres python benchmarks/bench_backends.py
+  python benchmarks/bench_backends.py --rows 50000 --workers 8   # sin DSN: solo SQLite
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_queue import _sembrar  # noqa: E402
+from db import connection, migrations, queries  # noqa: E402
+from tests.conftest import PG_SCHEMA_PATH, SCHEMA_SQL  # noqa: E402
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(int(len(valores) * p / 100), len(valores) - 1)]
+
+
+def _poll(db, repeat):
+    consultas = {
+        "get_routable_ideas": lambda: queries.get_routable_ideas(db),
+        "get_ideas_in_status": lambda: queries.get_ideas_in_status(db, "queued_software"),
+        "get_retryable_failed_ideas": lambda: queries.get_retryable_failed_ideas(db),
+        "get_pipeline_stats": lambda: queries.get_pipeline_stats(db),
+    }
+    tiempos = {}
+    for nombre, fn in consultas.items():
+        fn()
+        inicio = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        tiempos[nombre] = (time.perf_counter() - inicio) / repeat * 1000
+    return tiempos
+
+
+def _claim(db, repeat):
+    tiempos = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        row = queries.claim_next(db, "queued_software", "bench")
+        queries.release_claim(db, row["id"], "bench")
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return _percentil(tiempos, 50), _percentil(tiempos, 95)
+
+
+def _drenar(abrir, db, cola, workers):
+    """Encola `cola` ideas nuevas y las reparte entre `workers` hilos."""
+    db.executemany("INSERT INTO ideas (text, execution_status, code_stage, priority) "
+                   "VALUES (?, 'queued_bench', 'organized', 'media')", [(f"bench {i}",) for i in range(cola)])
+    db.commit()
+    tomadas, esperas = [], []
+
+    def worker(nombre):
+        conn = abrir()
+        try:
+            while (row := queries.claim_next(conn, "queued_bench", nombre, columns=("id",))) is not None:
+                tomadas.append(row["id"])
+            esperas.append(conn.busy_wait_s)
+        finally:
+            conn.close()
+
+    hilos = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(workers)]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    segundos = time.perf_counter() - inicio
+    assert len(tomadas) == len(set(tomadas)) == cola, "dos workers tomaron la misma idea"
+    return cola / segundos, sum(esperas)
+
+
+def _medir(nombre, abrir, db, args):
+    _sembrar(db, args.rows)
+    migrations.migrate(db)
+    poll = _poll(db, args.repeat)
+    p50, p95 = _claim(db, args.repeat)
+    por_s, espera = _drenar(abrir, db, args.cola, args.workers)
+    return nombre, poll, p50, p95, por_s, espera
+
+
+def _sqlite(tmp, args):
+    path = os.path.join(tmp, "bench.db")
+    db = connection._create_connection(path)
+    db.executescript(SCHEMA_SQL)
+    try:
+        return _medir("sqlite", lambda: connection._create_connection(path), db, args)
+    finally:
+        db.close()
+
+
+def _postgres(dsn, args):
+    import psycopg
+
+    from db import postgres
+
+    schema = f"openclaw_bench_{uuid.uuid4().hex[:12]}"
+    with psycopg.connect(dsn, autocommit=True) as admin:
+        admin.execute(f"CREATE SCHEMA {schema}")
+    params = psycopg.conninfo.conninfo_to_dict(dsn)
+    params["options"] = f"{params.get('options', '')} -c search_path={schema}".strip()
+    pool = postgres.Pool(psycopg.conninfo.make_conninfo(**params), max_size=args.workers + 1)
+    db = pool.acquire()
+    try:
+        with open(PG_SCHEMA_PATH, encoding="utf-8") as f:
+            db.executescript(f.read())
+        return _medir("postgres", pool.acquire, db, args)
+    finally:
+        db.close()
+        pool.close()
+        with psycopg.connect(dsn, autocommit=True) as admin:
+            admin.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000, help="ideas sinteticas")
+    parser.add_argument("--repeat", type=int, default=50, help="repeticiones de poll / claim")
+    parser.add_argument("--cola", type=int, default=400, help="ideas a drenar con claim_next")
+    parser.add_argument("--workers", type=int, default=4, help="hilos drenando la cola")
+    args = parser.parse_args()
+    dsn = os.getenv("PG_BENCH_DSN") or os.getenv("PG_TEST_DSN")
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as tmp:
+        resultados.append(_sqlite(tmp, args))
+    if dsn:
+        resultados.append(_postgres(dsn, args))
+    else:
+        print("PG_BENCH_DSN / PG_TEST_DSN no definido: solo SQLite\n")
+
+    print(f"{args.rows} ideas, {args.workers} workers drenando {args.cola}\n")
+    print(f"{'consulta (ms)':<28}" + "".join(f"{r[0]:>12}" for r in resultados))
+    for consulta in resultados[0][1]:
+        print(f"{consulta:<28}" + "".join(f"{r[1][consulta]:>12.3f}" for r in resultados))
+    print(f"{'claim+release p50':<28}" + "".join(f"{r[2]:>12.3f}" for r in resultados))
+    print(f"{'claim+release p95':<28}" + "".join(f"{r[3]:>12.3f}" for r in resultados))
+    print(f"{'drenado ideas/s':<28}" + "".join(f"{r[4]:>12.0f}" for r in resultados))
+    print(f"{'espera por lock (s)':<28}" + "".join(f"{r[5]:>12.2f}" for r in resultados))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark del perfil de conexion SQLite (db.connection.PROFILE).
+
+Siembra la misma BD sintetica que bench_queue.py y, para cada perfil, abre
+una conexion nueva y mide:
+
+  frio:      el primer ciclo de poll (cache de paginas de la conexion vacia)
+  caliente:  la media de `--repeat` ciclos siguientes
+  orden:     un ORDER BY sin indice sobre todas las ideas (usa temp_store)
+
+Un ciclo de poll son las consultas que hacen los agentes en cada vuelta
+(get_routable_ideas, claim_next sin match, get_retryable_failed_ideas,
+get_context_string) mas el conteo por estados del fallback de stats.
+
+Perfiles:
+  sqlite:    valores por defecto de SQLite / sqlite3 (cache ~2 MB, sin mmap,
+             temp en archivo, 128 sentencias preparadas)
+  openclaw:  db.connection.PROFILE (DB_CACHE_KB, DB_MMAP_MB, ...)
+  grande:    cache 64 MB + mmap 256 MB, para BDs que no caben en el default
+
+Uso:
+  python benchmarks/bench_connection.py
+  python benchmarks/bench_connection.py --rows 300000 --repeat 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_queue import _sembrar  # noqa: E402
+from db import connection, migrations, queries  # noqa: E402
+from tests.conftest import SCHEMA_SQL  # noqa: E402
+
+PERFILES = {
+    "sqlite": {"cache_kb": 2000, "mmap_mb": 0, "temp_store": "default", "cached_statements": 128},
+    "openclaw": {},
+    "grande": {"cache_kb": 65536, "mmap_mb": 256, "temp_store": "memory", "cached_statements": 256},
+}
+
+
+def _ciclo(db):
+    queries.get_routable_ideas(db)
+    queries.claim_next(db, "queued_missing", "bench")
+    queries.get_retryable_failed_ideas(db)
+    queries.get_context_string(db)
+    queries._count_pipeline_buckets(db)   # recorre toda la tabla: aqui pesa cache_size
+
+
+def _orden(db):
+    return db.execute("SELECT id FROM ideas ORDER BY text DESC, created_at LIMIT 1").fetchone()
+
+
+def _medir(path, perfil, repeat):
+    db = connection._create_connection(path, profile=perfil)
+    inicio = time.perf_counter()
+    _ciclo(db)
+    frio = (time.perf_counter() - inicio) * 1000
+    inicio = time.perf_counter()
+    for _ in range(repeat):
+        _ciclo(db)
+    caliente = (time.perf_counter() - inicio) / repeat * 1000
+    inicio = time.perf_counter()
+    _orden(db)
+    orden = (time.perf_counter() - inicio) * 1000
+    sentencias = db.statements
+    db.close()
+    return frio, caliente, orden, sentencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="ideas sinteticas")
+    parser.add_argument("--repeat", type=int, default=20, help="ciclos calientes por perfil")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        db = connection._create_connection(path)
+        db.executescript(SCHEMA_SQL)
+        _sembrar(db, args.rows)
+        migrations.migrate(db)
+        db.close()
+        print(f"{args.rows} ideas ({os.path.getsize(path) / 1e6:.1f} MB), perfil actual: {connection.PROFILE}\n")
+
+        print(f"{'perfil':<10} {'frio':>9} {'caliente':>10} {'orden':>9} {'sentencias':>11}")
+        for nombre, perfil in PERFILES.items():
+            _medir(path, perfil, 1)   # calentar la cache del SO igual para todos
+            frio, caliente, orden, sentencias = _medir(path, perfil, args.repeat)
+            print(f"{nombre:<10} {frio:>7.2f}ms {caliente:>8.2f}ms {orden:>7.1f}ms {sentencias:>11}")
+
+
+if __name__ == "__main__":
+    main()
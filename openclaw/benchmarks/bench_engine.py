@@ -0,0 +1,86 @@
+"""
+Benchmark del motor async contra un Ollama simulado.
+
+Levanta un servidor local que responde /api/generate tras `--delay` segundos
+y lanza `--requests` prompts con pensar_paralelo() para cada limite de
+concurrencia. El throughput deberia crecer casi linealmente con el limite
+hasta que el servidor (o el pool HTTP) se sature.
+
+Uso:
+  python benchmarks/bench_engine.py
+  python benchmarks/bench_engine.py --delay 0.5 --requests 32 --concurrency 1,2,4,8,16
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _Servidor(ThreadingHTTPServer):
+    request_queue_size = 128   # con el backlog por defecto (5) se pierden conexiones
+
+
+def _handler(delay):
+    class _Ollama(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(delay)
+            payload = json.dumps({"response": "ok", "prompt_eval_count": 10, "eval_count": 5}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+    return _Ollama
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=0.2, help="latencia simulada por peticion (s)")
+    parser.add_argument("--requests", type=int, default=16, help="prompts por corrida")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="limites a probar, separados por coma")
+    args = parser.parse_args()
+
+    os.environ["LLM_LEDGER"] = "false"
+    import compartido
+    logging.getLogger("OpenClaw").setLevel(logging.WARNING)
+
+    server = _Servidor(("127.0.0.1", 0), _handler(args.delay))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    compartido.CONFIG["ollama_url"] = f"http://127.0.0.1:{server.server_address[1]}/api/generate"
+    compartido.CONFIG["llm_ledger"] = False
+
+    print(f"{args.requests} peticiones, latencia simulada {args.delay:.2f}s")
+    print(f"{'limite':>7} {'tiempo':>8} {'req/s':>7} {'speedup':>8} {'max_en_vuelo':>13}")
+    base = None
+    for limite in [int(x) for x in args.concurrency.split(",")]:
+        compartido.motor_async = None
+        compartido.CONFIG["llm_concurrency"] = {"local": limite}
+        motor = compartido.get_motor()
+        inicio = time.perf_counter()
+        out = compartido.pensar_paralelo(["prompt"] * args.requests, fallback="gemini")
+        elapsed = time.perf_counter() - inicio
+        fallos = sum(1 for r in out if not r)
+        rps = args.requests / elapsed
+        base = base or rps
+        print(f"{limite:>7} {elapsed:>7.2f}s {rps:>7.1f} {rps / base:>7.1f}x "
+              f"{motor.stats()['local']['max_in_flight']:>13}" + (f"  ({fallos} fallos)" if fallos else ""))
+        motor.close()
+
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
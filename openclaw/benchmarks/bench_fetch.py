@@ -0,0 +1,117 @@
+"""
+Benchmark de memoria y latencia al tomar tareas con outputs grandes.
+
+Crea una BD temporal donde cada idea en cola arrastra `--mb` MB de
+execution_output / execution_error (codigo y documentos generados, historial
+de rechazos) y compara, para cada agente:
+
+  antes:   get_ideas_in_status(...) con todas las columnas y fetchall()
+  despues: claim_next con las columnas de la etapa (DEV/CONSULTING/BUILDER)
+           o iter_ideas_in_status + get_execution_output truncado (QA/REVIEWER)
+
+Mide el pico de memoria Python (tracemalloc) y el tiempo de un ciclo. En
+DEV/CONSULTING/BUILDER el tiempo "despues" incluye sellar y soltar el lease:
+SQLite reescribe el registro completo (con sus MB) en cada UPDATE, asi que ahi
+domina la escritura, no la lectura.
+
+Uso:
+  python benchmarks/bench_fetch.py
+  python benchmarks/bench_fetch.py --ideas 20 --mb 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import migrations, queries  # noqa: E402
+from db.connection import _create_connection  # noqa: E402
+from tests.conftest import SCHEMA_SQL  # noqa: E402
+
+MAX_REVIEW_CHARS = 8000   # lo que QA/REVIEWER mandan al LLM
+
+
+def _sembrar(db, ideas, mb):
+    grande = "x" * (mb * 1024 * 1024)
+    for estado in ("queued_software", "queued_consulting", "developed", "built", "reviewing"):
+        db.executemany("""
+            INSERT INTO ideas (text, execution_status, code_stage, priority, execution_output, execution_error)
+            VALUES (?, ?, 'organized', 'media', ?, ?)
+        """, [(f"{estado} {i}", estado, grande, grande) for i in range(ideas)])
+    db.commit()
+
+
+def _antes_primera(db, estado):
+    task = queries.get_ideas_in_status(db, estado)[0]
+    return task["text"]
+
+
+def _despues_primera(db, estado):
+    task = queries.claim_next(db, estado, "bench")
+    queries.release_claim(db, task["id"], "bench")
+    return task["text"]
+
+
+def _antes_lote(db, estado):
+    vistos = 0
+    for task in queries.get_ideas_in_status(db, estado):
+        vistos += len((task["execution_output"] or "")[:MAX_REVIEW_CHARS])
+    return vistos
+
+
+def _despues_lote(db, estado):
+    vistos = 0
+    for task in queries.iter_ideas_in_status(db, estado):
+        texto, _ = queries.get_execution_output(db, task["id"], max_chars=MAX_REVIEW_CHARS)
+        vistos += len(texto)
+    return vistos
+
+
+def _medir(fn, db, estado, repeat):
+    tracemalloc.start()
+    fn(db, estado)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    inicio = time.perf_counter()
+    for _ in range(repeat):
+        fn(db, estado)
+    return pico / 1e6, (time.perf_counter() - inicio) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ideas", type=int, default=10, help="ideas por estado")
+    parser.add_argument("--mb", type=int, default=2, help="MB de output y de error por idea")
+    parser.add_argument("--repeat", type=int, default=5, help="repeticiones para la latencia")
+    args = parser.parse_args()
+
+    casos = [
+        ("DEV", "queued_software", _antes_primera, _despues_primera),
+        ("CONSULTING", "queued_consulting", _antes_primera, _despues_primera),
+        ("BUILDER", "developed", _antes_primera, _despues_primera),
+        ("QA", "built", _antes_lote, _despues_lote),
+        ("REVIEWER", "reviewing", _antes_lote, _despues_lote),
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        db = _create_connection(path)
+        db.executescript(SCHEMA_SQL)
+        _sembrar(db, args.ideas, args.mb)
+        migrations.migrate(db)
+        print(f"{args.ideas} ideas x 5 estados, {args.mb} MB de output + {args.mb} MB de error cada una "
+              f"({os.path.getsize(path) / 1e6:.0f} MB)\n")
+
+        print(f"{'agente':<11} {'pico antes':>11} {'pico despues':>13} {'ms antes':>10} {'ms despues':>11}")
+        for agente, estado, antes, despues in casos:
+            mem_a, ms_a = _medir(antes, db, estado, args.repeat)
+            mem_d, ms_d = _medir(despues, db, estado, args.repeat)
+            print(f"{agente:<11} {mem_a:>9.1f}MB {mem_d:>11.2f}MB {ms_a:>10.1f} {ms_d:>11.2f}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
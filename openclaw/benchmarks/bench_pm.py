@@ -0,0 +1,103 @@
+"""
+Benchmark del ruteo del PM: un commit por idea vs un lote por ciclo.
+
+Crea una BD temporal (en disco, WAL, como la del dashboard) con N ideas
+organizadas sin rutear y mide un ciclo de ruteo:
+
+  antes:   por idea, UPDATE suggested_agent + commit y update_execution_status
+           (otro commit), que es como ruteaba pm.ciclo
+  despues: agents.pm.ciclo, que decide todo en memoria y aplica el lote con
+           update_execution_status_batch en una transaccion
+
+Uso:
+  python benchmarks/bench_pm.py
+  python benchmarks/bench_pm.py --ideas 1000 10000
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents import pm  # noqa: E402
+from db import migrations, queries  # noqa: E402
+from db.connection import _create_connection, reset_connection, set_connection  # noqa: E402
+from tests.conftest import SCHEMA_SQL  # noqa: E402
+
+_TEXTOS = ["Presupuesto OPEX planta norte", "Script para exportar KPIs", "Plan de turnos mina",
+           "Auditoria de permisos ambientales", "Revisar contrato de arriendo", "Malla de capacitacion HSE"]
+_CATEGORIAS = [None, "Finanzas", "Operaciones", "Software", "Consulting", "Capacitacion"]
+
+
+def _crear_bd(path, ideas, seed=3):
+    rng = random.Random(seed)
+    db = _create_connection(path)
+    db.executescript(SCHEMA_SQL)
+    db.executemany(
+        "INSERT INTO ideas (text, ai_category, code_stage, priority) VALUES (?, ?, 'organized', ?)",
+        [(rng.choice(_TEXTOS), rng.choice(_CATEGORIAS), rng.choice(("alta", "media", "baja")))
+         for _ in range(ideas)],
+    )
+    db.commit()
+    migrations.migrate(db)
+    return db
+
+
+def _ciclo_por_idea(db):
+    """El ruteo anterior: hasta dos UPDATE y dos commits por idea."""
+    routed = 0
+    for idea in queries.get_routable_ideas(db):
+        ruta = pm._decidir_ruta(idea)
+        if not ruta:
+            continue
+        cola, agente, _ = ruta
+        if agente:
+            db.execute("UPDATE ideas SET suggested_agent = ? WHERE id = ?", [agente, idea['id']])
+            db.commit()
+        queries.update_execution_status(db, idea['id'], cola, agent_name=pm.NOMBRE)
+        routed += 1
+    return routed
+
+
+def _ciclo_en_lote(db):
+    set_connection(db)
+    try:
+        with patch.object(pm, "log"):
+            return pm.ciclo()
+    finally:
+        reset_connection()
+
+
+def _medir(fn, ideas):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = _crear_bd(os.path.join(tmp, "bench.db"), ideas)
+        inicio = time.perf_counter()
+        routed = fn(db)
+        segundos = time.perf_counter() - inicio
+        db.close()
+    return routed, segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ideas", type=int, nargs="+", default=[1000, 10000], help="ideas pendientes")
+    args = parser.parse_args()
+    logging.getLogger("OpenClaw").setLevel(logging.WARNING)
+
+    print(f"{'ideas':>7} {'ruteadas':>9} {'antes':>10} {'despues':>10} {'ideas/s antes':>14} "
+          f"{'ideas/s despues':>16} {'mejora':>7}")
+    for n in args.ideas:
+        routed, antes = _medir(_ciclo_por_idea, n)
+        routed_lote, despues = _medir(_ciclo_en_lote, n)
+        assert routed == routed_lote, (routed, routed_lote)
+        print(f"{n:>7} {routed:>9} {antes:>9.2f}s {despues:>9.3f}s {routed / antes:>14.0f} "
+              f"{routed / despues:>16.0f} {antes / despues:>6.0f}x")
+
+
+if __name__ == "__main__":
+    main()
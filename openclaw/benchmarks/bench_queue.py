@@ -0,0 +1,106 @@
+"""
+Benchmark de las consultas de cola sobre una BD sintetica grande.
+
+Crea una BD temporal con el schema del dashboard y `--rows` ideas repartidas
+entre todos los estados, mide cada consulta que hacen los agentes en su poll
+(sin indices) y repite tras db.migrations.migrate(). Imprime la latencia
+media por consulta y el plan de SQLite.
+
+Uso:
+  python benchmarks/bench_queue.py
+  python benchmarks/bench_queue.py --rows 100000 --repeat 50
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import migrations, queries  # noqa: E402
+from db.connection import _create_connection  # noqa: E402
+from tests.conftest import SCHEMA_SQL  # noqa: E402
+
+# Casi todo terminado; las colas vivas son pequenas, como en produccion
+_ESTADOS = ([("completed", "expressed")] * 80 + [("failed", "organized")] * 5 +
+            [(None, "captured")] * 5 + [(None, "organized")] * 2 +
+            [("queued_software", "organized"), ("queued_consulting", "organized"),
+             ("developed", "distilled"), ("built", "distilled"), ("reviewing", "distilled"),
+             ("in_progress", "organized"), ("blocked", "organized")])
+
+
+def _sembrar(db, rows, seed=7):
+    rng = random.Random(seed)
+    lote = []
+    for i in range(rows):
+        estado, stage = rng.choice(_ESTADOS)
+        lote.append((f"idea {i}", estado, stage, rng.choice(("alta", "media", "baja")),
+                     f"-{rows - i} minutes", f"-{rows - i} minutes"))
+    db.executemany("""
+        INSERT INTO ideas (text, execution_status, code_stage, priority, created_at, executed_at)
+        VALUES (?, ?, ?, ?, datetime('now', ?), datetime('now', ?))
+    """, lote)
+    db.executemany("INSERT INTO context_items (key, content) VALUES (?, ?)",
+                   [(f"ctx-{i}", "x" * 200) for i in range(rows // 100)])
+    db.commit()
+
+
+def _consultas(db):
+    return {
+        "get_routable_ideas": lambda: queries.get_routable_ideas(db),
+        "get_ideas_in_status": lambda: queries.get_ideas_in_status(db, "queued_software"),
+        "claim_next (sin match)": lambda: queries.claim_next(db, "queued_missing", "bench"),
+        "get_retryable_failed_ideas": lambda: queries.get_retryable_failed_ideas(db),
+        "get_pipeline_stats": lambda: queries.get_pipeline_stats(db),
+        "get_context_string": lambda: queries.get_context_string(db),
+    }
+
+
+def _medir(db, repeat):
+    tiempos = {}
+    for nombre, fn in _consultas(db).items():
+        fn()   # calentar cache de paginas
+        inicio = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        tiempos[nombre] = (time.perf_counter() - inicio) / repeat * 1000
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="ideas sinteticas")
+    parser.add_argument("--repeat", type=int, default=20, help="repeticiones por consulta")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        db = _create_connection(path)
+        db.executescript(SCHEMA_SQL)
+        inicio = time.perf_counter()
+        _sembrar(db, args.rows)
+        queries.ensure_execution_schema(db)
+        print(f"{args.rows} ideas sembradas en {time.perf_counter() - inicio:.1f}s "
+              f"({os.path.getsize(path) / 1e6:.1f} MB)\n")
+
+        antes = _medir(db, args.repeat)
+        inicio = time.perf_counter()
+        migrations.migrate(db)
+        print(f"migrate(): {time.perf_counter() - inicio:.2f}s\n")
+        despues = _medir(db, args.repeat)
+
+        print(f"{'consulta':<28} {'sin indices':>12} {'con indices':>12} {'mejora':>8}")
+        for nombre in antes:
+            print(f"{nombre:<28} {antes[nombre]:>10.2f}ms {despues[nombre]:>10.3f}ms "
+                  f"{antes[nombre] / max(despues[nombre], 1e-6):>7.0f}x")
+
+        print("\nPlanes con indices:")
+        for query, detail in migrations.query_plans(db).items():
+            print(f"  {query:<28} {' | '.join(detail)}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
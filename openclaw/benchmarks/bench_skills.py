@@ -0,0 +1,81 @@
+"""
+Benchmark del indice de skills (skills/index.py).
+
+Copia core/skills a un directorio temporal y mide:
+
+  frio:         primer refresh() sin archivo de cache (parsea todos los SOPs)
+  tibio:        refresh() de un indice nuevo con el archivo de cache ya escrito
+                (como al reiniciar OpenClaw): solo stat, nada se reparsea
+  incremental:  lo mismo despues de editar `--cambios` SOPs
+  listar:       list_available_skills() por llamada, antes (os.walk completo)
+                y ahora (paths() del indice: un stat por directorio)
+
+Uso:
+  python benchmarks/bench_skills.py
+  python benchmarks/bench_skills.py --cambios 10 --repeat 200
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from skills.index import SkillsIndex  # noqa: E402
+from skills.loader import _get_skills_dir  # noqa: E402
+
+
+def _walk(skills_dir):
+    """list_available_skills() de antes: os.walk completo en cada llamada."""
+    result = []
+    for root, _, files in os.walk(skills_dir):
+        for f in files:
+            if f.endswith(".md"):
+                result.append(os.path.relpath(os.path.join(root, f), skills_dir).replace("\\", "/"))
+    return sorted(result)
+
+
+def _por_llamada(fn, repeat):
+    inicio = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - inicio) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cambios", type=int, default=3, help="SOPs editados antes del refresh incremental")
+    parser.add_argument("--repeat", type=int, default=100, help="llamadas para medir list_available_skills")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        skills_dir = os.path.join(tmp, "skills")
+        shutil.copytree(_get_skills_dir(), skills_dir)
+        cache = os.path.join(tmp, "skills_index.json")
+
+        frio = SkillsIndex(skills_dir, cache).refresh()
+        tibio = SkillsIndex(skills_dir, cache).refresh()
+
+        for rel in _walk(skills_dir)[:args.cambios]:
+            with open(os.path.join(skills_dir, rel), "a", encoding="utf-8") as f:
+                f.write("\n<!-- editado -->\n")
+        incremental = SkillsIndex(skills_dir, cache).refresh()
+
+        indice = SkillsIndex(skills_dir, cache)
+        indice.refresh()
+        antes = _por_llamada(lambda: _walk(skills_dir), args.repeat)
+        ahora = _por_llamada(indice.paths, args.repeat)
+        s = indice.stats()
+
+        print(f"{s['skills']} SOPs, {s['bytes'] / 1e6:.1f} MB, ~{s['tokens']} tokens, "
+              f"cache {os.path.getsize(cache) / 1024:.0f} KB\n")
+        print(f"{'refresh':<13} {'ms':>8} {'parseados':>10}")
+        for nombre, r in (("frio", frio), ("tibio", tibio), ("incremental", incremental)):
+            print(f"{nombre:<13} {r['ms']:>8.1f} {r['parsed']:>10}")
+        print(f"\nlist_available_skills: os.walk {antes:.3f} ms -> indice {ahora:.3f} ms por llamada")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark del escritor unico (db/writer.py) frente a un commit por hilo.
+
+Siembra la BD sintetica de bench_queue.py con `--ideas` ideas en
+queued_software y lanza `--hilos` agentes simulados que, sin LLM, hacen lo
+que hace DEV en cada vuelta:
+
+  claim_next -> update_execution_progress -> update_execution_status(developed)
+
+mientras otro hilo hace de dashboard: con su propia conexion (fuera de la
+cola, como el proceso Node) cambia la prioridad de una idea cada `--dashboard-ms`.
+
+Modos:
+  directo:  cada escritura toma el lock de escritura y hace su commit
+  cola:     las escrituras de los agentes pasan por el escritor unico
+
+Por modo imprime ideas/s, latencia por escritura (p50/p95), esperas por el
+lock de los agentes y del dashboard, errores "database is locked" y, en
+modo cola, lotes y tamano medio de lote.
+
+Uso:
+  python benchmarks/bench_writer.py
+  python benchmarks/bench_writer.py --hilos 12 --ideas 3000 --dashboard-ms 2
+  python benchmarks/bench_writer.py --delay-ms 2     # lotes mas grandes, mas latencia
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_queue import _sembrar  # noqa: E402
+from db import connection, migrations, queries, writer  # noqa: E402
+from tests.conftest import SCHEMA_SQL  # noqa: E402
+
+
+def _percentil(valores, pct):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * pct / 100))]
+
+
+def _preparar(path, ideas):
+    db = connection._create_connection(path)
+    db.executescript(SCHEMA_SQL)
+    _sembrar(db, 1000)
+    db.executemany("INSERT INTO ideas (text, execution_status, priority) VALUES (?, 'queued_software', 'media')",
+                   [(f"tarea {i}",) for i in range(ideas)])
+    db.commit()
+    migrations.migrate(db)
+    db.close()
+
+
+def _agente(nombre, latencias, parar):
+    db = connection.get_connection()
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        idea = queries.claim_next(db, "queued_software", nombre)
+        if idea is None:
+            return
+        queries.update_execution_progress(db, idea["id"], "**Generando...**\n\n" + "x" * 500)
+        queries.update_execution_status(db, idea["id"], "developed", output="print('ok')\n" * 50,
+                                        agent_name=nombre)
+        latencias.append((time.perf_counter() - inicio) * 1000 / 3)
+
+
+def _dashboard(path, intervalo, parar, resultado):
+    db = sqlite3.connect(path, timeout=5, isolation_level=None)
+    espera = 0.0
+    errores = 0
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            espera += time.perf_counter() - inicio
+            db.execute("UPDATE ideas SET priority = CASE priority WHEN 'alta' THEN 'media' ELSE 'alta' END "
+                       "WHERE id = (SELECT MIN(id) FROM ideas)")
+            db.execute("COMMIT")
+        except sqlite3.OperationalError:
+            errores += 1
+        parar.wait(intervalo)
+    db.close()
+    resultado.update(espera=espera, errores=errores)
+
+
+def _correr(path, modo, hilos, dashboard_ms, delay_ms):
+    os.environ["DB_PATH"] = path
+    connection.reset_connection()
+    cola = writer.start(path, max_delay_ms=delay_ms) if modo == "cola" else None
+    latencias, parar, dash = [], threading.Event(), {}
+    tablero = threading.Thread(target=_dashboard, args=(path, dashboard_ms / 1000, parar, dash))
+    tablero.start()
+    agentes = [threading.Thread(target=_agente, args=(f"DEV-{i}", latencias, parar)) for i in range(hilos)]
+    inicio = time.perf_counter()
+    for a in agentes:
+        a.start()
+    for a in agentes:
+        a.join()
+    total = time.perf_counter() - inicio
+    parar.set()
+    tablero.join()
+    stats = cola.stats() if cola else None
+    writer.stop()
+    conexiones = connection.connection_stats()
+    connection.close_all()
+    return {
+        "ideas_s": len(latencias) / total,
+        "p50": _percentil(latencias, 50),
+        "p95": _percentil(latencias, 95),
+        "espera_agentes": sum(c["busy_wait_s"] for c in conexiones),
+        "errores": sum(c["busy_errors"] for c in conexiones) + (stats["errors"] if stats else 0),
+        "espera_dashboard": dash["espera"],
+        "errores_dashboard": dash["errores"],
+        "cola": stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hilos", type=int, default=6, help="agentes simulados")
+    parser.add_argument("--ideas", type=int, default=1200, help="ideas en queued_software")
+    parser.add_argument("--dashboard-ms", type=float, default=5, help="intervalo de escritura del dashboard")
+    parser.add_argument("--delay-ms", type=float, default=0, help="max_delay_ms del escritor unico")
+    args = parser.parse_args()
+
+    print(f"{args.hilos} agentes, {args.ideas} ideas, dashboard cada {args.dashboard_ms:g} ms\n")
+    print(f"{'modo':<8} {'ideas/s':>8} {'p50':>8} {'p95':>8} {'lock agentes':>13} "
+          f"{'lock dashboard':>15} {'errores':>8}  lotes")
+    for modo in ("directo", "cola"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            _preparar(path, args.ideas)
+            r = _correr(path, modo, args.hilos, args.dashboard_ms, args.delay_ms)
+        lotes = ""
+        if r["cola"]:
+            c = r["cola"]
+            lotes = (f"{c['batches']} (media {c['batch_size']['mean']:.1f}, "
+                     f"lock escritor {c['lock_wait_ms']['count'] and c['lock_wait_ms']['mean']:.2f} ms/lote)")
+        print(f"{modo:<8} {r['ideas_s']:>8.0f} {r['p50']:>6.2f}ms {r['p95']:>6.2f}ms "
+              f"{r['espera_agentes'] * 1000:>11.0f}ms {r['espera_dashboard'] * 1000:>13.0f}ms "
+              f"{r['errores'] + r['errores_dashboard']:>8}  {lotes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,31 @@ Adaptado de Sistema-OpenClaw/compartido.py (v7.4) para SecondBrain.
 Diferencia principal: No usa Obsidian. Todo va por SQLite via db/queries.py.
 """
 import os
+import asyncio
+import json
 import logging
 import logging.handlers
+import socket
+import threading
+import time
 from pathlib import Path
 
 import requests
 from dotenv import load_dotenv
 
+from db import artifacts
+from db import connection as db_connection
+from db.cache import reference_cache
+from db.slowlog import query_log
+from llm.balancer import OllamaBalancer
+from llm.cache import ResponseCache, cache_key
+from llm.engine import AsyncEngine
+from llm.hedging import Hedger, cancelable
+from llm.health import HealthRegistry, clasificar_error
+from llm.residency import ResidencyManager
+from llm.streaming import Cancelado, Progreso, consumir
+from llm.transport import HttpTransport, abort as abortar_conexion
+
 # ── Cargar .env desde el directorio de openclaw ──────────────────────────────
 _env_path = Path(__file__).parent / ".env"
 load_dotenv(_env_path)
@@ -45,6 +63,21 @@ logging.getLogger().addHandler(_fh)
 
 logger = logging.getLogger("OpenClaw")
 
+
+def _parse_mapa(texto, tipo=int):
+    """Parsea 'qa=3600,reviewer=1800' -> {'qa': 3600, 'reviewer': 1800}."""
+    mapa = {}
+    for par in (texto or "").split(","):
+        if "=" not in par:
+            continue
+        clave, valor = par.split("=", 1)
+        try:
+            mapa[clave.strip().lower()] = tipo(valor.strip())
+        except ValueError:
+            logger.warning("Valor invalido en configuracion: %r", par)
+    return mapa
+
+
 # ── Configuracion ────────────────────────────────────────────────────────────
 CONFIG = {
     "gemini_api_key":    os.getenv("GEMINI_API_KEY", ""),
@@ -53,6 +86,8 @@ CONFIG = {
     "claude_model":      os.getenv("CLAUDE_MODEL", "claude-sonnet-4-6"),
     "local_model":       os.getenv("LOCAL_MODEL", "llama3"),
     "ollama_url":        os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate"),
+    # Varios servidores Ollama (ej. "http://gpu1:11434,http://gpu2:11434"); vacio = solo OLLAMA_URL
+    "ollama_urls":       [u.strip() for u in os.getenv("OLLAMA_URLS", "").split(",") if u.strip()],
     "tts_enabled":       os.getenv("TTS_ENABLED", "false").lower() == "true",
     "intervalo_pm":       int(os.getenv("INTERVALO_PM", "30")),
     "intervalo_dev":      int(os.getenv("INTERVALO_DEV", "60")),
@@ -60,14 +95,134 @@ CONFIG = {
     "intervalo_builder":    int(os.getenv("INTERVALO_BUILDER", "45")),
     "intervalo_consulting": int(os.getenv("INTERVALO_CONSULTING", "45")),
     "intervalo_reviewer":   int(os.getenv("INTERVALO_REVIEWER", "90")),
+    # Despertar a un agente apenas entra trabajo en su cola (el intervalo queda de respaldo)
+    "db_watch":             os.getenv("DB_WATCH", "true").lower() == "true",
+    "db_watch_interval":    float(os.getenv("DB_WATCH_INTERVAL", "0.5")),
+    # Transporte HTTP (keep-alive compartido por todos los motores)
+    "http_connect_timeout": float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+    "http_read_timeout":    float(os.getenv("HTTP_READ_TIMEOUT", "120")),
+    "http_max_per_host":    int(os.getenv("HTTP_MAX_PER_HOST", "6")),
+    "ollama_timeout":       float(os.getenv("OLLAMA_TIMEOUT", "300")),
+    # Reuso de prefijos: Ollama mantiene el modelo (y su KV cache) cargado este tiempo;
+    # Claude marca como cacheable el system prompt si es largo
+    "ollama_keep_alive":    os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+    "claude_prompt_cache":  os.getenv("CLAUDE_PROMPT_CACHE", "true").lower() == "true",
+    # Residencia: precargar el modelo local al arrancar y re-cargarlo si /api/ps
+    # muestra que Ollama lo descargo (cada N segundos; 0 = solo al arrancar)
+    "ollama_warmup":          os.getenv("OLLAMA_WARMUP", "true").lower() == "true",
+    "ollama_residency_check": float(os.getenv("OLLAMA_RESIDENCY_CHECK", "60")),
+    # Cache de respuestas de pensar() (opt-in)
+    "llm_cache":             os.getenv("LLM_CACHE", "false").lower() == "true",
+    "llm_cache_path":        os.getenv("LLM_CACHE_PATH", str(Path(__file__).parent / "data" / "llm_cache.db")),
+    "llm_cache_max_mb":      int(os.getenv("LLM_CACHE_MAX_MB", "64")),
+    "llm_cache_ttl":         int(os.getenv("LLM_CACHE_TTL", "86400")),
+    "llm_cache_ttl_agentes": _parse_mapa(os.getenv("LLM_CACHE_TTL_AGENTES", "")),
+    # Circuit breaker de backends IA
+    "circuit_failures":    int(os.getenv("CIRCUIT_FAILURES", "3")),
+    "circuit_backoff_max": float(os.getenv("CIRCUIT_BACKOFF_MAX", "600")),
+    # Streaming: cada cuantos segundos se vuelca el output parcial a la BD
+    "stream_flush_s":      float(os.getenv("STREAM_FLUSH_S", "5")),
+    # Leases de tareas: segundos que una idea tomada queda reservada al worker
+    # (se renueva mientras trabaja; si el proceso muere otro la toma al vencer)
+    "lease_seconds":       int(os.getenv("LEASE_SECONDS", "900")),
+    # Ledger de uso: una fila por llamada LLM en la tabla llm_usage
+    "llm_ledger":          os.getenv("LLM_LEDGER", "true").lower() == "true",
+    # Motor async: peticiones simultaneas por backend (ej. "local=2,gemini=8,claude=8")
+    "llm_concurrency":     {"local": 2, "gemini": 8, "claude": 8,
+                            **_parse_mapa(os.getenv("LLM_CONCURRENCY", ""))},
+    # Hedging por agente: "reviewer=p90,qa=6" (percentil del TTFT del primario o segundos)
+    "llm_hedge":           _parse_mapa(os.getenv("LLM_HEDGE", ""), tipo=str),
+    "llm_hedge_delay":     float(os.getenv("LLM_HEDGE_DELAY", "10")),
+    # Perfil de las conexiones SQLite (0 = valor por defecto de SQLite)
+    "db_cache_kb":          int(os.getenv("DB_CACHE_KB", "16384")),
+    "db_mmap_mb":           int(os.getenv("DB_MMAP_MB", "64")),
+    "db_temp_store":        os.getenv("DB_TEMP_STORE", "memory"),
+    "db_cached_statements": int(os.getenv("DB_CACHED_STATEMENTS", "256")),
+    # Backend: sqlite (DB_PATH) o postgres (la BD del dashboard, variables PG_*)
+    "db_backend":           os.getenv("DB_BACKEND", "sqlite").lower(),
+    "db_pool_max":          int(os.getenv("PG_POOL_MAX", "10")),
+    "db_prepare_threshold": int(os.getenv("PG_PREPARE_THRESHOLD", "2")),
+    # Cache de datos de referencia (contexto, usuarios, areas): entradas y edad maxima
+    "db_ref_cache":         os.getenv("DB_REF_CACHE", "true").lower() == "true",
+    "db_ref_cache_entries": int(os.getenv("DB_REF_CACHE_ENTRIES", "128")),
+    "db_ref_cache_ttl":     float(os.getenv("DB_REF_CACHE_TTL", "300")),
+    # Escritor unico (solo SQLite): las escrituras de los agentes se encolan y se
+    # confirman en lotes (hasta N operaciones; X ms de espera extra por lote, 0 = no esperar)
+    "db_writer":            os.getenv("DB_WRITER", "false").lower() == "true",
+    "db_writer_batch":      int(os.getenv("DB_WRITER_BATCH", "64")),
+    "db_writer_delay_ms":   float(os.getenv("DB_WRITER_DELAY_MS", "0")),
+    # Mantenimiento en segundo plano (solo SQLite): checkpoints del WAL, ANALYZE e
+    # incremental vacuum en ventanas sin escrituras
+    "db_maintenance":           os.getenv("DB_MAINTENANCE", "true").lower() == "true",
+    "db_maint_interval":        float(os.getenv("DB_MAINT_INTERVAL", "30")),
+    "db_maint_quiet":           float(os.getenv("DB_MAINT_QUIET", "10")),
+    "db_wal_limit_mb":          int(os.getenv("DB_WAL_LIMIT_MB", "64")),
+    "db_analyze_every":         float(os.getenv("DB_ANALYZE_EVERY", "3600")),
+    "db_vacuum_budget_ms":      float(os.getenv("DB_VACUUM_BUDGET_MS", "200")),
+    # Log de consultas lentas: histograma por consulta y, sobre el umbral, la sentencia
+    # (parametros redactados) con su EXPLAIN QUERY PLAN
+    "db_slow_log":              os.getenv("DB_SLOW_LOG", "false").lower() == "true",
+    "db_slow_ms":               float(os.getenv("DB_SLOW_MS", "50")),
+    # Artefactos (outputs, build reports, reviews) comprimidos fuera de la BD (opt-in)
+    "artifacts":            os.getenv("ARTIFACTS", "false").lower() == "true",
+    "artifacts_dir":        os.getenv("ARTIFACTS_DIR", str(Path(__file__).parent / "data" / "artifacts")),
+    "artifacts_codec":      os.getenv("ARTIFACTS_CODEC", "zlib").lower(),
+    "artifacts_summary":    int(os.getenv("ARTIFACTS_SUMMARY_CHARS", "400")),
 }
 
+# ── Perfil de conexion a la BD ───────────────────────────────────────────────
+# Los modulos de db/ traen defaults propios para funcionar sueltos (p.ej.
+# `python -m db.slowlog`); aqui configure() les aplica los valores de CONFIG.
+db_connection.configure(
+    cache_kb=CONFIG["db_cache_kb"],
+    mmap_mb=CONFIG["db_mmap_mb"],
+    temp_store=CONFIG["db_temp_store"],
+    cached_statements=CONFIG["db_cached_statements"],
+    backend=CONFIG["db_backend"],
+    pool_max=CONFIG["db_pool_max"],
+    prepare_threshold=CONFIG["db_prepare_threshold"],
+)
+reference_cache.configure(
+    max_entries=CONFIG["db_ref_cache_entries"],
+    ttl=CONFIG["db_ref_cache_ttl"],
+    enabled=CONFIG["db_ref_cache"],
+)
+query_log.configure(enabled=CONFIG["db_slow_log"], threshold_ms=CONFIG["db_slow_ms"])
+artifacts.configure(
+    root=CONFIG["artifacts_dir"],
+    codec=CONFIG["artifacts_codec"],
+    enabled=CONFIG["artifacts"],
+    summary_chars=CONFIG["artifacts_summary"],
+)
+
+# ── Transporte HTTP compartido ───────────────────────────────────────────────
+transport = HttpTransport(
+    connect_timeout=CONFIG["http_connect_timeout"],
+    read_timeout=CONFIG["http_read_timeout"],
+    max_per_host=CONFIG["http_max_per_host"],
+)
+
+
+def _sdk_http_client(host):
+    """httpx.Client del transporte para un SDK cloud, o None si httpx no esta."""
+    try:
+        return transport.httpx_client(host)
+    except ImportError:
+        return None
+
 # ── Cliente Gemini ───────────────────────────────────────────────────────────
 cliente_gemini = None
 try:
     if CONFIG["gemini_api_key"]:
         from google import genai
-        cliente_gemini = genai.Client(api_key=CONFIG["gemini_api_key"])
+        _gemini_http = _sdk_http_client("https://generativelanguage.googleapis.com")
+        if _gemini_http is not None:
+            cliente_gemini = genai.Client(
+                api_key=CONFIG["gemini_api_key"],
+                http_options=genai.types.HttpOptions(httpx_client=_gemini_http),
+            )
+        else:
+            cliente_gemini = genai.Client(api_key=CONFIG["gemini_api_key"])
         logger.info("Gemini configurado OK (modelo: %s)", CONFIG["gemini_model"])
     else:
         logger.warning("GEMINI_API_KEY no configurada — agentes DEV y CONSULTING no funcionaran")
@@ -79,7 +234,11 @@ cliente_claude = None
 try:
     if CONFIG["anthropic_api_key"]:
         import anthropic
-        cliente_claude = anthropic.Anthropic(api_key=CONFIG["anthropic_api_key"])
+        _claude_http = _sdk_http_client("https://api.anthropic.com")
+        if _claude_http is not None:
+            cliente_claude = anthropic.Anthropic(api_key=CONFIG["anthropic_api_key"], http_client=_claude_http)
+        else:
+            cliente_claude = anthropic.Anthropic(api_key=CONFIG["anthropic_api_key"])
         logger.info("Claude configurado OK (modelo: %s)", CONFIG["claude_model"])
     else:
         logger.warning("ANTHROPIC_API_KEY no configurada — agentes QA y REVIEWER no funcionaran")
@@ -94,27 +253,236 @@ def _estimate_tokens(text):
     return len(text or "") // 4
 
 
+# ── Salud de backends / circuit breaker ────────────────────────────────────
+
+health = HealthRegistry(
+    failure_threshold=CONFIG["circuit_failures"],
+    backoff_max=CONFIG["circuit_backoff_max"],
+)
+
+
+def _ollama_base(url=None):
+    """URL base de Ollama (sin /api/...), ej. http://localhost:11434."""
+    return (url or CONFIG["ollama_url"]).split("/api/")[0].rstrip("/")
+
+
+def _ollama_hosts():
+    """URLs base de todos los servidores Ollama (OLLAMA_URLS o solo OLLAMA_URL)."""
+    return [_ollama_base(u) for u in CONFIG["ollama_urls"]] or [_ollama_base()]
+
+
+def _ollama_chat_url(host=None):
+    return f"{host or _ollama_base()}/api/chat"
+
+
+def _payload_ollama(prompt, sistema, stream):
+    """Payload de /api/chat: el system va como mensaje propio para que Ollama reuse su prefijo."""
+    mensajes = [{"role": "system", "content": sistema}] if sistema else []
+    mensajes.append({"role": "user", "content": prompt})
+    return {"model": CONFIG["local_model"], "messages": mensajes, "stream": stream,
+            "keep_alive": CONFIG["ollama_keep_alive"]}
+
+
+def _texto_ollama(data):
+    """Texto de una respuesta /api/chat (message.content) o /api/generate (response)."""
+    return (data.get("message") or {}).get("content") or data.get("response") or ""
+
+
+# Claude solo cachea prefijos desde ~1024 tokens; por debajo la marca no sirve
+_CLAUDE_CACHE_MIN_CHARS = 4096
+
+
+def _system_claude(sistema):
+    """System de Claude; si es largo, como bloque con cache_control para reusar el prefijo."""
+    if CONFIG["claude_prompt_cache"] and len(sistema) >= _CLAUDE_CACHE_MIN_CHARS:
+        return [{"type": "text", "text": sistema, "cache_control": {"type": "ephemeral"}}]
+    return sistema
+
+
+# ── Servidores Ollama: balanceo y residencia del modelo ──────────────────────
+
+balanceador = OllamaBalancer(_ollama_hosts)
+
+residencia = ResidencyManager(
+    transport,
+    model=CONFIG["local_model"],
+    hosts=_ollama_hosts,
+    on_models=lambda host, modelos: balanceador.set_models(host, modelos),
+    keep_alive=CONFIG["ollama_keep_alive"],
+    interval=CONFIG["ollama_residency_check"],
+    timeout=CONFIG["ollama_timeout"],
+)
+
+
+def _probe_local():
+    """Basta con que responda uno de los servidores Ollama."""
+    error = None
+    for host in _ollama_hosts():
+        try:
+            transport.get(f"{host}/api/tags", timeout=5, verify=False).raise_for_status()
+            return
+        except Exception as e:
+            error = e
+    raise error
+
+
+def _probe_gemini():
+    cliente_gemini.models.get(model=CONFIG["gemini_model"])
+
+
+def _probe_claude():
+    cliente_claude.models.list(limit=1)
+
+
+health.register_probe("local", _probe_local)
+if cliente_gemini:
+    health.register_probe("gemini", _probe_gemini)
+if cliente_claude:
+    health.register_probe("claude", _probe_claude)
+
+
+# ── Contabilidad de uso (ledger por llamada) ────────────────────────────────
+
+def _entero(valor):
+    """Valor entero de un campo de usage del proveedor, o None (mocks, campos ausentes)."""
+    return valor if isinstance(valor, int) and not isinstance(valor, bool) else None
+
+
+def _uso_ollama(uso, data):
+    """Copia prompt_eval_count / eval_count de una respuesta Ollama al registro de uso.
+
+    Con el prefijo en su KV cache Ollama solo evalua los tokens nuevos, asi que
+    prompt_eval_count cae muy por debajo del tamano del prompt: la diferencia
+    (estimada por caracteres) se registra como cached_tokens.
+    """
+    if uso is None:
+        return
+    uso["output_tokens"] = _entero(data.get("eval_count"))
+    duracion = _entero(data.get("prompt_eval_duration"))
+    if duracion is not None:
+        uso["prompt_eval_ms"] = duracion // 1_000_000
+    evaluados = _entero(data.get("prompt_eval_count"))
+    if evaluados is None:
+        uso["input_tokens"] = None
+        return
+    estimado = (uso.get("_prompt_chars", 0) + uso.get("_system_chars", 0)) // 4
+    cacheados = estimado - evaluados if evaluados < estimado // 2 else 0
+    uso["cached_tokens"] = cacheados
+    uso["input_tokens"] = evaluados + cacheados
+
+
+def _uso_gemini(uso, respuesta):
+    if uso is None:
+        return
+    meta = getattr(respuesta, "usage_metadata", None)
+    if meta is None:
+        return
+    # En streaming cada chunk trae usage_metadata; solo el ultimo con totales
+    for campo, attr in (("input_tokens", "prompt_token_count"), ("output_tokens", "candidates_token_count"),
+                        ("cached_tokens", "cached_content_token_count")):
+        valor = _entero(getattr(meta, attr, None))
+        if valor is not None:
+            uso[campo] = valor
+
+
+def _uso_claude(uso, usage):
+    if uso is None or usage is None:
+        return
+    # input_tokens de Claude excluye lo leido/escrito en el cache de prompts
+    base = _entero(getattr(usage, "input_tokens", None))
+    leidos = _entero(getattr(usage, "cache_read_input_tokens", None)) or 0
+    escritos = _entero(getattr(usage, "cache_creation_input_tokens", None)) or 0
+    uso["input_tokens"] = base + leidos + escritos if base is not None else None
+    uso["cached_tokens"] = leidos
+    uso["output_tokens"] = _entero(getattr(usage, "output_tokens", None))
+
+
+def _nuevo_uso(backend, prompt, sistema, agente="", idea_id=None, skills=None):
+    return {
+        "agent": agente or None,
+        "idea_id": idea_id,
+        "skills": skills,
+        "backend": backend,
+        "model": CONFIG[_MODELO_POR_BACKEND[backend]],
+        "_prompt_chars": len(prompt or ""),
+        "_system_chars": len(sistema or ""),
+        "_inicio": time.monotonic(),
+    }
+
+
+def _cerrar_uso(uso, texto, outcome, ttft=None, registrar=True):
+    """Completa un registro de uso y lo envia al ledger.
+
+    Los tokens de entrada del proveedor se reparten entre prompt y sistema en
+    proporcion a sus caracteres (los proveedores solo informan el total).
+    Si el proveedor no informo tokens se usa la estimacion ~4 chars/token.
+    """
+    wall = time.monotonic() - uso.pop("_inicio")
+    prompt_chars = uso.pop("_prompt_chars")
+    system_chars = uso.pop("_system_chars")
+    entrada = uso.pop("input_tokens", None)
+    salida = uso.get("output_tokens")
+
+    uso["token_source"] = "provider" if entrada is not None else "estimate"
+    if entrada is None:
+        entrada = (prompt_chars + system_chars) // 4
+    total_chars = prompt_chars + system_chars
+    uso["system_tokens"] = round(entrada * system_chars / total_chars) if total_chars else 0
+    uso["prompt_tokens"] = entrada - uso["system_tokens"]
+    if salida is None:
+        uso["output_tokens"] = _estimate_tokens(texto)
+    uso["wall_ms"] = int(wall * 1000)
+    uso["ttft_ms"] = int((ttft if ttft is not None else wall) * 1000)
+    uso["outcome"] = outcome
+    if registrar:
+        _registrar_uso(uso)
+    return uso
+
+
+def _registrar_uso(uso):
+    """Escribe una fila en llm_usage. Nunca interrumpe la inferencia."""
+    if not CONFIG["llm_ledger"]:
+        return
+    try:
+        from db.connection import get_connection
+        from db import queries
+        queries.record_llm_usage(get_connection(), uso)
+    except Exception as e:
+        logger.debug("Ledger de uso no disponible: %s", e)
+
+
 # ── Motores de IA ────────────────────────────────────────────────────────────
 
-def pensar_con_gemini(prompt, modelo=None):
-    """Inferencia en nube con Google Gemini. Retorna '' si falla."""
+def pensar_con_gemini(prompt, modelo=None, uso=None):
+    """Inferencia en nube con Google Gemini. Retorna '' si falla.
+
+    Si se pasa `uso` (dict) se completa con los tokens informados por la API.
+    """
     if not cliente_gemini:
         return ""
+    inicio = time.monotonic()
     try:
         res = cliente_gemini.models.generate_content(
             model=modelo or CONFIG["gemini_model"],
             contents=prompt
         )
+        health.record_success("gemini", time.monotonic() - inicio)
+        _uso_gemini(uso, res)
         return res.text or ""
     except Exception as e:
+        kind = clasificar_error(e)
+        health.record_failure("gemini", kind, time.monotonic() - inicio, e)
+        if uso is not None:
+            uso["error_kind"] = kind
         logger.warning("Gemini error: %s", e)
         return ""
 
 
-def pensar_con_claude(prompt, sistema="", modelo=None, max_tokens=4096):
+def pensar_con_claude(prompt, sistema="", modelo=None, max_tokens=4096, uso=None):
     """Inferencia en nube con Anthropic Claude. Retorna '' si falla."""
     if not cliente_claude:
         return ""
+    inicio = time.monotonic()
     try:
         kwargs = {
             "model": modelo or CONFIG["claude_model"],
@@ -122,84 +490,673 @@ def pensar_con_claude(prompt, sistema="", modelo=None, max_tokens=4096):
             "messages": [{"role": "user", "content": prompt}],
         }
         if sistema:
-            kwargs["system"] = sistema
+            kwargs["system"] = _system_claude(sistema)
         resp = cliente_claude.messages.create(**kwargs)
+        health.record_success("claude", time.monotonic() - inicio)
+        _uso_claude(uso, getattr(resp, "usage", None))
         return resp.content[0].text if resp.content else ""
     except Exception as e:
+        kind = clasificar_error(e)
+        health.record_failure("claude", kind, time.monotonic() - inicio, e)
+        if uso is not None:
+            uso["error_kind"] = kind
         logger.warning("Claude error: %s", e)
         return ""
 
 
-def pensar_con_local(prompt):
-    """Inferencia local via Ollama. Fallback cuando Gemini/Claude no responden."""
-    payload = {"model": CONFIG["local_model"], "prompt": prompt, "stream": False}
+def pensar_con_local(prompt, sistema="", uso=None):
+    """Inferencia local via Ollama (/api/chat). Fallback cuando Gemini/Claude no responden.
+
+    El system prompt va como mensaje aparte: con el modelo residente
+    (keep_alive) Ollama reusa el KV cache del prefijo en vez de re-evaluarlo.
+    Con varios servidores (OLLAMA_URLS) el balanceador elige el host.
+    """
+    payload = _payload_ollama(prompt, sistema, stream=False)
+    host = balanceador.acquire(CONFIG["local_model"])
+    url = _ollama_chat_url(host)
+    inicio = time.monotonic()
+    kind = None
     try:
-        logger.info("Ollama: conectando a %s (modelo: %s)...", CONFIG["ollama_url"], CONFIG["local_model"])
-        r = requests.post(CONFIG["ollama_url"], json=payload, timeout=300, verify=False)
+        logger.info("Ollama: conectando a %s (modelo: %s)...", url, CONFIG["local_model"])
+        r = transport.post(url, json=payload, timeout=CONFIG["ollama_timeout"], verify=False)
         if r.status_code == 200:
-            text = r.json().get("response", "").strip()
+            health.record_success("local", time.monotonic() - inicio)
+            data = r.json()
+            _uso_ollama(uso, data)
+            residencia.observe(host, data)
+            text = _texto_ollama(data).strip()
             if text:
                 logger.info("Ollama: respuesta OK (%d chars)", len(text))
             else:
                 logger.warning("Ollama: respuesta vacia")
             return text
         else:
+            kind = clasificar_error(status_code=r.status_code)
+            health.record_failure("local", kind, time.monotonic() - inicio, f"HTTP {r.status_code}")
+            if uso is not None:
+                uso["error_kind"] = kind
             logger.warning("Ollama: HTTP %d — %s", r.status_code, r.text[:200])
             return ""
-    except requests.exceptions.ConnectionError:
-        logger.warning("Ollama: no se pudo conectar a %s — esta corriendo 'ollama serve'?", CONFIG["ollama_url"])
+    except requests.exceptions.ConnectionError as e:
+        kind = clasificar_error(e)
+        health.record_failure("local", kind, time.monotonic() - inicio, e)
+        if uso is not None:
+            uso["error_kind"] = kind
+        logger.warning("Ollama: no se pudo conectar a %s — esta corriendo 'ollama serve'?", host)
         return ""
     except Exception as e:
+        kind = clasificar_error(e)
+        health.record_failure("local", kind, time.monotonic() - inicio, e)
+        if uso is not None:
+            uso["error_kind"] = kind
         logger.warning("Ollama: error inesperado — %s", e)
         return ""
+    finally:
+        balanceador.release(host, ok=kind is None, latency=time.monotonic() - inicio,
+                            kind=kind, model=CONFIG["local_model"])
+
+
+# ── Cache de respuestas (opt-in) ─────────────────────────────────────────────
+
+_MODELO_POR_BACKEND = {"local": "local_model", "gemini": "gemini_model", "claude": "claude_model"}
+
+response_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Cache de respuestas compartido (se crea al primer uso)."""
+    global response_cache
+    if response_cache is not None:
+        return response_cache
+    with _cache_lock:
+        if response_cache is None:
+            response_cache = ResponseCache(
+                CONFIG["llm_cache_path"],
+                max_bytes=CONFIG["llm_cache_max_mb"] * 1024 * 1024,
+                default_ttl=CONFIG["llm_cache_ttl"],
+                ttl_by_agent=CONFIG["llm_cache_ttl_agentes"],
+            )
+        return response_cache
 
 
 # ── Motor universal: Ollama primario, cloud fallback ────────────────────────
 
-def pensar(prompt, sistema="", max_tokens=4096, fallback="gemini"):
+def _cadena_backends(fallback):
+    """Orden de intento: Ollama primero, luego el cloud preferido y el otro."""
+    if fallback == "claude":
+        return ["local", "claude", "gemini"]
+    return ["local", "gemini", "claude"]
+
+
+def _llamar_backend(backend, prompt, sistema, max_tokens, uso=None):
+    """Invoca un backend con el formato de prompt que espera."""
+    full_prompt = f"{sistema}\n\n{prompt}" if sistema else prompt
+    if backend == "local":
+        return pensar_con_local(prompt, sistema=sistema, uso=uso)
+    if backend == "claude":
+        return pensar_con_claude(prompt, sistema=sistema, max_tokens=max_tokens, uso=uso)
+    return pensar_con_gemini(full_prompt, uso=uso)
+
+
+def _abrir_cache(cache):
+    """Resuelve el parametro `cache` de pensar*() al ResponseCache a usar (o None)."""
+    usar_cache = CONFIG["llm_cache"] if cache is None else cache
+    if cache is False and CONFIG["llm_cache"]:
+        get_response_cache().note_bypass()
+    return get_response_cache() if usar_cache else None
+
+
+def _buscar_en_cache(rc, cadena, prompt, sistema, max_tokens):
+    """Busca el prompt en cache para cada backend de la cadena.
+
+    Returns:
+        (respuesta o None, backend del acierto o None, {backend: clave}).
+        Las claves se reusan al guardar.
+    """
+    claves = {}
+    if rc is None:
+        return None, None, claves
+    for backend in cadena:
+        claves[backend] = cache_key(backend, CONFIG[_MODELO_POR_BACKEND[backend]], sistema, prompt, max_tokens)
+    # Una sola consulta por llamada: el hit ratio no depende del largo de la cadena
+    clave, cacheado = rc.get_first(claves.values())
+    if not cacheado:
+        return None, None, claves
+    backend = next(b for b, k in claves.items() if k == clave)
+    logger.info("AI response (cache %s): ~%d output tokens", backend, _estimate_tokens(cacheado))
+    return cacheado, backend, claves
+
+
+def _log_request(prompt, sistema):
+    input_tokens = _estimate_tokens(prompt) + _estimate_tokens(sistema)
+    logger.info("AI request: ~%d input tokens (prompt=%d, system=%d)",
+                input_tokens, _estimate_tokens(prompt), _estimate_tokens(sistema))
+    return input_tokens
+
+
+def pensar(prompt, sistema="", max_tokens=4096, fallback="gemini", agente="", cache=None,
+           idea_id=None, skills=None):
     """Inferencia universal. Ollama primero, cloud como respaldo.
 
     Args:
         prompt:   Texto del prompt.
         sistema:  System instruction (para Claude y Ollama /api/generate).
         fallback: 'gemini' o 'claude' — cual cloud probar primero si Ollama falla.
+        agente:   Nombre del agente que llama (TTL de cache, ledger de uso).
+        cache:    None = segun CONFIG['llm_cache'], True = forzar, False = no cachear.
+        idea_id:  Idea procesada (para el ledger de uso).
+        skills:   Skill set usado (para el ledger de uso).
 
     Returns:
         str con la respuesta, o '' si todo falla.
     """
-    input_tokens = _estimate_tokens(prompt) + _estimate_tokens(sistema)
-    logger.info("AI request: ~%d input tokens (prompt=%d, system=%d)",
-                input_tokens, _estimate_tokens(prompt), _estimate_tokens(sistema))
+    input_tokens = _log_request(prompt, sistema)
+    cadena = _cadena_backends(fallback)
+    rc = _abrir_cache(cache)
 
-    # 1. Ollama (primario)
-    full_prompt = f"{sistema}\n\n{prompt}" if sistema else prompt
-    resultado = pensar_con_local(full_prompt)
-    if resultado:
-        output_tokens = _estimate_tokens(resultado)
-        logger.info("AI response (local): ~%d output tokens, ~%d total", output_tokens, input_tokens + output_tokens)
-        return resultado
-
-    logger.info("Ollama no respondio, intentando cloud (%s)...", fallback)
+    # 0. Cache: cualquier backend de la cadena que ya haya respondido este prompt
+    inicio_cache = _nuevo_uso(cadena[0], prompt, sistema, agente, idea_id, skills)
+    cacheado, backend_cache, claves = _buscar_en_cache(rc, cadena, prompt, sistema, max_tokens)
+    if cacheado:
+        inicio_cache.update(backend=backend_cache, model=CONFIG[_MODELO_POR_BACKEND[backend_cache]])
+        _cerrar_uso(inicio_cache, cacheado, "cache")
+        return cacheado
 
-    # 2. Cloud fallback
-    if fallback == "claude":
-        resultado = pensar_con_claude(prompt, sistema=sistema, max_tokens=max_tokens)
+    usados = set()
+    politica = hedger.politica(agente)
+    if politica is not None:
+        resultado, backend = _pensar_con_cobertura(
+            cadena, politica, prompt, sistema, max_tokens, None, None,
+            {"agente": agente, "idea_id": idea_id, "skills": skills}, usados,
+        )
         if resultado:
-            logger.info("AI response (claude): ~%d output tokens, ~%d total", _estimate_tokens(resultado), input_tokens + _estimate_tokens(resultado))
+            if rc is not None:
+                rc.put(claves[backend], resultado, backend,
+                       model=CONFIG[_MODELO_POR_BACKEND[backend]], agent=agente)
             return resultado
-        resultado = pensar_con_gemini(full_prompt)
-        if resultado:
-            logger.info("AI response (gemini): ~%d output tokens, ~%d total", _estimate_tokens(resultado), input_tokens + _estimate_tokens(resultado))
-        return resultado
-    else:
-        resultado = pensar_con_gemini(full_prompt)
+
+    for i, backend in enumerate(cadena):
+        if backend in usados or not _backend_disponible(backend):
+            continue
+        if not health.allow(backend):
+            logger.info("AI: circuito %s abierto, se omite", backend)
+            continue
+        if i == 1:
+            logger.info("Ollama no respondio, intentando cloud (%s)...", fallback)
+        uso = _nuevo_uso(backend, prompt, sistema, agente, idea_id, skills)
+        resultado = _llamar_backend(backend, prompt, sistema, max_tokens, uso=uso)
+        _cerrar_uso(uso, resultado, "ok" if resultado else ("error" if uso.get("error_kind") else "empty"))
         if resultado:
-            logger.info("AI response (gemini): ~%d output tokens, ~%d total", _estimate_tokens(resultado), input_tokens + _estimate_tokens(resultado))
+            hedger.observe(backend, total=uso["wall_ms"] / 1000)
+            output_tokens = _estimate_tokens(resultado)
+            logger.info("AI response (%s): ~%d output tokens, ~%d total",
+                        backend, output_tokens, input_tokens + output_tokens)
+            if rc is not None:
+                rc.put(claves[backend], resultado, backend,
+                       model=CONFIG[_MODELO_POR_BACKEND[backend]], agent=agente)
             return resultado
-        resultado = pensar_con_claude(prompt, sistema=sistema, max_tokens=max_tokens)
-        if resultado:
-            logger.info("AI response (claude): ~%d output tokens, ~%d total", _estimate_tokens(resultado), input_tokens + _estimate_tokens(resultado))
-        return resultado
+    return ""
+
+
+# ── Motor async (varias peticiones en vuelo) ─────────────────────────────────
+
+async def _apensar_local(motor, prompt, sistema, max_tokens, uso):
+    payload = _payload_ollama(prompt, sistema, stream=False)
+    host = balanceador.acquire(CONFIG["local_model"])
+    inicio = time.monotonic()
+    kind = None
+    try:
+        r = await motor.client(host).post(_ollama_chat_url(host), json=payload)
+        r.raise_for_status()
+        data = r.json()
+    except asyncio.CancelledError:
+        kind = "cancelled"
+        raise
+    except Exception as e:
+        kind = clasificar_error(e)
+        raise
+    finally:
+        balanceador.release(host, ok=None if kind == "cancelled" else kind is None,
+                            latency=time.monotonic() - inicio, kind=kind, model=CONFIG["local_model"])
+    _uso_ollama(uso, data)
+    residencia.observe(host, data)
+    return _texto_ollama(data).strip()
+
+
+async def _apensar_gemini(motor, prompt, sistema, max_tokens, uso):
+    full_prompt = f"{sistema}\n\n{prompt}" if sistema else prompt
+    res = await cliente_gemini.aio.models.generate_content(
+        model=CONFIG["gemini_model"], contents=full_prompt
+    )
+    _uso_gemini(uso, res)
+    return res.text or ""
+
+
+def _claude_async(_key):
+    import anthropic
+    return anthropic.AsyncAnthropic(
+        api_key=CONFIG["anthropic_api_key"],
+        http_client=transport.async_client("https://api.anthropic.com"),
+    )
+
+
+async def _apensar_claude(motor, prompt, sistema, max_tokens, uso):
+    kwargs = {
+        "model": CONFIG["claude_model"],
+        "max_tokens": max_tokens,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    if sistema:
+        kwargs["system"] = _system_claude(sistema)
+    resp = await motor.client("claude", _claude_async).messages.create(**kwargs)
+    _uso_claude(uso, getattr(resp, "usage", None))
+    return resp.content[0].text if resp.content else ""
+
+
+async def _acerrar_uso(uso, texto, outcome):
+    """Cierre del registro de uso sin bloquear el loop con la escritura a SQLite."""
+    _cerrar_uso(uso, texto, outcome, registrar=False)
+    await asyncio.to_thread(_registrar_uso_y_liberar, uso)
+
+
+def _registrar_uso_y_liberar(uso):
+    """_registrar_uso desde un hilo del executor del loop, que no cierra su conexion.
+
+    Sin esto cada hilo del executor retiene la suya (en Postgres un checkout
+    del pool) mientras viva el motor.
+    """
+    try:
+        _registrar_uso(uso)
+    finally:
+        _liberar_conexion_db()
+
+
+motor_async = None
+_motor_lock = threading.Lock()
+
+
+def get_motor():
+    """Motor async compartido (se crea y arranca la primera vez)."""
+    global motor_async
+    if motor_async is not None:
+        return motor_async
+    with _motor_lock:
+        if motor_async is None:
+            backends = {"local": _apensar_local}
+            if cliente_gemini is not None:
+                backends["gemini"] = _apensar_gemini
+            if cliente_claude is not None:
+                backends["claude"] = _apensar_claude
+            limites = CONFIG["llm_concurrency"]
+            motor_async = AsyncEngine(
+                backends,
+                limits=limites,
+                timeouts={"local": CONFIG["ollama_timeout"]},
+                default_timeout=CONFIG["http_read_timeout"],
+                health=health,
+                usage=(lambda backend, prompt, sistema, meta: _nuevo_uso(backend, prompt, sistema, **meta),
+                       _acerrar_uso),
+                client_factory=lambda host: transport.async_client(
+                    host, read_timeout=CONFIG["ollama_timeout"], max_connections=max(limites.values())
+                ),
+            )
+            motor_async.start()
+    return motor_async
+
+
+def pensar_paralelo(prompts, sistema="", max_tokens=4096, fallback="gemini", agente="", timeout=None):
+    """Varios prompts a la vez por el motor async. Bloquea hasta tener todas las respuestas.
+
+    La concurrencia real la limita CONFIG['llm_concurrency'] por backend; cada
+    prompt sigue la misma cadena Ollama -> cloud que pensar().
+
+    Args:
+        timeout: Segundos para el lote completo; al vencer se cancela lo pendiente
+                 y se lanza concurrent.futures.TimeoutError.
+
+    Returns:
+        Lista de respuestas en el orden de `prompts` ('' las que fallaron).
+    """
+    for p in prompts:
+        _log_request(p, sistema)
+    return get_motor().pensar_muchos_sync(
+        list(prompts), timeout=timeout, sistema=sistema, max_tokens=max_tokens,
+        cadena=_cadena_backends(fallback), meta={"agente": agente},
+    )
+
+
+# ── Streaming ────────────────────────────────────────────────────────────────
+
+def _con_salud(backend, chunks, uso=None):
+    """Envuelve un generador de chunks registrando exito/fallo en `health`.
+
+    Cortar el stream desde fuera (close) cuenta como exito: el backend respondio.
+    """
+    inicio = time.monotonic()
+    try:
+        for chunk in chunks:
+            yield chunk
+    except GeneratorExit:
+        health.record_success(backend, time.monotonic() - inicio)
+        raise
+    except Exception as e:
+        kind = clasificar_error(e)
+        health.record_failure(backend, kind, time.monotonic() - inicio, e)
+        if uso is not None:
+            uso["error_kind"] = kind
+        raise
+    else:
+        health.record_success(backend, time.monotonic() - inicio)
+    finally:
+        chunks.close()
+
+
+def _chunks_local(prompt, sistema="", uso=None, al_cancelar=None):
+    payload = _payload_ollama(prompt, sistema, stream=True)
+    host = balanceador.acquire(CONFIG["local_model"])
+    inicio = time.monotonic()
+    ok, latencia = None, None
+    # Con al_cancelar (carrera de hedging) la conexion se corta al cancelar,
+    # aunque Ollama todavia no haya mandado nada: no ocupa el pool hasta el timeout
+    conexiones, cortada = [], []
+    conexiones_lock = threading.Lock()
+
+    def _tomar(conn):
+        with conexiones_lock:
+            conexiones.append(conn)
+
+    def _cortar():
+        with conexiones_lock:
+            cortada.append(True)
+            for conn in conexiones:
+                abortar_conexion(conn)
+
+    if al_cancelar is not None:
+        al_cancelar(_cortar)
+        if cortada:
+            balanceador.release(host, ok=None)
+            return
+    try:
+        r = transport.post(_ollama_chat_url(host), json=payload, timeout=CONFIG["ollama_timeout"],
+                           verify=False, stream=True, on_conn=_tomar)
+        try:
+            r.raise_for_status()
+            for linea in r.iter_lines():
+                if not linea:
+                    continue
+                data = json.loads(linea)
+                if data.get("error"):
+                    raise RuntimeError(f"Ollama: {data['error']}")
+                texto = _texto_ollama(data)
+                if texto:
+                    ok = True   # cortar despues del primer token no es culpa del host
+                    yield texto
+                if data.get("done"):
+                    _uso_ollama(uso, data)
+                    residencia.observe(host, data)
+                    latencia = time.monotonic() - inicio
+                    break
+            ok = True
+        finally:
+            with conexiones_lock:
+                conexiones.clear()   # vuelve al pool: ya no es nuestra para cortarla
+            r.close()
+    except Exception as e:
+        if cortada:
+            return   # cancelada por la carrera: no es un fallo del host
+        ok = False
+        balanceador.release(host, ok=False, kind=clasificar_error(e))
+        raise
+    finally:
+        with conexiones_lock:
+            conexiones.clear()
+        if ok is not False:
+            balanceador.release(host, ok=ok, latency=latencia, model=CONFIG["local_model"])
+
+
+def _chunks_gemini(prompt, modelo=None, uso=None):
+    for chunk in cliente_gemini.models.generate_content_stream(
+        model=modelo or CONFIG["gemini_model"], contents=prompt
+    ):
+        _uso_gemini(uso, chunk)  # el ultimo chunk trae los totales
+        yield chunk.text or ""
+
+
+def _chunks_claude(prompt, sistema="", modelo=None, max_tokens=4096, uso=None):
+    kwargs = {
+        "model": modelo or CONFIG["claude_model"],
+        "max_tokens": max_tokens,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    if sistema:
+        kwargs["system"] = _system_claude(sistema)
+    with cliente_claude.messages.stream(**kwargs) as stream:
+        try:
+            for texto in stream.text_stream:
+                yield texto
+        finally:
+            # Tambien si se corto antes: el snapshot tiene el usage acumulado
+            snapshot = getattr(stream, "current_message_snapshot", None)
+            _uso_claude(uso, getattr(snapshot, "usage", None))
+
+
+def stream_con_local(prompt, sistema="", uso=None, al_cancelar=None):
+    """Streaming via Ollama (NDJSON de /api/chat). Lanza excepcion si falla.
+
+    `al_cancelar(fn)` registra como cortar la conexion (ver llm.hedging.Cancelacion).
+    """
+    return _con_salud("local", _chunks_local(prompt, sistema, uso, al_cancelar), uso)
+
+
+def stream_con_gemini(prompt, modelo=None, uso=None):
+    """Streaming con Gemini. Lanza excepcion si falla."""
+    return _con_salud("gemini", _chunks_gemini(prompt, modelo, uso), uso)
+
+
+def stream_con_claude(prompt, sistema="", modelo=None, max_tokens=4096, uso=None):
+    """Streaming con Claude. Lanza excepcion si falla."""
+    return _con_salud("claude", _chunks_claude(prompt, sistema, modelo, max_tokens, uso), uso)
+
+
+def _backend_disponible(backend):
+    if backend == "gemini":
+        return cliente_gemini is not None
+    if backend == "claude":
+        return cliente_claude is not None
+    return True
+
+
+def _stream_backend(backend, prompt, sistema, max_tokens, uso=None, al_cancelar=None):
+    """Stream de `backend`. Solo Ollama usa `al_cancelar`: los SDK cloud se cortan en su siguiente chunk."""
+    full_prompt = f"{sistema}\n\n{prompt}" if sistema else prompt
+    if backend == "local":
+        return stream_con_local(prompt, sistema=sistema, uso=uso, al_cancelar=al_cancelar)
+    if backend == "claude":
+        return stream_con_claude(prompt, sistema=sistema, max_tokens=max_tokens, uso=uso)
+    return stream_con_gemini(full_prompt, uso=uso)
+
+
+# ── Hedging (cobertura entre backends) ───────────────────────────────────────
+
+hedger = Hedger(CONFIG["llm_hedge"], default_delay=CONFIG["llm_hedge_delay"])
+
+
+def _pensar_con_cobertura(cadena, politica, prompt, sistema, max_tokens, parar, on_progress, meta, usados):
+    """Carrera primario vs respaldo (ver llm/hedging.py) en streaming.
+
+    Los backends que entran en la carrera se agregan a `usados` para que el
+    loop normal de pensar() no los repita si ninguno responde.
+
+    Returns:
+        (texto, backend) o ('', None).
+    """
+    def _proximo():
+        for b in cadena:
+            if b not in usados and _backend_disponible(b) and health.allow(b):
+                usados.add(b)
+                return b
+        return None
+
+    primario = _proximo()
+    if primario is None:
+        return "", None
+
+    lider = []   # el primero en dar un token es el que alimenta on_progress
+    lider_lock = threading.Lock()
+    cancelado = []   # Cancelado del on_progress del lider: corta tambien al otro backend
+    condiciones = ([parar] if callable(parar) else list(parar or [])) + [lambda texto, desde=0: bool(cancelado)]
+
+    def _lanzar(backend, cancel, primer_token):
+        def _marcar_lider():
+            with lider_lock:
+                if not lider:
+                    lider.append(backend)
+
+        progreso = None
+        if on_progress:
+            progreso = Progreso(lambda t: on_progress(t) if lider[:1] == [backend] else None,
+                                CONFIG["stream_flush_s"])
+        uso = _nuevo_uso(backend, prompt, sistema, **meta)
+        inicio = uso["_inicio"]
+        chunks = cancelable(_stream_backend(backend, prompt, sistema, max_tokens, uso=uso,
+                                            al_cancelar=cancel.al_cancelar),
+                            cancel, primer_token, on_first=_marcar_lider)
+        try:
+            res = consumir(chunks, condiciones, progreso)
+            if isinstance(res.error, Cancelado):
+                cancelado.append(res.error)
+            if cancel.is_set() or cancelado:
+                outcome = "cancelled"
+            elif res.error is not None:
+                outcome = "error"
+            elif not res.texto.strip():
+                outcome = "empty"
+            else:
+                outcome = "stopped" if res.detenido else "ok"
+            # Un primario cancelado sin tokens aporta su espera como TTFT (cota inferior)
+            ttft = res.ttft if res.ttft is not None else (
+                time.monotonic() - inicio if outcome == "cancelled" else None)
+            _cerrar_uso(uso, res.texto, outcome, ttft=ttft)
+            hedger.observe(backend, ttft=ttft, total=uso["wall_ms"] / 1000 if outcome == "ok" else None)
+            return res.texto if outcome in ("ok", "stopped") else ""
+        finally:
+            _liberar_conexion_db()
+
+    delay = hedger.delay_for(primario, politica)
+    texto, ganador = hedger.carrera(meta.get("agente"), primario, _lanzar, _proximo, delay)
+    if cancelado:
+        raise cancelado[0]
+    if texto and on_progress:
+        try:
+            on_progress(texto)
+        except Cancelado:
+            raise
+        except Exception as e:
+            logger.warning("Streaming: fallo el flush de progreso — %s", e)
+    return texto, ganador
+
+
+def _liberar_conexion_db():
+    """Cierra la conexion SQLite del hilo actual (los hilos de la carrera son efimeros)."""
+    if not CONFIG["llm_ledger"]:
+        return
+    try:
+        from db.connection import close_connection
+        close_connection()
+    except Exception:
+        pass
+
+
+def pensar_streaming(prompt, sistema="", max_tokens=4096, fallback="gemini", agente="",
+                     cache=None, parar=None, on_progress=None, idea_id=None, skills=None):
+    """Como pensar(), pero genera en streaming con parada temprana y progreso.
+
+    Args:
+        parar:       Condicion(es) de llm.streaming (ej. hasta_fin_archivos()) que
+                     cortan la generacion en cuanto se cumplen.
+        on_progress: callback(texto_parcial) llamado cada CONFIG['stream_flush_s']
+                     segundos (ej. para volcar a ideas.execution_output). Si lanza
+                     llm.streaming.Cancelado la generacion se corta y se propaga.
+
+    Returns:
+        str con la respuesta (posiblemente cortada por `parar`), o '' si todo falla.
+        Una respuesta interrumpida por error se descarta y se prueba el siguiente backend.
+    """
+    input_tokens = _log_request(prompt, sistema)
+    cadena = _cadena_backends(fallback)
+    rc = _abrir_cache(cache)
+    inicio_cache = _nuevo_uso(cadena[0], prompt, sistema, agente, idea_id, skills)
+    cacheado, backend_cache, claves = _buscar_en_cache(rc, cadena, prompt, sistema, max_tokens)
+    if cacheado:
+        inicio_cache.update(backend=backend_cache, model=CONFIG[_MODELO_POR_BACKEND[backend_cache]])
+        _cerrar_uso(inicio_cache, cacheado, "cache")
+        return cacheado
+
+    usados = set()
+    politica = hedger.politica(agente)
+    if politica is not None:
+        texto, backend = _pensar_con_cobertura(
+            cadena, politica, prompt, sistema, max_tokens, parar, on_progress,
+            {"agente": agente, "idea_id": idea_id, "skills": skills}, usados,
+        )
+        if texto:
+            if rc is not None:
+                rc.put(claves[backend], texto, backend,
+                       model=CONFIG[_MODELO_POR_BACKEND[backend]], agent=agente)
+            return texto
+
+    for backend in cadena:
+        if backend in usados or not _backend_disponible(backend) or not health.allow(backend):
+            continue
+        progreso = Progreso(on_progress, CONFIG["stream_flush_s"]) if on_progress else None
+        uso = _nuevo_uso(backend, prompt, sistema, agente, idea_id, skills)
+        res = consumir(_stream_backend(backend, prompt, sistema, max_tokens, uso=uso), parar, progreso)
+        if isinstance(res.error, Cancelado):
+            _cerrar_uso(uso, res.texto, "cancelled", ttft=res.ttft)
+            raise res.error
+        if res.error is not None:
+            _cerrar_uso(uso, res.texto, "error", ttft=res.ttft)
+            logger.warning("AI stream (%s) fallo tras %d chars: %s", backend, len(res.texto), res.error)
+            continue
+        if not res.texto.strip():
+            _cerrar_uso(uso, res.texto, "empty", ttft=res.ttft)
+            continue
+        _cerrar_uso(uso, res.texto, "stopped" if res.detenido else "ok", ttft=res.ttft)
+        hedger.observe(backend, ttft=res.ttft, total=None if res.detenido else uso["wall_ms"] / 1000)
+        if progreso is not None:
+            progreso.final(res.texto)
+        output_tokens = _estimate_tokens(res.texto)
+        logger.info("AI response (%s, stream%s): ~%d output tokens, ~%d total",
+                    backend, ", parada temprana" if res.detenido else "",
+                    output_tokens, input_tokens + output_tokens)
+        if rc is not None:
+            rc.put(claves[backend], res.texto, backend,
+                   model=CONFIG[_MODELO_POR_BACKEND[backend]], agent=agente)
+        return res.texto
+    return ""
+
+
+# ── Identidad del worker (leases de tareas) ─────────────────────────────────
+
+def worker_id(agente):
+    """Dueno de un lease: 'DEV@host:pid', distinto por agente y proceso."""
+    return f"{agente}@{socket.gethostname()}:{os.getpid()}"
+
+
+def lease_perdido(db, idea_id, worker):
+    """Renueva el lease de `worker`; True si otro worker ya tomo la idea.
+
+    El agente debe abandonar la tarea sin escribir su resultado: la idea ya
+    es de otro.
+    """
+    from db import queries
+    if queries.renew_lease(db, idea_id, worker, CONFIG["lease_seconds"]):
+        return False
+    agente = worker.split("@", 1)[0]
+    log(agente, f"#{idea_id} lease perdido — otro worker la tomo, se descarta el resultado", "!")
+    logger.warning("Lease perdido: #%s (%s)", idea_id, worker)
+    return True
 
 
 # ── Utilidades de consola ────────────────────────────────────────────────────
@@ -240,7 +1197,7 @@ def enviar_telegram(mensaje):
     if not bot_token or not chat_id:
         return
     try:
-        requests.post(
+        transport.post(
             f"https://api.telegram.org/bot{bot_token}/sendMessage",
             json={"chat_id": chat_id, "text": mensaje, "parse_mode": "HTML"},
             timeout=10,
@@ -248,3 +1205,7 @@ def enviar_telegram(mensaje):
         logger.info("Telegram enviado: %s", mensaje[:60])
     except Exception as e:
         logger.debug("Telegram no disponible: %s", e)
+
+
+# Los agentes notifican con este nombre (antes WhatsApp via Twilio).
+enviar_whatsapp = enviar_telegram
@@ -0,0 +1,192 @@
+"""
+Content-addressed, compressed store for execution artifacts.
+
+DEV / CONSULTING outputs, BUILDER build reports and QA / REVIEWER reviews
+used to live concatenated in ideas.execution_output: every stage rewrote
+the whole TEXT value in the shared WAL database and every fetch of the
+column dragged it into Python. With the store enabled each artifact is
+written once, compressed, to
+
+    <root>/<first 2 hex chars>/<sha256 of the text>.z    (zlib)
+                                                   .xz   (lzma)
+
+and the idea only keeps a short stub (summary + reference) in
+execution_output plus one idea_artifacts row per artifact — see the
+Artifacts section of db/queries.py, whose get_execution_output assembles
+the old concatenated text for the dashboard and the reviewers.
+
+Identical texts share one file; files are written to a temp name and
+renamed, so a reader never sees half a blob.
+"""
+import hashlib
+import lzma
+import os
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+
+# codec -> (file suffix, compress, decompressor factory)
+CODECS = {
+    "zlib": (".z", lambda data: zlib.compress(data, 6), zlib.decompressobj),
+    "lzma": (".xz", lambda data: lzma.compress(data, preset=6), lzma.LZMADecompressor),
+}
+
+SETTINGS = {
+    # Same default as CONFIG["artifacts_dir"], so `python -m db.artifacts` finds the blobs
+    "root": os.getenv("ARTIFACTS_DIR", str(Path(__file__).resolve().parent.parent / "data" / "artifacts")),
+    "codec": "zlib",
+    "enabled": False,            # new outputs go to the store (ideas that already have artifacts always do)
+    "summary_chars": 400,        # text kept in execution_output per artifact
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class BlobStore:
+    """Compressed blobs on disk, named by the SHA-256 of their text."""
+
+    def __init__(self, root, codec="zlib"):
+        if codec not in CODECS:
+            raise ValueError(f"codec must be one of {', '.join(CODECS)}")
+        self.root = Path(root)
+        self.codec = codec
+
+    def put(self, text):
+        """Store `text` (if not already there) and return its reference.
+
+        Returns:
+            (ref, stored_bytes) — stored_bytes is the size of the file on disk.
+        """
+        data = text.encode("utf-8")
+        ref = hashlib.sha256(data).hexdigest()
+        existing = self._find(ref)
+        if existing is not None:
+            # Refresh the mtime: gc's age guard must cover this new reference too,
+            # or a sweep racing with the caller's row insert could delete the blob
+            os.utime(existing)
+            return ref, existing.stat().st_size
+        suffix, compress, _ = CODECS[self.codec]
+        path = self._path(ref, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        packed = compress(data)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(packed)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return ref, len(packed)
+
+    def get(self, ref, max_chars=None):
+        """Text of `ref`; with max_chars only enough of the blob to cover that prefix is inflated."""
+        path = self._find(ref)
+        if path is None:
+            raise FileNotFoundError(f"artifact {ref} not found under {self.root}")
+        codec = next(name for name, (suffix, _, _) in CODECS.items() if path.suffix == suffix)
+        decompressor = CODECS[codec][2]()
+        data = path.read_bytes()
+        if max_chars is None:
+            return decompressor.decompress(data).decode("utf-8")
+        if max_chars <= 0:
+            return ""
+        # UTF-8 is at most 4 bytes per character; cut characters split at the edge
+        raw = decompressor.decompress(data, int(max_chars) * 4)
+        return raw.decode("utf-8", errors="ignore")[:max_chars]
+
+    def exists(self, ref):
+        return self._find(ref) is not None
+
+    def gc(self, referenced, older_than=0):
+        """Delete blobs whose reference is not in `referenced` and older than `older_than` seconds.
+
+        Returns:
+            (files removed, bytes reclaimed)
+        """
+        referenced = set(referenced)
+        cutoff = time.time() - older_than
+        removed = reclaimed = 0
+        for path in self._blobs():
+            if path.stem not in referenced and path.stat().st_mtime <= cutoff:
+                reclaimed += path.stat().st_size
+                path.unlink()
+                removed += 1
+        return removed, reclaimed
+
+    def stats(self):
+        """{blobs, bytes} currently on disk."""
+        sizes = [p.stat().st_size for p in self._blobs()]
+        return {"blobs": len(sizes), "bytes": sum(sizes)}
+
+    def _path(self, ref, suffix):
+        return self.root / ref[:2] / (ref + suffix)
+
+    def _find(self, ref):
+        for suffix, _, _ in CODECS.values():
+            path = self._path(ref, suffix)
+            if path.exists():
+                return path
+        return None
+
+    def _blobs(self):
+        if not self.root.exists():
+            return []
+        suffixes = {suffix for suffix, _, _ in CODECS.values()}
+        return [p for p in self.root.glob("??/*") if p.suffix in suffixes]
+
+
+def configure(**settings):
+    """Update SETTINGS (root, codec, enabled, summary_chars); the store is reopened on next use."""
+    global _store
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown artifact settings: {', '.join(sorted(unknown))}")
+    if settings.get("codec", SETTINGS["codec"]) not in CODECS:
+        raise ValueError(f"codec must be one of {', '.join(CODECS)}")
+    with _store_lock:
+        SETTINGS.update(settings)
+        _store = None
+
+
+def store():
+    """The BlobStore for SETTINGS (created on first use)."""
+    global _store
+    if _store is not None:
+        return _store
+    with _store_lock:
+        if _store is None:
+            _store = BlobStore(SETTINGS["root"], SETTINGS["codec"])
+        return _store
+
+
+def summarize(text, limit=None):
+    """First `limit` characters of `text`, cut at a line break when there is one."""
+    limit = SETTINGS["summary_chars"] if limit is None else limit
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    if "\n" in cut:
+        cut = cut[:cut.rindex("\n")]
+    return cut.rstrip() + " …"
+
+
+if __name__ == "__main__":
+    import sys
+
+    from db import queries
+    from db.connection import get_connection
+
+    conn = get_connection()
+    if sys.argv[1:] == ["gc"]:
+        removed, reclaimed = queries.collect_artifact_garbage(conn)
+        print(f"Artefactos huerfanos borrados: {removed} ({reclaimed / 1024:.1f} KB)")
+    elif len(sys.argv) == 2 and sys.argv[1].isdigit():
+        text, _ = queries.get_execution_output(conn, int(sys.argv[1]))
+        sys.stdout.write(text + "\n")
+    else:
+        print("Uso: python -m db.artifacts <idea_id> | gc")
+        sys.exit(2)
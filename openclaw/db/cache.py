@@ -0,0 +1,191 @@
+"""
+Read-through cache for reference data (context items, users, areas).
+
+CONSULTING reads get_context_string on every task and get_users /
+get_areas are full-table reads of data that changes a few times a day.
+Functions decorated with reference_cache.cached(signature_sql) keep their
+last result per connection and only re-run the query when it may have
+changed:
+
+  1. SQLite fast path: PRAGMA data_version (moves when another connection
+     commits) plus the connection's own total_changes. If neither moved
+     since the entry was last validated, it is served without touching
+     the table.
+  2. Otherwise (and always on Postgres) the entry's signature query runs,
+     e.g. COUNT(*) / MAX(last_updated) of the table; same signature, same
+     result.
+
+Edits the signature cannot see (an in-place UPDATE of users.role, a
+context item rewritten twice within the same second by the dashboard) are
+bounded by the TTL ceiling; writers in this process call invalidate().
+Entries are LRU-bounded; stats() reports hit ratio and the query time
+saved.
+"""
+import functools
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+
+class ReferenceCache:
+    """Per-connection memo of reference queries, invalidated by a cheap signature."""
+
+    def __init__(self, max_entries=128, ttl=300.0, enabled=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries = OrderedDict()   # (id(conn), name, args) -> _Entry
+        self._lock = threading.Lock()
+        self._stats = {}                # name -> counters
+
+    def configure(self, max_entries=None, ttl=None, enabled=None):
+        """Change the limits; shrinking max_entries evicts right away."""
+        with self._lock:
+            if max_entries is not None:
+                if max_entries < 0:
+                    raise ValueError("max_entries must be >= 0")
+                self.max_entries = max_entries
+            if ttl is not None:
+                self.ttl = ttl
+            if enabled is not None:
+                self.enabled = enabled
+            self._evict()
+
+    def cached(self, signature_sql):
+        """Decorator for `fn(db, *args)`; `signature_sql` returns one row that changes with the data.
+
+        The undecorated function stays reachable as fn.__wrapped__.
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(db, *args):
+                return self.get(db, fn.__name__, lambda: fn(db, *args), signature_sql, args)
+            return wrapper
+        return decorator
+
+    def get(self, db, name, load, signature_sql, args=()):
+        """Cached result of `load()` for (db, name, args), re-running it if the signature moved."""
+        if not self.enabled or self.max_entries == 0:
+            return load()
+        start = time.perf_counter()
+        key = (id(db), name, args)
+        version = _fast_version(db)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            counters = self._counters(name)
+            if entry is not None and entry.owner() is not db:
+                del self._entries[key]      # a new connection that got a dead one's id
+                entry = None
+            if entry is not None and now - entry.stored_at >= self.ttl:
+                del self._entries[key]
+                counters["expirations"] += 1
+                entry = None
+            if entry is not None and version is not None and version == entry.version:
+                return self._hit(key, entry, counters, start)
+        signature = tuple(db.execute(signature_sql).fetchone())
+        with self._lock:
+            entry = self._entries.get(key)
+            counters = self._counters(name)
+            if entry is not None and entry.owner() is db and entry.signature == signature:
+                entry.version = version
+                return self._hit(key, entry, counters, start)
+            if entry is not None:
+                counters["invalidations"] += 1
+        loaded = time.perf_counter()
+        value = load()
+        load_ms = (time.perf_counter() - loaded) * 1000
+        with self._lock:
+            self._counters(name)["misses"] += 1
+            self._entries[key] = _Entry(_owner_ref(db), value, signature, version, now, load_ms)
+            self._entries.move_to_end(key)
+            self._evict()
+        return _copy(value)
+
+    def invalidate(self, name):
+        """Drop every entry of `name` (for writers that know they changed its data)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == name]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """{hits, misses, hit_ratio, saved_ms, invalidations, expirations, evictions,
+        entries, by_query: {name: counters}}."""
+        with self._lock:
+            by_query = {name: dict(c) for name, c in self._stats.items()}
+            entries = len(self._entries)
+        total = {k: sum(c[k] for c in by_query.values())
+                 for k in ("hits", "misses", "invalidations", "expirations", "evictions")}
+        total["saved_ms"] = round(sum(c["saved_ms"] for c in by_query.values()), 3)
+        lookups = total["hits"] + total["misses"]
+        total["hit_ratio"] = round(total["hits"] / lookups, 3) if lookups else 0.0
+        total["entries"] = entries
+        total["by_query"] = by_query
+        return total
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+    def _counters(self, name):
+        counters = self._stats.get(name)
+        if counters is None:
+            counters = self._stats[name] = {"hits": 0, "misses": 0, "invalidations": 0,
+                                            "expirations": 0, "evictions": 0, "saved_ms": 0.0}
+        return counters
+
+    def _hit(self, key, entry, counters, start):
+        self._entries.move_to_end(key)
+        counters["hits"] += 1
+        counters["saved_ms"] += max(entry.load_ms - (time.perf_counter() - start) * 1000, 0.0)
+        return _copy(entry.value)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            (_, name, _), _ = self._entries.popitem(last=False)
+            self._counters(name)["evictions"] += 1
+
+
+class _Entry:
+    __slots__ = ("owner", "value", "signature", "version", "stored_at", "load_ms")
+
+    def __init__(self, owner, value, signature, version, stored_at, load_ms):
+        self.owner = owner
+        self.value = value
+        self.signature = signature
+        self.version = version
+        self.stored_at = stored_at
+        self.load_ms = load_ms
+
+
+def _owner_ref(db):
+    """Callable returning the entry's connection, so a reused id() is never mistaken for it.
+
+    Weak where possible (CountingConnection, PgConnection); a plain
+    sqlite3.Connection cannot be weakly referenced and is kept alive by its
+    entries until they are evicted.
+    """
+    try:
+        return weakref.ref(db)
+    except TypeError:
+        return lambda: db
+
+
+def _fast_version(db):
+    """(data_version, total_changes) on SQLite, None where there is no such counter."""
+    if getattr(db, "dialect", "sqlite") != "sqlite":
+        return None
+    return db.execute("PRAGMA data_version").fetchone()[0], db.total_changes
+
+
+def _copy(value):
+    # Callers may append to the row list; the cached one must not change
+    return list(value) if isinstance(value, list) else value
+
+
+reference_cache = ReferenceCache()
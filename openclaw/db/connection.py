@@ -4,12 +4,28 @@ Connects to the SAME database as the SecondBrain dashboard.
 Uses WAL mode for concurrent access (dashboard Node.js + OpenClaw Python).
 
 Each thread gets its own connection to avoid SQLite threading issues.
+Stats / monitoring code can ask for a separate read connection
+(get_read_connection) opened with PRAGMA query_only.
+
+Every connection opened here is tracked in a registry, so close_all()
+really closes them (including those of threads that never called
+close_connection()) and connection_stats() can report per-connection
+counters. PRAGMAs come from PROFILE.
+
+PROFILE["backend"] = "postgres" switches every get_connection() to the
+dashboard's PostgreSQL database: each thread checks a connection out of a
+bounded pool (see db/postgres.py) and close_connection() gives it back.
+SQLite stays the default.
 """
 import os
 import sqlite3
 import threading
+import time
+import weakref
 from pathlib import Path
 
+from db.slowlog import query_log
+
 _local = threading.local()
 _db_path = None
 _path_lock = threading.Lock()
@@ -17,6 +33,120 @@ _path_lock = threading.Lock()
 # For testing: injected connection overrides per-thread connections
 _test_db = None
 
+# Connection profile (see configure()). cache_kb / mmap_mb of 0 keep SQLite's default.
+PROFILE = {
+    "cache_kb": 16384,          # PRAGMA cache_size = -cache_kb (page cache per connection)
+    "mmap_mb": 64,              # PRAGMA mmap_size: reads straight from the OS page cache
+    "temp_store": "memory",     # sorts / temp B-trees in RAM instead of temp files
+    "cached_statements": 256,   # sqlite3 prepared-statement cache per connection
+    "busy_timeout_ms": 5000,
+    "backend": "sqlite",        # or "postgres" (db/postgres.py, PG_* env like the dashboard)
+    "pool_max": 10,             # postgres: connections in the pool
+    "prepare_threshold": 2,     # postgres: runs of a statement before it is prepared server-side
+}
+
+_BACKENDS = ("sqlite", "postgres")
+
+_TEMP_STORES = {"default": 0, "file": 1, "memory": 2}
+
+# BEGIN IMMEDIATE only waits for the write lock, so any time above this is a busy wait
+_BUSY_WAIT_S = 0.001
+
+# id(conn) -> conn for every live connection. Weak, so a thread that dies
+# without close_connection() still lets its connection be collected.
+_registry = weakref.WeakValueDictionary()
+_registry_lock = threading.Lock()
+_generation = 0                # bumped by close_all(); stale thread-locals reconnect
+_pg_pool = None                # db.postgres.Pool, created on first use
+
+
+class CountingConnection(sqlite3.Connection):
+    """sqlite3.Connection that counts its statements and lock waits.
+
+    Counters (read with connection_stats()):
+      statements:  execute / executemany / executescript calls
+      busy_waits:  BEGIN IMMEDIATE calls that had to wait for the write lock
+      busy_wait_s: total time spent in those waits
+      busy_errors: statements that gave up with "database is locked"
+    """
+
+    dialect = "sqlite"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.role = "rw"
+        self.thread_name = threading.current_thread().name
+        self.opened_at = time.time()
+        self.statements = 0
+        self.busy_waits = 0
+        self.busy_wait_s = 0.0
+        self.busy_errors = 0
+
+    def execute(self, sql, parameters=()):
+        self.statements += 1
+        if sql.lstrip()[:15].upper() == "BEGIN IMMEDIATE":
+            inicio = time.perf_counter()
+            try:
+                return self._counted(super().execute, sql, parameters)
+            finally:
+                espera = time.perf_counter() - inicio
+                if espera > _BUSY_WAIT_S:
+                    self.busy_waits += 1
+                    self.busy_wait_s += espera
+        if query_log.enabled:
+            inicio = time.perf_counter()
+            cursor = self._counted(super().execute, sql, parameters)
+            query_log.observe(sql, parameters, time.perf_counter() - inicio,
+                              lambda: self._plan(sql, parameters))
+            return cursor
+        return self._counted(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self.statements += 1
+        if query_log.enabled:
+            inicio = time.perf_counter()
+            cursor = self._counted(super().executemany, sql, seq_of_parameters)
+            query_log.observe(sql, None, time.perf_counter() - inicio)
+            return cursor
+        return self._counted(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        self.statements += 1
+        return self._counted(super().executescript, sql_script)
+
+    def _counted(self, fn, *args):
+        try:
+            return fn(*args)
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e) or "busy" in str(e):
+                self.busy_errors += 1
+            raise
+
+    def _plan(self, sql, parameters):
+        """EXPLAIN QUERY PLAN detail lines of `sql` (for the slow-query log)."""
+        rows = sqlite3.Connection.execute(self, "EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        return [row[3] for row in rows]
+
+    def close(self):
+        unregister(self)
+        super().close()
+
+
+def configure(**profile):
+    """Update PROFILE (cache_kb, mmap_mb, temp_store, cached_statements, busy_timeout_ms,
+    backend, pool_max, prepare_threshold).
+
+    Applies to connections opened afterwards.
+    """
+    unknown = set(profile) - set(PROFILE)
+    if unknown:
+        raise ValueError(f"Unknown connection settings: {', '.join(sorted(unknown))}")
+    if profile.get("temp_store", "default") not in _TEMP_STORES:
+        raise ValueError(f"temp_store must be one of {', '.join(_TEMP_STORES)}")
+    if profile.get("backend", "sqlite") not in _BACKENDS:
+        raise ValueError(f"backend must be one of {', '.join(_BACKENDS)}")
+    PROFILE.update(profile)
+
 
 def _resolve_db_path():
     """Resolve and cache the database path (once, thread-safe)."""
@@ -42,14 +172,71 @@ def _resolve_db_path():
         return _db_path
 
 
-def _create_connection(path):
-    """Create a new SQLite connection with standard PRAGMAs."""
-    conn = sqlite3.connect(path, check_same_thread=False)
+def _create_connection(path, read_only=False, profile=None):
+    """Create a new SQLite connection with the PRAGMAs of `profile` (default PROFILE).
+
+    read_only=True adds PRAGMA query_only, so a stray write on a
+    monitoring connection fails instead of taking the write lock.
+    """
+    p = {**PROFILE, **(profile or {})}
+    conn = sqlite3.connect(path, check_same_thread=False, factory=CountingConnection,
+                           cached_statements=p["cached_statements"])
     conn.row_factory = sqlite3.Row
+    conn.path = path
     conn.execute("PRAGMA journal_mode = WAL")
     conn.execute("PRAGMA synchronous = NORMAL")
-    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute(f"PRAGMA busy_timeout = {int(p['busy_timeout_ms'])}")
     conn.execute("PRAGMA foreign_keys = ON")
+    if p["cache_kb"]:
+        conn.execute(f"PRAGMA cache_size = {-int(p['cache_kb'])}")
+    if p["mmap_mb"]:
+        conn.execute(f"PRAGMA mmap_size = {int(p['mmap_mb']) * 1024 * 1024}")
+    conn.execute(f"PRAGMA temp_store = {_TEMP_STORES[p['temp_store']]}")
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+        conn.role = "ro"
+    _register(conn)
+    return conn
+
+
+def _postgres_pool():
+    """The process-wide PostgreSQL pool, created from PROFILE on first use."""
+    global _pg_pool
+    with _path_lock:
+        if _pg_pool is None:
+            from db import postgres
+            _pg_pool = postgres.Pool(
+                postgres.conninfo_from_env(),
+                max_size=PROFILE["pool_max"],
+                timeout=PROFILE["busy_timeout_ms"] / 1000,
+                prepare_threshold=PROFILE["prepare_threshold"],
+                cached_statements=PROFILE["cached_statements"],
+                busy_timeout_ms=PROFILE["busy_timeout_ms"],
+            )
+        return _pg_pool
+
+
+def _register(conn):
+    with _registry_lock:
+        _registry[id(conn)] = conn
+
+
+def unregister(conn):
+    """Drop a connection from the registry (called by its close())."""
+    with _registry_lock:
+        _registry.pop(id(conn), None)
+
+
+def _thread_connection(attr, read_only):
+    entry = getattr(_local, attr, None)
+    if entry is not None and entry[1] == _generation:
+        return entry[0]
+    if PROFILE["backend"] == "postgres":
+        conn = _postgres_pool().acquire(read_only=read_only)
+        _register(conn)
+    else:
+        conn = _create_connection(_resolve_db_path(), read_only=read_only)
+    setattr(_local, attr, (conn, _generation))
     return conn
 
 
@@ -62,30 +249,73 @@ def get_connection():
     # Test mode: return injected connection
     if _test_db is not None:
         return _test_db
+    return _thread_connection('conn', read_only=False)
 
-    # Thread-local connection
-    conn = getattr(_local, 'conn', None)
-    if conn is not None:
-        return conn
 
-    path = _resolve_db_path()
-    _local.conn = _create_connection(path)
-    return _local.conn
+def get_read_connection():
+    """Get the current thread's read-only connection (PRAGMA query_only).
+
+    For stats and monitoring: it never holds the write lock, and its
+    counters are reported apart from the agents' read-write connection.
+    """
+    if _test_db is not None:
+        return _test_db
+    return _thread_connection('read_conn', read_only=True)
 
 
 def close_connection():
-    """Close the current thread's connection. Call from each thread on shutdown."""
-    conn = getattr(_local, 'conn', None)
-    if conn is not None:
-        conn.close()
-        _local.conn = None
+    """Close the current thread's connections. Call from each thread on shutdown."""
+    for attr in ('conn', 'read_conn'):
+        entry = getattr(_local, attr, None)
+        if entry is not None:
+            entry[0].close()
+            setattr(_local, attr, None)
 
 
 def close_all():
-    """Reset path cache. Individual threads should call close_connection()."""
-    global _db_path
+    """Close every registered connection (any thread) and reset the path cache.
+
+    With the postgres backend the pool is closed too. Threads that keep
+    running get a fresh connection on their next get_connection().
+
+    Returns:
+        Number of connections closed.
+    """
+    global _db_path, _generation, _pg_pool
+    with _registry_lock:
+        conns = list(_registry.values())
+        _generation += 1
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.ProgrammingError:
+            pass
     with _path_lock:
         _db_path = None
+        pool, _pg_pool = _pg_pool, None
+    if pool is not None:
+        pool.close()
+    return len(conns)
+
+
+def connection_stats():
+    """Counters of every live connection, in opening order.
+
+    Returns:
+        [{thread, role, age_s, statements, busy_waits, busy_wait_s, busy_errors}]
+    """
+    with _registry_lock:
+        conns = sorted(_registry.values(), key=lambda c: c.opened_at)
+    now = time.time()
+    return [{
+        "thread": c.thread_name,
+        "role": c.role,
+        "age_s": round(now - c.opened_at),
+        "statements": c.statements,
+        "busy_waits": c.busy_waits,
+        "busy_wait_s": round(c.busy_wait_s, 3),
+        "busy_errors": c.busy_errors,
+    } for c in conns]
 
 
 def reset_connection():
@@ -94,6 +324,7 @@ def reset_connection():
     _test_db = None
     _db_path = None
     _local.conn = None
+    _local.read_conn = None
 
 
 def set_connection(conn):
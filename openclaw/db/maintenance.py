@@ -0,0 +1,251 @@
+"""
+Background maintenance of the shared SQLite database.
+
+The agents keep long-lived connections on a WAL database shared with the
+dashboard, and nothing used to checkpoint it, refresh the planner's
+statistics or give back the pages freed when big execution_output values
+are rewritten (or moved to the artifact store). Maintainer runs one thread
+that every `interval` seconds:
+
+  - measures the WAL file; above `wal_limit_mb` it runs
+    wal_checkpoint(PASSIVE), which never blocks readers or writers,
+  - in a quiet window (no commit from any connection for `quiet_s`
+    seconds, nothing pending in the commit queue) runs
+    wal_checkpoint(TRUNCATE) so the WAL file shrinks back to zero,
+  - every `analyze_every` seconds (quiet windows only) runs a bounded
+    ANALYZE (PRAGMA analysis_limit) plus PRAGMA optimize,
+  - with auto_vacuum = INCREMENTAL, runs PRAGMA incremental_vacuum in
+    small steps until the freelist is empty or `vacuum_budget_ms` is spent.
+
+Databases created by the dashboard have auto_vacuum = NONE; switching
+needs one full VACUUM with the agents stopped:
+
+    python -m db.maintenance incremental
+
+Every run is logged and kept in stats() with its duration and the bytes it
+reclaimed (WAL bytes truncated, pages returned to the filesystem).
+`python -m db.maintenance` runs one forced pass and prints the reports.
+Postgres has its own autovacuum; the thread does not start there.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from db import connection, writer
+
+logger = logging.getLogger("OpenClaw.maintenance")
+
+_VACUUM_STEP_PAGES = 64        # pages per incremental_vacuum call (one short write transaction)
+
+
+class Maintainer:
+    """Checkpoints, ANALYZE and incremental vacuum on a schedule, in quiet windows.
+
+    Args:
+        interval:         Seconds between checks.
+        quiet_s:          Seconds without commits that make a quiet window.
+        wal_limit_mb:     WAL size that triggers a PASSIVE checkpoint at any time.
+        analyze_every:    Seconds between ANALYZE runs (0 disables them).
+        vacuum_budget_ms: Time budget of each incremental vacuum (0 disables it).
+        path:             SQLite file (default: DB_PATH).
+    """
+
+    def __init__(self, interval=30.0, quiet_s=10.0, wal_limit_mb=64, analyze_every=3600.0,
+                 vacuum_budget_ms=200.0, path=None):
+        self.interval = interval
+        self.quiet_s = quiet_s
+        self.wal_limit = wal_limit_mb * 1024 * 1024
+        self.analyze_every = analyze_every
+        self.vacuum_budget_ms = vacuum_budget_ms
+        self.path = path
+        self._thread = None
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=50)
+        self._totals = {}               # task -> {runs, total_ms, reclaimed_bytes}
+        self._data_version = None
+        self._last_commit = time.monotonic()
+        self._last_analyze = time.monotonic()
+        self._wal_bytes = 0
+        self._freelist_bytes = 0
+
+    def start(self, shutdown):
+        """Start the maintenance thread (SQLite only); it stops when `shutdown` is set."""
+        if connection.PROFILE["backend"] != "sqlite":
+            return None
+        self._thread = threading.Thread(target=self._run, args=(shutdown,), daemon=True, name="MAINTENANCE")
+        self._thread.start()
+        return self._thread
+
+    def _run(self, shutdown):
+        try:
+            db = self._connect()
+        except Exception:
+            logger.exception("Mantenimiento de la BD no iniciado")
+            return
+        try:
+            while not shutdown.wait(self.interval):
+                try:
+                    self.run_once(db)
+                except Exception as e:
+                    logger.warning("Mantenimiento de la BD fallido: %s", e)
+        finally:
+            db.close()
+
+    def _connect(self):
+        path = self.path or connection._resolve_db_path()
+        # Short busy_timeout: maintenance gives up and retries next time instead of queueing behind agents
+        db = connection._create_connection(path, profile={"busy_timeout_ms": 100})
+        db.role = "maintenance"
+        self.path = path
+        self._data_version = db.execute("PRAGMA data_version").fetchone()[0]
+        return db
+
+    # ── Schedule ─────────────────────────────────────────────────────────────
+
+    def quiet(self, db):
+        """True if no connection has committed for quiet_s seconds and the commit queue is empty."""
+        now = time.monotonic()
+        current = db.execute("PRAGMA data_version").fetchone()[0]
+        if current != self._data_version:
+            self._data_version = current
+            self._last_commit = now
+        queue = writer.active()
+        if queue is not None and queue.stats()["pending"]:
+            self._last_commit = now
+        return now - self._last_commit >= self.quiet_s
+
+    def run_once(self, db, force=False):
+        """One scheduling pass; force=True runs every task as if the window were quiet.
+
+        Returns:
+            The reports of the tasks that ran (see _report).
+        """
+        quiet = force or self.quiet(db)
+        reports = []
+        if quiet and self.analyze_every and (force or time.monotonic() - self._last_analyze >= self.analyze_every):
+            reports.append(self.analyze(db))
+        if quiet and self.vacuum_budget_ms and incremental_enabled(db) and _freelist_pages(db):
+            reports.append(self.vacuum(db, self.vacuum_budget_ms))
+        # Last, so the pages the vacuum freed leave the file in this same pass
+        wal = self.wal_size()
+        if quiet and wal:
+            reports.append(self.checkpoint(db, "TRUNCATE"))
+        elif wal > self.wal_limit:
+            reports.append(self.checkpoint(db, "PASSIVE"))
+        with self._lock:
+            self._wal_bytes = self.wal_size()
+            self._freelist_bytes = _freelist_pages(db) * _page_size(db)
+        return reports
+
+    # ── Tasks ────────────────────────────────────────────────────────────────
+
+    def wal_size(self):
+        try:
+            return os.path.getsize(self.path + "-wal")
+        except OSError:
+            return 0
+
+    def checkpoint(self, db, mode="PASSIVE"):
+        """wal_checkpoint(mode); reclaimed bytes is how much the WAL file shrank."""
+        before = self.wal_size()
+        start = time.perf_counter()
+        busy, log_frames, done = db.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        return self._report(f"checkpoint_{mode.lower()}", start, max(before - self.wal_size(), 0),
+                            busy=bool(busy), frames=log_frames, checkpointed=done)
+
+    def analyze(self, db, limit=400):
+        """Bounded ANALYZE (analysis_limit rows per index) plus PRAGMA optimize."""
+        start = time.perf_counter()
+        db.execute(f"PRAGMA analysis_limit = {int(limit)}")
+        db.execute("ANALYZE")
+        db.execute("PRAGMA optimize")
+        db.commit()
+        self._last_analyze = time.monotonic()
+        return self._report("analyze", start, 0)
+
+    def vacuum(self, db, budget_ms):
+        """incremental_vacuum in small steps until the freelist is empty or budget_ms is spent."""
+        page_size = _page_size(db)
+        before = _page_count(db)
+        start = time.perf_counter()
+        deadline = start + budget_ms / 1000
+        while _freelist_pages(db) and time.perf_counter() < deadline:
+            db.execute(f"PRAGMA incremental_vacuum({_VACUUM_STEP_PAGES})").fetchall()
+        pages = before - _page_count(db)
+        return self._report("incremental_vacuum", start, pages * page_size, pages=pages,
+                            left=_freelist_pages(db))
+
+    # ── Reporting ────────────────────────────────────────────────────────────
+
+    def _report(self, task, start, reclaimed, **detail):
+        """Record and log one run: {task, at, duration_ms, reclaimed_bytes, **detail}."""
+        report = {"task": task, "at": time.time(), "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                  "reclaimed_bytes": reclaimed, **detail}
+        with self._lock:
+            self._history.append(report)
+            totals = self._totals.setdefault(task, {"runs": 0, "total_ms": 0.0, "reclaimed_bytes": 0})
+            totals["runs"] += 1
+            totals["total_ms"] = round(totals["total_ms"] + report["duration_ms"], 2)
+            totals["reclaimed_bytes"] += reclaimed
+        logger.info("Mantenimiento %s: %.1fms, %d KB liberados%s", task, report["duration_ms"],
+                    reclaimed // 1024, "".join(f" {k}={v}" for k, v in detail.items()))
+        return report
+
+    def stats(self):
+        """{wal_bytes, freelist_bytes, tasks: {task: {runs, total_ms, reclaimed_bytes}}, last: [reports]}."""
+        with self._lock:
+            return {
+                "wal_bytes": self._wal_bytes,
+                "freelist_bytes": self._freelist_bytes,
+                "tasks": {task: dict(t) for task, t in self._totals.items()},
+                "last": list(self._history)[-5:],
+            }
+
+
+def incremental_enabled(db):
+    return db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def enable_incremental_vacuum(db):
+    """Switch the database to auto_vacuum = INCREMENTAL (a full VACUUM; stop the agents first).
+
+    Returns:
+        Bytes reclaimed by the VACUUM.
+    """
+    if incremental_enabled(db):
+        return 0
+    before = os.path.getsize(db.path)
+    db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    db.execute("VACUUM")
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    return max(before - os.path.getsize(db.path), 0)
+
+
+def _page_size(db):
+    return db.execute("PRAGMA page_size").fetchone()[0]
+
+
+def _page_count(db):
+    return db.execute("PRAGMA page_count").fetchone()[0]
+
+
+def _freelist_pages(db):
+    return db.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+if __name__ == "__main__":
+    import sys
+
+    maintainer = Maintainer()
+    conn = maintainer._connect()
+    if sys.argv[1:] == ["incremental"]:
+        conn.execute("PRAGMA busy_timeout = 5000")
+        print(f"auto_vacuum = INCREMENTAL; VACUUM libero {enable_incremental_vacuum(conn) / 1024:.0f} KB")
+        sys.exit(0)
+    for r in maintainer.run_once(conn, force=True):
+        print(f"{r['task']:<20} {r['duration_ms']:>9.1f}ms {r['reclaimed_bytes'] / 1024:>9.0f} KB")
+    s = maintainer.stats()
+    print(f"WAL: {s['wal_bytes'] / 1024:.0f} KB | paginas libres: {s['freelist_bytes'] / 1024:.0f} KB"
+          + ("" if incremental_enabled(conn) else " (auto_vacuum NONE: python -m db.maintenance incremental)"))
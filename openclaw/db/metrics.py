@@ -0,0 +1,48 @@
+"""
+Fixed-bucket latency / size histograms shared by the DB instrumentation
+(commit queue, slow-query log). Cheap to update under a lock and to
+snapshot for the status monitor; percentiles are bucket upper bounds.
+"""
+
+
+class Histogram:
+    """Counts of observations per upper bound, plus count / sum / max."""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th observation (max for the overflow bucket)."""
+        if not self.count:
+            return 0
+        rank = max(1, round(self.count * pct / 100))
+        seen = 0
+        for bound, n in zip(self.bounds + (self.max,), self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        labels = [f"<={b:g}" for b in self.bounds] + [f">{self.bounds[-1]:g}"]
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else 0,
+            "p50": round(self.percentile(50), 3),
+            "p95": round(self.percentile(95), 3),
+            "max": round(self.max, 3),
+            "buckets": {label: n for label, n in zip(labels, self.counts) if n},
+        }
@@ -0,0 +1,163 @@
+"""
+Idempotent schema migration for the parts of the database OpenClaw owns.
+
+The ideas table belongs to the SecondBrain dashboard; OpenClaw only adds
+what its own queries need, all of it safe to run on every start:
+  - lease columns (claimed_by, lease_expires_at) — see queries.claim_next
+  - retry / failure / rejection counters and the idea_execution_events
+    history — see queries.update_execution_status
+  - pipeline_counters and the triggers that keep it exact, so the status
+    monitor reads a few rows instead of aggregating ideas
+  - pipeline_versions and its triggers, which db/watcher.py watches to wake
+    the agents whose queue changed
+  - indexes that serve each queue query without a table scan or a temp
+    B-tree sort. The priority rank is an index on the same CASE expression
+    the queries use (queries.PRIORITY_RANK) rather than a stored column, so
+    the dashboard keeps writing `priority` and the rank can never go stale.
+
+Usage:
+  python -m db.migrations            # apply to DB_PATH and print the query plans
+  python -m db.migrations reconcile  # rebuild pipeline_counters and report drift
+  python -m db.migrations artifacts  # move existing execution_output texts to the
+                                     # artifact store (db/artifacts.py); not run by migrate()
+"""
+import logging
+
+from db import queries
+
+logger = logging.getLogger("OpenClaw.migrations")
+
+# name -> CREATE INDEX statement (IF NOT EXISTS makes each one idempotent)
+INDEXES = {
+    # get_ideas_in_status / claim_next: WHERE execution_status = ? ORDER BY rank, created_at
+    "idx_ideas_queue": f"""
+        CREATE INDEX IF NOT EXISTS idx_ideas_queue
+        ON ideas (execution_status, ({queries.PRIORITY_RANK}), created_at)""",
+    # get_routable_ideas: only organized ideas PM has not routed yet
+    "idx_ideas_routable": f"""
+        CREATE INDEX IF NOT EXISTS idx_ideas_routable
+        ON ideas (({queries.PRIORITY_RANK}), created_at)
+        WHERE code_stage = 'organized' AND (execution_status IS NULL OR execution_status = '')""",
+    # get_retryable_failed_ideas: failed ideas, oldest first; retry_count < ?
+    # is checked from the index entry, without visiting the row
+    "idx_ideas_retryable": """
+        CREATE INDEX IF NOT EXISTS idx_ideas_retryable
+        ON ideas (executed_at, retry_count)
+        WHERE execution_status = 'failed' AND code_stage != 'expressed'""",
+    # reconcile_pipeline_counters: covering index for the full recount
+    "idx_ideas_status_stage": """
+        CREATE INDEX IF NOT EXISTS idx_ideas_status_stage
+        ON ideas (execution_status, code_stage)""",
+    # get_context_string: latest 20 items
+    "idx_context_items_updated": """
+        CREATE INDEX IF NOT EXISTS idx_context_items_updated
+        ON context_items (last_updated)""",
+}
+
+def _existing_indexes(db):
+    if queries.dialect(db) == "postgres":
+        sql = "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"
+    else:
+        sql = "SELECT name FROM sqlite_master WHERE type = 'index'"
+    return {r[0] for r in db.execute(sql).fetchall()}
+
+
+def migrate(db):
+    """Apply every step that is missing. Safe to call on each start.
+
+    Returns:
+        Names of the indexes created by this call (empty if all existed).
+    """
+    queries.ensure_execution_schema(db)
+    if queries.ensure_pipeline_counters(db):
+        logger.info("Migracion: pipeline_counters creada")
+    if queries.ensure_change_tracking(db):
+        logger.info("Migracion: pipeline_versions creada")
+    before = _existing_indexes(db)
+    for sql in INDEXES.values():
+        db.execute(sql)
+    # Fresh statistics let the planner pick the partial / expression indexes
+    db.execute("ANALYZE ideas")
+    db.commit()
+    created = [name for name in INDEXES if name not in before]
+    if created:
+        logger.info("Migracion: indices creados %s", ", ".join(created))
+    return created
+
+
+def query_plans(db):
+    """EXPLAIN QUERY PLAN (Postgres: EXPLAIN) of each pipeline query, for checking index use.
+
+    Returns:
+        {query name: [plan detail lines]}
+    """
+    checks = {
+        "get_routable_ideas": (queries.get_routable_ideas, ()),
+        "get_ideas_in_status": (queries.get_ideas_in_status, ("queued_software",)),
+        "get_retryable_failed_ideas": (queries.get_retryable_failed_ideas, ()),
+        "get_context_string": (queries.get_context_string.__wrapped__, ()),   # past the cache
+    }
+    plans = {}
+    for name, (fn, args) in checks.items():
+        plans[name] = _explain(db, fn, args)
+    plans["claim_next"] = _explain_claim(db)
+    return plans
+
+
+def _plan(db, sql, params=()):
+    if queries.dialect(db) == "postgres":
+        return [r[0] for r in db.execute("EXPLAIN " + sql, params).fetchall()]
+    return [r[3] for r in db.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+
+class _ExplainingConnection:
+    """Stand-in connection that runs EXPLAIN QUERY PLAN instead of each SELECT."""
+
+    def __init__(self, db):
+        self._db = db
+        self.dialect = queries.dialect(db)
+        self.details = []
+
+    def execute(self, sql, params=()):
+        self.details.extend(_plan(self._db, sql, params))
+        return self._db.execute("SELECT 1 WHERE 1 = 0")
+
+
+def _explain(db, fn, args):
+    conn = _ExplainingConnection(db)
+    fn(conn, *args)
+    return conn.details
+
+
+def _explain_claim(db):
+    return _plan(db, f"""
+        SELECT id FROM ideas
+        WHERE execution_status = ?
+          AND (lease_expires_at IS NULL OR lease_expires_at <= datetime('now'))
+        ORDER BY {queries.PRIORITY_RANK}, created_at ASC, id ASC
+        LIMIT 1
+    """, ["queued_software"])
+
+
+if __name__ == "__main__":
+    import sys
+
+    from db.connection import get_connection
+
+    conn = get_connection()
+    if sys.argv[1:] == ["reconcile"]:
+        drift = queries.reconcile_pipeline_counters(conn)
+        for bucket, (counter, actual) in drift.items():
+            print(f"{bucket:<12} contador={counter} real={actual} ({actual - counter:+d})")
+        print("Contadores reconstruidos" + ("" if drift else " (sin desvio)"))
+        sys.exit(1 if drift else 0)
+    if sys.argv[1:] == ["artifacts"]:
+        moved = queries.migrate_execution_outputs(conn)
+        print(f"Outputs movidos al almacen de artefactos: {moved['ideas']} ideas, "
+              f"{moved['chars_before']} -> {moved['chars_after']} caracteres en execution_output")
+        sys.exit(0)
+    print("Indices creados:", ", ".join(migrate(conn)) or "ninguno (ya existian)")
+    for query, detail in query_plans(conn).items():
+        print(f"\n{query}")
+        for line in detail:
+            print(f"  {line}")
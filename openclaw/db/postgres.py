@@ -0,0 +1,362 @@
+"""
+PostgreSQL backend for OpenClaw (DB_BACKEND=postgres).
+
+The dashboard runs on PostgreSQL (apps/dashboard/database.js); with this
+backend OpenClaw works on that same database. Like the dashboard's
+"SQLite → PostgreSQL compatibility layer", PgConnection keeps the
+SQLite-flavoured SQL in db/queries.py working unchanged:
+
+  - `?` placeholders become positional parameters (as convertPlaceholders
+    does in the dashboard) and `:name` ones named parameters; literals,
+    quoted identifiers, comments and `::` casts are left alone
+  - datetime('now'[, modifier]) becomes a UTC timestamp(0) (+ interval)
+  - INTEGER PRIMARY KEY AUTOINCREMENT becomes SERIAL PRIMARY KEY
+  - PRAGMA table_info(t) reads information_schema.columns
+  - transactions behave like sqlite3's default mode: reads run in
+    autocommit (a poll never leaves the session idle in transaction) and
+    the first INSERT / UPDATE / DELETE / LOCK opens a transaction that
+    lasts until commit() or rollback(). BEGIN IMMEDIATE is a plain BEGIN:
+    queries that need SQLite's write lock take a table lock instead
+    (queries.lock_ideas_for_write) and claim_next uses FOR UPDATE SKIP LOCKED.
+  - psycopg errors are re-raised as the sqlite3 exceptions, with the
+    messages the queries already check ("no such table", "no such column",
+    "database is locked"). Postgres aborts the whole transaction on an
+    error, so the connection rolls it back before raising.
+
+Connections come from a bounded Pool (pool_max) and keep their
+server-side prepared statements across checkouts: psycopg prepares a
+statement once it has run `prepare_threshold` times and keeps up to
+`cached_statements` of them per connection.
+
+Settings are the dashboard's: PG_HOST, PG_PORT, PG_USER, PG_PASSWORD,
+PG_DATABASE (or a full PG_DSN).
+"""
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import psycopg
+from psycopg import errors
+from psycopg.pq import TransactionStatus
+
+from db.slowlog import query_log
+
+# ─── SQL Translation ─────────────────────────────────────────────────────────
+
+# String literals, quoted identifiers and comments: copied untouched
+_VERBATIM = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/", re.S)
+_NAMED = re.compile(r"(?<![:\w]):(\w+)")
+_DATETIME_NOW = re.compile(r"datetime\(\s*'now'\s*(?:,\s*([^()]+?))?\s*\)", re.I)
+_AUTOINCREMENT = re.compile(r"INTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT", re.I)
+_TABLE_INFO = re.compile(r"^\s*PRAGMA\s+table_info\((\w+)\)\s*;?\s*$", re.I)
+_BEGIN = re.compile(r"^\s*BEGIN(\s+(DEFERRED|IMMEDIATE|EXCLUSIVE))?(\s+TRANSACTION)?\s*;?\s*$", re.I)
+# Statements before which sqlite3 opens a transaction implicitly
+_WRITE = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE|LOCK)\b", re.I)
+
+_UTC_NOW = "timezone('UTC', now())"
+
+# Same threshold as connection._BUSY_WAIT_S: a LOCK TABLE slower than this waited
+_BUSY_WAIT_S = 0.001
+
+_TABLE_INFO_SQL = """
+    SELECT ordinal_position - 1, column_name, data_type, is_nullable = 'NO', column_default, 0
+    FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = %s
+    ORDER BY ordinal_position
+"""
+
+
+def _now_sql(match):
+    if match.group(1):
+        return f"CAST({_UTC_NOW} + CAST({match.group(1)} AS interval) AS timestamp(0))"
+    return f"CAST({_UTC_NOW} AS timestamp(0))"
+
+
+@functools.lru_cache(maxsize=1024)
+def translate(sql, with_params=True):
+    """Rewrite one SQLite statement for psycopg (see the module docstring).
+
+    with_params=False is for statements sent without parameters, where
+    psycopg does not parse placeholders (so `%` must not be doubled).
+    """
+    sql = _AUTOINCREMENT.sub("SERIAL PRIMARY KEY", _DATETIME_NOW.sub(_now_sql, sql))
+    if not with_params:
+        return sql
+    out, pos = [], 0
+    for m in _VERBATIM.finditer(sql):
+        out.append(_translate_placeholders(sql[pos:m.start()]))
+        out.append(m.group(0).replace("%", "%%"))
+        pos = m.end()
+    out.append(_translate_placeholders(sql[pos:]))
+    return "".join(out)
+
+
+def _translate_placeholders(code):
+    code = code.replace("%", "%%").replace("?", "%s")
+    return _NAMED.sub(r"%(\1)s", code)
+
+
+def _sqlite_error(e):
+    """The sqlite3 exception the callers of db/queries.py expect for a psycopg error."""
+    message = str(e).splitlines()[0] if str(e) else type(e).__name__
+    if isinstance(e, errors.UndefinedTable):
+        m = re.search(r'relation "([^"]+)"', message)
+        return sqlite3.OperationalError(f"no such table: {m.group(1) if m else message}")
+    if isinstance(e, errors.UndefinedColumn):
+        m = re.search(r'column "([^"]+)" of relation "([^"]+)"', message)
+        if m:
+            return sqlite3.OperationalError(f"table {m.group(2)} has no column named {m.group(1)}")
+        m = re.search(r'column "?([^" ]+)"? does not exist', message)
+        return sqlite3.OperationalError(f"no such column: {m.group(1) if m else message}")
+    if isinstance(e, (errors.LockNotAvailable, errors.DeadlockDetected, errors.SerializationFailure)):
+        return sqlite3.OperationalError(f"database is locked ({message})")
+    if isinstance(e, psycopg.IntegrityError):
+        return sqlite3.IntegrityError(message)
+    return sqlite3.OperationalError(message)
+
+
+# ─── Rows ────────────────────────────────────────────────────────────────────
+
+class Row(tuple):
+    """sqlite3.Row look-alike: index by position or column name; dict(row) works."""
+
+    def __new__(cls, values, index):
+        row = super().__new__(cls, values)
+        row._index = index
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return list(self._index)
+
+
+def _row_factory(cursor):
+    index = {col.name: i for i, col in enumerate(cursor.description or ())}
+    return lambda values: Row(values, index)
+
+
+# ─── Connection ──────────────────────────────────────────────────────────────
+
+class PgConnection:
+    """sqlite3.Connection-compatible wrapper over a pooled psycopg connection.
+
+    Has the same counters as connection.CountingConnection (statements,
+    busy_waits for LOCK TABLE calls that had to wait, busy_errors), so
+    connection_stats() reports both backends alike. close() gives the
+    connection back to its pool.
+    """
+
+    dialect = "postgres"
+
+    def __init__(self, raw, pool, read_only=False):
+        self._raw = raw
+        self._pool = pool
+        self.row_factory = None     # accepted for sqlite3 compatibility; rows are always Row
+        self.role = "ro" if read_only else "rw"
+        self.thread_name = threading.current_thread().name
+        self.opened_at = time.time()
+        self.statements = 0
+        self.busy_waits = 0
+        self.busy_wait_s = 0.0
+        self.busy_errors = 0
+
+    @property
+    def in_transaction(self):
+        return self._raw.info.transaction_status != TransactionStatus.IDLE
+
+    def _run(self, fn, *args, **kwargs):
+        self.statements += 1
+        try:
+            return fn(*args, **kwargs)
+        except psycopg.Error as e:
+            err = _sqlite_error(e)
+            if "locked" in str(err):
+                self.busy_errors += 1
+            if not self._raw.closed:
+                self._raw.rollback()
+            raise err from e
+
+    def _begin_if_write(self, sql):
+        if _WRITE.match(sql) and not self.in_transaction:
+            self._run(self._raw.execute, "BEGIN")
+
+    def execute(self, sql, parameters=()):
+        if self._raw.closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        if _BEGIN.match(sql):
+            return self._run(self._raw.execute, "BEGIN")
+        table_info = _TABLE_INFO.match(sql)
+        if table_info:
+            return self._run(self._raw.execute, _TABLE_INFO_SQL, [table_info.group(1)])
+        self._begin_if_write(sql)
+        if sql.lstrip()[:10].upper() == "LOCK TABLE":
+            inicio = time.perf_counter()
+            try:
+                return self._run(self._raw.execute, translate(sql, False))
+            finally:
+                espera = time.perf_counter() - inicio
+                if espera > _BUSY_WAIT_S:
+                    self.busy_waits += 1
+                    self.busy_wait_s += espera
+        if query_log.enabled:
+            inicio = time.perf_counter()
+            cursor = self._execute(sql, parameters)
+            query_log.observe(sql, parameters, time.perf_counter() - inicio,
+                              lambda: self._plan(sql, parameters))
+            return cursor
+        return self._execute(sql, parameters)
+
+    def _execute(self, sql, parameters):
+        if not parameters:
+            return self._run(self._raw.execute, translate(sql, False))
+        return self._run(self._raw.execute, translate(sql), parameters)
+
+    def _plan(self, sql, parameters):
+        """EXPLAIN lines of `sql` (for the slow-query log); a savepoint keeps a failure out of the caller's transaction."""
+        with self._raw.transaction():
+            if parameters:
+                rows = self._raw.execute("EXPLAIN " + translate(sql), parameters).fetchall()
+            else:
+                rows = self._raw.execute("EXPLAIN " + translate(sql, False)).fetchall()
+        return [row[0] for row in rows]
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin_if_write(sql)
+        cursor = self._raw.cursor()
+        inicio = time.perf_counter()
+        self._run(cursor.executemany, translate(sql), list(seq_of_parameters))
+        if query_log.enabled:
+            query_log.observe(sql, None, time.perf_counter() - inicio)
+        return cursor
+
+    def executescript(self, sql_script):
+        """Run a multi-statement script, committing before and after like sqlite3."""
+        self.commit()
+        self._run(self._raw.execute, translate(sql_script, False), prepare=False)
+        self.commit()
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        from db import connection
+        connection.unregister(self)
+        if self._raw is not None:
+            raw, self._raw = self._raw, _ClosedRaw()
+            self._pool.release(raw, reset=self.role == "ro")
+
+
+class _ClosedRaw:
+    """Placeholder for the psycopg connection once a PgConnection is closed."""
+
+    closed = True
+
+    def __getattr__(self, name):
+        raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+
+
+# ─── Pool ────────────────────────────────────────────────────────────────────
+
+def conninfo_from_env():
+    """libpq conninfo from PG_DSN or the dashboard's PG_* variables."""
+    if os.getenv("PG_DSN"):
+        return os.getenv("PG_DSN")
+    return psycopg.conninfo.make_conninfo(
+        host=os.getenv("PG_HOST", "localhost"),
+        port=os.getenv("PG_PORT", "5432"),
+        user=os.getenv("PG_USER", "secondbrain"),
+        password=os.getenv("PG_PASSWORD", "secondbrain"),
+        dbname=os.getenv("PG_DATABASE", "secondbrain"),
+    )
+
+
+class Pool:
+    """Bounded pool of psycopg connections (LIFO, opened on demand).
+
+    acquire() waits up to `timeout` seconds for a free slot and raises
+    sqlite3.OperationalError when the pool stays exhausted.
+    """
+
+    def __init__(self, conninfo, max_size=10, timeout=5.0, prepare_threshold=2,
+                 cached_statements=256, busy_timeout_ms=5000):
+        self.conninfo = conninfo
+        self.max_size = max_size
+        self.timeout = timeout
+        self.prepare_threshold = prepare_threshold
+        self.cached_statements = cached_statements
+        self.busy_timeout_ms = busy_timeout_ms
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        params = psycopg.conninfo.conninfo_to_dict(self.conninfo)
+        # busy_timeout's counterpart, added to any options the DSN already sets
+        params["options"] = f"{params.get('options', '')} -c lock_timeout={int(self.busy_timeout_ms)}".strip()
+        raw = psycopg.connect(**params, row_factory=_row_factory, autocommit=True)
+        raw.prepare_threshold = self.prepare_threshold
+        raw.prepared_max = self.cached_statements
+        return raw
+
+    def acquire(self, read_only=False):
+        """Check out a connection as a PgConnection (close() returns it)."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("PostgreSQL pool is closed")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(
+                f"PostgreSQL pool exhausted ({self.max_size} connections in use for {self.timeout}s)")
+        try:
+            with self._lock:
+                raw = self._idle.pop() if self._idle else None
+            if raw is None or raw.closed:
+                raw = self._connect()
+            if read_only:
+                raw.execute("SET default_transaction_read_only = on")
+        except psycopg.Error as e:
+            self._slots.release()
+            raise _sqlite_error(e) from e
+        except Exception:
+            self._slots.release()
+            raise
+        return PgConnection(raw, self, read_only=read_only)
+
+    def release(self, raw, reset=False):
+        try:
+            if not raw.closed:
+                if raw.info.transaction_status != TransactionStatus.IDLE:
+                    raw.rollback()
+                if reset:
+                    raw.execute("RESET ALL")
+        except psycopg.Error:
+            raw.close()
+        with self._lock:
+            if self._closed or raw.closed:
+                raw.close()
+            else:
+                self._idle.append(raw)
+        self._slots.release()
+
+    def size(self):
+        """(idle connections, connections checked out)."""
+        with self._lock:
+            idle = len(self._idle)
+        return idle, self.max_size - self._slots._value
+
+    def close(self):
+        """Close the idle connections; those checked out close when released."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for raw in idle:
+            raw.close()
@@ -12,7 +12,57 @@ The ideas table columns used by OpenClaw:
   - code_stage:       CODE flow stage (captured, organized, distilled, expressed)
   - suggested_agent:  AI-suggested agent (staffing, training, finance, compliance)
   - suggested_skills: JSON array of skill paths
+
+Columns added by OpenClaw (on first use, ignored by the dashboard):
+  - claimed_by:       Worker holding the idea (e.g. 'DEV@host:1234')
+  - lease_expires_at: UTC datetime after which other workers may claim it
+  - retry_count:      Times PM re-queued the idea after a failure
+  - failure_count:    Times a stage ended in 'failed'
+  - rejection_count:  Times QA / REVIEWER / BUILDER sent it back
+
+Tables owned by OpenClaw (created on first use, the dashboard never reads them):
+  - idea_execution_events: append-only history of every status change — see
+                           update_execution_status
+  - llm_usage: one row per LLM call (tokens, latency, outcome) — see record_llm_usage
+  - pipeline_counters: ideas per stats bucket, kept by triggers — see get_pipeline_stats
+  - pipeline_versions: per-status change counter, bumped by triggers — see
+                       get_status_versions and db/watcher.py
+  - idea_artifacts: outputs / reports / reviews kept in db/artifacts.py's blob
+                    store; execution_output then only holds their summaries —
+                    see get_execution_output
+
+The SQL is SQLite's. With DB_BACKEND=postgres, db/postgres.PgConnection
+translates it (placeholders, datetime('now'), ...); the few statements
+that differ for real — claim locking, triggers, catalog lookups — branch
+on dialect(db).
 """
+import math
+import sqlite3
+
+from db import artifacts, writer
+from db.cache import reference_cache
+
+# Queue order. Queries interpolate this exact expression so SQLite can serve
+# ORDER BY from the expression indexes created in db/migrations.py.
+PRIORITY_RANK = "CASE priority WHEN 'alta' THEN 1 WHEN 'media' THEN 2 ELSE 3 END"
+
+
+def dialect(db):
+    """'postgres' for a db/postgres.PgConnection, 'sqlite' for any sqlite3 connection."""
+    return getattr(db, "dialect", "sqlite")
+
+
+def lock_ideas_for_write(db):
+    """Start a transaction that holds off every other writer of ideas until commit.
+
+    SQLite: BEGIN IMMEDIATE (the database write lock). Postgres: a SHARE ROW
+    EXCLUSIVE lock on ideas, which still lets readers and the dashboard's
+    SELECTs through.
+    """
+    if dialect(db) == "postgres":
+        db.execute("LOCK TABLE ideas IN SHARE ROW EXCLUSIVE MODE")
+    else:
+        db.execute("BEGIN IMMEDIATE")
 
 
 # ─── PM Agent Queries ────────────────────────────────────────────────────────
@@ -21,41 +71,107 @@ def get_routable_ideas(db):
     """Ideas organized by dashboard, not yet routed by PM.
     PM picks these up and sets execution_status to queued_software or queued_consulting.
     """
-    return db.execute("""
+    return db.execute(f"""
         SELECT id, text, ai_type, ai_category, suggested_agent, suggested_skills,
                execution_status, code_stage, priority, assigned_to
         FROM ideas
         WHERE code_stage = 'organized'
           AND (execution_status IS NULL OR execution_status = '')
-        ORDER BY
-            CASE priority WHEN 'alta' THEN 1 WHEN 'media' THEN 2 ELSE 3 END,
-            created_at ASC
+        ORDER BY {PRIORITY_RANK}, created_at ASC
     """).fetchall()
 
 
 # ─── Pipeline Queries ────────────────────────────────────────────────────────
 
+IDEA_COLUMNS = ("id", "text", "ai_type", "ai_category", "suggested_agent", "suggested_skills",
+                "execution_status", "execution_output", "execution_error", "code_stage",
+                "priority", "assigned_to", "ai_summary", "related_area_id")
+
+# Columns each stage actually reads from the idea it takes. execution_output
+# can be megabytes of generated code/documents (or just artifact summaries),
+# so BUILDER, QA and REVIEWER load it by id (get_execution_output).
+# Review feedback comes from the event history (get_recent_feedback).
+STAGE_COLUMNS = {
+    'queued_software': ("id", "text", "rejection_count"),
+    'queued_consulting': ("id", "text", "suggested_agent", "suggested_skills"),
+    'developed': ("id", "text", "ai_summary", "related_area_id"),
+    'built': ("id", "text"),
+    'reviewing': ("id", "text"),
+}
+
+
+def _column_list(columns):
+    unknown = set(columns) - set(IDEA_COLUMNS) - {name for name, _ in _OPENCLAW_COLUMNS}
+    if unknown:
+        raise ValueError(f"Unknown idea columns: {', '.join(sorted(unknown))}")
+    return ", ".join(columns)
+
+
 def get_ideas_in_status(db, execution_status):
-    """Get ideas in a specific execution state."""
-    return db.execute("""
-        SELECT id, text, ai_type, ai_category, suggested_agent, suggested_skills,
-               execution_status, execution_output, execution_error, code_stage,
-               priority, assigned_to, ai_summary, related_area_id
+    """Get ideas in a specific execution state (all columns, for reporting)."""
+    return db.execute(f"""
+        SELECT {_column_list(IDEA_COLUMNS)}
         FROM ideas
         WHERE execution_status = ?
-        ORDER BY
-            CASE priority WHEN 'alta' THEN 1 WHEN 'media' THEN 2 ELSE 3 END,
-            created_at ASC
+        ORDER BY {PRIORITY_RANK}, created_at ASC
     """, [execution_status]).fetchall()
 
 
-def update_execution_status(db, idea_id, status, output=None, error=None, agent_name=None):
-    """Update idea with execution results.
+def iter_ideas_in_status(db, execution_status, columns=None):
+    """Lazily iterate the ideas in a state, in queue order.
 
-    When status='completed', also moves code_stage to 'expressed'.
-    When status='reviewing', moves code_stage to 'distilled'.
-    The dashboard reads these same columns.
+    The ids are fetched up front (one cheap index scan, fully consumed) and
+    each row is then loaded by id with only `columns` (default: the stage's
+    STAGE_COLUMNS), so a batch stage holds one small row at a time. No cursor
+    stays open between rows: a stage that spends minutes on each idea does not
+    pin a WAL read snapshot and block checkpoints. Ideas that left the state
+    in the meantime (moved by the caller or by another connection) are skipped.
+    """
+    columns = columns or STAGE_COLUMNS.get(execution_status, IDEA_COLUMNS)
+    ids = [row[0] for row in db.execute(f"""
+        SELECT id FROM ideas
+        WHERE execution_status = ?
+        ORDER BY {PRIORITY_RANK}, created_at ASC
+    """, [execution_status]).fetchall()]
+    sql = f"SELECT {_column_list(columns)} FROM ideas WHERE id = ? AND execution_status = ?"
+    for idea_id in ids:
+        row = db.execute(sql, [idea_id, execution_status]).fetchone()
+        if row is not None:
+            yield row
+
+
+def get_execution_output(db, idea_id, max_chars=None):
+    """Load an idea's execution_output on its own, when it is about to be used.
+
+    Ideas with artifacts get the concatenated text the column used to hold,
+    assembled from the blob store (see _assemble_artifacts). Otherwise the
+    column is read; with max_chars only that prefix leaves SQLite (substr),
+    so reviewing a multi-MB output costs max_chars of memory.
+
+    Returns:
+        (text, full_length) — ('', 0) if the idea has no output.
     """
+    rows = _with_execution_schema(db, lambda: db.execute(
+        "SELECT title, blob, chars FROM idea_artifacts WHERE idea_id = ? ORDER BY seq", [idea_id]
+    ).fetchall())
+    if rows:
+        return _assemble_artifacts(rows, max_chars)
+    if max_chars is None:
+        row = db.execute(
+            "SELECT execution_output, length(execution_output) FROM ideas WHERE id = ?", [idea_id]
+        ).fetchone()
+    else:
+        row = db.execute(
+            "SELECT substr(execution_output, 1, ?), length(execution_output) FROM ideas WHERE id = ?",
+            [int(max_chars), idea_id],
+        ).fetchone()
+    if not row or row[0] is None:
+        return '', 0
+    return row[0], row[1]
+
+
+def _execution_status_sql(status):
+    """UPDATE for one status change (named params, see _status_change)."""
     # Determine code_stage update
     code_stage_sql = "code_stage"
     if status == 'completed':
@@ -70,34 +186,518 @@ def update_execution_status(db, idea_id, status, output=None, error=None, agent_
         para_type_sql = "'project'"
         is_project_sql = "1"
 
-    db.execute(f"""
+    return f"""
         UPDATE ideas SET
-            execution_status = ?,
-            execution_output = COALESCE(?, execution_output),
-            execution_error = ?,
+            execution_status = :status,
+            execution_output = CASE WHEN CAST(:section AS TEXT) IS NULL THEN COALESCE(:output, execution_output)
+                                    ELSE COALESCE(:output, execution_output, '') || CAST(:section AS TEXT) END,
+            execution_error = :error,
             executed_at = datetime('now'),
-            executed_by = ?,
+            executed_by = :agent,
+            suggested_agent = COALESCE(:suggested_agent, suggested_agent),
             code_stage = {code_stage_sql},
             para_type = {para_type_sql},
-            is_project = {is_project_sql}
-        WHERE id = ?
-    """, [status, output, error, agent_name, idea_id])
+            is_project = {is_project_sql},
+            retry_count = retry_count + CASE WHEN :outcome = 'retried' THEN 1 ELSE 0 END,
+            failure_count = failure_count + CASE WHEN :outcome = 'failed' THEN 1 ELSE 0 END,
+            rejection_count = rejection_count + CASE WHEN :outcome = 'rejected' THEN 1 ELSE 0 END
+        WHERE id = :idea_id
+    """
+
+
+def _status_change(idea_id, status, output, error, agent_name, suggested_agent, outcome, duration,
+                   append=None):
+    if outcome is None:
+        outcome = 'queued' if status.startswith('queued_') else _STATUS_OUTCOMES.get(status, 'succeeded')
+    return {
+        "idea_id": idea_id, "status": status, "output": output,
+        "section": _section(*append) if append is not None else None,
+        "error": error, "agent": agent_name,
+        "suggested_agent": suggested_agent, "outcome": outcome,
+        "duration_ms": round(duration * 1000) if duration is not None else None,
+    }
+
+
+def _apply_status_changes(db, changes, before=None):
+    """Write status changes and their events in one transaction (one commit).
+
+    `before()`, if given, runs first inside the same transaction.
+    """
+    by_status = {}
+    for change in changes:
+        by_status.setdefault(change["status"], []).append(change)
+
+    def _apply():
+        try:
+            if before is not None:
+                before()
+            for status, group in by_status.items():
+                # Event first: it records the state the idea is leaving
+                db.executemany(_EVENT_INSERT_SQL, group)
+                db.executemany(_execution_status_sql(status), group)
+        except Exception:
+            db.rollback()
+            raise
+        db.commit()
+    if by_status:
+        _with_execution_schema(db, _apply)
+    return len(changes)
+
+
+@writer.queued()
+def update_execution_status(db, idea_id, status, output=None, error=None, agent_name=None,
+                            outcome=None, duration=None, append=None):
+    """Update idea with execution results.
+
+    When status='completed', also moves code_stage to 'expressed'.
+    When status='reviewing', moves code_stage to 'distilled'.
+    The dashboard reads these same columns.
+
+    `output` replaces the idea's output; `append=(title, text)` adds a
+    "---\n### title" section after it without reading it back (build
+    reports, reviews). Either goes to the artifact store when the idea
+    uses it (see _store_artifacts).
+
+    Every call also appends an idea_execution_events row (error as the
+    message) and bumps the matching counter. `outcome` defaults from the
+    status ('failed', 'started', 'queued', ...); pass 'rejected' when a
+    reviewer sends the idea back and 'retried' for PM re-queues.
+    `duration` is the seconds the stage took, if known.
+    """
+    change = _status_change(idea_id, status, output, error, agent_name, None, outcome, duration, append)
+    before = None
+    if output is not None or append is not None:
+        def before():
+            _store_artifacts(db, change, output, append, agent_name)
+    _apply_status_changes(db, [change], before)
+
+
+@writer.queued()
+def update_execution_status_batch(db, updates, agent_name=None):
+    """Apply many status changes in a single transaction (one commit).
+
+    Args:
+        updates: iterable of (idea_id, status, suggested_agent, error, outcome).
+                 suggested_agent=None keeps the current one; error is
+                 written as given and outcome=None uses the default, like
+                 update_execution_status.
+
+    Rows are grouped by status so each group is one executemany.
+
+    Returns:
+        Number of updates applied.
+    """
+    return _apply_status_changes(db, [
+        _status_change(idea_id, status, None, error, agent_name, suggested_agent, outcome, None)
+        for idea_id, status, suggested_agent, error, outcome in updates
+    ])
+
+
+@writer.queued(wait=False)
+def update_execution_progress(db, idea_id, partial_output):
+    """Store partial output of a streaming generation so the dashboard shows progress.
+
+    Only touches ideas still 'in_progress': if the status moved on (or
+    someone else took the idea) the partial text is discarded. The partial
+    text supersedes the artifacts of a previous round. With the commit
+    queue running (db/writer.py) it returns without waiting for the write.
+    """
+    def _progress():
+        db.execute("""
+            UPDATE ideas SET execution_output = ?
+            WHERE id = ? AND execution_status = 'in_progress'
+        """, [partial_output, idea_id])
+        db.execute("""
+            DELETE FROM idea_artifacts
+            WHERE idea_id = ? AND EXISTS (SELECT 1 FROM ideas WHERE id = ? AND execution_status = 'in_progress')
+        """, [idea_id, idea_id])
+    try:
+        _with_execution_schema(db, _progress)
+    except Exception:
+        db.rollback()
+        raise
     db.commit()
 
 
 def count_previous_failures(db, idea_id):
     """Count how many times an idea has been rejected (for blocking logic)."""
-    row = db.execute("""
-        SELECT execution_error FROM ideas WHERE id = ?
-    """, [idea_id]).fetchone()
-    if not row or not row['execution_error']:
-        return 0
-    # Count occurrences of RECHAZADO in error history
-    return row['execution_error'].count('RECHAZADO') + row['execution_error'].count('REJECTED')
+    def _count():
+        row = db.execute("SELECT rejection_count FROM ideas WHERE id = ?", [idea_id]).fetchone()
+        return row[0] if row else 0
+    return _with_execution_schema(db, _count)
+
+
+# ─── Execution History ──────────────────────────────────────────────────────
+
+# Added to ideas on first use; the counters replace counting markers in
+# execution_error, which only ever holds the latest message.
+_OPENCLAW_COLUMNS = (
+    ("claimed_by", "TEXT"),
+    ("lease_expires_at", "TIMESTAMP"),   # SQLite stores datetime('now') text either way
+    ("retry_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("failure_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("rejection_count", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+# Counters seeded from the text markers older versions left in execution_error
+_COUNTER_BACKFILL = {
+    "retry_count": "(length(execution_error) - length(replace(execution_error, '[RETRY]', ''))) / 7",
+    "rejection_count": ("(length(execution_error) - length(replace(execution_error, 'RECHAZADO', ''))) / 9"
+                        " + (length(execution_error) - length(replace(execution_error, 'REJECTED', ''))) / 8"),
+}
+
+_EXECUTION_EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idea_execution_events (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    idea_id     INTEGER NOT NULL,
+    stage       TEXT,              -- execution_status the idea was in
+    status      TEXT NOT NULL,     -- execution_status it moved to
+    agent       TEXT,
+    outcome     TEXT NOT NULL,     -- started, succeeded, approved, rejected, failed, blocked, queued, retried
+    message     TEXT,
+    duration_ms INTEGER,
+    created_at  TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE INDEX IF NOT EXISTS idx_execution_events_idea ON idea_execution_events (idea_id, outcome, id);
+
+CREATE TABLE IF NOT EXISTS idea_artifacts (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    idea_id      INTEGER NOT NULL,
+    seq          INTEGER NOT NULL,  -- position in the assembled output
+    title        TEXT,              -- section heading; NULL for the main output
+    agent        TEXT,
+    blob         TEXT NOT NULL,     -- db/artifacts.py reference (SHA-256 of the text)
+    chars        INTEGER NOT NULL,
+    stored_bytes INTEGER NOT NULL,
+    created_at   TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE INDEX IF NOT EXISTS idx_idea_artifacts_idea ON idea_artifacts (idea_id, seq);
+"""
+
+_EVENT_INSERT_SQL = """
+    INSERT INTO idea_execution_events (idea_id, stage, status, agent, outcome, message, duration_ms)
+    SELECT id, execution_status, CAST(:status AS TEXT), CAST(:agent AS TEXT), CAST(:outcome AS TEXT),
+           CAST(:error AS TEXT), CAST(:duration_ms AS INTEGER)
+    FROM ideas WHERE id = :idea_id
+"""
+
+# Default outcome for a status change (queued_* is 'queued')
+_STATUS_OUTCOMES = {
+    'in_progress': 'started',
+    'completed': 'approved',
+    'failed': 'failed',
+    'blocked': 'blocked',
+}
+
+
+def ensure_execution_schema(db):
+    """Add OpenClaw's columns to ideas and create idea_execution_events / idea_artifacts (idempotent)."""
+    existing = {r[1] for r in db.execute("PRAGMA table_info(ideas)").fetchall()}
+    for name, sql_type in _OPENCLAW_COLUMNS:
+        if name not in existing:
+            db.execute(f"ALTER TABLE ideas ADD COLUMN {name} {sql_type}")
+            if name in _COUNTER_BACKFILL:
+                db.execute(f"UPDATE ideas SET {name} = {_COUNTER_BACKFILL[name]} "
+                           f"WHERE execution_error IS NOT NULL")
+    db.commit()
+    db.executescript(_EXECUTION_EVENTS_SCHEMA)
+
+
+def _with_execution_schema(db, fn):
+    """Run fn(); if OpenClaw's columns or tables are missing, add them and run it again."""
+    try:
+        return fn()
+    except sqlite3.OperationalError as e:
+        if "no such column" not in str(e) and not any(
+                f"no such table: {t}" in str(e) for t in ("idea_execution_events", "idea_artifacts")):
+            raise
+        ensure_execution_schema(db)
+        return fn()
+
+
+def get_recent_feedback(db, idea_id, limit=3):
+    """Reviewer feedback for a correction, rebuilt from the last `limit` rejections.
+
+    Ideas with no event history at all (rejected before the events table
+    existed) fall back to execution_error when it holds a rejection.
+
+    Returns:
+        The rejection messages, oldest first, or '' if there are none.
+    """
+    def _feedback():
+        rows = db.execute("""
+            SELECT agent, message FROM idea_execution_events
+            WHERE idea_id = ? AND outcome = 'rejected'
+            ORDER BY id DESC
+            LIMIT ?
+        """, [idea_id, limit]).fetchall()
+        if rows:
+            return "\n\n---\n\n".join(r['message'] or f"{r['agent']}: rechazado sin detalle"
+                                         for r in reversed(rows))
+        if db.execute("SELECT 1 FROM idea_execution_events WHERE idea_id = ? LIMIT 1", [idea_id]).fetchone():
+            return ''
+        row = db.execute("SELECT execution_error FROM ideas WHERE id = ?", [idea_id]).fetchone()
+        error = (row['execution_error'] if row else None) or ''
+        return error if ('RECHAZADO' in error or 'REJECTED' in error) else ''
+    return _with_execution_schema(db, _feedback)
+
+
+def count_execution_events(db, idea_id, outcome, agent=None):
+    """Count an idea's events with `outcome` (optionally only from `agent`)."""
+    sql = "SELECT COUNT(*) FROM idea_execution_events WHERE idea_id = ? AND outcome = ?"
+    params = [idea_id, outcome]
+    if agent is not None:
+        sql += " AND agent = ?"
+        params.append(agent)
+    return _with_execution_schema(db, lambda: db.execute(sql, params).fetchone()[0])
+
+
+def get_execution_events(db, idea_id, limit=50):
+    """An idea's most recent events, newest first (for the dashboard / debugging)."""
+    def _events():
+        return db.execute("""
+            SELECT id, stage, status, agent, outcome, message, duration_ms, created_at
+            FROM idea_execution_events
+            WHERE idea_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, [idea_id, limit]).fetchall()
+    return _with_execution_schema(db, _events)
+
+
+# ─── Task Claiming (leases) ─────────────────────────────────────────────────
+
+@writer.queued()
+def claim_next(db, execution_status, worker_id, lease_seconds=900, columns=None):
+    """Atomically take the highest-priority unclaimed idea in a state.
+
+    A single UPDATE ... RETURNING stamps `claimed_by` and `lease_expires_at`
+    on the first idea (same order as get_ideas_in_status) that has no lease
+    or whose lease expired. On SQLite, BEGIN IMMEDIATE takes the write lock
+    up front, so concurrent workers (threads or processes) queue on
+    busy_timeout instead of reading the same candidate. On Postgres the
+    candidate is picked FOR UPDATE SKIP LOCKED: a worker skips the rows
+    other workers are claiming instead of waiting for them. The
+    execution_status is not changed; the caller moves the idea on as before
+    and renews the lease while it works.
+
+    Only `columns` are returned (default: the stage's STAGE_COLUMNS), so
+    DEV and CONSULTING never pull the previous output they do not read.
+
+    Returns:
+        The claimed row, or None.
+    """
+    columns = columns or STAGE_COLUMNS.get(execution_status, IDEA_COLUMNS)
+    postgres = dialect(db) == "postgres"
+
+    def _claim():
+        own_tx = not db.in_transaction
+        if own_tx and not postgres:
+            db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(f"""
+                UPDATE ideas SET
+                    claimed_by = ?,
+                    lease_expires_at = datetime('now', ?)
+                WHERE id = (
+                    SELECT id FROM ideas
+                    WHERE execution_status = ?
+                      AND (lease_expires_at IS NULL OR lease_expires_at <= datetime('now'))
+                    ORDER BY {PRIORITY_RANK}, created_at ASC, id ASC
+                    LIMIT 1{" FOR UPDATE SKIP LOCKED" if postgres else ""}
+                )
+                RETURNING {_column_list(columns)}
+            """, [worker_id, f"+{int(lease_seconds)} seconds", execution_status]).fetchall()
+        except Exception:
+            if own_tx:
+                db.rollback()
+            raise
+        if own_tx:
+            db.commit()
+        return row[0] if row else None
+    return _with_execution_schema(db, _claim)
+
+
+@writer.queued()
+def renew_lease(db, idea_id, worker_id, lease_seconds=900):
+    """Extend a lease held by worker_id (call it during long LLM calls / builds).
+
+    Returns:
+        False if the lease was lost (expired and taken by another worker).
+    """
+    def _renew():
+        cur = db.execute("""
+            UPDATE ideas SET lease_expires_at = datetime('now', ?)
+            WHERE id = ? AND claimed_by = ?
+        """, [f"+{int(lease_seconds)} seconds", idea_id, worker_id])
+        db.commit()
+        return cur.rowcount == 1
+    return _with_execution_schema(db, _renew)
+
+
+@writer.queued()
+def release_claim(db, idea_id, worker_id):
+    """Drop worker_id's lease on an idea so it can be claimed again right away."""
+    def _release():
+        db.execute("""
+            UPDATE ideas SET claimed_by = NULL, lease_expires_at = NULL
+            WHERE id = ? AND claimed_by = ?
+        """, [idea_id, worker_id])
+        db.commit()
+    _with_execution_schema(db, _release)
+
+
+# ─── Artifacts ───────────────────────────────────────────────────────────────
+# With the blob store (db/artifacts.py) an idea's output and the sections
+# appended to it are idea_artifacts rows pointing at compressed files;
+# execution_output keeps one summary stub per artifact, so stage updates
+# and column fetches stay small. get_execution_output reassembles the full
+# text. Ideas without artifacts keep using the column as before.
+
+def _section(title, text):
+    """The text `append=(title, text)` adds after an output."""
+    return f"\n\n---\n### {title}\n{text}"
+
+
+def _artifact_stub(ref, text):
+    return f"{artifacts.summarize(text)}\n\n[artefacto {ref[:12]} · {len(text)} caracteres]"
+
+
+def _add_artifact(db, idea_id, seq, title, text, agent):
+    """Store `text` as artifact `seq` of the idea; returns its stub for execution_output."""
+    ref, stored = artifacts.store().put(text)
+    db.execute("""
+        INSERT INTO idea_artifacts (idea_id, seq, title, agent, blob, chars, stored_bytes)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [idea_id, seq, title, agent, ref, len(text), stored])
+    return _artifact_stub(ref, text)
+
+
+def _store_artifacts(db, change, output, append, agent):
+    """Route a status change's output / appended section to the blob store, if the idea uses it.
+
+    An idea uses the store once it has artifacts; with artifacts.SETTINGS
+    enabled, new outputs (and appends to ideas still holding plain text,
+    whose text becomes the main artifact) move there too. change's output
+    / section are replaced by their stubs; otherwise left for the column.
+    """
+    idea_id = change["idea_id"]
+    count, last = db.execute(
+        "SELECT COUNT(*), MAX(seq) FROM idea_artifacts WHERE idea_id = ?", [idea_id]
+    ).fetchone()
+    if not count and not artifacts.SETTINGS["enabled"]:
+        return
+    if output is not None:
+        db.execute("DELETE FROM idea_artifacts WHERE idea_id = ?", [idea_id])
+        change["output"] = _add_artifact(db, idea_id, 0, None, output, agent)
+        count, last = 1, 0
+    if append is not None:
+        if not count:
+            row = db.execute("SELECT execution_output FROM ideas WHERE id = ?", [idea_id]).fetchone()
+            last = -1
+            if row and row[0]:
+                change["output"] = _add_artifact(db, idea_id, 0, None, row[0], None)
+                last = 0
+        title, text = append
+        change["section"] = _section(title, _add_artifact(db, idea_id, last + 1, title, text, agent))
+
+
+def _assemble_artifacts(rows, max_chars=None):
+    """(text, full_length) of the concatenated artifacts, inflating only what max_chars needs."""
+    store = artifacts.store()
+    parts, remaining, total = [], max_chars, 0
+    for row in rows:
+        head = "" if row['title'] is None else _section(row['title'], "")
+        total += len(head) + row['chars']
+        if remaining is not None and remaining <= 0:
+            continue
+        try:
+            body = store.get(row['blob'], max_chars=None if remaining is None else max(remaining - len(head), 0))
+        except FileNotFoundError:
+            body = f"[artefacto {row['blob'][:12]} no encontrado]"
+        part = head + body
+        if remaining is not None:
+            part = part[:remaining]
+            remaining -= len(part)
+        parts.append(part)
+    return "".join(parts), total
+
+
+def migrate_execution_outputs(db, batch=100):
+    """Move existing execution_output texts into the artifact store (idempotent).
+
+    Only outputs longer than their summary move; each becomes the idea's
+    main artifact and the column keeps its stub. Ideas mid-generation
+    (in_progress) are left alone. Commits every `batch` ideas.
+
+    Returns:
+        {ideas, chars_before, chars_after} — chars of execution_output moved / left behind.
+    """
+    ensure_execution_schema(db)
+    ids = [r[0] for r in db.execute("""
+        SELECT id FROM ideas
+        WHERE length(execution_output) > ?
+          AND (execution_status IS NULL OR execution_status != 'in_progress')
+          AND NOT EXISTS (SELECT 1 FROM idea_artifacts a WHERE a.idea_id = ideas.id)
+        ORDER BY id
+    """, [artifacts.SETTINGS["summary_chars"]]).fetchall()]
+    result = {"ideas": 0, "chars_before": 0, "chars_after": 0}
+    for start in range(0, len(ids), batch):
+        lock_ideas_for_write(db)
+        try:
+            for idea_id in ids[start:start + batch]:
+                row = db.execute("""
+                    SELECT execution_output FROM ideas
+                    WHERE id = ? AND NOT EXISTS (SELECT 1 FROM idea_artifacts a WHERE a.idea_id = ideas.id)
+                """, [idea_id]).fetchone()
+                if not row or not row[0]:
+                    continue
+                stub = _add_artifact(db, idea_id, 0, None, row[0], None)
+                db.execute("UPDATE ideas SET execution_output = ? WHERE id = ?", [stub, idea_id])
+                result["ideas"] += 1
+                result["chars_before"] += len(row[0])
+                result["chars_after"] += len(stub)
+        except Exception:
+            db.rollback()
+            raise
+        db.commit()
+    return result
+
+
+def collect_artifact_garbage(db, older_than=3600):
+    """Delete blobs no idea_artifacts row references (replaced outputs).
+
+    Blobs younger than `older_than` seconds are kept: a writer may have
+    stored one whose row is not committed yet.
+
+    Returns:
+        (files removed, bytes reclaimed)
+    """
+    ensure_execution_schema(db)
+    referenced = [r[0] for r in db.execute("SELECT DISTINCT blob FROM idea_artifacts").fetchall()]
+    return artifacts.store().gc(referenced, older_than=older_than)
+
+
+def get_artifact_stats(db):
+    """{artifacts, ideas, chars, stored_bytes} in idea_artifacts ({} before it exists)."""
+    try:
+        row = db.execute("""
+            SELECT COUNT(*), COUNT(DISTINCT idea_id), COALESCE(SUM(chars), 0), COALESCE(SUM(stored_bytes), 0)
+            FROM idea_artifacts
+        """).fetchone()
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):
+            raise
+        return {}
+    return {"artifacts": row[0], "ideas": row[1], "chars": row[2], "stored_bytes": row[3]}
 
 
 # ─── Context & Reference Queries ─────────────────────────────────────────────
+# Served from db/cache.py: re-read only when the signature query changes
+# (or the cache TTL runs out).
 
+@reference_cache.cached(
+    "SELECT COUNT(*), MAX(last_updated), MAX(id), SUM(LENGTH(content)) FROM context_items")
 def get_context_string(db):
     """Load context items as a formatted string for AI prompts."""
     items = db.execute(
@@ -108,6 +708,7 @@ def get_context_string(db):
     return "\n".join(f"- {r['key']}: {r['content']}" for r in items)
 
 
+@reference_cache.cached("SELECT COUNT(*), MAX(id) FROM users")
 def get_users(db):
     """Get team members for assignment context."""
     return db.execute(
@@ -115,6 +716,7 @@ def get_users(db):
     ).fetchall()
 
 
+@reference_cache.cached("SELECT COUNT(*), MAX(id) FROM areas WHERE status = 'active'")
 def get_areas(db):
     """Get active responsibility areas."""
     return db.execute(
@@ -122,6 +724,7 @@ def get_areas(db):
     ).fetchall()
 
 
+@writer.queued()
 def save_context_item(db, key, content, category='resource'):
     """Save a generated output as a context/memory item."""
     existing = db.execute(
@@ -138,46 +741,472 @@ def save_context_item(db, key, content, category='resource'):
             VALUES (?, ?, ?, 'resource', 'expressed', datetime('now'))
         """, [key, content, category])
     db.commit()
+    reference_cache.invalidate("get_context_string")    # last_updated only has 1s resolution
 
 
 # ─── Retry Queries ──────────────────────────────────────────────────────────
 
 def get_retryable_failed_ideas(db, max_retries=2):
-    """Get failed ideas that can be retried (failed less than max_retries times).
+    """Get failed ideas that can be retried (re-queued less than max_retries times).
     PM uses this to re-queue ideas that failed due to transient AI issues.
     """
-    rows = db.execute("""
-        SELECT id, text, ai_type, ai_category, suggested_agent, suggested_skills,
-               execution_status, execution_error, code_stage, priority, assigned_to
+    def _retryable():
+        return db.execute("""
+            SELECT id, text, ai_type, ai_category, suggested_agent, suggested_skills,
+                   execution_status, execution_error, code_stage, priority, assigned_to
+            FROM ideas
+            WHERE execution_status = 'failed'
+              AND code_stage != 'expressed'
+              AND retry_count < ?
+            ORDER BY executed_at ASC
+        """, [max_retries]).fetchall()
+    return _with_execution_schema(db, _retryable)
+
+
+# ─── Stats Queries ───────────────────────────────────────────────────────────
+
+PIPELINE_BUCKETS = ("pending", "queued", "in_progress", "building", "in_review", "completed", "failed", "blocked")
+
+
+def _pipeline_bucket(row):
+    """SQL expression mapping an ideas row (`row` = alias, NEW or OLD) to its stats bucket.
+
+    NULL for ideas no bucket counts (e.g. captured and not yet organized).
+    """
+    return f"""CASE
+        WHEN {row}.execution_status IS NULL
+            THEN CASE WHEN {row}.code_stage = 'organized' THEN 'pending' END
+        WHEN {row}.execution_status LIKE 'queued_%' THEN 'queued'
+        WHEN {row}.execution_status = 'developed' THEN 'building'
+        WHEN {row}.execution_status IN ('built', 'reviewing') THEN 'in_review'
+        WHEN {row}.execution_status IN ('in_progress', 'completed', 'failed', 'blocked')
+            THEN {row}.execution_status
+    END"""
+
+
+def _bump_counter(row, delta):
+    return f"""
+        INSERT INTO pipeline_counters (bucket, n)
+        SELECT bucket, {delta} FROM (SELECT {_pipeline_bucket(row)} AS bucket) AS b WHERE bucket IS NOT NULL
+        ON CONFLICT (bucket) DO UPDATE SET n = pipeline_counters.n + {delta};"""
+
+
+# Counters kept exact by triggers, whoever writes ideas (agents or dashboard)
+_PIPELINE_COUNTERS_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS pipeline_counters (
+    bucket TEXT PRIMARY KEY,
+    n      INTEGER NOT NULL DEFAULT 0
+);
+CREATE TRIGGER IF NOT EXISTS pipeline_counters_insert AFTER INSERT ON ideas
+BEGIN {_bump_counter("NEW", 1)}
+END;
+CREATE TRIGGER IF NOT EXISTS pipeline_counters_delete AFTER DELETE ON ideas
+BEGIN {_bump_counter("OLD", -1)}
+END;
+CREATE TRIGGER IF NOT EXISTS pipeline_counters_update AFTER UPDATE OF execution_status, code_stage ON ideas
+WHEN ({_pipeline_bucket("OLD")}) IS NOT ({_pipeline_bucket("NEW")})
+BEGIN {_bump_counter("OLD", -1)} {_bump_counter("NEW", 1)}
+END;
+"""
+
+# Same counters on Postgres: one plpgsql function behind the three triggers
+_PIPELINE_COUNTERS_SCHEMA_PG = f"""
+CREATE TABLE IF NOT EXISTS pipeline_counters (
+    bucket TEXT PRIMARY KEY,
+    n      INTEGER NOT NULL DEFAULT 0
+);
+CREATE OR REPLACE FUNCTION pipeline_counters_bump() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN {_bump_counter("OLD", -1)}
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN {_bump_counter("NEW", 1)}
+    END IF;
+    RETURN NULL;
+END $$;
+DROP TRIGGER IF EXISTS pipeline_counters_insert ON ideas;
+DROP TRIGGER IF EXISTS pipeline_counters_delete ON ideas;
+CREATE TRIGGER pipeline_counters_insert AFTER INSERT ON ideas
+    FOR EACH ROW EXECUTE FUNCTION pipeline_counters_bump();
+CREATE TRIGGER pipeline_counters_delete AFTER DELETE ON ideas
+    FOR EACH ROW EXECUTE FUNCTION pipeline_counters_bump();
+CREATE TRIGGER pipeline_counters_update AFTER UPDATE OF execution_status, code_stage ON ideas
+    FOR EACH ROW WHEN (({_pipeline_bucket("OLD")}) IS DISTINCT FROM ({_pipeline_bucket("NEW")}))
+    EXECUTE FUNCTION pipeline_counters_bump();
+"""
+
+
+def _count_pipeline_buckets(db):
+    """Exact bucket counts with a full aggregate over ideas."""
+    stats = dict.fromkeys(PIPELINE_BUCKETS, 0)
+    rows = db.execute(f"""
+        SELECT {_pipeline_bucket("ideas")} AS bucket, COUNT(*)
         FROM ideas
-        WHERE execution_status = 'failed'
-          AND code_stage != 'expressed'
-        ORDER BY executed_at ASC
+        GROUP BY bucket
     """).fetchall()
+    for bucket, n in rows:
+        if bucket is not None:
+            stats[bucket] = n
+    return stats
 
-    retryable = []
-    for row in rows:
-        error = row['execution_error'] or ''
-        # Count retry markers
-        retry_count = error.count('[RETRY]')
-        if retry_count < max_retries:
-            retryable.append(row)
-    return retryable
 
+def ensure_pipeline_counters(db):
+    """Create pipeline_counters and its triggers if missing, seeding it from ideas.
+
+    Table, triggers and seed go in one write-locked transaction, so no
+    write can land between counting and the triggers taking over.
+
+    Returns:
+        True if the counters were created by this call.
+    """
+    if _trigger_exists(db, "pipeline_counters_update"):
+        return False
+    try:
+        if dialect(db) == "postgres":
+            lock_ideas_for_write(db)
+            db.execute(_PIPELINE_COUNTERS_SCHEMA_PG)
+        else:
+            db.executescript("BEGIN IMMEDIATE;" + _PIPELINE_COUNTERS_SCHEMA)
+        _write_pipeline_counters(db, _count_pipeline_buckets(db))
+    except Exception:
+        db.rollback()
+        raise
+    db.commit()
+    return True
+
+
+def _trigger_exists(db, name):
+    if dialect(db) == "postgres":
+        sql = ("SELECT 1 FROM information_schema.triggers "
+               "WHERE trigger_schema = current_schema() AND trigger_name = ?")
+    else:
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?"
+    return db.execute(sql, [name]).fetchone() is not None
+
+
+def _write_pipeline_counters(db, counts):
+    db.execute("DELETE FROM pipeline_counters")
+    db.executemany("INSERT INTO pipeline_counters (bucket, n) VALUES (?, ?)", counts.items())
+
+
+def reconcile_pipeline_counters(db):
+    """Rebuild pipeline_counters from a full count and report any drift.
+
+    The triggers keep the counters exact; drift means someone wrote with
+    the triggers missing (e.g. an old backup restored over the table) or
+    edited the counters by hand.
+
+    Returns:
+        {bucket: (counter value, actual count)} for each bucket that differed.
+    """
+    ensure_pipeline_counters(db)
+    db.commit()
+    lock_ideas_for_write(db)
+    try:
+        actual = _count_pipeline_buckets(db)
+        stored = dict(db.execute("SELECT bucket, n FROM pipeline_counters").fetchall())
+        drift = {b: (stored.get(b, 0), n) for b, n in actual.items() if stored.get(b, 0) != n}
+        _write_pipeline_counters(db, actual)
+    except Exception:
+        db.rollback()
+        raise
+    db.commit()
+    return drift
 
-# ─── Stats Queries ───────────────────────────────────────────────────────────
 
 def get_pipeline_stats(db):
-    """Get pipeline status counts for the status monitor."""
-    return db.execute("""
-        SELECT
-            SUM(CASE WHEN execution_status IS NULL AND code_stage = 'organized' THEN 1 ELSE 0 END) as pending,
-            SUM(CASE WHEN execution_status LIKE 'queued_%' THEN 1 ELSE 0 END) as queued,
-            SUM(CASE WHEN execution_status = 'in_progress' THEN 1 ELSE 0 END) as in_progress,
-            SUM(CASE WHEN execution_status = 'developed' THEN 1 ELSE 0 END) as building,
-            SUM(CASE WHEN execution_status IN ('built', 'reviewing') THEN 1 ELSE 0 END) as in_review,
-            SUM(CASE WHEN execution_status = 'completed' THEN 1 ELSE 0 END) as completed,
-            SUM(CASE WHEN execution_status = 'failed' THEN 1 ELSE 0 END) as failed,
-            SUM(CASE WHEN execution_status = 'blocked' THEN 1 ELSE 0 END) as blocked
-        FROM ideas
-    """).fetchone()
+    """Get pipeline status counts for the status monitor.
+
+    Reads the trigger-maintained pipeline_counters (a handful of rows, the
+    same cost at any table size). Before db.migrations has created them it
+    falls back to the full aggregate.
+    """
+    try:
+        rows = db.execute("SELECT bucket, n FROM pipeline_counters").fetchall()
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):
+            raise
+        return _count_pipeline_buckets(db)
+    stats = dict.fromkeys(PIPELINE_BUCKETS, 0)
+    for bucket, n in rows:
+        if bucket in stats:
+            stats[bucket] = n
+    return stats
+
+
+# ─── Change Tracking ─────────────────────────────────────────────────────────
+
+# NOTIFY channel of the Postgres triggers (payload: the status an idea entered)
+CHANGE_CHANNEL = "openclaw_pipeline"
+
+
+def _wake_status(row):
+    """SQL expression: the queue an ideas row (`row` = NEW or OLD) sits in.
+
+    The execution_status, or 'pending' for organized ideas PM has not
+    routed yet (what get_routable_ideas returns). NULL otherwise.
+    """
+    return f"""CASE
+        WHEN COALESCE({row}.execution_status, '') = ''
+            THEN CASE WHEN {row}.code_stage = 'organized' THEN 'pending' END
+        ELSE {row}.execution_status
+    END"""
+
+
+def _bump_version(row):
+    return f"""
+        INSERT INTO pipeline_versions (status, version)
+        SELECT status, 1 FROM (SELECT {_wake_status(row)} AS status) AS s WHERE status IS NOT NULL
+        ON CONFLICT (status) DO UPDATE SET version = pipeline_versions.version + 1;"""
+
+
+# Bumped whenever an idea enters a status, whoever writes ideas (agents or dashboard)
+_PIPELINE_VERSIONS_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS pipeline_versions (
+    status  TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TRIGGER IF NOT EXISTS pipeline_versions_insert AFTER INSERT ON ideas
+BEGIN {_bump_version("NEW")}
+END;
+CREATE TRIGGER IF NOT EXISTS pipeline_versions_update AFTER UPDATE OF execution_status, code_stage ON ideas
+WHEN ({_wake_status("OLD")}) IS NOT ({_wake_status("NEW")})
+BEGIN {_bump_version("NEW")}
+END;
+"""
+
+# Postgres: same versions, plus a NOTIFY that db/watcher.py LISTENs to.
+# NOTIFY is sent on commit, once per distinct status in the transaction.
+_PIPELINE_VERSIONS_SCHEMA_PG = f"""
+CREATE TABLE IF NOT EXISTS pipeline_versions (
+    status  TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE OR REPLACE FUNCTION pipeline_versions_bump() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF ({_wake_status("NEW")}) IS NOT NULL THEN {_bump_version("NEW")}
+        PERFORM pg_notify('{CHANGE_CHANNEL}', {_wake_status("NEW")});
+    END IF;
+    RETURN NULL;
+END $$;
+DROP TRIGGER IF EXISTS pipeline_versions_insert ON ideas;
+CREATE TRIGGER pipeline_versions_insert AFTER INSERT ON ideas
+    FOR EACH ROW EXECUTE FUNCTION pipeline_versions_bump();
+CREATE TRIGGER pipeline_versions_update AFTER UPDATE OF execution_status, code_stage ON ideas
+    FOR EACH ROW WHEN (({_wake_status("OLD")}) IS DISTINCT FROM ({_wake_status("NEW")}))
+    EXECUTE FUNCTION pipeline_versions_bump();
+"""
+
+
+def ensure_change_tracking(db):
+    """Create pipeline_versions and its triggers if missing.
+
+    Returns:
+        True if they were created by this call.
+    """
+    if _trigger_exists(db, "pipeline_versions_update"):
+        return False
+    if dialect(db) == "postgres":
+        try:
+            db.execute("BEGIN")
+            db.execute(_PIPELINE_VERSIONS_SCHEMA_PG)
+        except Exception:
+            db.rollback()
+            raise
+        db.commit()
+    else:
+        db.executescript(_PIPELINE_VERSIONS_SCHEMA)
+    return True
+
+
+def get_status_versions(db):
+    """{status: version} — a status' version grows each time an idea enters it.
+
+    Empty before db.migrations has created the table.
+    """
+    try:
+        return dict(db.execute("SELECT status, version FROM pipeline_versions").fetchall())
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):
+            raise
+        return {}
+
+
+# ─── LLM Usage Ledger ────────────────────────────────────────────────────────
+
+_LLM_USAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at    TEXT NOT NULL DEFAULT (datetime('now')),
+    agent         TEXT,
+    idea_id       INTEGER,
+    skills        TEXT,
+    backend       TEXT NOT NULL,
+    model         TEXT,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    system_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER,
+    prompt_eval_ms INTEGER,
+    token_source  TEXT,
+    wall_ms       INTEGER NOT NULL DEFAULT 0,
+    ttft_ms       INTEGER,
+    outcome       TEXT NOT NULL,
+    error_kind    TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_llm_usage_backend ON llm_usage(backend, created_at);
+CREATE INDEX IF NOT EXISTS idx_llm_usage_agent ON llm_usage(agent, created_at);
+CREATE INDEX IF NOT EXISTS idx_llm_usage_idea ON llm_usage(idea_id);
+"""
+
+_LLM_USAGE_COLUMNS = (
+    "agent", "idea_id", "skills", "backend", "model", "prompt_tokens", "system_tokens",
+    "output_tokens", "cached_tokens", "prompt_eval_ms", "token_source", "wall_ms", "ttft_ms",
+    "outcome", "error_kind",
+)
+
+# Columns get_llm_usage_stats may group by (interpolated into SQL, so whitelisted)
+_LLM_USAGE_GROUPS = ("backend", "agent", "model", "skills", "outcome")
+
+
+def ensure_llm_usage_table(db):
+    """Create the llm_usage table and its indexes if missing (idempotent)."""
+    db.executescript(_LLM_USAGE_SCHEMA)
+    db.commit()
+
+
+@writer.queued(wait=False)
+def record_llm_usage(db, usage):
+    """Append one LLM call to the ledger.
+
+    `usage` is a dict with the keys in _LLM_USAGE_COLUMNS (missing keys are
+    stored as NULL / 0). The table is created on first use. With the commit
+    queue running (db/writer.py) it returns without waiting for the write.
+    """
+    values = [usage.get(col) for col in _LLM_USAGE_COLUMNS]
+    if isinstance(values[2], (list, tuple)):
+        values[2] = ",".join(values[2])
+    sql = f"""
+        INSERT INTO llm_usage ({", ".join(_LLM_USAGE_COLUMNS)})
+        VALUES ({", ".join("?" * len(_LLM_USAGE_COLUMNS))})
+    """
+    try:
+        db.execute(sql, values)
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):
+            raise
+        ensure_llm_usage_table(db)
+        db.execute(sql, values)
+    db.commit()
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list (None if empty)."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def get_llm_usage_stats(db, group_by='backend', since=None):
+    """Latency and throughput per backend (or agent, model...) from the ledger.
+
+    Latency percentiles and tokens/s only count calls that produced output
+    (outcome 'ok' or 'stopped'); cache hits and failures are counted apart.
+    tokens/s is decode speed: each call's time to first token, when known,
+    is left out of its wall time.
+
+    Args:
+        group_by: One of _LLM_USAGE_GROUPS.
+        since:    Optional SQLite datetime string ('2025-01-01 00:00:00').
+
+    Prefix reuse: `prefix_hit_rate` is the share of answered calls where the
+    backend served part of the prompt from its prefix/KV cache, `cached_share`
+    the share of input tokens served that way. `prefill_saved_ms` prices the
+    cached tokens at the group's measured prompt-eval speed (Ollama only
+    reports prompt_eval_duration, so it is None for cloud backends).
+
+    Returns:
+        {group: {calls, ok, errors, cache_hits, prompt_tokens, system_tokens,
+                 output_tokens, cached_tokens, p50_ms, p95_ms, ttft_p50_ms,
+                 tokens_per_s, prefix_hit_rate, cached_share, prefill_saved_ms}}
+    """
+    if group_by not in _LLM_USAGE_GROUPS:
+        raise ValueError(f"group_by must be one of {_LLM_USAGE_GROUPS}")
+    where = "WHERE created_at >= ?" if since else ""
+    try:
+        rows = db.execute(f"""
+            SELECT {group_by} AS grp, outcome, prompt_tokens, system_tokens,
+                   output_tokens, wall_ms, ttft_ms, cached_tokens, prompt_eval_ms
+            FROM llm_usage {where}
+        """, [since] if since else []).fetchall()
+    except sqlite3.OperationalError as e:
+        if "no such table" in str(e):
+            return {}
+        raise
+
+    groups = {}
+    for grp, outcome, prompt_t, system_t, output_t, wall_ms, ttft_ms, cached_t, eval_ms in rows:
+        g = groups.setdefault(grp or '-', {
+            "calls": 0, "ok": 0, "errors": 0, "cache_hits": 0,
+            "prompt_tokens": 0, "system_tokens": 0, "output_tokens": 0, "cached_tokens": 0,
+            "_wall": [], "_ttft": [], "_gen_tokens": 0, "_gen_ms": 0,
+            "_prefix_hits": 0, "_input": 0, "_eval_ms": 0, "_eval_tokens": 0,
+        })
+        g["calls"] += 1
+        g["prompt_tokens"] += prompt_t or 0
+        g["system_tokens"] += system_t or 0
+        g["output_tokens"] += output_t or 0
+        if outcome == 'cache':
+            g["cache_hits"] += 1
+        elif outcome in ('ok', 'stopped'):
+            g["ok"] += 1
+            g["_wall"].append(wall_ms or 0)
+            if ttft_ms is not None:
+                g["_ttft"].append(ttft_ms)
+            g["_gen_tokens"] += output_t or 0
+            # Decode time only: the wait for the first token is prefill/queueing
+            g["_gen_ms"] += max((wall_ms or 0) - (ttft_ms or 0), 0)
+            g["cached_tokens"] += cached_t or 0
+            g["_input"] += (prompt_t or 0) + (system_t or 0)
+            if cached_t:
+                g["_prefix_hits"] += 1
+            if eval_ms:
+                g["_eval_ms"] += eval_ms
+                g["_eval_tokens"] += (prompt_t or 0) + (system_t or 0) - (cached_t or 0)
+        else:
+            g["errors"] += 1
+
+    for g in groups.values():
+        wall = sorted(g.pop("_wall"))
+        ttft = sorted(g.pop("_ttft"))
+        gen_tokens = g.pop("_gen_tokens")
+        gen_ms = g.pop("_gen_ms")
+        g["p50_ms"] = _percentile(wall, 50)
+        g["p95_ms"] = _percentile(wall, 95)
+        g["ttft_p50_ms"] = _percentile(ttft, 50)
+        g["tokens_per_s"] = round(gen_tokens * 1000.0 / gen_ms, 1) if gen_ms else None
+        prefix_hits = g.pop("_prefix_hits")
+        input_tokens = g.pop("_input")
+        eval_ms = g.pop("_eval_ms")
+        eval_tokens = g.pop("_eval_tokens")
+        g["prefix_hit_rate"] = round(prefix_hits / g["ok"], 3) if g["ok"] else 0.0
+        g["cached_share"] = round(g["cached_tokens"] / input_tokens, 3) if input_tokens else 0.0
+        g["prefill_saved_ms"] = (
+            int(g["cached_tokens"] * eval_ms / eval_tokens) if eval_ms and eval_tokens > 0 else None
+        )
+    return groups
+
+
+def get_idea_llm_usage(db, idea_id):
+    """All ledger rows of one idea, oldest first (cost breakdown per idea)."""
+    try:
+        return db.execute("""
+            SELECT created_at, agent, skills, backend, model, prompt_tokens, system_tokens,
+                   output_tokens, cached_tokens, prompt_eval_ms, token_source, wall_ms, ttft_ms,
+                   outcome, error_kind
+            FROM llm_usage WHERE idea_id = ? ORDER BY id ASC
+        """, [idea_id]).fetchall()
+    except sqlite3.OperationalError as e:
+        if "no such table" in str(e):
+            return []
+        raise
@@ -0,0 +1,194 @@
+"""
+Slow-query log and per-query latency histograms.
+
+Nothing told us which query gets slow on production-sized databases.
+With the log enabled, CountingConnection (SQLite) and PgConnection time
+every execute / executemany and hand the statement to query_log.observe():
+
+  - the statement is attributed to the db/queries.py function that issued
+    it (claim_next, get_ideas_in_status, ...; other callers are named
+    module.function) and added to that name's latency histogram,
+  - above `threshold_ms` it is recorded in a bounded list of slow queries:
+    statement shape (whitespace collapsed, literals replaced by ?), bound
+    parameters redacted (text and blobs become <str:len> / <bytes:len>;
+    numbers and NULL are kept), duration and thread,
+  - the first time a shape is slow its plan is captured once — EXPLAIN
+    QUERY PLAN on SQLite, EXPLAIN on Postgres — and logged with it.
+
+Times are those of execute(): for SELECTs that is up to the first row,
+which is where SQLite does the sorting / scanning a bad plan costs.
+
+stats() and dump() are the read side: the status monitor logs the worst
+queries, main writes dump() to logs/slow_queries.json on SIGUSR1, and
+`python -m db.slowlog` runs the pipeline queries once and prints both.
+"""
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+from db.metrics import Histogram
+
+logger = logging.getLogger("OpenClaw.slowlog")
+
+_LATENCY_BOUNDS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+_EXPLAINABLE = re.compile(r"\s*(SELECT|WITH|UPDATE|DELETE|INSERT|REPLACE)\b", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+_CONNECTION_MODULES = {"db.connection", "db.postgres", __name__}
+
+
+class QueryLog:
+    """Times statements, keeps per-name histograms and the slow ones with their plans."""
+
+    def __init__(self, enabled=False, threshold_ms=50.0, max_entries=200, explain=True):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self._slow = deque(maxlen=max_entries)
+        self._plans = {}                # shape -> [plan lines]
+        self._histograms = {}           # query name -> Histogram
+        self._lock = threading.Lock()
+
+    def configure(self, enabled=None, threshold_ms=None, max_entries=None, explain=None):
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if threshold_ms is not None:
+                self.threshold_ms = threshold_ms
+            if explain is not None:
+                self.explain = explain
+            if max_entries is not None:
+                self._slow = deque(self._slow, maxlen=max_entries)
+
+    def observe(self, sql, parameters, elapsed_s, explain=None):
+        """Account one statement; `explain()` returns its plan lines (called once per slow shape)."""
+        name = _caller_name()
+        ms = elapsed_s * 1000
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(_LATENCY_BOUNDS_MS)
+            histogram.add(ms)
+        if ms < self.threshold_ms:
+            return
+        shape = statement_shape(sql)
+        entry = {"at": time.time(), "name": name, "ms": round(ms, 3), "shape": shape,
+                 "params": redact(parameters), "thread": threading.current_thread().name}
+        with self._lock:
+            self._slow.append(entry)
+            new_shape = shape not in self._plans
+            if new_shape:
+                self._plans[shape] = None     # claimed: no other thread explains it too
+        if not new_shape:
+            logger.info("Consulta lenta %s: %.1fms", name, ms)
+            return
+        plan = None
+        if self.explain and explain is not None and _EXPLAINABLE.match(sql):
+            try:
+                plan = explain()
+            except Exception as e:
+                plan = [f"(sin plan: {e})"]
+        with self._lock:
+            self._plans[shape] = plan
+        logger.warning("Consulta lenta %s: %.1fms params=%s\n  %s%s", name, ms, entry["params"], shape,
+                       "".join(f"\n  plan: {line}" for line in plan or ()))
+
+    def slow(self, limit=None):
+        """Most recent slow statements first."""
+        with self._lock:
+            entries = list(self._slow)[::-1]
+        return entries[:limit] if limit else entries
+
+    def stats(self):
+        """{query name: {count, mean, p50, p95, max, buckets}} in ms, slowest p95 first."""
+        with self._lock:
+            snapshot = {name: h.snapshot() for name, h in self._histograms.items()}
+        return dict(sorted(snapshot.items(), key=lambda kv: (-kv[1]["p95"], -kv[1]["max"])))
+
+    def dump(self, path=None):
+        """{threshold_ms, queries, slow, plans}; written as JSON to `path` if given."""
+        with self._lock:
+            plans = {shape: plan for shape, plan in self._plans.items() if plan is not None}
+        data = {"threshold_ms": self.threshold_ms, "queries": self.stats(), "slow": self.slow(), "plans": plans}
+        if path is not None:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        return data
+
+    def reset(self):
+        with self._lock:
+            self._slow.clear()
+            self._plans.clear()
+            self._histograms.clear()
+
+
+def statement_shape(sql):
+    """`sql` with literals replaced by ? and whitespace collapsed (one shape per query, not per call)."""
+    shape = _STRING.sub("?", sql)
+    shape = _NUMBER.sub("?", shape)
+    shape = _LIST.sub("(?...)", shape)
+    return _SPACE.sub(" ", shape).strip()
+
+
+def redact(parameters):
+    """Bound parameters with text and blobs replaced by their type and length."""
+    if isinstance(parameters, dict):
+        return {k: _redact_value(v) for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_redact_value(v) for v in parameters]
+    return "<many>"     # executemany (rows not kept)
+
+
+def _redact_value(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<bytes:{len(value)}>"
+    if isinstance(value, str):
+        return f"<str:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def _caller_name():
+    """Outermost db/queries.py function on the stack, else module.function of the first caller."""
+    frame = sys._getframe(2)
+    while frame is not None and (frame.f_globals.get("__name__") in _CONNECTION_MODULES
+                                 or frame.f_code.co_qualname.startswith("_BatchConnection.")):
+        frame = frame.f_back
+    if frame is None:
+        return "?"
+    if frame.f_globals.get("__name__") != "db.queries":
+        return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+    name = frame.f_code.co_name
+    while frame is not None and frame.f_globals.get("__name__") == "db.queries":
+        if not frame.f_code.co_name.startswith("_") or name.startswith("_"):
+            name = frame.f_code.co_name
+        frame = frame.f_back
+    return name
+
+
+query_log = QueryLog()
+
+
+if __name__ == "__main__":
+    from db import queries
+    from db.connection import get_connection
+
+    query_log.configure(enabled=True, threshold_ms=float(sys.argv[1]) if sys.argv[1:] else 0)
+    conn = get_connection()
+    queries.get_routable_ideas(conn)
+    queries.get_ideas_in_status(conn, "queued_software")
+    queries.get_retryable_failed_ideas(conn)
+    queries.get_pipeline_stats(conn)
+    for name, s in query_log.stats().items():
+        print(f"{name:<32} n={s['count']:<4} p50={s['p50']}ms p95={s['p95']}ms max={s['max']}ms")
+    for shape, plan in query_log.dump()["plans"].items():
+        print(f"\n{shape[:160]}")
+        for line in plan:
+            print(f"  {line}")
@@ -0,0 +1,121 @@
+"""
+Change notifications for the agent loops.
+
+Agents used to sleep their whole interval between polls, so an idea
+waited up to a full interval at every hop and idle polls kept hitting the
+database. ChangeWatcher runs one cheap thread that notices when ideas
+enter a status and wakes only the agents subscribed to it:
+
+  - SQLite: polls PRAGMA data_version every `interval` seconds on its own
+    connection (it changes when any other connection commits, dashboard
+    included) and, only when it moved, reads pipeline_versions to see
+    which statuses changed.
+  - Postgres: LISTENs on queries.CHANGE_CHANNEL; the pipeline_versions
+    trigger NOTIFYs the status on commit.
+
+Subscribers get a threading.Event; agent loops wait on it with their usual
+interval as timeout, so the fixed interval stays as a safety net (and is
+all there is if the watcher is disabled or its triggers are missing).
+"""
+import logging
+import threading
+
+from db import connection, queries
+
+logger = logging.getLogger("OpenClaw.watcher")
+
+
+class ChangeWatcher:
+    """Wakes subscribers when ideas enter the statuses they consume."""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self._subscribers = []          # (frozenset of statuses, Event)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {"checks": 0, "changes": 0, "wakeups": {}}
+
+    def subscribe(self, statuses):
+        """Event set whenever an idea enters one of `statuses` (and on wake_all())."""
+        event = threading.Event()
+        with self._lock:
+            self._subscribers.append((frozenset(statuses), event))
+        return event
+
+    def notify(self, statuses):
+        """Wake the subscribers of any of `statuses`."""
+        statuses = set(statuses)
+        with self._lock:
+            for wanted, event in self._subscribers:
+                if wanted & statuses:
+                    event.set()
+            for status in statuses:
+                self._stats["wakeups"][status] = self._stats["wakeups"].get(status, 0) + 1
+
+    def wake_all(self):
+        """Wake every subscriber (on shutdown, so no loop waits out its interval)."""
+        with self._lock:
+            for _, event in self._subscribers:
+                event.set()
+
+    def stats(self):
+        """{checks, changes, wakeups: {status: n}} since start."""
+        with self._lock:
+            return {**self._stats, "wakeups": dict(self._stats["wakeups"])}
+
+    def start(self, shutdown):
+        """Start the watcher thread; it stops (and wakes everyone) when `shutdown` is set."""
+        target = self._listen if connection.PROFILE["backend"] == "postgres" else self._poll
+        self._thread = threading.Thread(target=self._run, args=(target, shutdown),
+                                        daemon=True, name="WATCHER")
+        self._thread.start()
+        return self._thread
+
+    def _run(self, target, shutdown):
+        try:
+            target(shutdown)
+        except Exception:
+            logger.exception("Watcher detenido; los agentes siguen con su intervalo fijo")
+        finally:
+            self.wake_all()
+
+    # ── SQLite ───────────────────────────────────────────────────────────────
+
+    def _poll(self, shutdown):
+        db = connection._create_connection(connection._resolve_db_path(), read_only=True)
+        try:
+            versions = queries.get_status_versions(db)
+            data_version = db.execute("PRAGMA data_version").fetchone()[0]
+            while not shutdown.wait(self.interval):
+                current = db.execute("PRAGMA data_version").fetchone()[0]
+                self._count("checks")
+                if current == data_version:
+                    continue
+                data_version = current
+                new = queries.get_status_versions(db)
+                changed = {s for s, v in new.items() if versions.get(s) != v}
+                versions = new
+                if changed:
+                    self._count("changes")
+                    self.notify(changed)
+        finally:
+            db.close()
+
+    # ── Postgres ─────────────────────────────────────────────────────────────
+
+    def _listen(self, shutdown):
+        import psycopg
+
+        with psycopg.connect(connection._postgres_pool().conninfo, autocommit=True) as conn:
+            conn.execute(f"LISTEN {queries.CHANGE_CHANNEL}")
+            while not shutdown.is_set():
+                changed = {n.payload for n in conn.notifies(timeout=self.interval)}
+                self._count("checks")
+                if changed:
+                    self._count("changes")
+                    self.notify(changed)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
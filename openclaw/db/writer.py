@@ -0,0 +1,305 @@
+"""
+Single-writer commit queue for the SQLite backend (optional).
+
+Six agent threads plus the dashboard write to one SQLite file, and each
+status change used to take the write lock and commit on its own: under
+load every writer waited (up to busy_timeout) for the others. With the
+queue started, the write functions of db/queries.py decorated with
+queued() no longer run on the caller's connection: they are handed to one
+writer thread that
+
+  - takes up to `max_batch` queued operations: whatever piled up while
+    the previous batch was committing, plus (optionally) what arrives
+    within `max_delay_ms` of the first one,
+  - runs them in a single BEGIN IMMEDIATE transaction, each inside its own
+    SAVEPOINT so a failing operation rolls back alone,
+  - commits once and resolves each operation's Future.
+
+Callers of wait=True functions block until their write is committed, so
+the API keeps its meaning (and read-your-writes); wait=False functions
+(streaming progress, the LLM ledger) return the Future right away. Writes
+from one thread are applied in submission order.
+
+Operations receive a _BatchConnection instead of a real connection:
+commit() is a no-op (the batch commits), rollback() rolls back to the
+operation's savepoint and BEGIN statements are skipped. Only connections
+to the queue's own database file that are not mid-transaction are
+routed; everything else (tests' in-memory databases, Postgres) writes
+directly as before.
+
+stats() reports ops, batches, errors and histograms of queue depth, batch
+size, lock wait and commit time.
+"""
+import concurrent.futures
+import functools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from db import connection
+from db.metrics import Histogram
+
+logger = logging.getLogger("OpenClaw.writer")
+
+_STOP = object()
+
+_active = None                 # the running CommitQueue, if any
+_active_lock = threading.Lock()
+
+
+class _BatchConnection:
+    """What a queued operation sees as `db`: the writer's connection inside the batch."""
+
+    dialect = "sqlite"
+    in_transaction = True
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, sql, parameters=()):
+        if sql.lstrip()[:5].upper() == "BEGIN":
+            return self._conn.execute("SELECT 1 WHERE 0")     # already inside the batch
+        return self._conn.execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._conn.executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        # sqlite3's executescript() would COMMIT the batch first; run it statement by statement
+        statement = ""
+        for line in sql_script.splitlines(keepends=True):
+            statement += line
+            if sqlite3.complete_statement(statement):
+                self._conn.execute(statement)
+                statement = ""
+        if statement.strip():
+            self._conn.execute(statement)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self._conn.execute("ROLLBACK TO op")
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class CommitQueue:
+    """One writer thread that group-commits the operations submitted to it.
+
+    Args:
+        path:         SQLite file (default: DB_PATH, like get_connection()).
+        max_batch:    Operations per transaction at most.
+        max_delay_ms: How long the writer waits for more work after the first
+                      operation of a batch before committing. 0 (default) never
+                      waits: batches are what queued up during the last commit,
+                      which keeps latency down; a few ms gives bigger batches.
+    """
+
+    def __init__(self, path=None, max_batch=64, max_delay_ms=0.0):
+        self.path = path or connection._resolve_db_path()
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._ops = self._batches = self._errors = 0
+        self._depth = Histogram((0, 1, 2, 4, 8, 16, 32, 64, 128))
+        self._batch_size = Histogram((1, 2, 4, 8, 16, 32, 64))
+        self._lock_wait_ms = Histogram((0.1, 1, 5, 10, 50, 100, 500, 1000, 5000))
+        self._commit_ms = Histogram((0.1, 0.5, 1, 5, 10, 50, 100))
+
+    def start(self):
+        """Open the writer connection and start the thread."""
+        from db import queries
+
+        self._conn = connection._create_connection(self.path)
+        self._conn.role = "writer"
+        # Schema helpers use executescript; run them now rather than inside a batch
+        queries.ensure_execution_schema(self._conn)
+        queries.ensure_llm_usage_table(self._conn)
+        self._thread = threading.Thread(target=self._run, daemon=True, name="DB-WRITER")
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        """Apply what is already queued, then stop the thread and close its connection."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        # Submitted after the stop marker: nobody will apply them
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP and item[3].set_running_or_notify_cancel():
+                item[3].set_exception(sqlite3.OperationalError("commit queue stopped"))
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue `fn(db, *args, **kwargs)`; the Future resolves to its result once committed."""
+        future = concurrent.futures.Future()
+        if self._thread is None:
+            future.set_exception(sqlite3.OperationalError("commit queue stopped"))
+            return future
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def accepts(self, db):
+        """True if a write on `db` should go through this queue."""
+        return (self.running
+                and threading.current_thread() is not self._thread
+                and getattr(db, "path", None) == self.path
+                and not db.in_transaction)
+
+    def stats(self):
+        """{ops, batches, errors, pending, queue_depth, batch_size, lock_wait_ms, commit_ms}."""
+        with self._lock:
+            return {
+                "ops": self._ops,
+                "batches": self._batches,
+                "errors": self._errors,
+                "pending": self._queue.qsize(),
+                "queue_depth": self._depth.snapshot(),
+                "batch_size": self._batch_size.snapshot(),
+                "lock_wait_ms": self._lock_wait_ms.snapshot(),
+                "commit_ms": self._commit_ms.snapshot(),
+            }
+
+    # ── writer thread ────────────────────────────────────────────────────────
+
+    def _run(self):
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                depth = self._queue.qsize()
+                batch, stopping = self._collect(item)
+                if batch:
+                    self._apply(batch, depth)
+        finally:
+            self._conn.close()
+
+    def _collect(self, first):
+        """The batch starting with `first`; (batch, stop requested)."""
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _apply(self, batch, depth):
+        batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        results = []
+        inicio = time.perf_counter()
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+            lock_wait = time.perf_counter() - inicio
+            proxy = _BatchConnection(self._conn)
+            for fn, args, kwargs, future in batch:
+                self._conn.execute("SAVEPOINT op")
+                try:
+                    results.append((future, fn(proxy, *args, **kwargs), None))
+                except Exception as e:
+                    self._conn.execute("ROLLBACK TO op")
+                    results.append((future, None, e))
+                self._conn.execute("RELEASE op")
+            committing = time.perf_counter()
+            self._conn.commit()
+            commit_s = time.perf_counter() - committing
+        except Exception as e:
+            # The transaction itself failed (e.g. still locked after busy_timeout)
+            if self._conn.in_transaction:
+                self._conn.rollback()
+            logger.warning("Lote de %d escrituras descartado: %s", len(batch), e)
+            with self._lock:
+                self._errors += len(batch)
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+        errors = sum(1 for _, _, e in results if e is not None)
+        with self._lock:
+            self._ops += len(batch)
+            self._batches += 1
+            self._errors += errors
+            self._depth.add(depth)
+            self._batch_size.add(len(batch))
+            self._lock_wait_ms.add(lock_wait * 1000)
+            self._commit_ms.add(commit_s * 1000)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+def start(path=None, max_batch=64, max_delay_ms=0.0):
+    """Start the process-wide commit queue (SQLite only); returns it."""
+    global _active
+    with _active_lock:
+        if _active is not None and _active.running:
+            return _active
+        _active = CommitQueue(path, max_batch=max_batch, max_delay_ms=max_delay_ms).start()
+        return _active
+
+
+def stop():
+    """Drain and stop the process-wide commit queue, if running."""
+    global _active
+    with _active_lock:
+        q, _active = _active, None
+    if q is not None:
+        q.stop()
+
+
+def active():
+    """The running CommitQueue, or None."""
+    return _active
+
+
+def queued(wait=True):
+    """Route a `fn(db, ...)` write through the running commit queue.
+
+    With no queue running, or a `db` it does not accept, fn runs directly.
+    wait=True returns fn's result once committed (exceptions re-raised);
+    wait=False returns the Future.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(db, *args, **kwargs):
+            q = _active
+            if q is None or not q.accepts(db):
+                return fn(db, *args, **kwargs)
+            future = q.submit(fn, *args, **kwargs)
+            if wait:
+                return future.result()
+            future.add_done_callback(_log_failure)
+            return future
+        return wrapper
+    return decorator
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Escritura en cola fallida: %s", future.exception())
@@ -0,0 +1,167 @@
+"""
+Reparto de peticiones entre varios servidores Ollama.
+
+Con una sola OLLAMA_URL un servidor CPU se satura mientras los demas estan
+ociosos. OllamaBalancer elige para cada peticion el host con menor costo
+estimado:
+
+    costo = (peticiones en vuelo + 1) * latencia reciente (EWMA)
+            + penalizacion de carga si el host no tiene el modelo cargado
+
+Es decir, "least outstanding requests" ponderado por lo rapido que responde
+cada host; a igualdad gana el que menos peticiones recibio. Los modelos
+cargados se aprenden de /api/ps (ResidencyManager) y de cada respuesta.
+
+Un host con `failure_threshold` fallos seguidos sale de la rotacion durante
+un enfriamiento con backoff exponencial; al vencer vuelve a recibir trafico.
+Si todos estan fuera se usa el que vuelve antes (hace de llamada de prueba).
+"""
+import logging
+import threading
+import time
+
+from llm.residency import nombre_modelo
+
+logger = logging.getLogger("OpenClaw.balancer")
+
+
+class _HostState:
+    """Estado de un host. Solo se modifica con el lock del balanceador."""
+
+    __slots__ = ("in_flight", "max_in_flight", "requests", "errors", "latency",
+                 "consecutive_failures", "down_until", "attempts", "models", "last_kind")
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.latency = None              # EWMA de segundos por respuesta completa
+        self.consecutive_failures = 0
+        self.down_until = 0.0            # fuera de rotacion hasta este instante
+        self.attempts = 0                # enfriamientos seguidos (exponente del backoff)
+        self.models = set()
+        self.last_kind = None
+
+
+class OllamaBalancer:
+    """Balanceo least-outstanding + latencia entre hosts Ollama.
+
+    Args:
+        hosts:             fn() -> lista de URLs base de Ollama.
+        failure_threshold: Fallos seguidos que sacan un host de la rotacion.
+        cooldown:          Enfriamiento base (s); se duplica en cada recaida.
+        cooldown_max:      Techo del enfriamiento.
+        alpha:             Peso de la ultima muestra en la EWMA de latencia.
+        cold_penalty:      Segundos que se suman a un host sin el modelo cargado.
+    """
+
+    def __init__(self, hosts, failure_threshold=2, cooldown=10.0, cooldown_max=300.0,
+                 alpha=0.3, cold_penalty=30.0):
+        self.hosts = hosts
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.cooldown_max = cooldown_max
+        self.alpha = alpha
+        self.cold_penalty = cold_penalty
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._clock = time.monotonic
+
+    def _get(self, host):
+        h = self._hosts.get(host)
+        if h is None:
+            h = self._hosts[host] = _HostState()
+        return h
+
+    # ── Eleccion ────────────────────────────────────────────────────────────
+
+    def acquire(self, model):
+        """Elige host para una peticion a `model` y la cuenta como en vuelo.
+
+        Siempre hay que llamar a release() con el host devuelto.
+        """
+        modelo = nombre_modelo(model)
+        with self._lock:
+            now = self._clock()
+            candidatos = [(host, self._get(host)) for host in self.hosts()]
+            if len(candidatos) == 1:
+                host, h = candidatos[0]
+            else:
+                vivos = [(host, h) for host, h in candidatos if h.down_until <= now]
+                if vivos:
+                    conocidas = [h.latency for _, h in vivos if h.latency is not None]
+                    referencia = sum(conocidas) / len(conocidas) if conocidas else 1.0
+                    host, h = min(vivos, key=lambda c: (self._costo(c[1], modelo, referencia), c[1].requests))
+                else:
+                    host, h = min(candidatos, key=lambda c: c[1].down_until)
+            h.in_flight += 1
+            h.max_in_flight = max(h.max_in_flight, h.in_flight)
+            h.requests += 1
+            return host
+
+    def _costo(self, h, modelo, referencia):
+        latencia = h.latency if h.latency is not None else referencia
+        costo = (h.in_flight + 1) * latencia
+        if modelo not in h.models:
+            costo += self.cold_penalty
+        return costo
+
+    def release(self, host, ok, latency=None, kind=None, model=None):
+        """Cierra una peticion: actualiza latencia, modelos cargados y salud del host.
+
+        ok=None (peticion cancelada desde fuera) solo la saca de en vuelo.
+        """
+        with self._lock:
+            h = self._get(host)
+            h.in_flight = max(h.in_flight - 1, 0)
+            if ok is None:
+                return
+            if ok:
+                if latency is not None:
+                    h.latency = latency if h.latency is None else (
+                        self.alpha * latency + (1 - self.alpha) * h.latency)
+                if model:
+                    h.models.add(nombre_modelo(model))
+                if h.down_until or h.consecutive_failures:
+                    logger.info("Ollama %s de vuelta en la rotacion", host)
+                h.consecutive_failures = 0
+                h.attempts = 0
+                h.down_until = 0.0
+                return
+            h.errors += 1
+            h.consecutive_failures += 1
+            h.last_kind = kind
+            if h.consecutive_failures >= self.failure_threshold:
+                h.attempts += 1
+                espera = min(self.cooldown_max, self.cooldown * (2 ** (h.attempts - 1)))
+                h.down_until = self._clock() + espera
+                logger.warning("Ollama %s fuera de rotacion %.0fs (%s, %d fallos seguidos)",
+                               host, espera, kind, h.consecutive_failures)
+
+    # ── Modelos cargados ────────────────────────────────────────────────────
+
+    def set_models(self, host, models):
+        """Reemplaza los modelos cargados de `host` (lo que lista /api/ps)."""
+        with self._lock:
+            self._get(host).models = {nombre_modelo(m) for m in models if m}
+
+    # ── Metricas ────────────────────────────────────────────────────────────
+
+    def stats(self):
+        """{host: {state, in_flight, max_in_flight, requests, errors, latency_s, retry_in, models}}"""
+        with self._lock:
+            now = self._clock()
+            return {
+                host: {
+                    "state": "down" if h.down_until > now else "up",
+                    "in_flight": h.in_flight,
+                    "max_in_flight": h.max_in_flight,
+                    "requests": h.requests,
+                    "errors": h.errors,
+                    "latency_s": round(h.latency, 3) if h.latency is not None else None,
+                    "retry_in": max(round(h.down_until - now, 1), 0.0),
+                    "models": sorted(h.models),
+                }
+                for host, h in self._hosts.items()
+            }
@@ -0,0 +1,167 @@
+"""
+Cache de respuestas IA direccionado por contenido (SQLite local).
+
+La clave es un SHA-256 de (backend, modelo, sistema, prompt, max_tokens), asi
+que un reintento de QA/REVIEWER con el mismo prompt no vuelve a pagar la
+latencia del LLM. Desalojo:
+  - TTL por agente (expires_at se fija al guardar)
+  - LRU por tamano total: si se supera max_bytes se borran las entradas
+    accedidas hace mas tiempo
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("OpenClaw.cache")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key         TEXT PRIMARY KEY,
+    backend     TEXT NOT NULL,
+    model       TEXT,
+    agent       TEXT,
+    response    TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL,
+    expires_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_lru ON llm_cache(last_access);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache(expires_at);
+"""
+
+
+def cache_key(backend, model, sistema, prompt, max_tokens):
+    """Hash estable de todo lo que determina la respuesta."""
+    h = hashlib.sha256()
+    for part in (backend, model or "", sistema or "", prompt or "", str(max_tokens)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """Cache persistente de respuestas, segura entre hilos.
+
+    Args:
+        path:        Archivo SQLite (':memory:' para tests).
+        max_bytes:   Tamano maximo total de respuestas almacenadas.
+        default_ttl: Segundos de vida si el agente no tiene TTL propio.
+        ttl_by_agent: {'qa': 3600, ...} — claves en minusculas.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, default_ttl=86400, ttl_by_agent=None):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.ttl_by_agent = {k.lower(): v for k, v in (ttl_by_agent or {}).items()}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "bypass": 0}
+
+    def ttl_for(self, agent):
+        return self.ttl_by_agent.get((agent or "").lower(), self.default_ttl)
+
+    def get(self, key):
+        """Retorna la respuesta cacheada o None. Actualiza last_access (LRU)."""
+        return self.get_first([key])[1]
+
+    def get_first(self, keys):
+        """Primera de `keys` con respuesta vigente (ej. una clave por backend de la cadena).
+
+        Cuenta como una sola consulta: un hit o un miss, sin importar cuantas
+        claves se prueben.
+
+        Returns:
+            (clave, respuesta) o (None, None).
+        """
+        now = time.time()
+        with self._lock:
+            expiradas = 0
+            for key in keys:
+                row = self._conn.execute(
+                    "SELECT response, expires_at FROM llm_cache WHERE key = ?", [key]
+                ).fetchone()
+                if row is None:
+                    continue
+                if row[1] <= now:
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", [key])
+                    expiradas += 1
+                    continue
+                self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", [now, key])
+                self._conn.commit()
+                self._stats["evictions"] += expiradas
+                self._stats["hits"] += 1
+                return key, row[0]
+            if expiradas:
+                self._conn.commit()
+            self._stats["evictions"] += expiradas
+            self._stats["misses"] += 1
+            return None, None
+
+    def put(self, key, response, backend, model=None, agent=None):
+        """Guarda una respuesta no vacia y aplica el limite de tamano."""
+        if not response:
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO llm_cache
+                    (key, backend, model, agent, response, size, created_at, last_access, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [key, backend, model, agent, response, size, now, now, now + self.ttl_for(agent)])
+            self._stats["stores"] += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        """Borra expiradas y luego las menos usadas hasta caber en max_bytes."""
+        cur = self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", [now])
+        self._stats["evictions"] += cur.rowcount
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM llm_cache ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", [key])
+            total -= size
+            self._stats["evictions"] += 1
+
+    def note_bypass(self):
+        with self._lock:
+            self._stats["bypass"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self):
+        """Contadores + entradas/bytes actuales y hit ratio."""
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+            s = dict(self._stats)
+        lookups = s["hits"] + s["misses"]
+        s["entries"] = entries
+        s["bytes"] = total
+        s["hit_ratio"] = round(s["hits"] / lookups, 3) if lookups else 0.0
+        return s
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
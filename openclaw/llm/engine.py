@@ -0,0 +1,287 @@
+"""
+Motor IA asincrono con concurrencia acotada por backend.
+
+pensar() es sincrono: cada hilo de agente tiene como mucho una peticion en
+vuelo. El motor corre un event loop propio en un hilo de fondo y deja lanzar
+muchas peticiones a la vez, limitadas por un semaforo por backend (Ollama
+1-2, cloud N). Cada llamada tiene timeout y se puede cancelar.
+
+Un backend es una corutina `fn(motor, prompt, sistema, max_tokens, uso) -> str`
+que lanza excepcion si falla; el motor registra exito/fallo en el
+HealthRegistry y cierra el registro de uso.
+
+Fachada sync para los hilos de agentes (no necesitan saber de asyncio):
+    motor.pensar_sync(prompt, ...)          -> str
+    motor.pensar_muchos_sync([p1, p2], ...) -> [str, str]
+    motor.submit(corutina)                  -> concurrent.futures.Future
+"""
+import asyncio
+import concurrent.futures
+import inspect
+import logging
+import threading
+import time
+
+from llm.health import TIMEOUT, clasificar_error
+
+logger = logging.getLogger("OpenClaw.engine")
+
+
+class _BackendStats:
+    """Contadores de un backend. Solo se tocan desde el event loop."""
+
+    __slots__ = ("calls", "ok", "errors", "timeouts", "cancelled", "waiting", "in_flight", "max_in_flight")
+
+    def __init__(self):
+        self.calls = 0
+        self.ok = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.waiting = 0          # esperando el semaforo
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class AsyncEngine:
+    """Event loop en un hilo + semaforo por backend.
+
+    Args:
+        backends:  {nombre: corutina} — ver docstring del modulo.
+        limits:    {nombre: peticiones simultaneas}; los que falten usan `default_limit`.
+        timeouts:  {nombre: segundos} por llamada; los que falten usan `default_timeout`.
+        health:    HealthRegistry opcional (circuit breaker compartido con pensar()).
+        usage:     Par opcional (inicio, cierre) para el ledger:
+                   inicio(backend, prompt, sistema, meta) -> dict
+                   cierre(uso, texto, outcome) (puede ser corutina)
+        client_factory: fn(host) -> httpx.AsyncClient, usado por `motor.client(host)`.
+    """
+
+    def __init__(self, backends, limits=None, timeouts=None, default_limit=4, default_timeout=120.0,
+                 health=None, usage=None, client_factory=None):
+        self.backends = dict(backends)
+        self.limits = dict(limits or {})
+        self.timeouts = dict(timeouts or {})
+        self.default_limit = default_limit
+        self.default_timeout = default_timeout
+        self.health = health
+        self._usage = usage
+        self._client_factory = client_factory
+        self._clients = {}
+        self._sems = {}
+        self._stats = {}
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # ── Ciclo de vida del loop ──────────────────────────────────────────────
+
+    def start(self):
+        """Arranca el hilo del event loop (idempotente)."""
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            listo = threading.Event()
+
+            def _run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(listo.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=_run, daemon=True, name="LLM-ASYNC")
+            self._thread.start()
+            listo.wait()
+            self._loop = loop
+            return loop
+
+    def close(self, timeout=5.0):
+        """Cancela lo pendiente, cierra los clientes HTTP y detiene el loop."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+        if loop is None:
+            return
+
+        async def _shutdown():
+            actual = asyncio.current_task()
+            pendientes = [t for t in asyncio.all_tasks() if t is not actual]
+            for t in pendientes:
+                t.cancel()
+            await asyncio.gather(*pendientes, return_exceptions=True)
+            clients, self._clients = list(self._clients.values()), {}
+            for c in clients:
+                try:
+                    cerrar = getattr(c, "aclose", None) or c.close
+                    r = cerrar()
+                    if inspect.isawaitable(r):
+                        await r
+                except Exception:
+                    pass
+
+        try:
+            asyncio.run_coroutine_threadsafe(_shutdown(), loop).result(timeout)
+        except Exception as e:
+            logger.warning("Motor async: cierre incompleto — %s", e)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        loop.close()
+        self._sems.clear()
+
+    # ── Recursos compartidos dentro del loop ────────────────────────────────
+
+    def client(self, key, factory=None):
+        """Cliente async del motor para `key` (se crea la primera vez).
+
+        Por defecto `client_factory(key)` (un httpx.AsyncClient por host); con
+        `factory` se puede guardar otro cliente (ej. el SDK async de Claude).
+        Todos se cierran en close().
+        """
+        c = self._clients.get(key)
+        if c is None:
+            c = self._clients[key] = (factory or self._client_factory)(key)
+        return c
+
+    def _semaphore(self, backend):
+        sem = self._sems.get(backend)
+        if sem is None:
+            sem = self._sems[backend] = asyncio.Semaphore(self.limits.get(backend, self.default_limit))
+        return sem
+
+    def _backend_stats(self, backend):
+        s = self._stats.get(backend)
+        if s is None:
+            s = self._stats[backend] = _BackendStats()
+        return s
+
+    # ── API async ───────────────────────────────────────────────────────────
+
+    async def call(self, backend, prompt, sistema="", max_tokens=4096, timeout=None, uso=None):
+        """Una llamada a un backend respetando su semaforo y su timeout.
+
+        El timeout cuenta desde que se obtiene el semaforo: la espera en cola
+        no consume el presupuesto de la llamada. Lanza la excepcion del backend,
+        asyncio.TimeoutError o CancelledError.
+        """
+        fn = self.backends[backend]
+        limite = timeout if timeout is not None else self.timeouts.get(backend, self.default_timeout)
+        st = self._backend_stats(backend)
+        st.waiting += 1
+        adquirido = False
+        try:
+            async with self._semaphore(backend):
+                adquirido = True
+                st.waiting -= 1
+                st.calls += 1
+                st.in_flight += 1
+                st.max_in_flight = max(st.max_in_flight, st.in_flight)
+                inicio = time.monotonic()
+                try:
+                    texto = await asyncio.wait_for(fn(self, prompt, sistema, max_tokens, uso), limite)
+                except asyncio.CancelledError:
+                    st.cancelled += 1
+                    raise
+                except asyncio.TimeoutError:
+                    st.timeouts += 1
+                    self._record_failure(backend, TIMEOUT, inicio, f"timeout {limite}s", uso)
+                    raise
+                except Exception as e:
+                    st.errors += 1
+                    self._record_failure(backend, clasificar_error(e), inicio, e, uso)
+                    raise
+                finally:
+                    st.in_flight -= 1
+                st.ok += 1
+                if self.health is not None:
+                    self.health.record_success(backend, time.monotonic() - inicio)
+                return texto
+        finally:
+            if not adquirido:   # cancelado mientras esperaba en la cola
+                st.waiting -= 1
+                st.cancelled += 1
+
+    def _record_failure(self, backend, kind, inicio, error, uso):
+        if uso is not None:
+            uso["error_kind"] = kind
+        if self.health is not None:
+            self.health.record_failure(backend, kind, time.monotonic() - inicio, error)
+
+    async def pensar(self, prompt, sistema="", max_tokens=4096, cadena=("local", "gemini"),
+                     timeout=None, meta=None):
+        """Recorre la cadena de backends hasta obtener texto. Retorna '' si todos fallan.
+
+        Los backends con el circuito abierto se omiten. Una cancelacion se
+        propaga (no se prueba el siguiente backend).
+        """
+        for backend in cadena:
+            if backend not in self.backends:
+                continue
+            if self.health is not None and not self.health.allow(backend):
+                continue
+            uso = self._usage[0](backend, prompt, sistema, meta or {}) if self._usage else None
+            try:
+                texto = await self.call(backend, prompt, sistema, max_tokens, timeout, uso)
+            except asyncio.CancelledError:
+                await self._cerrar_uso(uso, "", "cancelled")
+                raise
+            except Exception as e:
+                await self._cerrar_uso(uso, "", "error")
+                logger.warning("Motor async: %s fallo — %s", backend, e or type(e).__name__)
+                continue
+            await self._cerrar_uso(uso, texto, "ok" if texto else "empty")
+            if texto:
+                return texto
+        return ""
+
+    async def pensar_muchos(self, prompts, **kwargs):
+        """pensar() concurrente sobre varios prompts; respuestas en el mismo orden."""
+        return list(await asyncio.gather(*(self.pensar(p, **kwargs) for p in prompts)))
+
+    async def _cerrar_uso(self, uso, texto, outcome):
+        if uso is None:
+            return
+        try:
+            r = self._usage[1](uso, texto, outcome)
+            if inspect.isawaitable(r):
+                await r
+        except Exception as e:
+            logger.debug("Motor async: no se pudo registrar uso — %s", e)
+
+    # ── Fachada sync ────────────────────────────────────────────────────────
+
+    def submit(self, coro):
+        """Programa una corutina en el loop del motor. Retorna concurrent.futures.Future.
+
+        `future.cancel()` cancela la tarea dentro del loop.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    def run(self, coro, timeout=None):
+        """Ejecuta una corutina y espera el resultado. Al vencer `timeout` la cancela."""
+        fut = self.submit(coro)
+        try:
+            return fut.result(timeout)
+        except concurrent.futures.TimeoutError:
+            fut.cancel()
+            raise
+
+    def pensar_sync(self, prompt, timeout=None, **kwargs):
+        """pensar() bloqueante para los hilos de agentes."""
+        return self.run(self.pensar(prompt, **kwargs), timeout)
+
+    def pensar_muchos_sync(self, prompts, timeout=None, **kwargs):
+        return self.run(self.pensar_muchos(prompts, **kwargs), timeout)
+
+    # ── Metricas ────────────────────────────────────────────────────────────
+
+    def stats(self):
+        """{backend: {calls, ok, errors, timeouts, cancelled, waiting, in_flight, max_in_flight, limit}}"""
+        out = {}
+        for backend, s in list(self._stats.items()):
+            d = s.as_dict()
+            d["limit"] = self.limits.get(backend, self.default_limit)
+            out[backend] = d
+        return out
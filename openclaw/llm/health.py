@@ -0,0 +1,268 @@
+"""
+Salud de los backends IA y circuit breaker para la cadena Ollama -> cloud.
+
+Cada llamada a pensar_con_local/gemini/claude registra exito o fallo con su
+latencia. Tras `failure_threshold` fallos consecutivos el circuito se abre y
+pensar() salta ese backend sin esperar el timeout. Mientras esta abierto:
+  - un hilo de fondo ejecuta el probe del backend con backoff exponencial
+    con jitter; si responde, el circuito se cierra
+  - los errores de cuota no se pueden verificar con un probe barato: al
+    vencer el backoff el circuito pasa a half-open y deja pasar UNA llamada
+    real, que decide si se cierra o se vuelve a abrir
+
+El backoff base depende del tipo de error, asi una cuota agotada en Gemini
+espera mucho mas que un reset de conexion de Ollama.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("OpenClaw.health")
+
+# Tipos de error
+CONNECTION = "connection"
+TIMEOUT = "timeout"
+QUOTA = "quota"
+SERVER = "server"        # HTTP 5xx
+CLIENT = "client"        # HTTP 4xx (no cuota)
+OTHER = "other"
+
+# Backoff base (segundos) por tipo de error
+BACKOFF_BASE = {
+    CONNECTION: 5.0,
+    TIMEOUT: 15.0,
+    SERVER: 10.0,
+    CLIENT: 30.0,
+    QUOTA: 120.0,
+    OTHER: 10.0,
+}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def clasificar_error(error=None, status_code=None):
+    """Clasifica una excepcion o status HTTP en un tipo de error.
+
+    Funciona con excepciones de requests, httpx, anthropic y google-genai
+    sin importarlas: usa status_code/code, el nombre de la clase y el mensaje.
+    """
+    if status_code is None and error is not None:
+        for attr in ("status_code", "code", "status"):
+            value = getattr(error, attr, None)
+            if isinstance(value, int):
+                status_code = value
+                break
+        if status_code is None:
+            resp = getattr(error, "response", None)
+            value = getattr(resp, "status_code", None)
+            if isinstance(value, int):
+                status_code = value
+
+    texto = f"{type(error).__name__} {error}".lower() if error is not None else ""
+
+    if status_code == 429 or any(k in texto for k in ("quota", "resource_exhausted", "rate limit", "ratelimit")):
+        return QUOTA
+    if status_code is not None and status_code >= 500:
+        return SERVER
+    if status_code is not None and status_code >= 400:
+        return CLIENT
+    if isinstance(error, TimeoutError) or "timeout" in texto or "timed out" in texto:
+        return TIMEOUT
+    if isinstance(error, ConnectionError) or "connect" in texto:
+        return CONNECTION
+    return OTHER
+
+
+class BackendHealth:
+    """Estado de un backend. Solo se modifica con el lock del registro."""
+
+    def __init__(self, name, window):
+        self.name = name
+        self.events = deque(maxlen=window)   # (ok, latency, kind)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.attempts = 0          # aperturas seguidas sin cerrar (exponente del backoff)
+        self.open_until = 0.0      # no probar antes de este instante
+        self.last_error = None
+        self.last_kind = None
+        self.trial_in_flight = False
+
+    def snapshot(self, now):
+        total = len(self.events)
+        fallos = sum(1 for ok, _, _ in self.events if not ok)
+        latencias = sorted(lat for ok, lat, _ in self.events if ok)
+        p50 = latencias[len(latencias) // 2] if latencias else None
+        return {
+            "state": self.state,
+            "error_rate": round(fallos / total, 3) if total else 0.0,
+            "samples": total,
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "last_kind": self.last_kind,
+            "last_error": self.last_error,
+            "retry_in": max(round(self.open_until - now, 1), 0.0) if self.state != CLOSED else 0.0,
+        }
+
+
+class HealthRegistry:
+    """Registro de salud + circuit breaker para varios backends.
+
+    Args:
+        failure_threshold: Fallos consecutivos que abren el circuito.
+        window:            Eventos recientes usados para error_rate/latencia.
+        backoff_max:       Techo del backoff exponencial (segundos).
+    """
+
+    def __init__(self, failure_threshold=3, window=20, backoff_max=600.0, rng=None):
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.backoff_max = backoff_max
+        self._backends = {}
+        self._probes = {}
+        self._lock = threading.Lock()
+        self._rng = rng or random.Random()
+        self._clock = time.time
+
+    def _get(self, name):
+        h = self._backends.get(name)
+        if h is None:
+            h = self._backends[name] = BackendHealth(name, self.window)
+        return h
+
+    def register_probe(self, name, probe):
+        """Registra una funcion sin argumentos que lanza excepcion si el backend esta caido."""
+        with self._lock:
+            self._get(name)
+            self._probes[name] = probe
+
+    def _backoff(self, kind, attempts):
+        """Backoff exponencial con jitter: base * 2^(n-1), entre 50% y 100%."""
+        base = BACKOFF_BASE.get(kind, BACKOFF_BASE[OTHER])
+        delay = min(self.backoff_max, base * (2 ** max(attempts - 1, 0)))
+        return delay * self._rng.uniform(0.5, 1.0)
+
+    # ── Registro de resultados ──────────────────────────────────────────────
+
+    def record_success(self, name, latency):
+        with self._lock:
+            h = self._get(name)
+            h.events.append((True, latency, None))
+            h.consecutive_failures = 0
+            h.trial_in_flight = False
+            if h.state != CLOSED:
+                logger.info("Circuito %s cerrado (respondio en %.1fs)", name, latency)
+            h.state = CLOSED
+            h.attempts = 0
+            h.open_until = 0.0
+
+    def record_failure(self, name, kind, latency=0.0, error=None):
+        with self._lock:
+            h = self._get(name)
+            h.events.append((False, latency, kind))
+            h.consecutive_failures += 1
+            h.last_kind = kind
+            h.last_error = str(error)[:200] if error is not None else kind
+            h.trial_in_flight = False
+            # Cuota agotada: reintentar ya solo empeora la situacion
+            umbral = 1 if kind == QUOTA else self.failure_threshold
+            if h.state == HALF_OPEN or h.consecutive_failures >= umbral:
+                self._open(h, kind)
+
+    def _open(self, h, kind):
+        h.attempts += 1
+        delay = self._backoff(kind, h.attempts)
+        h.state = OPEN
+        h.open_until = self._clock() + delay
+        logger.warning("Circuito %s ABIERTO (%s, %d fallos) — reintento en %.0fs",
+                       h.name, kind, h.consecutive_failures, delay)
+
+    # ── Consulta desde pensar() ─────────────────────────────────────────────
+
+    def allow(self, name):
+        """True si se puede llamar al backend ahora.
+
+        Un circuito abierto sin probe (o por cuota) pasa a half-open al vencer
+        el backoff y deja pasar una sola llamada de prueba.
+        """
+        with self._lock:
+            h = self._get(name)
+            if h.state == CLOSED:
+                return True
+            if h.state == OPEN and self._clock() >= h.open_until and self._needs_trial(h):
+                h.state = HALF_OPEN
+            if h.state == HALF_OPEN and not h.trial_in_flight:
+                h.trial_in_flight = True
+                return True
+            return False
+
+    def _needs_trial(self, h):
+        return h.name not in self._probes or h.last_kind == QUOTA
+
+    def is_open(self, name):
+        with self._lock:
+            return self._get(name).state != CLOSED
+
+    # ── Probes de fondo ─────────────────────────────────────────────────────
+
+    def probe_due(self):
+        """Ejecuta los probes de circuitos abiertos cuyo backoff vencio.
+
+        Returns:
+            Segundos hasta el siguiente probe pendiente (o None si no hay).
+        """
+        now = self._clock()
+        pendientes = []
+        proximo = None
+        with self._lock:
+            for name, h in self._backends.items():
+                if h.state != OPEN or self._needs_trial(h):
+                    continue
+                if now >= h.open_until:
+                    pendientes.append((name, self._probes[name]))
+                else:
+                    espera = h.open_until - now
+                    proximo = espera if proximo is None else min(proximo, espera)
+
+        for name, probe in pendientes:
+            inicio = time.monotonic()
+            try:
+                probe()
+            except Exception as e:
+                kind = clasificar_error(e)
+                with self._lock:
+                    h = self._get(name)
+                    h.last_kind = kind
+                    h.last_error = str(e)[:200]
+                    self._open(h, kind)
+                    espera = h.open_until - self._clock()
+                proximo = espera if proximo is None else min(proximo, espera)
+            else:
+                self.record_success(name, time.monotonic() - inicio)
+        return proximo
+
+    def run_prober(self, stop_event, max_sleep=5.0):
+        """Loop del hilo de probes. Termina cuando stop_event se activa."""
+        while not stop_event.is_set():
+            try:
+                proximo = self.probe_due()
+            except Exception:
+                logger.exception("Error en probe de salud")
+                proximo = None
+            espera = max_sleep if proximo is None else min(max(proximo, 0.1), max_sleep)
+            stop_event.wait(timeout=espera)
+
+    def start_prober(self, stop_event):
+        t = threading.Thread(target=self.run_prober, args=(stop_event,), daemon=True, name="HEALTH")
+        t.start()
+        return t
+
+    # ── Metricas ────────────────────────────────────────────────────────────
+
+    def snapshot(self):
+        with self._lock:
+            now = self._clock()
+            return {name: h.snapshot(now) for name, h in self._backends.items()}
@@ -0,0 +1,264 @@
+"""
+Peticiones con cobertura (hedging) entre backends IA.
+
+Si el backend primario no produjo su primer token tras `delay` segundos se
+lanza el siguiente backend de la cadena en paralelo; gana el primero que
+termina con texto y el otro se cancela: se ejecutan los cierres que registro
+(ej. cortar su conexion HTTP, aunque siga esperando el primer token) y, si no
+registro ninguno, se corta en su siguiente chunk.
+
+Politica por agente (CONFIG['llm_hedge'], ej. "reviewer=p90,qa=6"):
+  off / vacio — sin cobertura
+  p90         — percentil 90 del TTFT reciente del primario (p50, p95...)
+  6           — segundos fijos
+Mientras haya pocas muestras de TTFT se usa `default_delay`.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("OpenClaw.hedging")
+
+PERCENTIL = "percentil"
+FIJO = "fijo"
+
+
+def parse_politica(valor):
+    """'p90' -> ('percentil', 90); '6' -> ('fijo', 6.0); 'off' / '' / None -> None."""
+    if valor is None:
+        return None
+    texto = str(valor).strip().lower()
+    if texto in ("", "off", "no", "0"):
+        return None
+    if texto.startswith("p"):
+        return (PERCENTIL, float(texto[1:]))
+    return (FIJO, float(texto))
+
+
+def _percentil(ordenados, pct):
+    """Percentil nearest-rank de una lista ya ordenada."""
+    rank = max(int(-(-pct * len(ordenados) // 100)), 1)
+    return ordenados[min(rank, len(ordenados)) - 1]
+
+
+class Cancelacion(threading.Event):
+    """Event de cancelacion de un backend en la carrera, con cierres que corren al activarse.
+
+    El backend registra con al_cancelar() lo que lo desbloquea (cerrar su
+    respuesta o su socket); sin eso seguiria esperando hasta el timeout de lectura.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._cierres = []
+        self._cierres_lock = threading.Lock()
+
+    def al_cancelar(self, fn):
+        """Corre `fn()` al cancelar (enseguida si ya se cancelo)."""
+        with self._cierres_lock:
+            if not self.is_set():
+                self._cierres.append(fn)
+                return
+        _cerrar(fn)
+
+    def set(self):
+        with self._cierres_lock:
+            super().set()
+            cierres, self._cierres = self._cierres, []
+        for fn in cierres:
+            _cerrar(fn)
+
+
+def _cerrar(fn):
+    try:
+        fn()
+    except Exception as e:
+        logger.debug("Hedge: fallo un cierre — %s", e)
+
+
+def cancelable(chunks, cancel, primer_token, on_first=None):
+    """Envuelve un iterador de chunks: avisa del primer token y se corta si `cancel` se activa.
+
+    Al terminar (o cortarse) cierra el iterador original.
+    """
+    try:
+        for chunk in chunks:
+            if cancel.is_set():
+                break
+            if chunk and not primer_token.is_set():
+                if on_first is not None:
+                    on_first()
+                primer_token.set()
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+class _AgentStats:
+    __slots__ = ("calls", "hedged", "hedge_wins", "primary_wins", "saved_s", "latencias")
+
+    def __init__(self, window):
+        self.calls = 0
+        self.hedged = 0          # se lanzo el segundo backend
+        self.hedge_wins = 0      # y termino antes que el primario
+        self.primary_wins = 0    # se lanzo pero el primario gano igual
+        self.saved_s = 0.0       # latencia de cola ahorrada (estimada)
+        self.latencias = deque(maxlen=window)
+
+
+class Hedger:
+    """Politicas, muestras de TTFT por backend y metricas por agente.
+
+    Args:
+        politicas:     {agente: 'p90' | '6' | 'off'} — claves en minusculas.
+        default_delay: Delay (s) mientras el primario tenga menos de `min_samples` TTFT.
+        min_delay:     Piso del delay derivado de percentiles.
+        window:        Muestras recientes que se guardan por backend / agente.
+    """
+
+    def __init__(self, politicas=None, default_delay=10.0, min_delay=0.5, min_samples=5, window=50):
+        self.politicas = {k.lower(): parse_politica(v) for k, v in (politicas or {}).items()}
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self._ttft = {}      # backend -> deque de segundos hasta el primer token
+        self._total = {}     # backend -> deque de segundos hasta la respuesta completa
+        self._stats = {}     # agente -> _AgentStats
+        self._lock = threading.Lock()
+
+    def politica(self, agente):
+        return self.politicas.get((agente or "").lower())
+
+    # ── Muestras de latencia ────────────────────────────────────────────────
+
+    def observe(self, backend, ttft=None, total=None):
+        """Registra el TTFT y/o la latencia total de una llamada a `backend`."""
+        with self._lock:
+            if ttft is not None:
+                self._ttft.setdefault(backend, deque(maxlen=self.window)).append(ttft)
+            if total is not None:
+                self._total.setdefault(backend, deque(maxlen=self.window)).append(total)
+
+    def delay_for(self, backend, politica):
+        """Segundos a esperar el primer token de `backend` antes de cubrir."""
+        tipo, valor = politica
+        if tipo == FIJO:
+            return valor
+        with self._lock:
+            muestras = sorted(self._ttft.get(backend, ()))
+        if len(muestras) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, _percentil(muestras, valor))
+
+    def _mediana_total(self, backend):
+        with self._lock:
+            muestras = sorted(self._total.get(backend, ()))
+        return _percentil(muestras, 50) if muestras else None
+
+    # ── Carrera ─────────────────────────────────────────────────────────────
+
+    def carrera(self, agente, primario, lanzar, siguiente, delay):
+        """Corre `primario` y, si no da su primer token en `delay` s, tambien `siguiente()`.
+
+        Args:
+            lanzar:    fn(backend, cancel, primer_token) -> texto ('' si fallo).
+                       Corre en un hilo propio; debe activar `primer_token` con
+                       el primer chunk (ver cancelable()) y cortar si `cancel`
+                       (una Cancelacion: registrar con al_cancelar() como cortar
+                       la peticion en curso).
+            siguiente: fn() -> backend de respaldo o None. Solo se llama si se cubre.
+
+        Returns:
+            (texto, backend ganador) — ('', None) si ninguno respondio.
+        """
+        resultados = queue.Queue()
+        cancels = {}
+        inicio = time.monotonic()
+
+        def _arrancar(backend):
+            cancel = Cancelacion()
+            primer = threading.Event()
+            cancels[backend] = cancel
+
+            def _run():
+                texto = ""
+                try:
+                    texto = lanzar(backend, cancel, primer)
+                except Exception as e:
+                    logger.warning("Hedge: %s fallo — %s", backend, e)
+                finally:
+                    resultados.put((backend, texto or "", time.monotonic() - inicio))
+                    primer.set()   # despierta la espera de la fase 1 si termino sin tokens
+
+            threading.Thread(target=_run, daemon=True, name=f"HEDGE-{backend}").start()
+            return primer
+
+        # Fase 1: el primario solo, hasta su primer token (o hasta que termine)
+        primer = _arrancar(primario)
+        respaldo = None
+        if not primer.wait(delay):
+            respaldo = siguiente()
+            if respaldo is not None:
+                logger.info("Hedge [%s]: %s sin primer token en %.1fs, lanzando %s",
+                            agente or "-", primario, delay, respaldo)
+                _arrancar(respaldo)
+
+        # Fase 2: gana el primero que termina con texto
+        pendientes = len(cancels)
+        ganador, texto, elapsed = None, "", time.monotonic() - inicio
+        while pendientes:
+            backend, resultado, t = resultados.get()
+            pendientes -= 1
+            if resultado.strip():
+                ganador, texto, elapsed = backend, resultado, t
+                break
+        for backend, cancel in cancels.items():
+            if backend != ganador:
+                cancel.set()
+
+        self._registrar(agente, primario, respaldo, ganador, elapsed)
+        return texto, ganador
+
+    def _registrar(self, agente, primario, respaldo, ganador, elapsed):
+        mediana = self._mediana_total(primario) if respaldo is not None and ganador == respaldo else None
+        with self._lock:
+            s = self._stats.get(agente or "-")
+            if s is None:
+                s = self._stats[agente or "-"] = _AgentStats(self.window)
+            s.calls += 1
+            s.latencias.append(elapsed)
+            if respaldo is None:
+                return
+            s.hedged += 1
+            if ganador == respaldo:
+                s.hedge_wins += 1
+                # Lo que habria tardado el primario: su mediana historica
+                if mediana is not None:
+                    s.saved_s += max(mediana - elapsed, 0.0)
+            elif ganador == primario:
+                s.primary_wins += 1
+
+    # ── Metricas ────────────────────────────────────────────────────────────
+
+    def stats(self):
+        """{agente: {calls, hedged, hedge_wins, primary_wins, hedge_rate, saved_s, p50_s, p95_s}}"""
+        with self._lock:
+            out = {}
+            for agente, s in self._stats.items():
+                lat = sorted(s.latencias)
+                out[agente] = {
+                    "calls": s.calls,
+                    "hedged": s.hedged,
+                    "hedge_wins": s.hedge_wins,
+                    "primary_wins": s.primary_wins,
+                    "hedge_rate": round(s.hedged / s.calls, 3) if s.calls else 0.0,
+                    "saved_s": round(s.saved_s, 2),
+                    "p50_s": round(_percentil(lat, 50), 3) if lat else None,
+                    "p95_s": round(_percentil(lat, 95), 3) if lat else None,
+                }
+            return out
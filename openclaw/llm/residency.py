@@ -0,0 +1,235 @@
+"""
+Residencia del modelo local en Ollama (calentamiento y re-calentamiento).
+
+Ollama carga el modelo en memoria con la primera peticion y lo descarga tras
+`keep_alive` sin uso. Esa carga (decenas de segundos en CPU) cae dentro del
+timeout de la primera llamada de DEV o CONSULTING. ResidencyManager:
+  - al arrancar precarga el modelo con un /api/generate de prompt vacio y el
+    keep_alive configurado (Ollama solo carga, no genera)
+  - cada `interval` segundos consulta /api/ps y, si el modelo ya no aparece
+    (desalojado por inactividad o por otro modelo), lo vuelve a cargar
+  - clasifica cada respuesta real como fria o caliente segun `load_duration`
+    y guarda el primer token (load + prompt_eval) de cada tipo, para ajustar
+    OLLAMA_KEEP_ALIVE con datos
+
+El estado es por host (URL base), listo para varios servidores Ollama.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("OpenClaw.residency")
+
+_NS = 1_000_000_000
+
+
+def nombre_modelo(modelo):
+    """'llama3' -> 'llama3:latest' (asi lo lista /api/ps)."""
+    return modelo if ":" in modelo else f"{modelo}:latest"
+
+
+def _segundos(data, campo):
+    valor = data.get(campo)
+    return valor / _NS if isinstance(valor, (int, float)) and not isinstance(valor, bool) else None
+
+
+def _mediana(muestras):
+    ordenadas = sorted(muestras)
+    return ordenadas[(len(ordenadas) - 1) // 2] if ordenadas else None
+
+
+class _HostResidency:
+    """Estado de un host. Solo se modifica con el lock del manager."""
+
+    __slots__ = ("resident", "warmups", "evictions", "last_warm_s", "last_check",
+                 "cold_ttft", "warm_ttft", "cold_calls", "warm_calls")
+
+    def __init__(self, window):
+        self.resident = False
+        self.warmups = 0
+        self.evictions = 0           # veces que /api/ps mostro el modelo descargado
+        self.last_warm_s = None      # lo que tardo el ultimo calentamiento
+        self.last_check = None
+        self.cold_ttft = deque(maxlen=window)
+        self.warm_ttft = deque(maxlen=window)
+        self.cold_calls = 0
+        self.warm_calls = 0
+
+
+class ResidencyManager:
+    """Mantiene `model` cargado en los hosts Ollama y mide frio vs caliente.
+
+    Args:
+        transport:      HttpTransport compartido (usa sus pools keep-alive).
+        model:          Modelo a mantener residente (CONFIG['local_model']).
+        hosts:          fn() -> lista de URLs base de Ollama.
+        keep_alive:     keep_alive del calentamiento (ej. '30m'; '-1m' = no descargar nunca).
+        interval:       Segundos entre consultas a /api/ps (0 = solo al arrancar).
+        cold_threshold: load_duration (s) a partir del cual una respuesta cuenta como fria.
+        timeout:        Timeout del calentamiento (la carga puede tardar).
+        on_models:      fn(host, modelos) opcional; recibe lo que /api/ps lista en
+                        cada host (y el modelo recien precargado).
+    """
+
+    def __init__(self, transport, model, hosts, keep_alive="30m", interval=60.0,
+                 cold_threshold=0.5, timeout=300.0, window=50, on_models=None):
+        self.transport = transport
+        self.model = model
+        self.hosts = hosts
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.cold_threshold = cold_threshold
+        self.timeout = timeout
+        self.window = window
+        self.on_models = on_models
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _get(self, host):
+        h = self._hosts.get(host)
+        if h is None:
+            h = self._hosts[host] = _HostResidency(self.window)
+        return h
+
+    # ── Operaciones contra Ollama ───────────────────────────────────────────
+
+    def loaded_models(self, host):
+        """Nombres de los modelos cargados en `host` segun /api/ps. Lanza excepcion si falla."""
+        r = self.transport.get(f"{host}/api/ps", timeout=5, verify=False)
+        r.raise_for_status()
+        return {m.get("name") or m.get("model") for m in r.json().get("models") or []}
+
+    def is_resident(self, host):
+        return nombre_modelo(self.model) in self.loaded_models(host)
+
+    def warm(self, host):
+        """Carga el modelo en `host` con un generate de prompt vacio.
+
+        Returns:
+            Segundos que tardo, o None si fallo (se registra en el log).
+        """
+        payload = {"model": self.model, "prompt": "", "stream": False, "keep_alive": self.keep_alive}
+        inicio = time.monotonic()
+        try:
+            r = self.transport.post(f"{host}/api/generate", json=payload, timeout=self.timeout, verify=False)
+            r.raise_for_status()
+            data = r.json()
+        except Exception as e:
+            logger.warning("Ollama %s: no se pudo precargar %s — %s", host, self.model, e)
+            return None
+        elapsed = time.monotonic() - inicio
+        carga = _segundos(data, "load_duration")
+        with self._lock:
+            h = self._get(host)
+            h.resident = True
+            h.warmups += 1
+            h.last_warm_s = elapsed
+        logger.info("Ollama %s: %s precargado en %.1fs (carga %.1fs, keep_alive=%s)",
+                    host, self.model, elapsed, carga or 0.0, self.keep_alive)
+        return elapsed
+
+    def check(self):
+        """Consulta /api/ps en cada host y re-calienta donde el modelo no este.
+
+        Returns:
+            {host: 'resident' | 'warmed' | 'failed' | 'unreachable'}
+        """
+        resultado = {}
+        for host in self.hosts():
+            try:
+                modelos = self.loaded_models(host)
+            except Exception as e:
+                logger.debug("Ollama %s: /api/ps no disponible — %s", host, e)
+                resultado[host] = "unreachable"
+                continue
+            if self.on_models is not None:
+                self.on_models(host, modelos)
+            residente = nombre_modelo(self.model) in modelos
+            with self._lock:
+                h = self._get(host)
+                h.last_check = time.time()
+                desalojado = h.resident and not residente
+                if desalojado:
+                    h.evictions += 1
+                h.resident = residente
+            if residente:
+                resultado[host] = "resident"
+                continue
+            if desalojado:
+                logger.info("Ollama %s: %s fue descargado, re-calentando", host, self.model)
+            if self.warm(host) is None:
+                resultado[host] = "failed"
+                continue
+            resultado[host] = "warmed"
+            if self.on_models is not None:
+                self.on_models(host, modelos | {nombre_modelo(self.model)})
+        return resultado
+
+    # ── Respuestas reales ───────────────────────────────────────────────────
+
+    def observe(self, host, data):
+        """Clasifica una respuesta final de Ollama (con load_duration) como fria o caliente.
+
+        El primer token se estima del lado del servidor: load_duration +
+        prompt_eval_duration (lo mismo para llamadas normales y streaming).
+        """
+        carga = _segundos(data, "load_duration")
+        if carga is None:
+            return
+        ttft = carga + (_segundos(data, "prompt_eval_duration") or 0.0)
+        fria = carga >= self.cold_threshold
+        with self._lock:
+            h = self._get(host)
+            h.resident = True
+            if fria:
+                h.cold_calls += 1
+                h.cold_ttft.append(ttft)
+            else:
+                h.warm_calls += 1
+                h.warm_ttft.append(ttft)
+            tipico = _mediana(h.warm_ttft)
+        if fria:
+            logger.info("Ollama %s: llamada en FRIO — carga %.1fs, primer token %.1fs (caliente p50 %s)",
+                        host, carga, ttft, f"{tipico:.2f}s" if tipico is not None else "-")
+        else:
+            logger.debug("Ollama %s: llamada en caliente — primer token %.2fs", host, ttft)
+
+    # ── Hilo de fondo ───────────────────────────────────────────────────────
+
+    def run(self, stop_event):
+        """Calienta al arrancar y luego vigila /api/ps hasta que stop_event se active."""
+        while not stop_event.is_set():
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Error vigilando la residencia de Ollama")
+            if not self.interval:
+                break
+            stop_event.wait(timeout=self.interval)
+
+    def start(self, stop_event):
+        t = threading.Thread(target=self.run, args=(stop_event,), daemon=True, name="OLLAMA-WARM")
+        t.start()
+        return t
+
+    # ── Metricas ────────────────────────────────────────────────────────────
+
+    def stats(self):
+        """{host: {resident, warmups, evictions, last_warm_s, cold_calls, warm_calls,
+                   cold_ttft_p50, warm_ttft_p50}}"""
+        with self._lock:
+            out = {}
+            for host, h in self._hosts.items():
+                frio, caliente = _mediana(h.cold_ttft), _mediana(h.warm_ttft)
+                out[host] = {
+                    "resident": h.resident,
+                    "warmups": h.warmups,
+                    "evictions": h.evictions,
+                    "last_warm_s": round(h.last_warm_s, 2) if h.last_warm_s is not None else None,
+                    "cold_calls": h.cold_calls,
+                    "warm_calls": h.warm_calls,
+                    "cold_ttft_p50": round(frio, 3) if frio is not None else None,
+                    "warm_ttft_p50": round(caliente, 3) if caliente is not None else None,
+                }
+            return out
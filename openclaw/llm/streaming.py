@@ -0,0 +1,171 @@
+"""
+Utilidades para generacion en streaming: condiciones de parada y flush
+periodico del output parcial.
+
+Una condicion de parada es cualquier callable `cond(texto, desde=0) -> bool`
+que recibe el texto acumulado y cuanto de el ya se reviso en la llamada
+anterior (puede ignorarlo o escanear solo lo nuevo); en cuanto alguna retorna
+True se cierra el stream del backend y se deja de pagar generacion. Las
+condiciones no guardan estado: la misma se comparte entre los backends de una
+carrera y entre los reintentos de la cadena.
+"""
+import logging
+import re
+import time
+
+logger = logging.getLogger("OpenClaw.streaming")
+
+FIN_ARCHIVOS = "=== END ==="   # linea que el prompt de DEV pide despues del ultimo archivo
+
+_RE_FIN_ARCHIVOS = re.compile(r'^[ \t]*===\s*END\s*===[ \t]*$', re.IGNORECASE | re.MULTILINE)
+_RE_VEREDICTO = re.compile(r'VEREDICTO:\s*\**\s*(APROBADO|RECHAZADO)[^\n]*\n', re.IGNORECASE)
+
+
+# ── Condiciones de parada ────────────────────────────────────────────────────
+
+def hasta_fin_archivos():
+    """Para en la linea === END === con la que DEV cierra su ultimo archivo.
+
+    Entre archivos los modelos suelen explicar el siguiente antes de abrir su
+    === FILE ===, asi que la prosa despues de un ENDFILE no indica el final:
+    solo el marcador explicito lo hace. Se escanean solo las lineas nuevas
+    (desde el inicio de la linea que estaba a medias en `desde`).
+    """
+    def _cond(texto, desde=0):
+        inicio = texto.rfind("\n", 0, desde) + 1
+        fin = texto.rfind("\n") + 1          # solo lineas completas
+        return fin > inicio and _RE_FIN_ARCHIVOS.search(texto, inicio, fin) is not None
+    return _cond
+
+
+def hasta_veredicto(campos=("SCORE", "RESUMEN"), seguir_si_rechazado=True):
+    """Para cuando la linea VEREDICTO: ya se parseo (formato de QA/REVIEWER).
+
+    Args:
+        campos: Lineas que deben estar completas ademas del veredicto
+                (por defecto SCORE y RESUMEN, que se guardan en el output).
+        seguir_si_rechazado: Un RECHAZADO sigue generando hasta el final,
+                porque sus DETALLES son el feedback que recibe DEV/CONSULTING.
+    """
+    patrones = [re.compile(rf'{c}:[^\n]*\n', re.IGNORECASE) for c in campos]
+
+    def _cond(texto, desde=0):
+        m = _RE_VEREDICTO.search(texto)
+        if not m:
+            return False
+        if seguir_si_rechazado and m.group(1).upper() == "RECHAZADO":
+            return False
+        resto = texto[m.start():]
+        return all(p.search(resto) for p in patrones)
+    return _cond
+
+
+def debe_parar(condiciones, texto, desde=0):
+    """True si alguna condicion se cumple. Acepta None, un callable o una lista."""
+    if not condiciones:
+        return False
+    if callable(condiciones):
+        condiciones = [condiciones]
+    return any(c(texto, desde) for c in condiciones)
+
+
+# ── Flush periodico ──────────────────────────────────────────────────────────
+
+class Cancelado(Exception):
+    """Lanzada por un callback de progreso para abandonar la generacion (ej. lease perdido).
+
+    Corta el stream y llega al llamador de pensar_streaming; no se prueba otro backend.
+    """
+
+
+class Progreso:
+    """Llama a `callback(texto)` como maximo cada `intervalo` segundos.
+
+    Los errores del callback se registran pero no cortan la generacion,
+    salvo Cancelado, que se propaga.
+    """
+
+    def __init__(self, callback, intervalo=5.0, clock=time.monotonic):
+        self.callback = callback
+        self.intervalo = intervalo
+        self._clock = clock
+        self._ultimo = clock()
+        self._ultimo_len = 0
+        self.flushes = 0
+
+    def due(self):
+        return self._clock() - self._ultimo >= self.intervalo
+
+    def update(self, texto):
+        if self.due():
+            self._flush(texto)
+
+    def final(self, texto):
+        if len(texto) != self._ultimo_len:
+            self._flush(texto)
+
+    def _flush(self, texto):
+        self._ultimo = self._clock()
+        self._ultimo_len = len(texto)
+        try:
+            self.callback(texto)
+            self.flushes += 1
+        except Cancelado:
+            raise
+        except Exception as e:
+            logger.warning("Streaming: fallo el flush de progreso — %s", e)
+
+
+# ── Consumo de un stream ─────────────────────────────────────────────────────
+
+class ResultadoStream:
+    __slots__ = ("texto", "detenido", "error", "chunks", "ttft")
+
+    def __init__(self, texto="", detenido=False, error=None, chunks=0, ttft=None):
+        self.texto = texto
+        self.detenido = detenido   # True si lo corto una condicion de parada
+        self.error = error         # excepcion si el backend fallo a mitad
+        self.chunks = chunks
+        self.ttft = ttft           # segundos hasta el primer chunk (None si no hubo)
+
+
+def consumir(chunks, parar=None, progreso=None):
+    """Consume un iterador de chunks aplicando parada y flush.
+
+    Cierra el iterador al parar (eso cierra la conexion HTTP del backend).
+    Las excepciones del backend se devuelven en `error` junto con lo generado;
+    un Cancelado del progreso tambien (el llamador decide si lo relanza).
+
+    Las condiciones solo se evaluan cuando llega un salto de linea o un '=',
+    que es donde terminan los marcadores que buscan, y reciben hasta donde se
+    reviso la vez anterior; asi no se re-escanea el texto completo por cada token.
+    """
+    texto = ""
+    revisado = 0
+    n = 0
+    detenido = False
+    error = None
+    ttft = None
+    inicio = time.monotonic()
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if ttft is None:
+                ttft = time.monotonic() - inicio
+            texto += chunk
+            n += 1
+            if progreso is not None and progreso.due():
+                progreso.update(texto)
+            if parar and ("\n" in chunk or "=" in chunk):
+                if debe_parar(parar, texto, revisado):
+                    detenido = True
+                    break
+                revisado = len(texto)
+    except Exception as e:
+        error = e
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    return ResultadoStream(texto, detenido, error, n, ttft)
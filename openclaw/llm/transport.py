@@ -0,0 +1,297 @@
+"""
+Transporte HTTP compartido para los motores de IA.
+
+Un unico HttpTransport mantiene una requests.Session con pool keep-alive por
+host (Ollama, Telegram) y fabrica clientes httpx con los mismos limites para
+los SDKs de Gemini y Claude. Asi los 6 hilos de agentes reutilizan conexiones
+TCP/TLS en vez de abrir una nueva por cada prompt.
+
+Los contadores por host permiten confirmar cuantas conexiones se reutilizan:
+  requests        — peticiones enviadas
+  new_connections — conexiones TCP abiertas
+  reused          — requests - new_connections
+"""
+import logging
+import socket
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger("OpenClaw.transport")
+
+_en_curso = threading.local()   # on_conn de la peticion que corre en este hilo (ver request)
+
+
+def _host_key(url):
+    """Normaliza una URL a 'scheme://host:port' (clave del pool)."""
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+
+class _HostStats:
+    """Contadores de un host. Protegidos por el lock del transporte."""
+
+    __slots__ = ("requests", "new_connections", "errors")
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.errors = 0
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused": max(self.requests - self.new_connections, 0),
+            "errors": self.errors,
+        }
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter cuyos pools urllib3 avisan cada vez que abren una conexion."""
+
+    def __init__(self, on_new_conn, **kwargs):
+        self._on_new_conn = on_new_conn
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_new_conn = self._on_new_conn
+
+        class _CountingHTTPPool(HTTPConnectionPool):
+            def _new_conn(self):
+                on_new_conn()
+                return super()._new_conn()
+
+            def _get_conn(self, timeout=None):
+                return _avisar_conexion(super()._get_conn(timeout))
+
+        class _CountingHTTPSPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                on_new_conn()
+                return super()._new_conn()
+
+            def _get_conn(self, timeout=None):
+                return _avisar_conexion(super()._get_conn(timeout))
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPPool,
+            "https": _CountingHTTPSPool,
+        }
+
+
+def _avisar_conexion(conn):
+    """Entrega la conexion del pool al on_conn de la peticion en curso en este hilo."""
+    on_conn = getattr(_en_curso, "on_conn", None)
+    if on_conn is not None:
+        on_conn(conn)
+    return conn
+
+
+def abort(conn):
+    """Corta desde otro hilo una conexion urllib3 en uso (ver request(on_conn=...)).
+
+    shutdown() despierta al hilo bloqueado leyendo el socket, que falla con un
+    error de conexion; urllib3 descarta la conexion y libera su lugar en el pool.
+    """
+    sock = getattr(conn, "sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class HttpTransport:
+    """Pool de sesiones HTTP keep-alive, una por host, seguro entre hilos.
+
+    Args:
+        connect_timeout: Segundos para establecer la conexion TCP/TLS.
+        read_timeout:    Segundos por defecto esperando respuesta.
+        max_per_host:    Conexiones simultaneas maximas por host. Si se
+                         alcanzan, las peticiones esperan una libre.
+        keepalive_expiry: Segundos que una conexion httpx ociosa sigue abierta.
+    """
+
+    def __init__(self, connect_timeout=10.0, read_timeout=60.0, max_per_host=6,
+                 keepalive_expiry=120.0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_per_host = max_per_host
+        self.keepalive_expiry = keepalive_expiry
+        self._sessions = {}       # host_key -> requests.Session
+        self._stats = {}          # host_key -> _HostStats
+        self._httpx_clients = []  # clientes entregados a los SDKs (para close())
+        self._lock = threading.Lock()
+
+    # ── Sesiones requests ───────────────────────────────────────────────────
+
+    def _host_stats(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = _HostStats()
+        return stats
+
+    def _count_new_conn(self, key):
+        with self._lock:
+            self._host_stats(key).new_connections += 1
+
+    def session_for(self, url):
+        """Retorna la Session compartida del host de `url` (la crea si no existe)."""
+        key = _host_key(url)
+        session = self._sessions.get(key)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                return session
+            adapter = _CountingAdapter(
+                lambda: self._count_new_conn(key),
+                pool_connections=1,
+                pool_maxsize=self.max_per_host,
+                pool_block=True,
+                max_retries=0,
+            )
+            session = requests.Session()
+            session.mount(key.split("://")[0] + "://", adapter)
+            self._host_stats(key)
+            self._sessions[key] = session
+            return session
+
+    def timeout(self, read=None):
+        """Tupla (connect, read) para requests."""
+        return (self.connect_timeout, read if read is not None else self.read_timeout)
+
+    def request(self, method, url, timeout=None, on_conn=None, **kwargs):
+        """Envia una peticion por el pool del host. Propaga excepciones de requests.
+
+        `on_conn(conn)` recibe la conexion del pool que usa la peticion, antes de
+        enviarla; con abort(conn) otro hilo puede cortarla sin esperar al timeout.
+        """
+        session = self.session_for(url)
+        key = _host_key(url)
+        with self._lock:
+            self._host_stats(key).requests += 1
+        _en_curso.on_conn = on_conn
+        try:
+            return session.request(method, url, timeout=self.timeout(timeout), **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._host_stats(key).errors += 1
+            raise
+        finally:
+            _en_curso.on_conn = None
+
+    def post(self, url, timeout=None, **kwargs):
+        return self.request("POST", url, timeout=timeout, **kwargs)
+
+    def get(self, url, timeout=None, **kwargs):
+        return self.request("GET", url, timeout=timeout, **kwargs)
+
+    # ── Clientes httpx (SDKs Gemini / Claude) ───────────────────────────────
+
+    def httpx_client(self, host, read_timeout=None):
+        """Crea un httpx.Client con los limites del transporte para un SDK.
+
+        Los contadores se registran bajo `host` (ej. 'https://api.anthropic.com:443').
+        Las nuevas conexiones se detectan con la extension 'trace' de httpcore.
+        """
+        import httpx
+
+        key = _host_key(host)
+        with self._lock:
+            self._host_stats(key)
+
+        def _trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                self._count_new_conn(key)
+
+        def _on_request(request):
+            request.extensions["trace"] = _trace
+            with self._lock:
+                self._host_stats(key).requests += 1
+
+        client = httpx.Client(
+            timeout=httpx.Timeout(
+                read_timeout if read_timeout is not None else self.read_timeout,
+                connect=self.connect_timeout,
+            ),
+            limits=httpx.Limits(
+                max_connections=self.max_per_host,
+                max_keepalive_connections=self.max_per_host,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            event_hooks={"request": [_on_request]},
+        )
+        with self._lock:
+            self._httpx_clients.append(client)
+        return client
+
+    def async_client(self, host, read_timeout=None, max_connections=None):
+        """Crea un httpx.AsyncClient con los limites del transporte (motor async).
+
+        Comparte los contadores de `host` con los clientes sync. El que lo
+        crea debe cerrarlo con `await client.aclose()` en su event loop.
+        """
+        import httpx
+
+        key = _host_key(host)
+        with self._lock:
+            self._host_stats(key)
+
+        async def _trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                self._count_new_conn(key)
+
+        async def _on_request(request):
+            request.extensions["trace"] = _trace
+            with self._lock:
+                self._host_stats(key).requests += 1
+
+        limite = max_connections or self.max_per_host
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                read_timeout if read_timeout is not None else self.read_timeout,
+                connect=self.connect_timeout,
+            ),
+            limits=httpx.Limits(
+                max_connections=limite,
+                max_keepalive_connections=limite,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            event_hooks={"request": [_on_request]},
+        )
+
+    # ── Metricas y cierre ───────────────────────────────────────────────────
+
+    def stats(self):
+        """Snapshot de contadores por host: {host_key: {requests, new_connections, reused, errors}}."""
+        with self._lock:
+            return {key: s.as_dict() for key, s in self._stats.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self._stats:
+                self._stats[key] = _HostStats()
+
+    def close(self):
+        """Cierra todas las sesiones y clientes httpx."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            clients = list(self._httpx_clients)
+            self._sessions.clear()
+            self._httpx_clients.clear()
+        for s in sessions:
+            s.close()
+        for c in clients:
+            try:
+                c.close()
+            except Exception:
+                pass
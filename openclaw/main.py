@@ -19,14 +19,20 @@ import os
 import sys
 import signal
 import threading
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 # Asegurar que estamos en el directorio correcto
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
-from compartido import hablar, log, CONFIG, logger
-from db.connection import get_connection
-from db import queries
+import compartido
+from compartido import hablar, log, CONFIG, logger, transport, get_response_cache, health
+from db.connection import close_all, connection_stats, get_connection, get_read_connection
+from db import migrations, queries, writer
+from db.cache import reference_cache
+from db.maintenance import Maintainer
+from db.slowlog import query_log
+from db.watcher import ChangeWatcher
+from skills.loader import get_index as indice_skills
 
 # ── Configuracion ────────────────────────────────────────────────────────────
 INTERVALOS = {
@@ -38,21 +44,45 @@ INTERVALOS = {
     "reviewer":   CONFIG["intervalo_reviewer"],
 }
 
+# Estados que consume cada agente: lo despiertan en cuanto entra una idea
+ENTRADAS = {
+    "pm":         ("pending",),
+    "dev":        ("queued_software",),
+    "builder":    ("developed",),
+    "qa":         ("built",),
+    "consulting": ("queued_consulting",),
+    "reviewer":   ("reviewing",),
+}
+
 # ── Estado global ────────────────────────────────────────────────────────────
 stats = {
     "pm": 0, "dev": 0, "builder": 0, "qa": 0, "consulting": 0, "reviewer": 0,
     "errores": 0, "inicio": datetime.now()
 }
 _shutdown = threading.Event()
+watcher = ChangeWatcher(interval=CONFIG["db_watch_interval"])
+mantenimiento = Maintainer(
+    interval=CONFIG["db_maint_interval"],
+    quiet_s=CONFIG["db_maint_quiet"],
+    wal_limit_mb=CONFIG["db_wal_limit_mb"],
+    analyze_every=CONFIG["db_analyze_every"],
+    vacuum_budget_ms=CONFIG["db_vacuum_budget_ms"],
+)
 
 
 # ── Hilo generico ────────────────────────────────────────────────────────────
 def _hilo_agente(nombre, importar_ciclo, stat_key, intervalo):
-    """Hilo generico para ejecutar un agente en loop."""
+    """Hilo generico para ejecutar un agente en loop.
+
+    Entre ciclos espera `intervalo` o hasta que el watcher avise que entro
+    una idea a su cola (o que se esta apagando), lo que ocurra primero.
+    """
     from db.connection import close_connection
     ciclo = importar_ciclo()
+    despertar = watcher.subscribe(ENTRADAS[stat_key])
     try:
         while not _shutdown.is_set():
+            despertar.clear()   # lo que llegue durante el ciclo adelanta el siguiente
             try:
                 n = ciclo()
                 stats[stat_key] += n
@@ -60,7 +90,7 @@ def _hilo_agente(nombre, importar_ciclo, stat_key, intervalo):
                 stats["errores"] += 1
                 log(nombre, f"Error en ciclo: {e}", "!")
                 logger.exception("Error en agente %s", nombre)
-            _shutdown.wait(timeout=intervalo)
+            despertar.wait(timeout=intervalo)
     finally:
         close_connection()
 
@@ -121,8 +151,7 @@ def mostrar_status():
 
         # Pipeline stats from DB
         try:
-            db = get_connection()
-            ps = queries.get_pipeline_stats(db)
+            ps = queries.get_pipeline_stats(get_read_connection())
             logger.info(
                 "STATUS [%dmin] — PM:%d DEV:%d BLD:%d QA:%d CONS:%d REV:%d | Errores:%d | "
                 "DB: pending=%s queued=%s active=%s build=%s review=%s done=%s fail=%s",
@@ -138,6 +167,150 @@ def mostrar_status():
                 stats['consulting'], stats['reviewer'], stats['errores']
             )
 
+        # Conexiones a la BD vivas: sentencias y esperas por el lock de escritura
+        for cs in connection_stats():
+            logger.info(
+                "BD %s/%s — sentencias=%d esperas_lock=%d (%.2fs) locked=%d edad=%ds",
+                cs['thread'], cs['role'], cs['statements'], cs['busy_waits'], cs['busy_wait_s'],
+                cs['busy_errors'], cs['age_s']
+            )
+
+        # Cache de datos de referencia
+        if CONFIG["db_ref_cache"]:
+            rc = reference_cache.stats()
+            logger.info(
+                "CACHE BD — hits=%d misses=%d (%.0f%%) invalidadas=%d vencidas=%d entradas=%d ahorro=%.1fms",
+                rc['hits'], rc['misses'], rc['hit_ratio'] * 100, rc['invalidations'],
+                rc['expirations'], rc['entries'], rc['saved_ms']
+            )
+
+        # Escritor unico: profundidad de la cola, tamano de lote y esperas por el lock
+        cola = writer.active()
+        if cola is not None:
+            ws = cola.stats()
+            logger.info(
+                "ESCRITOR BD — ops=%d lotes=%d errores=%d pendientes=%d | lote p50=%s p95=%s | "
+                "cola p95=%s | lock p95=%sms max=%sms | commit p95=%sms",
+                ws['ops'], ws['batches'], ws['errors'], ws['pending'],
+                ws['batch_size']['p50'], ws['batch_size']['p95'], ws['queue_depth']['p95'],
+                ws['lock_wait_ms']['p95'], ws['lock_wait_ms']['max'], ws['commit_ms']['p95']
+            )
+
+        # Mantenimiento: tamano del WAL, paginas libres y lo liberado por tarea
+        if CONFIG["db_maintenance"]:
+            ms = mantenimiento.stats()
+            logger.info(
+                "MANTENIMIENTO BD — wal=%dKB libres=%dKB | %s",
+                ms['wal_bytes'] // 1024, ms['freelist_bytes'] // 1024,
+                ", ".join(f"{t}: {ts['runs']}x {ts['total_ms']:.0f}ms {ts['reclaimed_bytes'] // 1024}KB"
+                          for t, ts in sorted(ms['tasks'].items())) or "sin ejecuciones"
+            )
+
+        # Consultas mas lentas (p95) y cuantas pasaron el umbral
+        if query_log.enabled:
+            for nombre, qs in list(query_log.stats().items())[:5]:
+                logger.info(
+                    "CONSULTA %s — n=%d p50=%sms p95=%sms max=%sms",
+                    nombre, qs['count'], qs['p50'], qs['p95'], qs['max']
+                )
+            logger.info("CONSULTAS LENTAS (>%gms): %d", query_log.threshold_ms, len(query_log.slow()))
+
+        # Despertares por cambios en las colas
+        if CONFIG["db_watch"]:
+            ws = watcher.stats()
+            logger.info(
+                "WATCHER — chequeos=%d cambios=%d despertares=%s",
+                ws['checks'], ws['changes'],
+                ", ".join(f"{k}={v}" for k, v in sorted(ws['wakeups'].items())) or "-"
+            )
+
+        # Reutilizacion de conexiones HTTP por host
+        for host, hs in transport.stats().items():
+            if hs['requests']:
+                logger.info(
+                    "HTTP %s — req=%d conexiones=%d reusadas=%d errores=%d",
+                    host, hs['requests'], hs['new_connections'], hs['reused'], hs['errors']
+                )
+
+        # Salud de backends IA
+        for backend, hs in health.snapshot().items():
+            if hs['samples'] or hs['state'] != 'closed':
+                logger.info(
+                    "IA %s — %s err=%.0f%% p50=%ss fallos_seguidos=%d%s",
+                    backend, hs['state'], hs['error_rate'] * 100, hs['latency_p50'],
+                    hs['consecutive_failures'],
+                    f" ({hs['last_kind']}, reintento en {hs['retry_in']}s)" if hs['state'] != 'closed' else ""
+                )
+
+        # Reparto entre servidores Ollama (solo si hay mas de uno)
+        if len(CONFIG["ollama_urls"]) > 1:
+            for host, bs in compartido.balanceador.stats().items():
+                logger.info(
+                    "OLLAMA-LB %s — %s req=%d err=%d en_vuelo=%d (max %d) latencia=%ss modelos=%s%s",
+                    host, bs['state'], bs['requests'], bs['errors'], bs['in_flight'],
+                    bs['max_in_flight'], bs['latency_s'], ",".join(bs['models']) or "-",
+                    f" (vuelve en {bs['retry_in']}s)" if bs['state'] == 'down' else ""
+                )
+
+        # Residencia del modelo local: llamadas en frio vs en caliente
+        for host, rs in compartido.residencia.stats().items():
+            logger.info(
+                "OLLAMA %s — residente=%s precargas=%d desalojos=%d | frio=%d (ttft p50 %ss) "
+                "caliente=%d (ttft p50 %ss)",
+                host, "si" if rs['resident'] else "no", rs['warmups'], rs['evictions'],
+                rs['cold_calls'], rs['cold_ttft_p50'], rs['warm_calls'], rs['warm_ttft_p50']
+            )
+
+        # Cache de respuestas IA
+        if CONFIG["llm_cache"]:
+            cs = get_response_cache().stats()
+            logger.info(
+                "CACHE IA — hits=%d misses=%d ratio=%.2f entradas=%d (%d KB) desalojos=%d bypass=%d",
+                cs['hits'], cs['misses'], cs['hit_ratio'], cs['entries'], cs['bytes'] // 1024,
+                cs['evictions'], cs['bypass']
+            )
+
+        # Motor async (solo si alguien lo uso)
+        if compartido.motor_async is not None:
+            for backend, ms in compartido.motor_async.stats().items():
+                logger.info(
+                    "ASYNC %s — llamadas=%d ok=%d err=%d timeouts=%d cancel=%d "
+                    "en_vuelo=%d/%d (max %d) en_cola=%d",
+                    backend, ms['calls'], ms['ok'], ms['errors'], ms['timeouts'], ms['cancelled'],
+                    ms['in_flight'], ms['limit'], ms['max_in_flight'], ms['waiting']
+                )
+
+        # Hedging: cuantas veces se lanzo el respaldo y cuanto ahorro
+        for agente, hs in compartido.hedger.stats().items():
+            logger.info(
+                "HEDGE %s — llamadas=%d cubiertas=%d (%.0f%%) gano_respaldo=%d gano_primario=%d "
+                "ahorro~%.1fs p50=%ss p95=%ss",
+                agente, hs['calls'], hs['hedged'], hs['hedge_rate'] * 100, hs['hedge_wins'],
+                hs['primary_wins'], hs['saved_s'], hs['p50_s'], hs['p95_s']
+            )
+
+        # Ledger de uso IA (ultimas 24h)
+        if CONFIG["llm_ledger"]:
+            try:
+                usage = queries.get_llm_usage_stats(get_read_connection(), 'backend', since=_hace_24h())
+            except Exception:
+                usage = {}
+            for backend, us in usage.items():
+                logger.info(
+                    "USO IA %s (24h) — llamadas=%d ok=%d err=%d cache=%d tokens in=%d+%d out=%d "
+                    "p50=%sms p95=%sms ttft=%sms %s tok/s | prefijo: hits=%.0f%% cacheado=%.0f%% "
+                    "prefill_ahorrado=%sms",
+                    backend, us['calls'], us['ok'], us['errors'], us['cache_hits'],
+                    us['prompt_tokens'], us['system_tokens'], us['output_tokens'],
+                    us['p50_ms'], us['p95_ms'], us['ttft_p50_ms'], us['tokens_per_s'],
+                    us['prefix_hit_rate'] * 100, us['cached_share'] * 100, us['prefill_saved_ms']
+                )
+
+
+def _hace_24h():
+    """Limite 'since' para el ledger en el formato de datetime('now') de SQLite (UTC)."""
+    return (datetime.now(timezone.utc) - timedelta(hours=24)).strftime("%Y-%m-%d %H:%M:%S")
+
 
 # ── MAIN ─────────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
@@ -164,6 +337,24 @@ if __name__ == "__main__":
         log("SYS", str(e), "!")
         sys.exit(1)
 
+    # Columnas de lease e indices de las colas (idempotente)
+    try:
+        migrations.migrate(db)
+    except Exception as e:
+        logger.warning("Migracion de la BD no aplicada: %s", e)
+
+    # Indice de skills: solo se reparsean los SOPs que cambiaron desde la ultima vez
+    try:
+        r = indice_skills().refresh()
+        log("SYS", f"Indice de skills: {r['files']} SOPs ({r['parsed']} reparseados) en {r['ms']:.0f} ms", "+")
+    except Exception as e:
+        logger.warning("Indice de skills no actualizado: %s", e)
+
+    # Escritor unico: las escrituras de los agentes se confirman en lotes
+    if CONFIG["db_writer"] and CONFIG["db_backend"] == "sqlite":
+        writer.start(max_batch=CONFIG["db_writer_batch"], max_delay_ms=CONFIG["db_writer_delay_ms"])
+        log("SYS", f"Escritor unico de la BD activo (lotes de hasta {CONFIG['db_writer_batch']})", ">")
+
     # Parsear argumento --solo
     solo = None
     if "--solo" in sys.argv:
@@ -200,10 +391,26 @@ if __name__ == "__main__":
         threads.append(t)
         log("SYS", f"{label} en linea (cada {INTERVALOS.get(label.lower(), '?')}s)", ">")
 
+    # Despertar por cambios en las colas (el intervalo queda de respaldo)
+    if CONFIG["db_watch"]:
+        watcher.start(_shutdown)
+        log("SYS", f"Watcher de colas activo (cada {CONFIG['db_watch_interval']}s)", ">")
+
+    # Checkpoints del WAL, ANALYZE e incremental vacuum en ventanas tranquilas
+    if CONFIG["db_maintenance"] and mantenimiento.start(_shutdown):
+        log("SYS", f"Mantenimiento de la BD activo (cada {CONFIG['db_maint_interval']:g}s)", ">")
+
     # Status thread
     t_status = threading.Thread(target=mostrar_status, daemon=True, name="STATUS")
     t_status.start()
 
+    # Probes de backends IA con circuito abierto
+    health.start_prober(_shutdown)
+
+    # Precargar el modelo local y vigilar que Ollama no lo descargue
+    if CONFIG["ollama_warmup"]:
+        compartido.residencia.start(_shutdown)
+
     hablar(f"OpenClaw SecondBrain iniciado con {len(agentes)} agentes activos.")
     print(f"\n  Ctrl+C para detener\n")
 
@@ -211,15 +418,25 @@ if __name__ == "__main__":
     def shutdown_handler(signum, frame):
         logger.info("Senal de apagado recibida...")
         _shutdown.set()
+        watcher.wake_all()
 
     signal.signal(signal.SIGINT, shutdown_handler)
     signal.signal(signal.SIGTERM, shutdown_handler)
 
+    # kill -USR1 <pid>: histogramas, consultas lentas y planes a logs/slow_queries.json
+    def volcar_consultas(signum, frame):
+        query_log.dump(os.path.join("logs", "slow_queries.json"))
+        logger.info("Consultas volcadas en logs/slow_queries.json")
+
+    if query_log.enabled and hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, volcar_consultas)
+
     try:
         while not _shutdown.is_set():
             _shutdown.wait(timeout=1)
     except KeyboardInterrupt:
         _shutdown.set()
+        watcher.wake_all()
 
     # Resumen final
     uptime = datetime.now() - stats["inicio"]
@@ -230,4 +447,11 @@ if __name__ == "__main__":
         stats['pm'], stats['dev'], stats['builder'], stats['qa'],
         stats['consulting'], stats['reviewer'], stats['errores']
     )
+    if compartido.motor_async is not None:
+        compartido.motor_async.close()
+    transport.close()
+    writer.stop()
+    if query_log.enabled:
+        query_log.dump(os.path.join("logs", "slow_queries.json"))
+    logger.info("Conexiones a la BD cerradas: %d", close_all())
     hablar("OpenClaw SecondBrain detenido. Hasta pronto.")
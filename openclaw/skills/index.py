@@ -0,0 +1,281 @@
+"""
+Skills Index — parsed metadata of every SOP, persisted between runs.
+
+list_available_skills() used to walk core/skills on every call, and
+nothing knew a skill's title, command, inputs or size without reading the
+whole file. The index parses each markdown file once:
+
+  - title (first `# ` heading) and every heading, with its level,
+  - slash-commands: the skill's own (`/analyze-reliability` and aliases
+    like `/weibull-analysis`, from its Trigger / Invocation section) and
+    the other skills it mentions,
+  - input / output tables: rows of the tables under Input / Output
+    headings, keyed by the table's header cells, tagged with their
+    subheading (`Required Inputs`, `Optional Inputs`, ...),
+  - bytes and an estimated token count (~4 chars per token, like the LLM
+    usage ledger's estimate).
+
+Entries are stored in a JSON cache file (SKILLS_INDEX, default
+data/skills_index.json) keyed by relative path with the file's mtime and
+size; refresh() stats every file and re-parses only the ones whose mtime
+or size changed. Directory mtimes are kept too, so paths() notices added
+or removed skills with a few stat calls instead of a full walk.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+_VERSION = 1                     # bump when the parsed fields change: forces a full rebuild
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_COMMAND = re.compile(r"(?<![\w/.:-])/[a-z][a-z0-9]*(?:-[a-z0-9]+)+\b")
+_TABLE_RULE = re.compile(r"^\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$")
+_IO_SECTIONS = {"inputs": ("input",), "outputs": ("output", "deliverable")}
+
+
+def parse_skill(text):
+    """Metadata of one SOP.
+
+    Returns:
+        {title, headings: [[level, text]], commands, mentions,
+         inputs: [{section, <header>: cell}], outputs: [...], bytes, tokens}
+    """
+    headings = []
+    commands, mentions = [], []
+    tables = {"inputs": [], "outputs": []}
+    path = []                           # headings above the current line: [(level, text)]
+    header = None                       # cells of the table being read
+    in_code = False
+    section, own = "", False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_code = not in_code
+            continue
+        match = None if in_code else _HEADING.match(stripped)
+        if match:
+            level, title = len(match.group(1)), match.group(2)
+            headings.append([level, title])
+            path = [h for h in path if h[0] < level] + [(level, title)]
+            section = " / ".join(t for _, t in path).lower()
+            own = any(k in section for k in ("trigger", "invocation", "command"))
+            header = None
+            continue
+        # Commands count inside code blocks too (some SOPs fence their /command)
+        for command in _COMMAND.findall(line):
+            target = commands if own else mentions
+            if command not in target:
+                target.append(command)
+        if in_code or not stripped.startswith("|"):
+            header = None
+            continue
+        cells = [c.strip().strip("`").strip() for c in stripped.strip("|").split("|")]
+        if header is None:
+            header = [c.lower() for c in cells]
+            continue
+        if _TABLE_RULE.match(stripped):
+            continue
+        for kind, keys in _IO_SECTIONS.items():
+            if any(k in section for k in keys):
+                row = {"section": path[-1][1] if path else ""}
+                row.update({h or str(i): c for i, (h, c) in enumerate(zip(header, cells))})
+                tables[kind].append(row)
+                break
+    mentions = [m for m in mentions if m not in commands]
+    title = next((t for level, t in headings if level == 1), headings[0][1] if headings else "")
+    return {
+        "title": title,
+        "headings": headings,
+        "commands": commands,
+        "mentions": mentions,
+        "inputs": tables["inputs"],
+        "outputs": tables["outputs"],
+        "bytes": len(text.encode("utf-8")),
+        "tokens": len(text) // 4,
+    }
+
+
+class SkillsIndex:
+    """Parsed skills of `skills_dir`, cached in `cache_path` (None: memory only)."""
+
+    def __init__(self, skills_dir, cache_path=None):
+        self.skills_dir = str(skills_dir)
+        self.cache_path = cache_path
+        self._entries = {}              # relative path -> entry (parse_skill + mtime_ns, size)
+        self._dirs = {}                 # relative dir -> mtime_ns
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._stats = {"refreshes": 0, "parsed": 0, "reused": 0, "removed": 0, "last_ms": 0.0}
+
+    def refresh(self):
+        """Stat every skill and re-parse the new / changed ones; saves the cache if anything moved.
+
+        Returns:
+            {files, parsed, reused, removed, ms}
+        """
+        start = time.perf_counter()
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            files, dirs = self._scan()
+            parsed = reused = 0
+            entries = {}
+            for rel, st in files.items():
+                entry = self._entries.get(rel)
+                if entry is not None and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                    entries[rel] = entry
+                    reused += 1
+                    continue
+                try:
+                    with open(os.path.join(self.skills_dir, rel), "r", encoding="utf-8") as f:
+                        text = f.read()
+                except (OSError, UnicodeDecodeError):
+                    continue
+                entries[rel] = {"path": rel, **parse_skill(text), "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+                parsed += 1
+            removed = len(set(self._entries) - set(entries))
+            changed = parsed or removed or dirs != self._dirs
+            self._entries, self._dirs = entries, dirs
+            if changed:
+                self._save()
+            ms = round((time.perf_counter() - start) * 1000, 2)
+            self._stats["refreshes"] += 1
+            self._stats["parsed"] += parsed
+            self._stats["reused"] += reused
+            self._stats["removed"] += removed
+            self._stats["last_ms"] = ms
+        return {"files": len(entries), "parsed": parsed, "reused": reused, "removed": removed, "ms": ms}
+
+    def paths(self):
+        """Sorted relative paths; re-walks only if a directory's mtime moved (skill added / removed)."""
+        if not self._loaded or self._dirs_changed():
+            self.refresh()
+        return sorted(self._entries)
+
+    def get(self, relative_path):
+        """Entry of one skill (refreshed if the file changed), or None."""
+        rel = relative_path.replace("\\", "/")
+        entry = self._entries.get(rel)
+        try:
+            st = os.stat(os.path.join(self.skills_dir, rel))
+        except OSError:
+            return None
+        if entry is None or entry["mtime_ns"] != st.st_mtime_ns or entry["size"] != st.st_size:
+            self.refresh()
+            entry = self._entries.get(rel)
+        return entry
+
+    def all(self):
+        self.paths()
+        return [self._entries[p] for p in sorted(self._entries)]
+
+    def by_command(self, command):
+        """Path of the skill invoked by `command` ('/weibull-analysis' or 'weibull-analysis'), or None."""
+        command = "/" + command.lstrip("/")
+        return next((e["path"] for e in self.all() if command in e["commands"]), None)
+
+    def stats(self):
+        """{skills, bytes, tokens, refreshes, parsed, reused, removed, last_ms}."""
+        with self._lock:
+            return {
+                "skills": len(self._entries),
+                "bytes": sum(e["bytes"] for e in self._entries.values()),
+                "tokens": sum(e["tokens"] for e in self._entries.values()),
+                **self._stats,
+            }
+
+    # ── Disk ─────────────────────────────────────────────────────────────────
+
+    def _scan(self):
+        """({relative file: stat}, {relative dir: mtime_ns}) of the markdown files."""
+        files, dirs = {}, {}
+        if not os.path.isdir(self.skills_dir):
+            return files, dirs
+        pending = [""]
+        while pending:
+            rel_dir = pending.pop()
+            full_dir = os.path.join(self.skills_dir, rel_dir)
+            dirs[rel_dir] = os.stat(full_dir).st_mtime_ns
+            with os.scandir(full_dir) as it:
+                for item in it:
+                    rel = f"{rel_dir}/{item.name}" if rel_dir else item.name
+                    if item.is_dir():
+                        pending.append(rel)
+                    elif item.name.endswith(".md"):
+                        files[rel] = item.stat()
+        return files, dirs
+
+    def _dirs_changed(self):
+        for rel_dir, mtime_ns in self._dirs.items():
+            try:
+                if os.stat(os.path.join(self.skills_dir, rel_dir)).st_mtime_ns != mtime_ns:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def _load(self):
+        self._loaded = True
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != _VERSION or data.get("skills_dir") != self.skills_dir:
+            return
+        self._entries = data.get("skills", {})
+        self._dirs = data.get("dirs", {})
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        data = {"version": _VERSION, "skills_dir": self.skills_dir, "dirs": self._dirs, "skills": self._entries}
+        folder = os.path.dirname(os.path.abspath(self.cache_path))
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix=".skills-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.cache_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def default_cache_path():
+    """SKILLS_INDEX, relative to openclaw/ (default data/skills_index.json)."""
+    path = os.getenv("SKILLS_INDEX", "data/skills_index.json")
+    if not os.path.isabs(path):
+        path = str((Path(__file__).parent.parent / path).resolve())
+    return path
+
+
+def _first_cell(row):
+    return next((v for k, v in row.items() if k != "section"), "")
+
+
+if __name__ == "__main__":
+    import sys
+
+    from skills.loader import get_index
+
+    index = get_index()
+    r = index.refresh()
+    print(f"{r['files']} skills ({r['parsed']} parseados, {r['reused']} sin cambios, "
+          f"{r['removed']} borrados) en {r['ms']} ms -> {index.cache_path}")
+    for arg in sys.argv[1:]:
+        path = index.by_command(arg) if arg.startswith("/") else arg
+        entry = index.get(path) if path else None
+        if entry is None:
+            print(f"\n{arg}: no encontrado")
+            continue
+        print(f"\n{entry['path']} — {entry['title']} ({entry['bytes']} bytes, ~{entry['tokens']} tokens)")
+        print(f"  comandos: {' '.join(entry['commands']) or '-'}")
+        print(f"  entradas: {', '.join(_first_cell(row) for row in entry['inputs']) or '-'}")
+        print(f"  salidas:  {', '.join(_first_cell(row) for row in entry['outputs']) or '-'}")
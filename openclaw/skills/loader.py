@@ -3,11 +3,16 @@ Skills Loader — Reads SOP markdown files from core/skills/ directory.
 These files serve as the knowledge base for consulting agents.
 
 Uses mtime-based caching: files are only re-read from disk when modified.
+The list of skills and their parsed metadata come from the persistent
+skills index (skills/index.py).
 """
 import os
 from pathlib import Path
 
+from skills.index import SkillsIndex, default_cache_path
+
 _skills_dir = None
+_index = None
 _content_cache = {}  # full_path -> (content, mtime)
 
 
@@ -27,14 +32,24 @@ def _get_skills_dir():
 
 def reset_skills_dir():
     """Reset cached path (for testing)."""
-    global _skills_dir
+    global _skills_dir, _index
     _skills_dir = None
+    _index = None
 
 
 def set_skills_dir(path):
-    """Override skills directory (for testing)."""
-    global _skills_dir
+    """Override skills directory (for testing); its index is kept in memory only."""
+    global _skills_dir, _index
     _skills_dir = path
+    _index = SkillsIndex(path)
+
+
+def get_index():
+    """The SkillsIndex of the skills directory (cache file from SKILLS_INDEX)."""
+    global _index
+    if _index is None:
+        _index = SkillsIndex(_get_skills_dir(), default_cache_path())
+    return _index
 
 
 def load_skill(relative_path):
@@ -51,10 +66,11 @@ def load_skill(relative_path):
     """
     skills_dir = _get_skills_dir()
     full_path = os.path.join(skills_dir, relative_path)
-    if not os.path.exists(full_path):
+    try:
+        mtime = os.stat(full_path).st_mtime_ns
+    except OSError:
         return None
 
-    mtime = os.path.getmtime(full_path)
     cached = _content_cache.get(full_path)
     if cached and cached[1] == mtime:
         return cached[0]
@@ -83,19 +99,9 @@ def load_skills(skill_paths):
 
 
 def list_available_skills():
-    """List all .md files in the skills directory tree.
+    """List all .md files in the skills directory tree (from the skills index).
 
     Returns:
         Sorted list of relative paths (forward slashes).
     """
-    skills_dir = _get_skills_dir()
-    if not os.path.exists(skills_dir):
-        return []
-
-    result = []
-    for root, _, files in os.walk(skills_dir):
-        for f in files:
-            if f.endswith(".md"):
-                rel = os.path.relpath(os.path.join(root, f), skills_dir)
-                result.append(rel.replace("\\", "/"))
-    return sorted(result)
+    return get_index().paths()
@@ -0,0 +1,160 @@
+"""Tests for db/artifacts.py — compressed, content-addressed execution artifacts."""
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+from db import artifacts, queries
+from db.artifacts import BlobStore
+from db.connection import reset_connection, set_connection
+
+CODIGO = "=== FILE: main.py ===\n" + "print('hola ñandú')\n" * 400 + "=== ENDFILE ==="
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    """Artifact store enabled on a temp dir; settings restored afterwards."""
+    antes = dict(artifacts.SETTINGS)
+    artifacts.configure(root=str(tmp_path / "artifacts"), enabled=True, summary_chars=80)
+    yield artifacts.store()
+    artifacts.configure(**antes)
+
+
+def _columna(db, idea_id):
+    return db.execute("SELECT execution_output FROM ideas WHERE id = ?", [idea_id]).fetchone()[0]
+
+
+class TestBlobStore:
+    @pytest.mark.parametrize("codec", ["zlib", "lzma"])
+    def test_roundtrip_and_dedup(self, tmp_path, codec):
+        store = BlobStore(tmp_path, codec)
+        ref, stored = store.put(CODIGO)
+        assert store.put(CODIGO) == (ref, stored)
+        assert store.get(ref) == CODIGO
+        assert stored < len(CODIGO.encode()) / 10
+        assert store.stats() == {"blobs": 1, "bytes": stored}
+
+    def test_prefix_only_inflates_what_it_needs(self, tmp_path):
+        store = BlobStore(tmp_path)
+        ref, _ = store.put("ñ" * 10000)
+        assert store.get(ref, max_chars=3) == "ñññ"
+        assert store.get(ref, max_chars=0) == ""
+
+    def test_missing_blob(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            BlobStore(tmp_path).get("0" * 64)
+
+    def test_gc_keeps_referenced_and_recent(self, tmp_path):
+        store = BlobStore(tmp_path)
+        vivo, _ = store.put("vivo")
+        huerfano, _ = store.put("huerfano")
+        assert store.gc([vivo], older_than=3600) == (0, 0)
+        viejo = time.time() - 7200
+        os.utime(store._find(huerfano), (viejo, viejo))
+        removed, _ = store.gc([vivo], older_than=3600)
+        assert removed == 1 and store.exists(vivo) and not store.exists(huerfano)
+
+    def test_dedup_hit_refreshes_age_for_gc(self, tmp_path):
+        store = BlobStore(tmp_path)
+        ref, _ = store.put("reusado")
+        viejo = time.time() - 7200
+        os.utime(store._find(ref), (viejo, viejo))
+        store.put("reusado")                    # nueva referencia, aun sin fila en idea_artifacts
+        assert store.gc([], older_than=3600) == (0, 0)
+        assert store.exists(ref)
+
+    def test_configure_rejects_unknown_codec(self):
+        with pytest.raises(ValueError):
+            artifacts.configure(codec="bz2")
+
+
+class TestColumnMode:
+    def test_append_concatenates_in_sql(self, db_with_ideas):
+        antes = _columna(db_with_ideas, 5)
+        queries.update_execution_status(db_with_ideas, 5, 'built', append=("Build Report (BUILDER)", "OK"),
+                                        agent_name='BUILDER')
+        assert _columna(db_with_ideas, 5) == f"{antes}\n\n---\n### Build Report (BUILDER)\nOK"
+        assert queries.get_artifact_stats(db_with_ideas)["artifacts"] == 0
+
+
+class TestArtifactStore:
+    def test_outputs_and_sections_leave_the_row(self, backend_db, almacen):
+        db = backend_db
+        db.execute("INSERT INTO ideas (text, execution_status) VALUES ('script', 'in_progress')")
+        db.commit()
+        idea = db.execute("SELECT MAX(id) FROM ideas").fetchone()[0]
+        queries.update_execution_status(db, idea, 'developed', output=CODIGO, agent_name='DEV')
+        queries.update_execution_status(db, idea, 'built', append=("Build Report (BUILDER)", "todo OK"),
+                                        agent_name='BUILDER')
+        queries.update_execution_status(db, idea, 'completed', append=("Code Review (QA)", "APROBADO"),
+                                        agent_name='QA')
+        esperado = f"{CODIGO}\n\n---\n### Build Report (BUILDER)\ntodo OK\n\n---\n### Code Review (QA)\nAPROBADO"
+        assert queries.get_execution_output(db, idea) == (esperado, len(esperado))
+        assert queries.get_execution_output(db, idea, max_chars=50) == (esperado[:50], len(esperado))
+        columna = _columna(db, idea)
+        assert len(columna) < 400 and "### Code Review (QA)" in columna and "[artefacto" in columna
+        assert queries.get_artifact_stats(db)["artifacts"] == 3
+
+    def test_new_output_replaces_previous_round(self, db_with_ideas, almacen):
+        queries.update_execution_status(db_with_ideas, 2, 'developed', output="v1", agent_name='DEV')
+        queries.update_execution_status(db_with_ideas, 2, 'queued_software', append=("Build Report", "fallo"),
+                                        agent_name='BUILDER', outcome='rejected')
+        queries.update_execution_status(db_with_ideas, 2, 'in_progress', agent_name='DEV')
+        queries.update_execution_progress(db_with_ideas, 2, "generando v2...")
+        assert queries.get_execution_output(db_with_ideas, 2)[0] == "generando v2..."
+        queries.update_execution_status(db_with_ideas, 2, 'developed', output="v2", agent_name='DEV')
+        assert queries.get_execution_output(db_with_ideas, 2)[0] == "v2"
+
+    def test_append_to_plain_text_moves_it_first(self, db_with_ideas, almacen):
+        antes = _columna(db_with_ideas, 5)
+        queries.update_execution_status(db_with_ideas, 5, 'built', append=("Build Report (BUILDER)", "OK"),
+                                        agent_name='BUILDER')
+        assert queries.get_execution_output(db_with_ideas, 5)[0] == f"{antes}\n\n---\n### Build Report (BUILDER)\nOK"
+
+    def test_ideas_with_artifacts_keep_them_when_disabled(self, db_with_ideas, almacen):
+        queries.update_execution_status(db_with_ideas, 2, 'developed', output=CODIGO, agent_name='DEV')
+        artifacts.configure(enabled=False)
+        queries.update_execution_status(db_with_ideas, 2, 'built', append=("Build Report", "OK"),
+                                        agent_name='BUILDER')
+        assert queries.get_execution_output(db_with_ideas, 2)[0] == f"{CODIGO}\n\n---\n### Build Report\nOK"
+
+    def test_missing_blob_is_reported_in_the_text(self, db_with_ideas, almacen, tmp_path):
+        queries.update_execution_status(db_with_ideas, 2, 'developed', output=CODIGO, agent_name='DEV')
+        for path in (tmp_path / "artifacts").rglob("*.z"):
+            path.unlink()
+        assert "no encontrado" in queries.get_execution_output(db_with_ideas, 2)[0]
+
+
+class TestMigration:
+    def test_moves_long_outputs_once(self, db_with_ideas, almacen):
+        db_with_ideas.execute("UPDATE ideas SET execution_output = ? WHERE id = 10", [CODIGO])
+        db_with_ideas.execute("INSERT INTO ideas (id, text, execution_status, execution_output) "
+                              "VALUES (30, 'a medias', 'in_progress', ?)", [CODIGO])
+        db_with_ideas.commit()
+        movidas = queries.migrate_execution_outputs(db_with_ideas)
+        assert movidas["ideas"] >= 1 and movidas["chars_after"] < movidas["chars_before"]
+        assert queries.get_execution_output(db_with_ideas, 10) == (CODIGO, len(CODIGO))
+        assert len(_columna(db_with_ideas, 10)) < 200
+        assert _columna(db_with_ideas, 30) == CODIGO                      # en progreso: no se toca
+        assert queries.migrate_execution_outputs(db_with_ideas)["ideas"] == 0
+
+    def test_garbage_collection_keeps_live_artifacts(self, db_with_ideas, almacen):
+        queries.update_execution_status(db_with_ideas, 2, 'developed', output="v1", agent_name='DEV')
+        queries.update_execution_status(db_with_ideas, 2, 'developed', output="v2", agent_name='DEV')
+        assert queries.collect_artifact_garbage(db_with_ideas, older_than=0)[0] == 1
+        assert queries.get_execution_output(db_with_ideas, 2)[0] == "v2"
+
+
+class TestAgents:
+    def test_qa_appends_review_without_truncating_the_code(self, db_with_ideas, almacen):
+        from agents.qa import ciclo
+        db_with_ideas.execute("UPDATE ideas SET execution_output = ? WHERE id = 10", [CODIGO])
+        db_with_ideas.commit()
+        set_connection(db_with_ideas)
+        try:
+            with patch('agents.qa.pensar_streaming', return_value="VEREDICTO: APROBADO\nSCORE: 9"):
+                assert ciclo() == 1
+            texto, _ = queries.get_execution_output(db_with_ideas, 10)
+            assert texto.startswith(CODIGO) and "### Code Review (QA" in texto
+        finally:
+            reset_connection()
@@ -0,0 +1,208 @@
+"""Tests for llm/balancer.py — Multi-host Ollama load balancing"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+from llm.balancer import OllamaBalancer
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def balancer():
+    hosts = ["http://a", "http://b", "http://c"]
+    b = OllamaBalancer(lambda: hosts, failure_threshold=2, cooldown=10, cold_penalty=0)
+    b._clock = _Clock()
+    return b
+
+
+class TestRouting:
+    def test_least_outstanding_requests(self, balancer):
+        elegidos = [balancer.acquire("llama3") for _ in range(3)]
+        assert sorted(elegidos) == ["http://a", "http://b", "http://c"]
+        balancer.release("http://b", ok=True, latency=1.0)
+        assert balancer.acquire("llama3") == "http://b"
+
+    def test_prefers_faster_host(self, balancer):
+        hosts = [balancer.acquire("llama3") for _ in range(3)]
+        for host, lat in zip(hosts, (4.0, 1.0, 2.0)):
+            balancer.release(host, ok=True, latency=lat)
+        # costo = (en vuelo + 1) * latencia: con 1 en vuelo b (1s) empata con c libre (2s)
+        assert [balancer.acquire("llama3") for _ in range(4)] == ["http://b", "http://c", "http://b", "http://b"]
+
+    def test_prefers_host_with_model_loaded(self):
+        b = OllamaBalancer(lambda: ["http://a", "http://b"], cold_penalty=30)
+        b.set_models("http://b", ["llama3:latest", "mistral:latest"])
+        assert b.acquire("llama3") == "http://b"
+        assert b.acquire("mistral:latest") == "http://b"
+        assert b.acquire("phi3") == "http://a"
+
+    def test_success_remembers_model(self, balancer):
+        host = balancer.acquire("llama3")
+        balancer.release(host, ok=True, latency=1.0, model="llama3")
+        assert balancer.stats()[host]["models"] == ["llama3:latest"]
+
+
+class TestUnhealthyHosts:
+    def test_host_dropped_after_failures_and_back_after_cooldown(self, balancer):
+        for _ in range(2):
+            balancer.release("http://a", ok=False, kind="connection")
+        assert balancer.stats()["http://a"]["state"] == "down"
+        assert "http://a" not in {balancer.acquire("llama3") for _ in range(6)}
+
+        balancer._clock.now += 11
+        for host in ("http://b", "http://c"):
+            while balancer.stats()[host]["in_flight"]:
+                balancer.release(host, ok=True, latency=1.0)
+        assert balancer.acquire("llama3") == "http://a"
+
+    def test_cooldown_doubles_on_relapse(self, balancer):
+        for _ in range(2):
+            balancer.release("http://a", ok=False, kind="timeout")
+        balancer._clock.now += 11
+        balancer.release("http://a", ok=False, kind="timeout")
+        assert balancer.stats()["http://a"]["retry_in"] == 20
+
+    def test_all_down_uses_first_to_return(self, balancer):
+        for host, fallos in (("http://a", 4), ("http://b", 2), ("http://c", 3)):
+            for _ in range(fallos):
+                balancer.release(host, ok=False, kind="connection")
+        assert balancer.acquire("llama3") == "http://b"
+
+    def test_cancelled_is_neutral(self, balancer):
+        host = balancer.acquire("llama3")
+        balancer.release(host, ok=None)
+        s = balancer.stats()[host]
+        assert s["in_flight"] == 0 and s["errors"] == 0 and s["latency_s"] is None
+
+
+# ── Integracion: varios Ollama simulados ────────────────────────────────────
+
+class _Ollama:
+    """Stand-in de /api/chat que tarda `delay` s y cuenta concurrencia."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.atendidas = 0
+        self.en_vuelo = 0
+        self.max_en_vuelo = 0
+        self.caido = False
+        self._lock = threading.Lock()
+        ollama = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if ollama.caido:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                with ollama._lock:
+                    ollama.atendidas += 1
+                    ollama.en_vuelo += 1
+                    ollama.max_en_vuelo = max(ollama.max_en_vuelo, ollama.en_vuelo)
+                time.sleep(ollama.delay)
+                with ollama._lock:
+                    ollama.en_vuelo -= 1
+                payload = json.dumps({"message": {"role": "assistant", "content": "ok"},
+                                      "done": True, "load_duration": 1000}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def granja(monkeypatch):
+    """Configura compartido con varios Ollama simulados."""
+    import compartido
+    servidores = []
+
+    def _crear(*delays, extra=()):
+        servidores.extend(_Ollama(d) for d in delays)
+        urls = [s.url for s in servidores] + list(extra)
+        monkeypatch.setitem(compartido.CONFIG, "ollama_urls", urls)
+        monkeypatch.setattr(compartido, "balanceador", OllamaBalancer(compartido._ollama_hosts))
+        return servidores
+    with patch.object(compartido, "_registrar_uso"):
+        yield _crear
+    for s in servidores:
+        s.close()
+
+
+class TestPensarConLocal:
+    def test_concurrent_calls_spread_across_hosts(self, granja):
+        import compartido
+        servidores = granja(0.2, 0.2, 0.2)
+        inicio = time.monotonic()
+        with ThreadPoolExecutor(6) as pool:
+            out = list(pool.map(lambda _: compartido.pensar_con_local("p"), range(6)))
+        assert out == ["ok"] * 6
+        assert [s.atendidas for s in servidores] == [2, 2, 2]
+        assert max(s.max_en_vuelo for s in servidores) <= 2
+        assert time.monotonic() - inicio < 6 * 0.2
+
+    def test_slow_host_gets_less_traffic(self, granja):
+        import compartido
+        rapido, lento = granja(0.01, 0.3)
+        for _ in range(8):
+            compartido.pensar_con_local("p")
+        assert rapido.atendidas > lento.atendidas
+        assert lento.atendidas <= 1
+
+    def test_unreachable_host_is_not_retried(self, granja):
+        import compartido
+        (vivo,) = granja(0.01, extra=["http://127.0.0.1:9"])
+        respuestas = [compartido.pensar_con_local("p") for _ in range(6)]
+        assert respuestas.count("ok") >= 5
+        assert compartido.balanceador.stats()["http://127.0.0.1:9"]["requests"] <= 1
+
+    def test_host_that_dies_leaves_rotation(self, granja):
+        import compartido
+        uno, dos = granja(0.01, 0.01)
+        for srv in (uno, dos):   # lo que haria la residencia tras /api/ps
+            compartido.balanceador.set_models(srv.url, [compartido.CONFIG["local_model"]])
+        for _ in range(4):
+            compartido.pensar_con_local("p")
+        assert uno.atendidas and dos.atendidas
+        dos.caido = True
+        respuestas = [compartido.pensar_con_local("p") for _ in range(8)]
+        assert respuestas.count("") == 2
+        s = compartido.balanceador.stats()[dos.url]
+        assert s["state"] == "down" and s["errors"] == 2
+
+    def test_single_url_still_works(self, monkeypatch):
+        import compartido
+        srv = _Ollama(0)
+        monkeypatch.setitem(compartido.CONFIG, "ollama_urls", [])
+        monkeypatch.setitem(compartido.CONFIG, "ollama_url", f"{srv.url}/api/generate")
+        with patch.object(compartido, "_registrar_uso"):
+            assert compartido.pensar_con_local("p") == "ok"
+        assert srv.atendidas == 1
+        srv.close()
@@ -195,10 +195,11 @@ class TestBuilderCiclo:
             reset_connection()
 
     def test_blocks_after_max_failures(self, db_with_ideas):
-        db_with_ideas.execute(
-            "UPDATE ideas SET execution_error = 'BUILDER RECHAZADO\nBUILDER RECHAZADO\nBUILDER RECHAZADO' WHERE id = 5"
-        )
-        db_with_ideas.commit()
+        from db import queries
+        for _ in range(3):   # tres builds rechazados en el historial; vuelve a 'developed'
+            queries.update_execution_status(db_with_ideas, 5, 'queued_software', error="BUILDER RECHAZADO",
+                                            agent_name='BUILDER', outcome='rejected')
+            queries.update_execution_status(db_with_ideas, 5, 'developed', agent_name='DEV')
         set_connection(db_with_ideas)
         try:
             from agents.builder import ciclo
@@ -236,3 +237,30 @@ class TestBuilderCiclo:
                 assert proj['icon'] == '🤖'
         finally:
             reset_connection()
+
+    def test_lost_lease_discards_the_build(self, db_with_ideas):
+        """Si otro BUILDER tomo la idea durante la ejecucion, no se escribe el resultado."""
+        from agents.builder import ciclo
+
+        def _robar(*a, **kw):
+            db_with_ideas.execute("UPDATE ideas SET claimed_by = 'BUILDER@otro:1' WHERE id = 5")
+            db_with_ideas.commit()
+            return True, {'type': 'script', 'stdout': 'OK'}
+
+        set_connection(db_with_ideas)
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                with patch('agents.builder.PROJECTS_DIR', Path(tmpdir)), \
+                     patch('agents.builder._crear_venv', return_value=(('/fake/python', '/fake/pip'), None)), \
+                     patch('agents.builder._instalar_dependencias', return_value=(True, None)), \
+                     patch('agents.builder._validar_sintaxis', return_value=(True, None)), \
+                     patch('agents.builder._intentar_ejecucion', side_effect=_robar):
+                    assert ciclo() == 0
+            row = db_with_ideas.execute(
+                "SELECT execution_status, execution_output, claimed_by FROM ideas WHERE id=5"
+            ).fetchone()
+            assert row['execution_status'] == 'developed'
+            assert 'Build Report' not in row['execution_output']
+            assert row['claimed_by'] == 'BUILDER@otro:1'
+        finally:
+            reset_connection()
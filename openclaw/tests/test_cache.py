@@ -0,0 +1,84 @@
+"""Tests for llm/cache.py — Content-addressed response cache"""
+import time
+
+import pytest
+
+from llm.cache import ResponseCache, cache_key
+
+
+@pytest.fixture
+def cache():
+    c = ResponseCache(":memory:", max_bytes=1000, default_ttl=60, ttl_by_agent={"QA": 5})
+    yield c
+    c.close()
+
+
+class TestCacheKey:
+    def test_key_is_stable(self):
+        assert cache_key("local", "llama3", "sys", "p", 4096) == cache_key("local", "llama3", "sys", "p", 4096)
+
+    def test_key_depends_on_every_field(self):
+        base = cache_key("local", "llama3", "sys", "p", 4096)
+        assert base != cache_key("gemini", "llama3", "sys", "p", 4096)
+        assert base != cache_key("local", "llama3.2", "sys", "p", 4096)
+        assert base != cache_key("local", "llama3", "sys2", "p", 4096)
+        assert base != cache_key("local", "llama3", "sys", "p2", 4096)
+        assert base != cache_key("local", "llama3", "sys", "p", 2048)
+
+    def test_no_ambiguity_between_fields(self):
+        assert cache_key("local", "m", "ab", "c", 1) != cache_key("local", "m", "a", "bc", 1)
+
+
+class TestResponseCache:
+    def test_miss_then_hit(self, cache):
+        assert cache.get("k") is None
+        cache.put("k", "respuesta", "local", model="llama3", agent="DEV")
+        assert cache.get("k") == "respuesta"
+        s = cache.stats()
+        assert s["hits"] == 1
+        assert s["misses"] == 1
+        assert s["stores"] == 1
+        assert s["hit_ratio"] == 0.5
+
+    def test_empty_response_not_stored(self, cache):
+        cache.put("k", "", "local")
+        assert cache.stats()["entries"] == 0
+
+    def test_ttl_per_agent(self, cache):
+        assert cache.ttl_for("qa") == 5
+        assert cache.ttl_for("REVIEWER") == 60
+        cache.put("k", "x", "claude", agent="QA")
+        cache._conn.execute("UPDATE llm_cache SET expires_at = ?", [time.time() - 1])
+        assert cache.get("k") is None
+        assert cache.stats()["evictions"] == 1
+
+    def test_lru_eviction_by_size(self, cache):
+        cache.put("a", "a" * 400, "local")
+        cache.put("b", "b" * 400, "local")
+        cache._conn.execute("UPDATE llm_cache SET last_access = last_access - 10 WHERE key = 'b'")
+        cache.get("a")  # a es la mas reciente
+        cache.put("c", "c" * 400, "local")
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        assert cache.stats()["bytes"] <= 1000
+
+    def test_oversized_response_skipped(self, cache):
+        cache.put("big", "x" * 2000, "local")
+        assert cache.get("big") is None
+
+    def test_persists_on_disk(self, tmp_path):
+        path = str(tmp_path / "sub" / "cache.db")
+        c = ResponseCache(path)
+        c.put("k", "v", "gemini")
+        c.close()
+        c2 = ResponseCache(path)
+        assert c2.get("k") == "v"
+        c2.close()
+
+    def test_get_first_counts_one_lookup(self, cache):
+        cache.put("gemini-key", "de gemini", "gemini")
+        assert cache.get_first(["local-key", "gemini-key", "claude-key"]) == ("gemini-key", "de gemini")
+        assert cache.get_first(["local-key", "claude-key"]) == (None, None)
+        s = cache.stats()
+        assert (s["hits"], s["misses"]) == (1, 1)
@@ -57,7 +57,7 @@ class TestAIClients:
 
     def test_pensar_con_local_returns_string(self):
         from compartido import pensar_con_local
-        with patch('compartido.requests.post') as mock_post:
+        with patch('compartido.transport.post') as mock_post:
             mock_resp = MagicMock()
             mock_resp.status_code = 200
             mock_resp.json.return_value = {"response": "local response"}
@@ -67,10 +67,102 @@ class TestAIClients:
 
     def test_pensar_con_local_empty_on_failure(self):
         from compartido import pensar_con_local
-        with patch('compartido.requests.post', side_effect=Exception("connection refused")):
+        with patch('compartido.transport.post', side_effect=Exception("connection refused")):
             result = pensar_con_local("test")
             assert result == ""
 
+    def test_pensar_con_local_uses_ollama_timeout(self):
+        from compartido import pensar_con_local, CONFIG
+        with patch('compartido.transport.post') as mock_post:
+            mock_post.return_value = MagicMock(status_code=200, json=MagicMock(return_value={"response": "ok"}))
+            pensar_con_local("test")
+            assert mock_post.call_args.kwargs['timeout'] == CONFIG['ollama_timeout']
+
+
+class TestPrefixReuse:
+    def test_local_sends_system_as_separate_chat_message(self):
+        from compartido import pensar_con_local, CONFIG
+        with patch('compartido.transport.post') as mock_post:
+            mock_post.return_value = MagicMock(status_code=200, json=MagicMock(
+                return_value={"message": {"role": "assistant", "content": "hola"}}))
+            assert pensar_con_local("pregunta", sistema="SOP largo") == "hola"
+            url = mock_post.call_args.args[0]
+            payload = mock_post.call_args.kwargs['json']
+        assert url.endswith("/api/chat")
+        assert payload['messages'] == [{"role": "system", "content": "SOP largo"},
+                                       {"role": "user", "content": "pregunta"}]
+        assert payload['keep_alive'] == CONFIG['ollama_keep_alive']
+
+    def test_claude_marks_long_system_prompt_cacheable(self, mock_claude):
+        from compartido import pensar_con_claude
+        mock_claude.messages.create.reset_mock()
+        pensar_con_claude("p", sistema="x" * 5000)
+        system = mock_claude.messages.create.call_args.kwargs['system']
+        assert system[0]['cache_control'] == {"type": "ephemeral"}
+        pensar_con_claude("p", sistema="corto")
+        assert mock_claude.messages.create.call_args.kwargs['system'] == "corto"
+
+    def test_claude_cache_read_counted_as_cached_input(self):
+        from compartido import _uso_claude
+        uso = {}
+        _uso_claude(uso, MagicMock(input_tokens=50, cache_read_input_tokens=3000,
+                                   cache_creation_input_tokens=0, output_tokens=10))
+        assert uso['input_tokens'] == 3050
+        assert uso['cached_tokens'] == 3000
+
+    def test_ollama_prefix_hit_estimated_from_prompt_eval_count(self):
+        from compartido import _uso_ollama
+        uso = {"_prompt_chars": 400, "_system_chars": 40000}   # ~10100 tokens
+        _uso_ollama(uso, {"prompt_eval_count": 100, "eval_count": 5,
+                          "prompt_eval_duration": 250_000_000})
+        assert uso['cached_tokens'] == 10000
+        assert uso['input_tokens'] == 10100
+        assert uso['prompt_eval_ms'] == 250
+        frio = {"_prompt_chars": 400, "_system_chars": 40000}
+        _uso_ollama(frio, {"prompt_eval_count": 9800, "eval_count": 5})
+        assert frio['cached_tokens'] == 0
+
+
+class TestPensar:
+    def test_local_first_then_cloud(self):
+        import compartido
+        with patch('compartido.pensar_con_local', return_value="") as local, \
+             patch('compartido.pensar_con_claude', return_value="de claude") as claude, \
+             patch('compartido.pensar_con_gemini', return_value="de gemini") as gemini:
+            assert compartido.pensar("p", sistema="s", fallback="claude") == "de claude"
+            assert local.called
+            assert not gemini.called
+
+    def test_empty_when_all_fail(self):
+        import compartido
+        with patch('compartido.pensar_con_local', return_value=""), \
+             patch('compartido.pensar_con_claude', return_value=""), \
+             patch('compartido.pensar_con_gemini', return_value=""):
+            assert compartido.pensar("p") == ""
+
+    def test_cache_hit_skips_backends(self, monkeypatch):
+        import compartido
+        from llm.cache import ResponseCache
+        monkeypatch.setattr(compartido, 'response_cache', ResponseCache(":memory:"))
+        with patch('compartido.pensar_con_local', return_value="respuesta") as local:
+            assert compartido.pensar("mismo prompt", sistema="s", agente="QA", cache=True) == "respuesta"
+            assert compartido.pensar("mismo prompt", sistema="s", agente="QA", cache=True) == "respuesta"
+            assert local.call_count == 1
+        assert compartido.response_cache.stats()["hits"] == 1
+        assert compartido.response_cache.stats()["misses"] == 1   # una por llamada, no por backend
+
+    def test_cache_bypass(self, monkeypatch):
+        import compartido
+        from llm.cache import ResponseCache
+        monkeypatch.setattr(compartido, 'response_cache', ResponseCache(":memory:"))
+        monkeypatch.setitem(compartido.CONFIG, 'llm_cache', True)
+        with patch('compartido.pensar_con_local', return_value="respuesta") as local:
+            compartido.pensar("p", cache=False)
+            compartido.pensar("p", cache=False)
+            assert local.call_count == 2
+        assert compartido.response_cache.stats()["bypass"] == 2
+        assert compartido.response_cache.stats()["entries"] == 0
+
 
 class TestUtilities:
     def test_log_prints_formatted(self, capsys):
@@ -80,6 +172,15 @@ class TestUtilities:
         assert "[TEST]" in captured.out
         assert "hello world" in captured.out
 
+    def test_enviar_telegram_uses_shared_transport(self, monkeypatch):
+        from compartido import enviar_telegram
+        monkeypatch.setenv("TELEGRAM_OPENCLAW_BOT_TOKEN", "tok")
+        monkeypatch.setenv("TELEGRAM_OPENCLAW_CHAT_ID", "42")
+        with patch('compartido.transport.post') as mock_post:
+            enviar_telegram("hola")
+            assert mock_post.called
+            assert mock_post.call_args.kwargs['json']['chat_id'] == "42"
+
     def test_hablar_no_crash_when_disabled(self):
         from compartido import hablar
         hablar("test")  # Should not raise
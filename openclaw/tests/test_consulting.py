@@ -2,7 +2,8 @@
 import json
 import pytest
 from unittest.mock import patch, MagicMock
-from db.connection import set_connection, reset_connection
+from db import queries
+from tests.conftest import idea_row
 
 
 class TestBuildPrompt:
@@ -78,115 +79,103 @@ class TestGetSkillPaths:
 
 
 class TestConsultingCiclo:
-    def test_processes_queued_consulting(self, db_with_ideas):
+    def test_processes_queued_consulting(self, agent_db):
         from agents.consulting import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.consulting.pensar_con_gemini', return_value="## Plan Completo\n1. Fase 1"), \
-                 patch('agents.consulting.load_skills', return_value=["# Skill content"]):
-                result = ciclo()
-            assert result == 1
-            row = db_with_ideas.execute(
-                "SELECT execution_status FROM ideas WHERE id=6"
-            ).fetchone()
-            assert row['execution_status'] == 'reviewing'
-        finally:
-            reset_connection()
-
-    def test_saves_output(self, db_with_ideas):
+        with patch('agents.consulting.pensar_streaming', return_value="## Plan Completo\n1. Fase 1"), \
+             patch('agents.consulting.load_skills', return_value=["# Skill content"]):
+            assert ciclo() == 1
+        row = idea_row(agent_db, 6)
+        assert row['execution_status'] == 'reviewing'
+        assert row['claimed_by'] is None
+
+    def test_saves_output(self, agent_db):
         from agents.consulting import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.consulting.pensar_con_gemini', return_value="Output document"), \
-                 patch('agents.consulting.load_skills', return_value=["# Skill"]):
-                ciclo()
-            row = db_with_ideas.execute(
-                "SELECT execution_output FROM ideas WHERE id=6"
-            ).fetchone()
-            assert "Output document" in row['execution_output']
-            assert "Agente:" in row['execution_output']
-        finally:
-            reset_connection()
-
-    def test_fallback_to_local_on_gemini_fail(self, db_with_ideas):
+        with patch('agents.consulting.pensar_streaming', return_value="Output document"), \
+             patch('agents.consulting.load_skills', return_value=["# Skill"]):
+            ciclo()
+        output = idea_row(agent_db, 6)['execution_output']
+        assert "Output document" in output
+        assert "Agente:" in output
+
+    def test_streams_with_skills_as_system_prompt(self, agent_db):
         from agents.consulting import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.consulting.pensar_con_gemini', return_value=""), \
-                 patch('agents.consulting.pensar_con_local', return_value="Local output"), \
-                 patch('agents.consulting.load_skills', return_value=["# Skill"]):
-                result = ciclo()
-            assert result == 1
-            row = db_with_ideas.execute(
-                "SELECT execution_status FROM ideas WHERE id=6"
-            ).fetchone()
-            assert row['execution_status'] == 'reviewing'
-        finally:
-            reset_connection()
-
-    def test_fails_on_no_skills(self, db_with_ideas):
+        with patch('agents.consulting.pensar_streaming', return_value="Output") as pensar, \
+             patch('agents.consulting.load_skills', return_value=["# Skill OPEX"]):
+            ciclo()
+        kwargs = pensar.call_args.kwargs
+        assert "# Skill OPEX" in kwargs['sistema']
+        assert kwargs['fallback'] == 'gemini'
+        assert kwargs['agente'] == 'CONSULTING' and kwargs['idea_id'] == 6
+
+    def test_progress_is_persisted_while_in_progress(self, agent_db):
         from agents.consulting import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.consulting.load_skills', return_value=[]):
-                result = ciclo()
-            assert result == 0
-        finally:
-            reset_connection()
-
-    def test_fails_when_no_ai_response(self, db_with_ideas):
+        vistos = []
+
+        def fake(prompt, on_progress=None, **kw):
+            on_progress("## Borrador parcial")
+            vistos.append(idea_row(agent_db, 6))
+            return "## Documento final"
+
+        with patch('agents.consulting.pensar_streaming', side_effect=fake), \
+             patch('agents.consulting.load_skills', return_value=["# Skill"]):
+            ciclo()
+        assert vistos[0]['execution_status'] == 'in_progress'
+        assert vistos[0]['execution_output'].endswith("## Borrador parcial")
+        assert vistos[0]['claimed_by'].startswith('CONSULTING@')
+        assert "## Documento final" in idea_row(agent_db, 6)['execution_output']
+
+    def test_releases_claim_on_exception(self, agent_db):
         from agents.consulting import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.consulting.pensar_con_gemini', return_value=""), \
-                 patch('agents.consulting.pensar_con_local', return_value=""), \
-                 patch('agents.consulting.load_skills', return_value=["# Skill"]):
-                result = ciclo()
-            assert result == 0
-            row = db_with_ideas.execute(
-                "SELECT execution_status FROM ideas WHERE id=6"
-            ).fetchone()
-            assert row['execution_status'] == 'failed'
-        finally:
-            reset_connection()
-
-    def test_returns_zero_when_no_tasks(self, test_db):
+        with patch('agents.consulting.pensar_streaming', side_effect=RuntimeError("boom")), \
+             patch('agents.consulting.load_skills', return_value=["# Skill"]):
+            with pytest.raises(RuntimeError):
+                ciclo()
+        assert idea_row(agent_db, 6)['claimed_by'] is None
+
+    def test_fails_on_no_skills(self, agent_db):
         from agents.consulting import ciclo
-        set_connection(test_db)
-        try:
+        with patch('agents.consulting.load_skills', return_value=[]), \
+             patch('agents.consulting.pensar_streaming') as pensar:
             assert ciclo() == 0
-        finally:
-            reset_connection()
+        pensar.assert_not_called()
+        assert idea_row(agent_db, 6)['execution_status'] == 'failed'
 
-    def test_includes_reviewer_feedback_on_retry(self, db_with_ideas):
+    def test_fails_when_no_ai_response(self, agent_db):
         from agents.consulting import ciclo
-        # Simulate rejected idea coming back
-        db_with_ideas.execute(
-            "UPDATE ideas SET execution_error = 'Falta especificidad' WHERE id = 6"
-        )
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.consulting.pensar_con_gemini', return_value="Improved doc") as mock_gemini, \
-                 patch('agents.consulting.load_skills', return_value=["# Skill"]):
-                ciclo()
-            # The prompt should include the feedback
-            call_args = mock_gemini.call_args[0][0]
-            assert 'FEEDBACK DEL REVISOR' in call_args
-            assert 'Falta especificidad' in call_args
-        finally:
-            reset_connection()
-
-    def test_saves_context_item(self, db_with_ideas):
+        with patch('agents.consulting.pensar_streaming', return_value=""), \
+             patch('agents.consulting.load_skills', return_value=["# Skill"]):
+            assert ciclo() == 0
+        row = idea_row(agent_db, 6)
+        assert row['execution_status'] == 'failed'
+        assert row['claimed_by'] is None
+
+    def test_returns_zero_when_no_tasks(self, agent_db):
         from agents.consulting import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.consulting.pensar_con_gemini', return_value="Document output"), \
-                 patch('agents.consulting.load_skills', return_value=["# Skill"]):
-                ciclo()
-            row = db_with_ideas.execute(
-                "SELECT * FROM context_items WHERE key = 'output-finance-6'"
-            ).fetchone()
-            assert row is not None
-            assert 'Document output' in row['content']
-        finally:
-            reset_connection()
+        agent_db.execute("DELETE FROM ideas")
+        with patch('agents.consulting.pensar_streaming') as pensar:
+            assert ciclo() == 0
+        pensar.assert_not_called()
+
+    def test_includes_reviewer_feedback_on_retry(self, agent_db):
+        from agents.consulting import ciclo
+        # Rechazo previo del Reviewer registrado como evento
+        queries.update_execution_status(agent_db, 6, 'queued_consulting',
+                                        error="REVIEWER RECHAZADO: Falta especificidad",
+                                        agent_name='REVIEWER', outcome='rejected')
+        with patch('agents.consulting.pensar_streaming', return_value="Improved doc") as pensar, \
+             patch('agents.consulting.load_skills', return_value=["# Skill"]):
+            assert ciclo() == 1
+        prompt = pensar.call_args.args[0]
+        assert 'FEEDBACK DEL REVISOR' in prompt
+        assert 'Falta especificidad' in prompt
+
+    def test_saves_context_item(self, agent_db):
+        from agents.consulting import ciclo
+        with patch('agents.consulting.pensar_streaming', return_value="Document output"), \
+             patch('agents.consulting.load_skills', return_value=["# Skill"]):
+            ciclo()
+        row = agent_db.execute(
+            "SELECT * FROM context_items WHERE key = 'output-finance-6'"
+        ).fetchone()
+        assert row is not None
+        assert 'Document output' in row['content']
@@ -1,5 +1,7 @@
 """Tests for db/connection.py and db/queries.py"""
 import sqlite3
+import threading
+import time
 import pytest
 from db import queries
 from db.connection import reset_connection, set_connection
@@ -19,6 +21,81 @@ class TestConnection:
         assert row['role'] == 'admin'
 
 
+class TestConnectionProfile:
+    @pytest.fixture
+    def db_file(self, tmp_path, monkeypatch):
+        from db import connection
+        path = tmp_path / "perfil.db"
+        sqlite3.connect(path).close()
+        monkeypatch.setenv("DB_PATH", str(path))
+        monkeypatch.setattr(connection, "PROFILE", dict(connection.PROFILE))
+        reset_connection()
+        yield str(path)
+        connection.close_all()
+        reset_connection()
+
+    def test_profile_pragmas_applied(self, db_file):
+        from db import connection
+        connection.configure(cache_kb=4096, mmap_mb=8, temp_store="memory", cached_statements=32)
+        conn = connection.get_connection()
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -4096
+        assert conn.execute("PRAGMA mmap_size").fetchone()[0] == 8 * 1024 * 1024
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2
+        with pytest.raises(ValueError):
+            connection.configure(temp_store="ssd")
+        with pytest.raises(ValueError):
+            connection.configure(page_size=8192)
+
+    def test_read_connection_is_query_only(self, db_file):
+        from db import connection
+        rw = connection.get_connection()
+        rw.execute("CREATE TABLE t (a)")
+        rw.commit()
+        ro = connection.get_read_connection()
+        assert ro is not rw and ro.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            ro.execute("INSERT INTO t VALUES (1)")
+
+    def test_close_all_closes_other_threads_connections(self, db_file):
+        from db import connection
+        abiertas = []
+        listo, fin = threading.Event(), threading.Event()
+
+        def hilo():
+            abiertas.append(connection.get_connection())   # nunca llama close_connection()
+            listo.set()
+            fin.wait(2)
+        t = threading.Thread(target=hilo, name="AGENTE")
+        t.start()
+        listo.wait(2)
+        principal = connection.get_connection()
+        assert {c['thread'] for c in connection.connection_stats()} == {"AGENTE", "MainThread"}
+        assert connection.close_all() == 2
+        fin.set()
+        t.join()
+        with pytest.raises(sqlite3.ProgrammingError):
+            abiertas[0].execute("SELECT 1")
+        assert connection.connection_stats() == []
+        assert connection.get_connection() is not principal      # reconecta sola
+
+    def test_counts_statements_and_busy_waits(self, db_file):
+        from db import connection
+        a = connection._create_connection(db_file)
+        b = connection._create_connection(db_file)
+        a.execute("BEGIN IMMEDIATE")
+        soltar = threading.Timer(0.05, a.commit)
+        soltar.start()
+        b.execute("BEGIN IMMEDIATE")     # espera el lock de escritura de `a`
+        b.commit()
+        soltar.join()
+        stats = {s['statements']: s for s in connection.connection_stats()}
+        espera = [s for s in connection.connection_stats() if s['busy_waits']]
+        assert len(espera) == 1 and espera[0]['busy_wait_s'] >= 0.04
+        assert all(s['statements'] >= 5 for s in stats.values())   # PRAGMAs + BEGIN
+        a.close()
+        b.close()
+
+
 class TestQueries:
     def test_get_routable_ideas_returns_organized_null_status(self, db_with_ideas):
         ideas = queries.get_routable_ideas(db_with_ideas)
@@ -55,6 +132,15 @@ class TestQueries:
         row = db_with_ideas.execute("SELECT code_stage FROM ideas WHERE id=6").fetchone()
         assert row['code_stage'] == 'distilled'
 
+    def test_update_execution_progress_only_in_progress(self, db_with_ideas):
+        queries.update_execution_status(db_with_ideas, 4, 'in_progress', agent_name='DEV')
+        queries.update_execution_progress(db_with_ideas, 4, 'parcial...')
+        row = db_with_ideas.execute("SELECT execution_output FROM ideas WHERE id=4").fetchone()
+        assert row['execution_output'] == 'parcial...'
+        queries.update_execution_progress(db_with_ideas, 8, 'parcial...')
+        row = db_with_ideas.execute("SELECT execution_output FROM ideas WHERE id=8").fetchone()
+        assert row['execution_output'] == 'Output final'
+
     def test_count_previous_failures_zero(self, db_with_ideas):
         assert queries.count_previous_failures(db_with_ideas, 1) == 0
 
@@ -95,3 +181,310 @@ class TestQueries:
         stats = queries.get_pipeline_stats(db_with_ideas)
         assert stats['completed'] == 1  # idea 8
         assert stats['queued'] >= 1
+
+
+class TestClaimNext:
+    def test_claims_highest_priority_and_stamps_lease(self, db_with_ideas):
+        db_with_ideas.execute(
+            "INSERT INTO ideas (id, text, execution_status, priority) VALUES (20, 'urgente', 'queued_software', 'alta')"
+        )
+        row = queries.claim_next(db_with_ideas, 'queued_software', 'DEV@a:1', 60)
+        assert row['id'] == 20
+        stamp = db_with_ideas.execute(
+            "SELECT claimed_by, lease_expires_at > datetime('now') AS vigente FROM ideas WHERE id = 20"
+        ).fetchone()
+        assert stamp['claimed_by'] == 'DEV@a:1' and stamp['vigente'] == 1
+
+    def test_claimed_idea_is_skipped_until_released(self, db_with_ideas):
+        assert queries.claim_next(db_with_ideas, 'queued_software', 'w1')['id'] == 4
+        assert queries.claim_next(db_with_ideas, 'queued_software', 'w2') is None
+        queries.release_claim(db_with_ideas, 4, 'w2')     # no es suyo: no hace nada
+        assert queries.claim_next(db_with_ideas, 'queued_software', 'w2') is None
+        queries.release_claim(db_with_ideas, 4, 'w1')
+        assert queries.claim_next(db_with_ideas, 'queued_software', 'w2')['id'] == 4
+
+    def test_expired_lease_can_be_taken_and_old_owner_loses_it(self, db_with_ideas):
+        queries.claim_next(db_with_ideas, 'queued_software', 'w1', 60)
+        db_with_ideas.execute("UPDATE ideas SET lease_expires_at = datetime('now', '-1 seconds') WHERE id = 4")
+        assert queries.claim_next(db_with_ideas, 'queued_software', 'w2', 60)['id'] == 4
+        assert queries.renew_lease(db_with_ideas, 4, 'w1') is False
+        assert queries.renew_lease(db_with_ideas, 4, 'w2') is True
+
+    def test_adds_columns_to_old_schema(self, db_with_ideas):
+        cols = {r[1] for r in db_with_ideas.execute("PRAGMA table_info(ideas)")}
+        assert 'claimed_by' not in cols
+        queries.claim_next(db_with_ideas, 'developed', 'BUILDER@a:1')
+        queries.ensure_execution_schema(db_with_ideas)    # idempotente
+        cols = {r[1] for r in db_with_ideas.execute("PRAGMA table_info(ideas)")}
+        assert {'claimed_by', 'lease_expires_at'} <= cols
+
+    def test_concurrent_claimers_never_share_an_idea(self, tmp_path):
+        from tests.conftest import SCHEMA_SQL
+        from db.connection import _create_connection
+
+        path = str(tmp_path / "claims.db")
+        setup = _create_connection(path)
+        setup.executescript(SCHEMA_SQL)
+        setup.executemany(
+            "INSERT INTO ideas (text, execution_status, priority) VALUES (?, 'queued_software', ?)",
+            [(f"idea {i}", ("alta", "media", "baja")[i % 3]) for i in range(300)],
+        )
+        setup.commit()
+        queries.ensure_execution_schema(setup)
+        setup.close()
+
+        procesadas = {}
+        errores = []
+        barrera = threading.Barrier(8)
+
+        def _worker(n):
+            db = _create_connection(path)
+            worker = f"DEV@test:{n}"
+            mias = procesadas[worker] = []
+            try:
+                barrera.wait()
+                while True:
+                    task = queries.claim_next(db, 'queued_software', worker, 60)
+                    if task is None:
+                        break
+                    mias.append(task['id'])
+                    time.sleep(0.001)      # "trabajo": deja que los demas reclamen en paralelo
+                    queries.update_execution_status(db, task['id'], 'developed', agent_name=worker)
+                    queries.release_claim(db, task['id'], worker)
+            except Exception as e:
+                errores.append(e)
+            finally:
+                db.close()
+
+        hilos = [threading.Thread(target=_worker, args=(n,)) for n in range(8)]
+        for t in hilos:
+            t.start()
+        for t in hilos:
+            t.join()
+
+        assert errores == []
+        todas = [i for ids in procesadas.values() for i in ids]
+        assert len(todas) == len(set(todas)) == 300
+        assert sum(1 for ids in procesadas.values() if ids) > 1   # de verdad hubo reparto
+
+
+class TestProjectedFetches:
+    def test_claim_returns_only_stage_columns(self, db_with_ideas):
+        dev = queries.claim_next(db_with_ideas, 'queued_software', 'DEV@a:1')
+        assert dev.keys() == ['id', 'text', 'rejection_count']
+        builder = queries.claim_next(db_with_ideas, 'developed', 'BUILDER@a:1')
+        assert 'execution_output' not in builder.keys()       # lo carga por id
+        assert 'main.py' in queries.get_execution_output(db_with_ideas, builder['id'])[0]
+
+    def test_claim_with_explicit_columns(self, db_with_ideas):
+        row = queries.claim_next(db_with_ideas, 'queued_consulting', 'w', columns=('id', 'priority'))
+        assert tuple(row) == (6, 'alta')
+        with pytest.raises(ValueError):
+            queries.claim_next(db_with_ideas, 'queued_consulting', 'w', columns=('id', 'x; DROP TABLE ideas'))
+
+    def test_iter_is_lazy_and_projected(self, db_with_ideas):
+        db_with_ideas.execute(
+            "INSERT INTO ideas (id, text, execution_status, priority) VALUES (21, 'segunda', 'reviewing', 'baja')"
+        )
+        db_with_ideas.commit()
+        filas = queries.iter_ideas_in_status(db_with_ideas, 'reviewing')
+        primera = next(filas)
+        assert primera.keys() == ['id', 'text'] and primera['id'] == 7
+        # El llamador mueve la idea mientras recorre: se sigue con la siguiente
+        queries.update_execution_status(db_with_ideas, 7, 'completed')
+        assert [r['id'] for r in filas] == [21]
+
+    def test_iter_does_not_pin_a_read_snapshot(self, tmp_path):
+        from tests.conftest import SCHEMA_SQL
+        from db.connection import _create_connection
+
+        path = str(tmp_path / "iter.db")
+        lector, escritor = _create_connection(path), _create_connection(path)
+        try:
+            lector.executescript(SCHEMA_SQL)
+            lector.executemany(
+                "INSERT INTO ideas (id, text, execution_status) VALUES (?, 'x', 'reviewing')",
+                [(i,) for i in (1, 2, 3)],
+            )
+            lector.commit()
+            filas = queries.iter_ideas_in_status(lector, 'reviewing')
+            assert next(filas)['id'] == 1
+            # Otra conexion (p.ej. la cola de escritura) mueve una idea pendiente
+            queries.update_execution_status(escritor, 2, 'completed')
+            assert escritor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0] == 0
+            assert [r['id'] for r in filas] == [3]
+        finally:
+            lector.close()
+            escritor.close()
+
+    def test_get_execution_output_truncates_in_sql(self, db_with_ideas):
+        db_with_ideas.execute("UPDATE ideas SET execution_output = ? WHERE id = 7", ["ab" * 5000])
+        assert queries.get_execution_output(db_with_ideas, 7, max_chars=3) == ("aba", 10000)
+        texto, total = queries.get_execution_output(db_with_ideas, 7)
+        assert len(texto) == total == 10000
+        assert queries.get_execution_output(db_with_ideas, 4) == ('', 0)
+        assert queries.get_execution_output(db_with_ideas, 999) == ('', 0)
+
+
+class TestMigrations:
+    def _sembrar(self, db, n=2000):
+        estados = [None, '', 'queued_software', 'queued_consulting', 'in_progress', 'developed',
+                   'built', 'reviewing', 'completed', 'failed', 'blocked']
+        db.executemany(
+            "INSERT INTO ideas (text, execution_status, code_stage, priority, created_at, executed_at) "
+            "VALUES ('x', ?, ?, ?, datetime('now', ?), datetime('now', ?))",
+            [(estados[i % len(estados)], ('organized', 'distilled', 'expressed')[i % 3],
+              ('alta', 'media', 'baja', None)[i % 4], f"-{i} seconds", f"-{i} seconds")
+             for i in range(n)],
+        )
+        db.commit()
+
+    def test_migrate_is_idempotent(self, test_db):
+        from db import migrations
+        assert set(migrations.migrate(test_db)) == set(migrations.INDEXES)
+        assert migrations.migrate(test_db) == []
+
+    def test_queue_queries_use_indexes_without_sorting(self, test_db):
+        from db import migrations
+        self._sembrar(test_db)
+        migrations.migrate(test_db)
+        for query, detail in migrations.query_plans(test_db).items():
+            plan = " | ".join(detail)
+            assert "USING" in plan and "INDEX" in plan, (query, plan)
+            assert "TEMP B-TREE" not in plan, (query, plan)
+
+    def test_indexed_order_matches_priority_order(self, test_db):
+        from db import migrations
+        self._sembrar(test_db, 300)
+        antes = [r['id'] for r in queries.get_ideas_in_status(test_db, 'queued_software')]
+        migrations.migrate(test_db)
+        despues = [r['id'] for r in queries.get_ideas_in_status(test_db, 'queued_software')]
+        assert antes == despues and antes
+
+    def test_pipeline_stats_match_full_aggregate(self, test_db):
+        self._sembrar(test_db, 500)
+        esperado = test_db.execute("""
+            SELECT
+                SUM(CASE WHEN execution_status IS NULL AND code_stage = 'organized' THEN 1 ELSE 0 END) as pending,
+                SUM(CASE WHEN execution_status LIKE 'queued_%' THEN 1 ELSE 0 END) as queued,
+                SUM(CASE WHEN execution_status = 'in_progress' THEN 1 ELSE 0 END) as in_progress,
+                SUM(CASE WHEN execution_status = 'developed' THEN 1 ELSE 0 END) as building,
+                SUM(CASE WHEN execution_status IN ('built', 'reviewing') THEN 1 ELSE 0 END) as in_review,
+                SUM(CASE WHEN execution_status = 'completed' THEN 1 ELSE 0 END) as completed,
+                SUM(CASE WHEN execution_status = 'failed' THEN 1 ELSE 0 END) as failed,
+                SUM(CASE WHEN execution_status = 'blocked' THEN 1 ELSE 0 END) as blocked
+            FROM ideas
+        """).fetchone()
+        assert queries.get_pipeline_stats(test_db) == dict(esperado)
+
+    def test_counters_follow_every_write(self, test_db):
+        from db import migrations
+        self._sembrar(test_db, 300)
+        migrations.migrate(test_db)
+        estados = [None, 'queued_software', 'developed', 'built', 'completed', 'failed', 'blocked']
+        for i in range(1, 301, 3):
+            test_db.execute("UPDATE ideas SET execution_status = ?, code_stage = ? WHERE id = ?",
+                            [estados[i % len(estados)], ('organized', 'distilled')[i % 2], i])
+        queries.update_execution_status(test_db, 2, 'completed')
+        test_db.execute("DELETE FROM ideas WHERE id % 7 = 0")
+        test_db.execute("INSERT INTO ideas (text, code_stage) VALUES ('nueva', 'organized')")
+        test_db.commit()
+        assert queries.get_pipeline_stats(test_db) == queries._count_pipeline_buckets(test_db)
+        assert queries.reconcile_pipeline_counters(test_db) == {}
+
+    def test_reconcile_reports_and_fixes_drift(self, test_db):
+        from db import migrations
+        self._sembrar(test_db, 100)
+        migrations.migrate(test_db)
+        real = queries.get_pipeline_stats(test_db)
+        test_db.execute("UPDATE pipeline_counters SET n = n + 5 WHERE bucket = 'failed'")
+        test_db.execute("DELETE FROM pipeline_counters WHERE bucket = 'queued'")
+        test_db.commit()
+        drift = queries.reconcile_pipeline_counters(test_db)
+        assert drift == {'failed': (real['failed'] + 5, real['failed']), 'queued': (0, real['queued'])}
+        assert queries.get_pipeline_stats(test_db) == real
+
+    def test_stats_read_counters_not_ideas(self, test_db):
+        from db import migrations
+        migrations.migrate(test_db)
+        plan = " | ".join(migrations._explain(test_db, queries.get_pipeline_stats, ()))
+        assert "pipeline_counters" in plan and "ideas" not in plan
+
+
+class TestBatchStatusUpdate:
+    def test_sets_status_agent_and_error_together(self, db_with_ideas):
+        n = queries.update_execution_status_batch(db_with_ideas, [
+            (1, 'queued_consulting', None, None, None),
+            (3, 'queued_consulting', 'compliance', None, None),
+            (5, 'completed', None, 'nota', None),
+        ], agent_name='PM')
+        assert n == 3
+        rows = {r['id']: r for r in db_with_ideas.execute(
+            "SELECT id, execution_status, suggested_agent, execution_error, executed_by, code_stage "
+            "FROM ideas WHERE id IN (1, 3, 5)")}
+        assert rows[1]['suggested_agent'] == 'staffing'          # se conserva
+        assert rows[3]['suggested_agent'] == 'compliance'
+        assert rows[5]['code_stage'] == 'expressed' and rows[5]['execution_error'] == 'nota'
+        assert {r['executed_by'] for r in rows.values()} == {'PM'}
+
+    def test_failure_rolls_back_whole_batch(self, db_with_ideas):
+        db_with_ideas.commit()
+        db_with_ideas.execute("""
+            CREATE TRIGGER no_blocked BEFORE UPDATE OF execution_status ON ideas
+            WHEN NEW.execution_status = 'blocked' BEGIN SELECT RAISE(ABORT, 'no'); END
+        """)
+        with pytest.raises(sqlite3.IntegrityError):
+            queries.update_execution_status_batch(db_with_ideas, [
+                (1, 'queued_consulting', None, None, None),
+                (2, 'blocked', None, None, None),
+            ])
+        row = db_with_ideas.execute("SELECT execution_status FROM ideas WHERE id = 1").fetchone()
+        assert row['execution_status'] is None
+
+    def test_empty_batch(self, db_with_ideas):
+        assert queries.update_execution_status_batch(db_with_ideas, []) == 0
+
+
+class TestExecutionHistory:
+    def test_status_change_appends_event_and_bumps_counter(self, db_with_ideas):
+        queries.update_execution_status(db_with_ideas, 4, 'in_progress', agent_name='DEV')
+        queries.update_execution_status(db_with_ideas, 4, 'failed', error='sin IA', agent_name='DEV', duration=1.25)
+        eventos = queries.get_execution_events(db_with_ideas, 4)
+        assert [(e['stage'], e['status'], e['outcome']) for e in eventos] == [
+            ('in_progress', 'failed', 'failed'), ('queued_software', 'in_progress', 'started')]
+        assert eventos[0]['message'] == 'sin IA' and eventos[0]['duration_ms'] == 1250
+        row = db_with_ideas.execute(
+            "SELECT failure_count, rejection_count, retry_count FROM ideas WHERE id = 4").fetchone()
+        assert tuple(row) == (1, 0, 0)
+
+    def test_feedback_uses_only_last_rejections(self, db_with_ideas):
+        for i in range(5):
+            queries.update_execution_status(db_with_ideas, 5, 'queued_software', error=f"QA RECHAZADO {i}",
+                                            agent_name='QA', outcome='rejected')
+            queries.update_execution_status(db_with_ideas, 5, 'failed', error="sin IA", agent_name='DEV')
+        feedback = queries.get_recent_feedback(db_with_ideas, 5, limit=3)
+        assert feedback == "QA RECHAZADO 2\n\n---\n\nQA RECHAZADO 3\n\n---\n\nQA RECHAZADO 4"
+        assert queries.count_previous_failures(db_with_ideas, 5) == 5
+        assert queries.count_execution_events(db_with_ideas, 5, 'rejected', agent='BUILDER') == 0
+
+    def test_feedback_falls_back_to_legacy_error(self, db_with_ideas):
+        db_with_ideas.execute("UPDATE ideas SET execution_error = 'QA RECHAZADO:\nfalta main' WHERE id = 4")
+        assert queries.get_recent_feedback(db_with_ideas, 4) == 'QA RECHAZADO:\nfalta main'
+        queries.update_execution_status(db_with_ideas, 4, 'in_progress', agent_name='DEV')
+        assert queries.get_recent_feedback(db_with_ideas, 4) == ''
+
+    def test_counters_backfilled_from_legacy_markers(self, db_with_ideas):
+        db_with_ideas.execute(
+            "UPDATE ideas SET execution_status = 'failed', "
+            "execution_error = 'QA RECHAZADO\n[RETRY] Re-encolada por PM\n[RETRY] Re-encolada por PM' WHERE id = 4")
+        queries.ensure_execution_schema(db_with_ideas)
+        row = db_with_ideas.execute("SELECT retry_count, rejection_count FROM ideas WHERE id = 4").fetchone()
+        assert tuple(row) == (2, 1)
+
+    def test_retry_eligibility_is_sql_predicate(self, db_with_ideas):
+        for idea_id in (4, 6):
+            queries.update_execution_status(db_with_ideas, idea_id, 'failed', error='x', agent_name='DEV')
+        queries.update_execution_status_batch(db_with_ideas, [(4, 'queued_software', None, 'x', 'retried')])
+        queries.update_execution_status(db_with_ideas, 4, 'failed', error='x', agent_name='DEV')
+        assert [r['id'] for r in queries.get_retryable_failed_ideas(db_with_ideas, max_retries=1)] == [6]
+        assert {r['id'] for r in queries.get_retryable_failed_ideas(db_with_ideas, max_retries=2)} == {4, 6}
@@ -0,0 +1,218 @@
+"""Tests for the database backends: the queries API on SQLite and PostgreSQL.
+
+The PostgreSQL runs need a local instance: PG_TEST_DSN=postgresql://... pytest
+(without it they are skipped).
+"""
+import sqlite3
+import threading
+
+import pytest
+from db import migrations, queries
+
+
+def _idea(db, text, status=None, priority='media', stage='organized'):
+    db.execute("INSERT INTO ideas (text, code_stage, execution_status, priority) VALUES (?, ?, ?, ?)",
+               [text, stage, status, priority])
+    db.commit()
+    return db.execute("SELECT MAX(id) FROM ideas").fetchone()[0]
+
+
+class TestTranslation:
+    @pytest.fixture(autouse=True)
+    def _postgres(self):
+        pytest.importorskip("psycopg")
+
+    def test_placeholders(self):
+        from db.postgres import translate
+        assert translate("SELECT * FROM t WHERE a = ? AND b = ?") == "SELECT * FROM t WHERE a = %s AND b = %s"
+        assert translate("UPDATE t SET a = :a WHERE id = :idea_id") == "UPDATE t SET a = %(a)s WHERE id = %(idea_id)s"
+
+    def test_leaves_literals_casts_and_comments(self):
+        from db.postgres import translate
+        sql = "SELECT '?', ':x', n::int FROM t -- que?\nWHERE s LIKE 'queued_%' AND a = ?"
+        assert translate(sql) == "SELECT '?', ':x', n::int FROM t -- que?\nWHERE s LIKE 'queued_%%' AND a = %s"
+        assert translate("SELECT 1 WHERE s LIKE 'q%'", False) == "SELECT 1 WHERE s LIKE 'q%'"
+
+    def test_sqlite_idioms(self):
+        from db.postgres import translate
+        assert "timezone('UTC', now())" in translate("UPDATE t SET at = datetime('now')")
+        assert "CAST(%s AS interval)" in translate("SELECT datetime('now', ?)")
+        assert "SERIAL PRIMARY KEY" in translate("CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT)", False)
+
+
+class TestBackends:
+    def test_dialect(self, backend_db):
+        assert queries.dialect(backend_db) in ("sqlite", "postgres")
+        row = backend_db.execute("SELECT username, role FROM users WHERE username = ?", ["david"]).fetchone()
+        assert row['role'] == 'admin' and row[0] == 'david' and dict(row) == {"username": "david", "role": "admin"}
+
+    def test_migrate_is_idempotent(self, backend_db):
+        assert "idx_ideas_queue" in migrations.migrate(backend_db)
+        assert migrations.migrate(backend_db) == []
+        assert set(migrations.query_plans(backend_db)) >= {"get_routable_ideas", "claim_next"}
+
+    def test_claim_in_priority_order_and_release(self, backend_db):
+        baja = _idea(backend_db, "baja", "queued_software", "baja")
+        alta = _idea(backend_db, "alta", "queued_software", "alta")
+        assert queries.claim_next(backend_db, "queued_software", "w1")["id"] == alta
+        assert queries.claim_next(backend_db, "queued_software", "w2")["id"] == baja
+        assert queries.claim_next(backend_db, "queued_software", "w3") is None
+        assert queries.renew_lease(backend_db, alta, "w1") is True
+        assert queries.renew_lease(backend_db, alta, "w2") is False
+        queries.release_claim(backend_db, alta, "w1")
+        assert queries.claim_next(backend_db, "queued_software", "w3")["id"] == alta
+
+    def test_status_changes_events_and_counters(self, backend_db):
+        migrations.migrate(backend_db)
+        idea = _idea(backend_db, "script", "queued_software")
+        queries.update_execution_status(backend_db, idea, "developed", output="x" * 50,
+                                        agent_name="DEV", duration=1.5)
+        queries.update_execution_status(backend_db, idea, "queued_software", error="RECHAZADO: faltan tests",
+                                        agent_name="BUILDER", outcome="rejected")
+        assert queries.count_previous_failures(backend_db, idea) == 1
+        assert queries.count_execution_events(backend_db, idea, "rejected", agent="BUILDER") == 1
+        assert queries.get_recent_feedback(backend_db, idea) == "RECHAZADO: faltan tests"
+        assert queries.get_execution_output(backend_db, idea, max_chars=10) == ("x" * 10, 50)
+        eventos = queries.get_execution_events(backend_db, idea)
+        assert [e['outcome'] for e in eventos] == ["rejected", "succeeded"]
+        assert eventos[1]['duration_ms'] == 1500
+
+    def test_batch_and_pipeline_counters(self, backend_db):
+        migrations.migrate(backend_db)
+        ids = [_idea(backend_db, f"idea {i}") for i in range(3)]
+        assert queries.get_pipeline_stats(backend_db)["pending"] == 3
+        queries.update_execution_status_batch(backend_db, [
+            (ids[0], "queued_consulting", "finance", None, None),
+            (ids[1], "queued_software", None, None, None),
+        ], agent_name="PM")
+        stats = queries.get_pipeline_stats(backend_db)
+        assert (stats["pending"], stats["queued"]) == (1, 2)
+        assert queries.reconcile_pipeline_counters(backend_db) == {}
+        row = backend_db.execute("SELECT suggested_agent FROM ideas WHERE id = ?", [ids[0]]).fetchone()
+        assert row[0] == "finance"
+
+    def test_lazy_schema_on_first_use(self, backend_db):
+        idea = _idea(backend_db, "sin migrar", "failed")
+        assert queries.count_previous_failures(backend_db, idea) == 0
+        assert [r['id'] for r in queries.get_retryable_failed_ideas(backend_db)] == [idea]
+
+    def test_context_and_llm_usage(self, backend_db):
+        queries.save_context_item(backend_db, "kpi", "margen 12%")
+        queries.save_context_item(backend_db, "kpi", "margen 15%")
+        assert "- kpi: margen 15%" in queries.get_context_string(backend_db)
+        queries.record_llm_usage(backend_db, {"agent": "DEV", "backend": "local", "outcome": "ok", "wall_ms": 100,
+                                              "prompt_tokens": 10, "system_tokens": 5, "output_tokens": 20})
+        assert queries.get_llm_usage_stats(backend_db)["local"]["tokens_per_s"] == 200.0
+
+
+class TestPostgres:
+    def test_claim_skips_rows_locked_by_another_worker(self, pg_pool):
+        a, b = pg_pool.acquire(), pg_pool.acquire()
+        try:
+            primera = _idea(a, "primera", "queued_software", "alta")
+            segunda = _idea(a, "segunda", "queued_software")
+            queries.ensure_execution_schema(a)
+            a.execute("UPDATE ideas SET text = text WHERE id = ?", [primera])   # `a` sigue en su transaccion
+            assert queries.claim_next(b, "queued_software", "w2")["id"] == segunda
+            a.rollback()
+            assert queries.claim_next(a, "queued_software", "w1")["id"] == primera
+        finally:
+            a.close()
+            b.close()
+
+    def test_concurrent_claims_never_share_an_idea(self, pg_pool):
+        db = pg_pool.acquire()
+        for i in range(20):
+            _idea(db, f"idea {i}", "queued_software")
+        queries.ensure_execution_schema(db)
+        db.close()
+        tomadas, errores = [], []
+
+        def worker(nombre):
+            conn = pg_pool.acquire()
+            try:
+                while (row := queries.claim_next(conn, "queued_software", nombre)) is not None:
+                    tomadas.append(row["id"])
+            except Exception as e:   # pragma: no cover - se reporta abajo
+                errores.append(e)
+            finally:
+                conn.close()
+        hilos = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(4)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        assert not errores
+        assert sorted(tomadas) == sorted(set(tomadas)) and len(tomadas) == 20
+
+    def test_pool_is_bounded_and_reuses_connections(self, pg_pool):
+        conns = [pg_pool.acquire() for _ in range(pg_pool.max_size)]
+        with pytest.raises(sqlite3.OperationalError, match="pool exhausted"):
+            pg_pool.acquire()
+        raw = conns[-1]._raw
+        for c in conns:
+            c.close()
+        assert pg_pool.size() == (pg_pool.max_size, 0)
+        assert pg_pool.acquire()._raw is raw           # LIFO: la ultima devuelta
+
+    def test_statements_are_prepared_server_side(self, pg_pool):
+        db = pg_pool.acquire()
+        try:
+            for _ in range(3):
+                queries.get_ideas_in_status(db, "queued_software")
+            preparadas = db.execute("SELECT COUNT(*) FROM pg_prepared_statements").fetchone()[0]
+            assert preparadas >= 1
+        finally:
+            db.close()
+
+    def test_errors_map_to_sqlite3_and_keep_connection_usable(self, pg_pool):
+        db = pg_pool.acquire()
+        try:
+            with pytest.raises(sqlite3.OperationalError, match="no such table: nada"):
+                db.execute("SELECT * FROM nada WHERE id = ?", [1])
+            with pytest.raises(sqlite3.OperationalError, match="no such column"):
+                db.execute("SELECT nada FROM ideas WHERE id = ?", [1])
+            assert db.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 3
+        finally:
+            db.close()
+
+    def test_read_only_checkout(self, pg_pool):
+        ro = pg_pool.acquire(read_only=True)
+        with pytest.raises(sqlite3.OperationalError, match="read-only"):
+            ro.execute("INSERT INTO users (username) VALUES (?)", ["x"])
+        ro.close()
+        rw = pg_pool.acquire()
+        rw.execute("INSERT INTO users (username) VALUES (?)", ["x"])    # el RESET ALL limpio la sesion
+        rw.commit()
+        rw.close()
+
+    def test_get_connection_checks_out_from_the_pool(self, pg_pool, monkeypatch):
+        from db import connection
+        monkeypatch.setattr(connection, "PROFILE", dict(connection.PROFILE))
+        monkeypatch.setenv("PG_DSN", pg_pool.conninfo)
+        connection.reset_connection()
+        connection.configure(backend="postgres", pool_max=2)
+        try:
+            db = connection.get_connection()
+            assert db is connection.get_connection() and queries.dialect(db) == "postgres"
+            assert connection.get_read_connection().role == "ro"
+            assert [s['role'] for s in connection.connection_stats()] == ["rw", "ro"]
+            connection.close_connection()
+            assert connection._pg_pool.size() == (2, 0)
+            connection.get_connection()
+            assert connection.close_all() == 1 and connection._pg_pool is None
+        finally:
+            connection.reset_connection()
+
+    def test_reads_do_not_leave_a_transaction_open(self, pg_pool):
+        db = pg_pool.acquire()
+        try:
+            queries.get_routable_ideas(db)
+            assert not db.in_transaction
+            _idea(db, "nueva")
+            db.execute("UPDATE ideas SET priority = ? WHERE text = ?", ["alta", "nueva"])
+            assert db.in_transaction
+            db.rollback()
+            assert db.execute("SELECT priority FROM ideas WHERE text = ?", ["nueva"]).fetchone()[0] == "media"
+        finally:
+            db.close()
@@ -1,7 +1,8 @@
 """Tests for agents/dev.py — DEV Code Generation Agent"""
 import pytest
 from unittest.mock import patch, MagicMock
-from db.connection import set_connection, reset_connection
+from db import queries
+from tests.conftest import idea_row
 
 
 class TestExtraerCodigo:
@@ -39,92 +40,165 @@ class TestExtraerCodigo:
 
 
 class TestProgramarConIA:
-    def test_gemini_success(self):
+    def test_pensar_success(self):
         from agents.dev import _programar_con_ia
-        with patch('agents.dev.pensar_con_gemini', return_value="code here"):
+        with patch('agents.dev.pensar_streaming', return_value="code here"):
             result, offline = _programar_con_ia("build X")
             assert result == "code here"
             assert offline is False
 
-    def test_gemini_fails_uses_local(self):
+    def test_uses_gemini_as_cloud_fallback(self):
         from agents.dev import _programar_con_ia
-        with patch('agents.dev.pensar_con_gemini', return_value=""), \
-             patch('agents.dev.pensar_con_local', return_value="local code"), \
-             patch('agents.dev.time') as mock_time:
-            result, offline = _programar_con_ia("build X")
-            assert result == "local code"
-            assert offline is True
+        with patch('agents.dev.pensar_streaming', return_value="code here") as mock_pensar:
+            _programar_con_ia("build X")
+            assert mock_pensar.call_args.kwargs['fallback'] == 'gemini'
+            assert "build X" in mock_pensar.call_args.args[0]
+
+    def test_streams_with_early_stop_and_progress(self):
+        from agents.dev import _programar_con_ia
+        progreso = MagicMock()
+        with patch('agents.dev.pensar_streaming', return_value="code") as mock_pensar:
+            _programar_con_ia("build X", on_progress=progreso)
+        kwargs = mock_pensar.call_args.kwargs
+        assert kwargs['on_progress'] is progreso
+        assert "=== END ===" in kwargs['sistema']
+        assert kwargs['parar']("=== FILE: a.py ===\nx\n=== ENDFILE ===\n=== END ===\n")
+        assert not kwargs['parar']("=== FILE: a.py ===\nx\n=== ENDFILE ===\n" + "Explicacion. " * 30)
 
     def test_correction_goes_direct_to_local(self):
         from agents.dev import _programar_con_ia
         with patch('agents.dev.pensar_con_local', return_value="fixed code") as mock_local, \
-             patch('agents.dev.pensar_con_gemini') as mock_gemini:
+             patch('agents.dev.pensar_streaming') as mock_pensar:
             result, offline = _programar_con_ia("build X", error_previo="bugs", es_correccion=True)
             assert result == "fixed code"
             assert offline is True
-            mock_gemini.assert_not_called()
+            assert "MODO CORRECCION" in mock_local.call_args.args[0]
+            mock_pensar.assert_not_called()
 
     def test_all_fail_returns_empty(self):
         from agents.dev import _programar_con_ia
-        with patch('agents.dev.pensar_con_gemini', return_value=""), \
-             patch('agents.dev.pensar_con_local', return_value=""), \
-             patch('agents.dev.time'):
+        with patch('agents.dev.pensar_streaming', return_value=""), \
+             patch('agents.dev.pensar_con_local', return_value=""):
             result, offline = _programar_con_ia("build X")
             assert result == ""
 
 
+def _rechazar(db, veces, idea_id=4):
+    """Registra `veces` rechazos de QA como eventos (suben rejection_count)."""
+    for i in range(veces):
+        queries.update_execution_status(db, idea_id, 'queued_software',
+                                        error=f"QA RECHAZADO: bug {i}", agent_name='QA',
+                                        outcome='rejected')
+
+
 class TestDevCiclo:
-    def test_processes_queued_software(self, db_with_ideas):
+    def test_processes_queued_software(self, agent_db):
         from agents.dev import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.dev.pensar_con_gemini', return_value="print('done')"):
-                result = ciclo()
-            assert result == 1
-            row = db_with_ideas.execute(
-                "SELECT execution_status FROM ideas WHERE id=4"
-            ).fetchone()
-            assert row['execution_status'] == 'developed'
-        finally:
-            reset_connection()
-
-    def test_returns_zero_when_no_tasks(self, test_db):
+        with patch('agents.dev.pensar_streaming',
+                   return_value="=== FILE: main.py ===\nprint('done')\n=== ENDFILE ===\n=== END ===\n"):
+            assert ciclo() == 1
+        row = idea_row(agent_db, 4)
+        assert row['execution_status'] == 'developed'
+        assert "print('done')" in row['execution_output']
+        assert "=== END ===" not in row['execution_output']
+        assert row['claimed_by'] is None
+
+    def test_progress_is_persisted_while_generating(self, agent_db):
         from agents.dev import ciclo
-        set_connection(test_db)
-        try:
+        vistos = []
+
+        def fake(prompt, on_progress=None, **kw):
+            on_progress("=== FILE: main.py ===\n")
+            vistos.append(idea_row(agent_db, 4))
+            return "=== FILE: main.py ===\nprint(1)\n=== ENDFILE ==="
+
+        with patch('agents.dev.pensar_streaming', side_effect=fake):
+            assert ciclo() == 1
+        assert vistos[0]['execution_status'] == 'in_progress'
+        assert vistos[0]['execution_output'].startswith("**Generando...**")
+        assert "=== FILE: main.py ===" in vistos[0]['execution_output']
+        assert vistos[0]['claimed_by'].startswith('DEV@')
+
+    def test_returns_zero_when_no_tasks(self, agent_db):
+        from agents.dev import ciclo
+        agent_db.execute("DELETE FROM ideas")
+        with patch('agents.dev.pensar_streaming') as pensar:
             assert ciclo() == 0
-        finally:
-            reset_connection()
+        pensar.assert_not_called()
 
-    def test_blocks_after_max_corrections(self, db_with_ideas):
+    def test_correction_uses_recent_feedback(self, agent_db):
         from agents.dev import ciclo
-        # Set up idea 4 as rejected multiple times
-        db_with_ideas.execute(
+        _rechazar(agent_db, 1)
+        with patch('agents.dev.pensar_con_local', return_value="print('fixed')") as local, \
+             patch('agents.dev.pensar_streaming') as pensar:
+            assert ciclo() == 1
+        pensar.assert_not_called()
+        assert "bug 0" in local.call_args.args[0]
+        assert idea_row(agent_db, 4)['execution_status'] == 'developed'
+
+    def test_blocks_after_max_corrections(self, agent_db):
+        from agents.dev import ciclo
+        # Idea rechazada varias veces antes de que existiera el historial de eventos
+        agent_db.execute(
             "UPDATE ideas SET execution_error = 'RECHAZADO\nRECHAZADO\nRECHAZADO' WHERE id = 4"
         )
-        set_connection(db_with_ideas)
-        try:
-            result = ciclo()
-            assert result == 0
-            row = db_with_ideas.execute(
-                "SELECT execution_status FROM ideas WHERE id=4"
-            ).fetchone()
-            assert row['execution_status'] == 'blocked'
-        finally:
-            reset_connection()
-
-    def test_failed_on_no_ai_response(self, db_with_ideas):
+        assert ciclo() == 0
+        assert idea_row(agent_db, 4)['execution_status'] == 'blocked'
+
+    def test_blocks_after_max_rejection_events(self, agent_db):
+        from agents.dev import ciclo, MAX_INTENTOS_CORRECCION
+        _rechazar(agent_db, MAX_INTENTOS_CORRECCION)
+        with patch('agents.dev.pensar_con_local') as local, \
+             patch('agents.dev.pensar_streaming') as pensar:
+            assert ciclo() == 0
+        local.assert_not_called()
+        pensar.assert_not_called()
+        row = idea_row(agent_db, 4)
+        assert row['execution_status'] == 'blocked'
+        assert f"tras {MAX_INTENTOS_CORRECCION} correcciones" in row['execution_error']
+        assert row['claimed_by'] is None
+
+    def test_failed_on_no_ai_response(self, agent_db):
+        from agents.dev import ciclo
+        with patch('agents.dev.pensar_streaming', return_value=""):
+            assert ciclo() == 0
+        row = idea_row(agent_db, 4)
+        assert row['execution_status'] == 'failed'
+        assert row['claimed_by'] is None
+
+
+class TestDevLease:
+    """Un DEV que perdio el lease deja de generar y no escribe su resultado."""
+
+    @staticmethod
+    def _robar(db):
+        db.execute("UPDATE ideas SET claimed_by = 'DEV@otro:1' WHERE id = 4")
+        db.commit()
+
+    def test_lost_lease_cuts_the_stream(self, agent_db):
         from agents.dev import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.dev.pensar_con_gemini', return_value=""), \
-                 patch('agents.dev.pensar_con_local', return_value=""), \
-                 patch('agents.dev.time'):
-                result = ciclo()
-            assert result == 0
-            row = db_with_ideas.execute(
-                "SELECT execution_status FROM ideas WHERE id=4"
-            ).fetchone()
-            assert row['execution_status'] == 'failed'
-        finally:
-            reset_connection()
+        from llm.streaming import Cancelado
+
+        def fake(prompt, on_progress=None, **kw):
+            self._robar(agent_db)
+            with pytest.raises(Cancelado):
+                on_progress("=== FILE: main.py ===\n")    # no llega a escribir el parcial
+            raise Cancelado("lease perdido")
+
+        with patch('agents.dev.pensar_streaming', side_effect=fake):
+            assert ciclo() == 0
+        row = idea_row(agent_db, 4)
+        assert row['execution_status'] == 'in_progress'
+        assert not row['execution_output']
+        assert row['claimed_by'] == 'DEV@otro:1'
+
+    def test_lease_lost_after_generation_skips_final_status(self, agent_db):
+        from agents.dev import ciclo
+
+        def fake(prompt, **kw):
+            self._robar(agent_db)
+            return "=== FILE: main.py ===\nprint(1)\n=== ENDFILE ===\n=== END ===\n"
+
+        with patch('agents.dev.pensar_streaming', side_effect=fake):
+            assert ciclo() == 0
+        assert idea_row(agent_db, 4)['execution_status'] == 'in_progress'
@@ -0,0 +1,176 @@
+"""Tests for llm/engine.py — Async LLM engine with per-backend concurrency"""
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm.engine import AsyncEngine
+from llm.health import HealthRegistry
+
+DELAY = 0.1
+
+
+class _SlowOllamaHandler(BaseHTTPRequestHandler):
+    """Stand-in de /api/chat: tarda DELAY segundos por peticion."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(DELAY)
+        roles = "+".join(m["role"] for m in body.get("messages", []))
+        payload = json.dumps({"message": {"role": "assistant",
+                                          "content": f"{roles}: {body['messages'][-1]['content']}"},
+                              "prompt_eval_count": 7, "eval_count": 3}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def ollama_lento(monkeypatch):
+    import compartido
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowOllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(compartido.CONFIG, "ollama_url",
+                        f"http://127.0.0.1:{server.server_address[1]}/api/generate")
+    yield
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def motor():
+    engines = []
+
+    def _crear(backends, **kw):
+        e = AsyncEngine(backends, **kw)
+        engines.append(e)
+        return e
+    yield _crear
+    for e in engines:
+        e.close()
+
+
+def _dormir(segundos, texto="ok"):
+    async def _backend(motor, prompt, sistema, max_tokens, uso):
+        await asyncio.sleep(segundos)
+        return f"{texto}:{prompt}"
+    return _backend
+
+
+class TestConcurrency:
+    def test_semaphore_caps_in_flight(self, motor):
+        m = motor({"local": _dormir(0.05)}, limits={"local": 2})
+        out = m.pensar_muchos_sync([str(i) for i in range(6)], cadena=("local",))
+        assert out == [f"ok:{i}" for i in range(6)]
+        s = m.stats()["local"]
+        assert s["max_in_flight"] == 2
+        assert s["calls"] == s["ok"] == 6
+        assert s["in_flight"] == 0 and s["waiting"] == 0
+
+    def test_backends_have_independent_limits(self, motor):
+        m = motor({"local": _dormir(0.05), "gemini": _dormir(0.05)},
+                  limits={"local": 1, "gemini": 4})
+        m.pensar_muchos_sync(["a"] * 4, cadena=("local",))
+        m.pensar_muchos_sync(["b"] * 4, cadena=("gemini",))
+        assert m.stats()["local"]["max_in_flight"] == 1
+        assert m.stats()["gemini"]["max_in_flight"] == 4
+
+
+class TestFailures:
+    def test_timeout_falls_back_and_marks_health(self, motor):
+        health = HealthRegistry()
+        m = motor({"local": _dormir(1.0), "gemini": _dormir(0, "cloud")},
+                  timeouts={"local": 0.05}, health=health)
+        assert m.pensar_sync("p", cadena=("local", "gemini")) == "cloud:p"
+        assert m.stats()["local"]["timeouts"] == 1
+        assert health.snapshot()["local"]["last_kind"] == "timeout"
+
+    def test_error_falls_back(self, motor):
+        async def roto(*a):
+            raise ConnectionError("refused")
+        m = motor({"local": roto, "gemini": _dormir(0, "cloud")})
+        assert m.pensar_sync("p", cadena=("local", "gemini")) == "cloud:p"
+        assert m.stats()["local"]["errors"] == 1
+
+    def test_open_circuit_is_skipped(self, motor):
+        health = HealthRegistry(failure_threshold=1)
+        health.record_failure("local", "connection")
+        m = motor({"local": _dormir(0), "gemini": _dormir(0, "cloud")}, health=health)
+        assert m.pensar_sync("p", cadena=("local", "gemini")) == "cloud:p"
+        assert "local" not in m.stats()
+
+    def test_sync_timeout_cancels_pending(self, motor):
+        m = motor({"local": _dormir(5)}, limits={"local": 1})
+        with pytest.raises(concurrent.futures.TimeoutError):
+            m.pensar_muchos_sync(["a", "b"], timeout=0.1, cadena=("local",))
+        time.sleep(0.05)
+        s = m.stats()["local"]
+        assert s["cancelled"] == 2          # uno en vuelo y otro en cola
+        assert s["in_flight"] == 0 and s["waiting"] == 0
+
+    def test_usage_hooks(self, motor):
+        cerrados = []
+
+        async def cierre(uso, texto, outcome):
+            cerrados.append((uso["backend"], outcome, texto))
+        m = motor({"local": _dormir(0)},
+                  usage=(lambda b, p, s, meta: {"backend": b, **meta}, cierre))
+        m.pensar_sync("p", cadena=("local",), meta={"agente": "QA"})
+        assert cerrados == [("local", "ok", "ok:p")]
+
+
+class TestCompartidoLedger:
+    def test_async_ledger_write_releases_the_executor_connection(self, monkeypatch):
+        import compartido
+        hilos = []
+        monkeypatch.setattr(compartido, "_registrar_uso",
+                            lambda uso: hilos.append(("registro", threading.get_ident())))
+        monkeypatch.setattr(compartido, "_liberar_conexion_db",
+                            lambda: hilos.append(("libera", threading.get_ident())))
+        uso = compartido._nuevo_uso("local", "p", "s", agente="QA")
+        asyncio.run(compartido._acerrar_uso(uso, "texto", "ok"))
+        assert [accion for accion, _ in hilos] == ["registro", "libera"]
+        assert hilos[0][1] == hilos[1][1] != threading.get_ident()
+
+
+class TestCompartidoMotor:
+    @pytest.fixture(autouse=True)
+    def motor_limpio(self, monkeypatch):
+        import compartido
+        monkeypatch.setattr(compartido, "motor_async", None)
+        yield
+        if compartido.motor_async is not None:
+            compartido.motor_async.close()
+
+    def test_pensar_paralelo_against_local_server(self, ollama_lento, monkeypatch):
+        import compartido
+        monkeypatch.setitem(compartido.CONFIG, "llm_concurrency", {"local": 4})
+        inicio = time.monotonic()
+        out = compartido.pensar_paralelo(["a", "b", "c", "d"], sistema="s")
+        elapsed = time.monotonic() - inicio
+        assert out == [f"system+user: {p}" for p in "abcd"]
+        assert elapsed < 4 * DELAY   # en paralelo, no en serie
+        assert compartido.health.snapshot()["local"]["samples"] == 4
+
+    def test_throughput_scales_with_concurrency(self, ollama_lento, monkeypatch):
+        import compartido
+        tiempos = {}
+        for limite in (1, 4):
+            compartido.motor_async = None
+            monkeypatch.setitem(compartido.CONFIG, "llm_concurrency", {"local": limite})
+            inicio = time.monotonic()
+            compartido.pensar_paralelo(["x"] * 8)
+            tiempos[limite] = time.monotonic() - inicio
+            compartido.motor_async.close()
+        assert tiempos[1] >= 8 * DELAY
+        assert tiempos[1] / tiempos[4] > 2.5
@@ -0,0 +1,170 @@
+"""Tests for llm/health.py — Backend health registry and circuit breaker"""
+import random
+import threading
+
+import pytest
+import requests
+
+from llm import health as h
+from llm.health import HealthRegistry, clasificar_error
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def registry():
+    r = HealthRegistry(failure_threshold=3, backoff_max=600, rng=random.Random(1))
+    r._clock = _Clock()
+    return r
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code, msg="boom"):
+        super().__init__(msg)
+        self.status_code = status_code
+
+
+class TestClasificarError:
+    def test_connection(self):
+        assert clasificar_error(requests.exceptions.ConnectionError("refused")) == h.CONNECTION
+        assert clasificar_error(ConnectionResetError()) == h.CONNECTION
+
+    def test_timeout(self):
+        assert clasificar_error(requests.exceptions.ReadTimeout("read timed out")) == h.TIMEOUT
+        assert clasificar_error(TimeoutError()) == h.TIMEOUT
+
+    def test_quota(self):
+        assert clasificar_error(_StatusError(429)) == h.QUOTA
+        assert clasificar_error(Exception("429 RESOURCE_EXHAUSTED: quota exceeded")) == h.QUOTA
+
+    def test_server(self):
+        assert clasificar_error(_StatusError(503, "overloaded")) == h.SERVER
+        assert clasificar_error(status_code=500) == h.SERVER
+
+    def test_client_and_other(self):
+        assert clasificar_error(status_code=404) == h.CLIENT
+        assert clasificar_error(ValueError("bad json")) == h.OTHER
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold(self, registry):
+        for _ in range(2):
+            registry.record_failure("local", h.CONNECTION)
+        assert registry.allow("local")
+        registry.record_failure("local", h.CONNECTION)
+        assert not registry.allow("local")
+        assert registry.snapshot()["local"]["state"] == h.OPEN
+
+    def test_success_resets_consecutive_failures(self, registry):
+        registry.record_failure("local", h.CONNECTION)
+        registry.record_failure("local", h.CONNECTION)
+        registry.record_success("local", 1.0)
+        registry.record_failure("local", h.CONNECTION)
+        assert registry.allow("local")
+
+    def test_quota_opens_immediately_and_backs_off_longer(self, registry):
+        registry.record_failure("gemini", h.QUOTA)
+        assert not registry.allow("gemini")
+        quota_wait = registry.snapshot()["gemini"]["retry_in"]
+        for _ in range(3):
+            registry.record_failure("local", h.CONNECTION)
+        conn_wait = registry.snapshot()["local"]["retry_in"]
+        assert quota_wait > conn_wait
+        assert quota_wait >= h.BACKOFF_BASE[h.QUOTA] * 0.5
+
+    def test_half_open_single_trial_without_probe(self, registry):
+        registry.record_failure("gemini", h.QUOTA)
+        registry._clock.now += 1000
+        assert registry.allow("gemini")       # llamada de prueba
+        assert not registry.allow("gemini")   # solo una a la vez
+        registry.record_success("gemini", 2.0)
+        assert registry.allow("gemini")
+        assert registry.snapshot()["gemini"]["state"] == h.CLOSED
+
+    def test_failed_trial_reopens_with_longer_backoff(self, registry):
+        registry.record_failure("gemini", h.QUOTA)
+        first = registry.snapshot()["gemini"]["retry_in"]
+        registry._clock.now += 1000
+        assert registry.allow("gemini")
+        registry.record_failure("gemini", h.QUOTA)
+        assert not registry.allow("gemini")
+        second = registry.snapshot()["gemini"]["retry_in"]
+        assert second > first
+
+    def test_backoff_is_capped(self, registry):
+        for attempts in range(1, 20):
+            assert registry._backoff(h.QUOTA, attempts) <= 600
+
+    def test_error_rate_and_latency(self, registry):
+        registry.record_success("claude", 1.0)
+        registry.record_success("claude", 3.0)
+        registry.record_failure("claude", h.SERVER, 0.5)
+        snap = registry.snapshot()["claude"]
+        assert snap["samples"] == 3
+        assert snap["error_rate"] == pytest.approx(0.333, abs=0.001)
+        assert snap["latency_p50"] == 3.0
+
+
+class TestProbes:
+    def test_probe_closes_circuit(self, registry):
+        calls = []
+        registry.register_probe("local", lambda: calls.append(1))
+        for _ in range(3):
+            registry.record_failure("local", h.CONNECTION)
+        # Con probe registrado no hay half-open: espera al probe
+        registry._clock.now += 1000
+        assert not registry.allow("local")
+        registry.probe_due()
+        assert calls == [1]
+        assert registry.allow("local")
+
+    def test_failed_probe_reschedules(self, registry):
+        def probe():
+            raise requests.exceptions.ConnectionError("refused")
+        registry.register_probe("local", probe)
+        for _ in range(3):
+            registry.record_failure("local", h.CONNECTION)
+        registry._clock.now += 1000
+        proximo = registry.probe_due()
+        assert proximo is not None and proximo > 0
+        assert registry.snapshot()["local"]["state"] == h.OPEN
+
+    def test_probe_not_due_yet(self, registry):
+        calls = []
+        registry.register_probe("local", lambda: calls.append(1))
+        for _ in range(3):
+            registry.record_failure("local", h.CONNECTION)
+        assert registry.probe_due() > 0
+        assert calls == []
+
+    def test_run_prober_stops(self, registry):
+        stop = threading.Event()
+        stop.set()
+        registry.run_prober(stop)  # retorna inmediatamente
+
+
+class TestPensarSkipsOpenCircuit:
+    def test_open_local_goes_straight_to_cloud(self, fresh_health):
+        from unittest.mock import patch
+        import compartido
+        for _ in range(3):
+            fresh_health.record_failure("local", h.CONNECTION)
+        with patch('compartido.pensar_con_local', return_value="local") as local, \
+             patch('compartido.pensar_con_gemini', return_value="nube"):
+            assert compartido.pensar("p") == "nube"
+            assert not local.called
+
+    def test_local_failures_recorded(self, fresh_health):
+        from unittest.mock import patch
+        import compartido
+        with patch('compartido.transport.post', side_effect=requests.exceptions.ConnectionError("refused")):
+            compartido.pensar_con_local("p")
+        snap = fresh_health.snapshot()["local"]
+        assert snap["consecutive_failures"] == 1
+        assert snap["last_kind"] == h.CONNECTION
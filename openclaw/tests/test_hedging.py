@@ -0,0 +1,250 @@
+"""Tests for llm/hedging.py — Hedged requests across backends"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+from llm.hedging import FIJO, PERCENTIL, Cancelacion, Hedger, cancelable, parse_politica
+
+
+def _contendiente(espera_primer_token, texto, vistos):
+    """lanzar() de prueba: tarda `espera_primer_token` en el primer chunk y respeta cancel."""
+    def _lanzar(backend, cancel, primer):
+        partes = []
+
+        def _chunks():
+            if cancel.wait(espera_primer_token):
+                return
+            for palabra in texto.split():
+                yield palabra + " "
+        for c in cancelable(_chunks(), cancel, primer):
+            partes.append(c)
+        vistos[backend] = "cancelled" if cancel.is_set() else "done"
+        return "".join(partes)
+    return _lanzar
+
+
+class TestPolitica:
+    def test_parse(self):
+        assert parse_politica("p90") == (PERCENTIL, 90.0)
+        assert parse_politica("6") == (FIJO, 6.0)
+        assert parse_politica("off") is None
+        assert parse_politica("") is None
+
+    def test_policies_per_agent(self):
+        h = Hedger({"REVIEWER": "p90", "qa": "off"})
+        assert h.politica("reviewer") == (PERCENTIL, 90.0)
+        assert h.politica("QA") is None
+        assert h.politica("DEV") is None
+
+    def test_delay_from_ttft_percentile(self):
+        h = Hedger(default_delay=10.0, min_samples=5)
+        assert h.delay_for("local", (PERCENTIL, 90)) == 10.0   # sin muestras
+        for t in range(1, 11):
+            h.observe("local", ttft=float(t))
+        assert h.delay_for("local", (PERCENTIL, 90)) == 9.0
+        assert h.delay_for("local", (PERCENTIL, 50)) == 5.0
+        assert h.delay_for("local", (FIJO, 2.5)) == 2.5
+
+
+class TestCarrera:
+    def test_fast_primary_is_not_hedged(self):
+        h = Hedger()
+        vistos = {}
+        siguiente = []
+        texto, ganador = h.carrera(
+            "reviewer", "local", _contendiente(0, "rapido", vistos),
+            lambda: siguiente.append(1), delay=0.5)
+        assert (texto.strip(), ganador) == ("rapido", "local")
+        assert siguiente == []
+        assert h.stats()["reviewer"]["hedged"] == 0
+
+    def test_slow_primary_loses_to_hedge_and_is_cancelled(self):
+        h = Hedger()
+        for _ in range(3):
+            h.observe("local", total=2.0)
+        vistos = {}
+        lanzadores = {"local": _contendiente(5, "lento", vistos),
+                      "gemini": _contendiente(0, "cloud", vistos)}
+        inicio = time.monotonic()
+        texto, ganador = h.carrera(
+            "reviewer", "local", lambda b, c, p: lanzadores[b](b, c, p),
+            lambda: "gemini", delay=0.05)
+        assert (texto.strip(), ganador) == ("cloud", "gemini")
+        assert time.monotonic() - inicio < 1.0
+        time.sleep(0.05)
+        assert vistos["local"] == "cancelled"
+        s = h.stats()["reviewer"]
+        assert s["hedged"] == 1 and s["hedge_wins"] == 1
+        assert 1.5 < s["saved_s"] <= 2.0     # mediana del primario - lo que tardo la cobertura
+
+    def test_primary_can_still_win_after_hedge(self):
+        h = Hedger()
+        vistos = {}
+        lanzadores = {"local": _contendiente(0.1, "primario", vistos),
+                      "gemini": _contendiente(2, "cloud", vistos)}
+        texto, ganador = h.carrera(
+            "qa", "local", lambda b, c, p: lanzadores[b](b, c, p), lambda: "gemini", delay=0.02)
+        assert ganador == "local"
+        s = h.stats()["qa"]
+        assert s["hedged"] == 1 and s["primary_wins"] == 1 and s["hedge_wins"] == 0
+
+    def test_failed_hedge_waits_for_primary(self):
+        h = Hedger()
+        vistos = {}
+        lanzadores = {"local": _contendiente(0.2, "primario", vistos),
+                      "gemini": lambda b, c, p: ""}
+        texto, ganador = h.carrera(
+            "qa", "local", lambda b, c, p: lanzadores[b](b, c, p), lambda: "gemini", delay=0.02)
+        assert (texto.strip(), ganador) == ("primario", "local")
+
+
+class TestPensarConCobertura:
+    @pytest.fixture(autouse=True)
+    def hedger_limpio(self, monkeypatch):
+        import compartido
+        monkeypatch.setattr(compartido, "hedger", Hedger({"reviewer": "0.05"}))
+
+    def _backends(self, lento):
+        cerrados = []
+
+        def fake(backend, *a, **kw):
+            def _gen():
+                try:
+                    if backend == "local":
+                        time.sleep(lento)
+                    yield f"respuesta {backend}\n"
+                finally:
+                    cerrados.append(backend)
+            return _gen()
+        return fake, cerrados
+
+    def test_hedge_wins_for_reviewer(self):
+        import compartido
+        fake, cerrados = self._backends(lento=0.5)
+        with patch("compartido._stream_backend", side_effect=fake):
+            out = compartido.pensar_streaming("p", agente="REVIEWER", fallback="claude")
+        assert out == "respuesta claude\n"
+        assert compartido.hedger.stats()["REVIEWER"]["hedge_wins"] == 1
+        time.sleep(0.6)
+        assert "local" in cerrados      # el perdedor se cerro
+
+    def test_non_streaming_pensar_uses_policy(self):
+        import compartido
+        fake, _ = self._backends(lento=0.5)
+        with patch("compartido._stream_backend", side_effect=fake), \
+             patch("compartido.pensar_con_local") as local:
+            assert compartido.pensar("p", agente="REVIEWER", fallback="gemini") == "respuesta gemini\n"
+            assert not local.called
+
+    def test_agents_without_policy_are_sequential(self):
+        import compartido
+        fake, _ = self._backends(lento=0.1)
+        with patch("compartido._stream_backend", side_effect=fake):
+            assert compartido.pensar_streaming("p", agente="DEV") == "respuesta local\n"
+        assert compartido.hedger.stats() == {}
+
+    def test_race_failure_continues_chain(self):
+        import compartido
+
+        def fake(backend, *a, **kw):
+            return iter([] if backend in ("local", "claude") else ["de gemini"])
+        with patch("compartido._stream_backend", side_effect=fake):
+            assert compartido.pensar_streaming("p", agente="REVIEWER", fallback="claude") == "de gemini"
+
+    def test_cancelled_primary_reports_its_wait_as_ttft(self):
+        import compartido
+        fake, _ = self._backends(lento=0.5)
+        cerrados = {}
+        real = compartido._cerrar_uso
+
+        def _capturar(uso, texto, outcome, ttft=None, **kw):
+            cerrados[uso["backend"]] = (outcome, ttft)
+            return real(uso, texto, outcome, ttft=ttft, **kw)
+
+        with patch("compartido._stream_backend", side_effect=fake), \
+             patch("compartido._cerrar_uso", side_effect=_capturar):
+            compartido.pensar_streaming("p", agente="REVIEWER", fallback="claude")
+            time.sleep(0.6)
+        outcome, ttft = cerrados["local"]
+        assert outcome == "cancelled" and ttft is not None and ttft >= 0.05
+
+    def test_cancelled_progress_cuts_both_backends(self, monkeypatch):
+        import compartido
+        from llm.streaming import Cancelado
+        monkeypatch.setitem(compartido.CONFIG, "stream_flush_s", 0)
+        cerrados = []
+
+        def fake(backend, *a, **kw):
+            def _gen():
+                try:
+                    if backend == "local":
+                        time.sleep(0.2)
+                    for _ in range(500):
+                        yield "linea\n"
+                        time.sleep(0.001)
+                finally:
+                    cerrados.append(backend)
+            return _gen()
+
+        def _progreso(parcial):
+            raise Cancelado("lease perdido")
+
+        with patch("compartido._stream_backend", side_effect=fake), pytest.raises(Cancelado):
+            compartido.pensar_streaming("p", agente="REVIEWER", fallback="claude", on_progress=_progreso)
+        time.sleep(0.3)
+        assert sorted(cerrados) == ["claude", "local"]
+
+
+class _Colgado(BaseHTTPRequestHandler):
+    """Ollama que acepta la peticion y no manda nada (modelo cargando)."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(3)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCancelacion:
+    def test_closers_run_on_cancel_or_immediately(self):
+        cancel, cerrados = Cancelacion(), []
+        cancel.al_cancelar(lambda: cerrados.append("a"))
+        assert cerrados == []
+        cancel.set()
+        cancel.al_cancelar(lambda: cerrados.append("b"))
+        assert cerrados == ["a", "b"] and cancel.is_set()
+
+    def test_losing_ollama_request_is_cut_before_first_token(self, monkeypatch):
+        import compartido
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Colgado)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        monkeypatch.setitem(compartido.CONFIG, "ollama_url",
+                            f"http://127.0.0.1:{server.server_address[1]}/api/generate")
+        monkeypatch.setattr(compartido, "hedger", Hedger({"reviewer": "0.1"}))
+        real = compartido._stream_backend
+        terminado = threading.Event()
+
+        def fake(backend, *a, **kw):
+            if backend != "local":
+                return iter(["respuesta claude\n"])
+
+            def _gen():
+                try:
+                    yield from real(backend, *a, **kw)
+                finally:
+                    terminado.set()
+            return _gen()
+
+        try:
+            with patch("compartido._stream_backend", side_effect=fake):
+                out = compartido.pensar_streaming("p", agente="REVIEWER", fallback="claude")
+            assert out == "respuesta claude\n"
+            assert terminado.wait(1.5)       # sin esperar los 3 s del servidor ni el timeout de lectura
+            assert compartido.health.snapshot().get("local", {}).get("consecutive_failures", 0) == 0
+        finally:
+            server.shutdown()
+            server.server_close()
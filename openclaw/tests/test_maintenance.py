@@ -0,0 +1,111 @@
+"""Tests for db/maintenance.py — WAL checkpoints, ANALYZE and incremental vacuum."""
+import sqlite3
+import time
+
+import pytest
+from db import connection, maintenance
+from db.maintenance import Maintainer
+from tests.conftest import SCHEMA_SQL
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "mant.db")
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA_SQL)
+    db.close()
+    return path
+
+
+@pytest.fixture
+def abrir(db_path):
+    """Conexion de mantenimiento de un Maintainer; se cierra al final."""
+    abiertas = []
+
+    def _abrir(**kwargs):
+        m = Maintainer(path=db_path, **kwargs)
+        db = m._connect()
+        abiertas.append(db)
+        return m, db
+    yield _abrir
+    for db in abiertas:
+        db.close()
+
+
+def _escribir(path, filas=200, tamano=4000):
+    db = connection._create_connection(path)
+    db.executemany("INSERT INTO ideas (text, execution_output) VALUES (?, ?)",
+                   [(f"idea {i}", "x" * tamano) for i in range(filas)])
+    db.commit()
+    return db
+
+
+class TestCheckpoint:
+    def test_quiet_window_truncates_the_wal(self, db_path, abrir):
+        m, db = abrir(quiet_s=0)
+        otra = _escribir(db_path)
+        antes = m.wal_size()
+        assert antes > 0
+        reportes = m.run_once(db, force=True)
+        otra.close()
+        truncate = next(r for r in reportes if r["task"] == "checkpoint_truncate")
+        assert truncate["reclaimed_bytes"] >= antes and m.wal_size() == 0
+
+    def test_busy_window_only_passive_above_limit(self, db_path, abrir):
+        m, db = abrir(quiet_s=3600, wal_limit_mb=0)
+        otra = _escribir(db_path)
+        reportes = m.run_once(db)
+        otra.close()
+        assert [r["task"] for r in reportes] == ["checkpoint_passive"]
+        assert reportes[0]["checkpointed"] == reportes[0]["frames"] > 0
+
+    def test_commit_from_another_connection_breaks_the_quiet(self, db_path, abrir):
+        m, db = abrir(quiet_s=0.2)
+        time.sleep(0.25)
+        assert m.quiet(db)
+        otra = _escribir(db_path, filas=1)
+        otra.close()
+        assert not m.quiet(db)
+
+
+class TestAnalyze:
+    def test_analyze_runs_on_schedule(self, db_path, abrir):
+        m, db = abrir(quiet_s=0, analyze_every=3600)
+        _escribir(db_path).close()
+        assert "analyze" in [r["task"] for r in m.run_once(db, force=True)]
+        assert db.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+        assert "analyze" not in [r["task"] for r in m.run_once(db)]       # no toca hasta dentro de 1h
+
+
+class TestVacuum:
+    def test_incremental_vacuum_returns_freed_pages(self, db_path, abrir):
+        m, db = abrir(quiet_s=0)
+        assert maintenance.enable_incremental_vacuum(db) >= 0 and maintenance.incremental_enabled(db)
+        _escribir(db_path).close()
+        db.execute("UPDATE ideas SET execution_output = 'resumen'")
+        db.commit()
+        tamano = db.execute("PRAGMA page_count").fetchone()[0]
+        reportes = m.run_once(db, force=True)
+        vacuum = next(r for r in reportes if r["task"] == "incremental_vacuum")
+        assert vacuum["reclaimed_bytes"] > 0 and vacuum["left"] == 0
+        assert db.execute("PRAGMA page_count").fetchone()[0] < tamano
+        s = m.stats()
+        assert s["freelist_bytes"] == 0 and s["wal_bytes"] == 0
+        assert s["tasks"]["incremental_vacuum"]["reclaimed_bytes"] == vacuum["reclaimed_bytes"]
+
+    def test_budget_limits_each_run(self, db_path, abrir):
+        m, db = abrir(quiet_s=0)
+        maintenance.enable_incremental_vacuum(db)
+        _escribir(db_path, filas=2000).close()
+        db.execute("DELETE FROM ideas")
+        db.commit()
+        vacuum = m.vacuum(db, budget_ms=0)
+        assert vacuum["pages"] == 0 and vacuum["left"] > 0
+
+    def test_without_incremental_mode_only_reports_free_pages(self, db_path, abrir):
+        m, db = abrir(quiet_s=0)
+        _escribir(db_path).close()
+        db.execute("DELETE FROM ideas")
+        db.commit()
+        assert "incremental_vacuum" not in [r["task"] for r in m.run_once(db, force=True)]
+        assert m.stats()["freelist_bytes"] > 0
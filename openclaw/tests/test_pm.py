@@ -1,5 +1,6 @@
 """Tests for agents/pm.py — PM Router Agent"""
 import pytest
+from db import queries
 from db.connection import set_connection, reset_connection
 
 
@@ -270,10 +271,13 @@ class TestPMCiclo:
             routed = ciclo()
             assert routed >= 1
             row = test_db.execute(
-                "SELECT execution_status, execution_error FROM ideas WHERE id=140"
+                "SELECT execution_status, execution_error, retry_count FROM ideas WHERE id=140"
             ).fetchone()
             assert row['execution_status'] == 'queued_consulting'
-            assert '[RETRY]' in row['execution_error']
+            assert row['retry_count'] == 1
+            assert row['execution_error'] == 'Ninguno de los modelos respondio'
+            evento = queries.get_execution_events(test_db, 140)[0]
+            assert (evento['stage'], evento['outcome'], evento['agent']) == ('failed', 'retried', 'PM')
         finally:
             reset_connection()
 
@@ -297,3 +301,19 @@ class TestPMCiclo:
             assert row['execution_status'] == 'failed'
         finally:
             reset_connection()
+
+    def test_cycle_commits_once(self, db_with_ideas):
+        """Todas las decisiones del ciclo se aplican en una sola transaccion."""
+        from agents.pm import ciclo
+        queries.ensure_execution_schema(db_with_ideas)
+        sentencias = []
+        db_with_ideas.set_trace_callback(sentencias.append)
+        set_connection(db_with_ideas)
+        try:
+            routed = ciclo()
+        finally:
+            db_with_ideas.set_trace_callback(None)
+            reset_connection()
+        assert routed >= 3
+        assert sum(1 for s in sentencias if s.strip().upper() == "COMMIT") == 1
+        assert not any("suggested_agent = ?" in s for s in sentencias)   # sin UPDATE suelto
@@ -1,139 +1,86 @@
 """Tests for agents/qa.py — QA Code Review Agent"""
-import pytest
 from unittest.mock import patch
-from db.connection import set_connection, reset_connection
+from db import queries
+from tests.conftest import idea_row
+
+APROBADO = "VEREDICTO: APROBADO\nSCORE: 9\nRESUMEN: Codigo limpio\nDETALLES:\n- Funcional\n- Sin bugs"
+RECHAZADO = "VEREDICTO: RECHAZADO\nSCORE: 3\nRESUMEN: Muchos bugs\nDETALLES:\n- Error en linea 5\n- Falta validacion"
 
 
 class TestQACiclo:
-    def test_approves_good_code(self, db_with_ideas):
+    def test_approves_good_code(self, agent_db):
         from agents.qa import ciclo
-        set_connection(db_with_ideas)
-        try:
-            review_text = (
-                "VEREDICTO: APROBADO\n"
-                "SCORE: 9\n"
-                "RESUMEN: Codigo limpio\n"
-                "DETALLES:\n- Funcional\n- Sin bugs"
-            )
-            with patch('agents.qa.pensar_con_claude', return_value=review_text):
-                result = ciclo()
-            assert result >= 1
-            row = db_with_ideas.execute(
-                "SELECT execution_status, code_stage FROM ideas WHERE id=10"
-            ).fetchone()
-            assert row['execution_status'] == 'completed'
-            assert row['code_stage'] == 'expressed'
-        finally:
-            reset_connection()
+        with patch('agents.qa.pensar_streaming', return_value=APROBADO):
+            assert ciclo() == 1
+        row = idea_row(agent_db, 10, "execution_status, code_stage")
+        assert row['execution_status'] == 'completed'
+        assert row['code_stage'] == 'expressed'
 
-    def test_rejects_bad_code(self, db_with_ideas):
+    def test_review_streams_with_early_stop(self, agent_db):
         from agents.qa import ciclo
-        set_connection(db_with_ideas)
-        try:
-            review_text = (
-                "VEREDICTO: RECHAZADO\n"
-                "SCORE: 3\n"
-                "RESUMEN: Muchos bugs\n"
-                "DETALLES:\n- Error en linea 5\n- Falta validacion"
-            )
-            with patch('agents.qa.pensar_con_claude', return_value=review_text):
-                result = ciclo()
-            assert result >= 1
-            row = db_with_ideas.execute(
-                "SELECT execution_status, execution_error FROM ideas WHERE id=10"
-            ).fetchone()
-            assert row['execution_status'] == 'queued_software'
-            assert 'RECHAZADO' in row['execution_error']
-        finally:
-            reset_connection()
+        with patch('agents.qa.pensar_streaming', return_value=APROBADO) as pensar:
+            ciclo()
+        kwargs = pensar.call_args.kwargs
+        assert kwargs['agente'] == 'QA' and kwargs['idea_id'] == 10
+        assert kwargs['fallback'] == 'claude'
+        assert kwargs['parar']("VEREDICTO: APROBADO\nSCORE: 8\nRESUMEN: OK\n")
+        assert "CODIGO GENERADO" in pensar.call_args.args[0]
+        assert 'print("api running")' in pensar.call_args.args[0]
 
-    def test_fallback_to_gemini_when_claude_fails(self, db_with_ideas):
+    def test_rejection_goes_back_to_dev_as_rejected_event(self, agent_db):
         from agents.qa import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.qa.pensar_con_claude', return_value=""), \
-                 patch('agents.qa.pensar_con_gemini', return_value="VEREDICTO: APROBADO\nSCORE: 8\nRESUMEN: OK\nDETALLES:\n- Bien"):
-                result = ciclo()
-            assert result >= 1
-            row = db_with_ideas.execute(
-                "SELECT execution_status, execution_output FROM ideas WHERE id=10"
-            ).fetchone()
-            assert row['execution_status'] == 'completed'
-            assert 'Gemini' in row['execution_output']
-        finally:
-            reset_connection()
+        with patch('agents.qa.pensar_streaming', return_value=RECHAZADO):
+            assert ciclo() == 1
+        row = idea_row(agent_db, 10, "execution_status, execution_error, rejection_count")
+        assert row['execution_status'] == 'queued_software'
+        assert 'QA RECHAZADO' in row['execution_error']
+        assert row['rejection_count'] == 1
+        assert queries.count_execution_events(agent_db, 10, 'rejected', agent='QA') == 1
+        assert 'Error en linea 5' in queries.get_recent_feedback(agent_db, 10)
 
-    def test_marks_failed_when_no_model_responds(self, db_with_ideas):
+    def test_marks_failed_when_no_model_responds(self, agent_db):
         from agents.qa import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.qa.pensar_con_claude', return_value=""), \
-                 patch('agents.qa.pensar_con_gemini', return_value=""), \
-                 patch('agents.qa.pensar_con_local', return_value=""):
-                result = ciclo()
-            assert result == 0
-            row = db_with_ideas.execute(
-                "SELECT execution_status, execution_error FROM ideas WHERE id=10"
-            ).fetchone()
-            assert row['execution_status'] == 'failed'
-            assert 'Ningún modelo de IA respondió' in (row['execution_error'] or '')
-        finally:
-            reset_connection()
+        with patch('agents.qa.pensar_streaming', return_value=""):
+            assert ciclo() == 0
+        row = idea_row(agent_db, 10)
+        assert row['execution_status'] == 'failed'
+        assert 'Ningún modelo de IA respondió' in (row['execution_error'] or '')
+        assert queries.count_execution_events(agent_db, 10, 'failed', agent='QA') == 1
 
-    def test_returns_zero_when_no_tasks(self, test_db):
+    def test_returns_zero_when_no_tasks(self, agent_db):
         from agents.qa import ciclo
-        set_connection(test_db)
-        try:
+        agent_db.execute("DELETE FROM ideas")
+        with patch('agents.qa.pensar_streaming') as pensar:
             assert ciclo() == 0
-        finally:
-            reset_connection()
+        pensar.assert_not_called()
 
-    def test_appends_review_to_output(self, db_with_ideas):
+    def test_appends_review_to_output(self, agent_db):
         from agents.qa import ciclo
-        set_connection(db_with_ideas)
-        try:
-            review_text = (
-                "VEREDICTO: APROBADO\n"
-                "SCORE: 8\n"
-                "RESUMEN: OK\n"
-                "DETALLES:\n- Good"
-            )
-            with patch('agents.qa.pensar_con_claude', return_value=review_text):
-                ciclo()
-            row = db_with_ideas.execute(
-                "SELECT execution_output FROM ideas WHERE id=10"
-            ).fetchone()
-            assert "Code Review (QA" in row['execution_output']
-            assert "APROBADO" in row['execution_output']
-        finally:
-            reset_connection()
+        with patch('agents.qa.pensar_streaming', return_value=APROBADO):
+            ciclo()
+        output = idea_row(agent_db, 10)['execution_output']
+        assert output.startswith('**Archivo: main.py**')
+        assert "Code Review (QA — Ollama/Cloud)" in output
+        assert "APROBADO" in output
 
-    def test_handles_exception_gracefully(self, db_with_ideas):
+    def test_large_output_is_truncated_for_review(self, agent_db):
         from agents.qa import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.qa.pensar_con_claude', side_effect=Exception("API down")):
-                result = ciclo()
-            assert result == 0
-            # Status should remain unchanged
-            row = db_with_ideas.execute(
-                "SELECT execution_status FROM ideas WHERE id=10"
-            ).fetchone()
-            assert row['execution_status'] == 'built'
-        finally:
-            reset_connection()
+        agent_db.execute("UPDATE ideas SET execution_output = ? WHERE id = 10", ["x" * 10000])
+        agent_db.commit()
+        with patch('agents.qa.pensar_streaming', return_value=APROBADO) as pensar:
+            ciclo()
+        prompt = pensar.call_args.args[0]
+        assert "[... TRUNCADO para review ...]" in prompt
+        assert "x" * 6001 not in prompt
+
+    def test_handles_exception_gracefully(self, agent_db):
+        from agents.qa import ciclo
+        with patch('agents.qa.pensar_streaming', side_effect=Exception("API down")):
+            assert ciclo() == 0
+        assert idea_row(agent_db, 10)['execution_status'] == 'built'
 
-    def test_parses_first_line_aprobado(self, db_with_ideas):
+    def test_parses_first_line_aprobado(self, agent_db):
         from agents.qa import ciclo
-        set_connection(db_with_ideas)
-        try:
-            review_text = "APROBADO\nSCORE: 7\nRESUMEN: Bien"
-            with patch('agents.qa.pensar_con_claude', return_value=review_text):
-                result = ciclo()
-            assert result >= 1
-            row = db_with_ideas.execute(
-                "SELECT execution_status FROM ideas WHERE id=10"
-            ).fetchone()
-            assert row['execution_status'] == 'completed'
-        finally:
-            reset_connection()
+        with patch('agents.qa.pensar_streaming', return_value="APROBADO\nSCORE: 7\nRESUMEN: Bien"):
+            assert ciclo() >= 1
+        assert idea_row(agent_db, 10)['execution_status'] == 'completed'
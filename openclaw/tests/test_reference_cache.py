@@ -0,0 +1,112 @@
+"""Tests for db/cache.py — read-through cache of reference queries."""
+import sqlite3
+
+import pytest
+from db import queries
+from db.cache import ReferenceCache, reference_cache
+from tests.conftest import SCHEMA_SQL, SEED_SQL
+
+
+@pytest.fixture
+def cache():
+    return ReferenceCache(max_entries=8, ttl=60)
+
+
+def _usuarios(cache, db, llamadas):
+    def load():
+        llamadas.append(1)
+        return db.execute("SELECT username FROM users ORDER BY id").fetchall()
+    return cache.get(db, "usuarios", load, "SELECT COUNT(*), MAX(id) FROM users")
+
+
+class TestReferenceCache:
+    def test_repeat_reads_are_served_from_cache(self, cache, test_db):
+        llamadas = []
+        primera = _usuarios(cache, test_db, llamadas)
+        assert _usuarios(cache, test_db, llamadas) == primera
+        assert len(llamadas) == 1
+        s = cache.stats()
+        assert (s["hits"], s["misses"], s["hit_ratio"]) == (1, 1, 0.5)
+        assert s["by_query"]["usuarios"]["hits"] == 1
+
+    def test_own_write_invalidates(self, cache, test_db):
+        llamadas = []
+        _usuarios(cache, test_db, llamadas)
+        test_db.execute("INSERT INTO users (username) VALUES ('nuevo')")
+        assert _usuarios(cache, test_db, llamadas)[-1][0] == "nuevo"
+        assert cache.stats()["invalidations"] == 1
+
+    def test_unrelated_write_keeps_the_entry(self, cache, test_db):
+        llamadas = []
+        _usuarios(cache, test_db, llamadas)
+        test_db.execute("INSERT INTO ideas (text) VALUES ('otra cosa')")
+        _usuarios(cache, test_db, llamadas)
+        assert len(llamadas) == 1 and cache.stats()["invalidations"] == 0
+
+    def test_commit_from_another_connection_invalidates(self, cache, tmp_path):
+        path = tmp_path / "ref.db"
+        lector, escritor = sqlite3.connect(path), sqlite3.connect(path)
+        try:
+            lector.executescript(SCHEMA_SQL)
+            lector.executescript(SEED_SQL)
+            llamadas = []
+            antes = len(_usuarios(cache, lector, llamadas))
+            escritor.execute("INSERT INTO users (username) VALUES ('dashboard')")
+            escritor.commit()
+            assert len(_usuarios(cache, lector, llamadas)) == antes + 1
+        finally:
+            lector.close()
+            escritor.close()
+
+    def test_ttl_ceiling(self, test_db):
+        cache = ReferenceCache(ttl=0)
+        llamadas = []
+        _usuarios(cache, test_db, llamadas)
+        _usuarios(cache, test_db, llamadas)
+        assert len(llamadas) == 2 and cache.stats()["expirations"] == 1
+
+    def test_bounded_size_evicts_least_recent(self, test_db):
+        cache = ReferenceCache(max_entries=1)
+        cache.get(test_db, "a", lambda: 1, "SELECT COUNT(*) FROM users")
+        cache.get(test_db, "b", lambda: 2, "SELECT COUNT(*) FROM users")
+        s = cache.stats()
+        assert s["entries"] == 1 and s["evictions"] == 1
+
+    def test_entries_are_per_connection(self, cache, test_db):
+        otra = sqlite3.connect(":memory:")
+        otra.executescript(SCHEMA_SQL)
+        try:
+            llamadas = []
+            assert len(_usuarios(cache, test_db, llamadas)) == 3
+            assert len(_usuarios(cache, otra, llamadas)) == 0
+        finally:
+            otra.close()
+
+    def test_callers_cannot_mutate_the_cached_list(self, cache, test_db):
+        llamadas = []
+        _usuarios(cache, test_db, llamadas).append("basura")
+        assert len(_usuarios(cache, test_db, llamadas)) == 3
+
+    def test_disabled_always_loads(self, test_db):
+        cache = ReferenceCache(enabled=False)
+        llamadas = []
+        _usuarios(cache, test_db, llamadas)
+        _usuarios(cache, test_db, llamadas)
+        assert len(llamadas) == 2 and cache.stats()["misses"] == 0
+
+
+class TestCachedQueries:
+    def test_context_string_follows_saves(self, backend_db):
+        queries.save_context_item(backend_db, "kpi", "margen 12%")
+        assert "margen 12%" in queries.get_context_string(backend_db)
+        queries.save_context_item(backend_db, "kpi", "margen 15%")
+        assert "margen 15%" in queries.get_context_string(backend_db)
+        antes = reference_cache.stats()["by_query"]["get_context_string"]["hits"]
+        queries.get_context_string(backend_db)
+        assert reference_cache.stats()["by_query"]["get_context_string"]["hits"] == antes + 1
+
+    def test_archived_area_drops_out(self, backend_db):
+        activas = len(queries.get_areas(backend_db))
+        backend_db.execute("UPDATE areas SET status = 'archived' WHERE id = (SELECT MIN(id) FROM areas)")
+        backend_db.commit()
+        assert len(queries.get_areas(backend_db)) == activas - 1
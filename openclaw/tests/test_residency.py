@@ -0,0 +1,151 @@
+"""Tests for llm/residency.py — Ollama model warm-up and residency"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+from llm.residency import ResidencyManager
+from llm.transport import HttpTransport
+
+CARGA_NS = 2_000_000_000      # 2s simulados de carga en frio
+EVAL_NS = 100_000_000         # 0.1s de prompt_eval
+
+
+class _Ollama:
+    """Stand-in de Ollama que recuerda que modelos tiene cargados."""
+
+    def __init__(self):
+        self.cargados = set()
+        self.peticiones = []
+        ollama = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path == "/api/ps":
+                    self._json({"models": [{"name": m, "model": m} for m in sorted(ollama.cargados)]})
+                else:
+                    self._json({"models": []})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                ollama.peticiones.append((self.path, body))
+                nombre = body["model"] if ":" in body["model"] else body["model"] + ":latest"
+                frio = nombre not in ollama.cargados
+                ollama.cargados.add(nombre)
+                data = {"done": True, "load_duration": CARGA_NS if frio else 1_000_000,
+                        "prompt_eval_duration": EVAL_NS, "prompt_eval_count": 5, "eval_count": 2}
+                if self.path == "/api/chat":
+                    data["message"] = {"role": "assistant", "content": "hola"}
+                else:
+                    data["response"] = ""
+                self._json(data)
+
+            def _json(self, data):
+                payload = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def ollama():
+    o = _Ollama()
+    yield o
+    o.close()
+
+
+@pytest.fixture
+def manager(ollama):
+    t = HttpTransport()
+    yield ResidencyManager(t, "llama3", hosts=lambda: [ollama.url], keep_alive="1h", interval=0)
+    t.close()
+
+
+class TestWarmup:
+    def test_startup_preloads_with_empty_generate(self, manager, ollama):
+        assert manager.check() == {ollama.url: "warmed"}
+        path, body = ollama.peticiones[0]
+        assert path == "/api/generate"
+        assert body["prompt"] == "" and body["keep_alive"] == "1h"
+        assert "llama3:latest" in ollama.cargados
+        assert manager.stats()[ollama.url]["warmups"] == 1
+
+    def test_resident_model_is_not_reloaded(self, manager, ollama):
+        ollama.cargados.add("llama3:latest")
+        assert manager.check() == {ollama.url: "resident"}
+        assert ollama.peticiones == []
+
+    def test_eviction_triggers_rewarm(self, manager, ollama):
+        manager.check()
+        ollama.cargados.clear()          # Ollama lo descargo por inactividad
+        assert manager.check() == {ollama.url: "warmed"}
+        s = manager.stats()[ollama.url]
+        assert s["evictions"] == 1 and s["warmups"] == 2 and s["resident"]
+
+    def test_unreachable_host(self):
+        t = HttpTransport()
+        m = ResidencyManager(t, "llama3", hosts=lambda: ["http://127.0.0.1:9"], interval=0)
+        assert m.check() == {"http://127.0.0.1:9": "unreachable"}
+        t.close()
+
+    def test_run_stops_with_event(self, ollama):
+        t = HttpTransport()
+        m = ResidencyManager(t, "llama3", hosts=lambda: [ollama.url], interval=0.01)
+        stop = threading.Event()
+        hilo = m.start(stop)
+        stop.set()
+        hilo.join(timeout=2)
+        assert not hilo.is_alive()
+        assert "llama3:latest" in ollama.cargados
+        t.close()
+
+
+class TestColdVsWarm:
+    def test_observe_classifies_by_load_duration(self, manager):
+        manager.observe("h", {"load_duration": CARGA_NS, "prompt_eval_duration": EVAL_NS})
+        manager.observe("h", {"load_duration": 1_000_000, "prompt_eval_duration": EVAL_NS})
+        manager.observe("h", {"response": "sin metricas"})
+        s = manager.stats()["h"]
+        assert s["cold_calls"] == 1 and s["warm_calls"] == 1
+        assert s["cold_ttft_p50"] == pytest.approx(2.1)
+        assert s["warm_ttft_p50"] == pytest.approx(0.101)
+
+    def test_pensar_con_local_first_call_cold_then_warm(self, ollama, monkeypatch):
+        import compartido
+        m = ResidencyManager(compartido.transport, "llama3", hosts=lambda: [ollama.url])
+        monkeypatch.setattr(compartido, "residencia", m)
+        monkeypatch.setitem(compartido.CONFIG, "ollama_url", f"{ollama.url}/api/generate")
+        monkeypatch.setitem(compartido.CONFIG, "local_model", "llama3")
+        with patch.object(compartido, "_registrar_uso"):
+            assert compartido.pensar_con_local("p") == "hola"
+            assert compartido.pensar_con_local("p") == "hola"
+        s = m.stats()[ollama.url]
+        assert s["cold_calls"] == 1 and s["warm_calls"] == 1
+
+    def test_warmed_model_makes_first_call_warm(self, ollama, monkeypatch):
+        import compartido
+        m = ResidencyManager(compartido.transport, "llama3", hosts=lambda: [ollama.url], interval=0)
+        monkeypatch.setattr(compartido, "residencia", m)
+        monkeypatch.setitem(compartido.CONFIG, "ollama_url", f"{ollama.url}/api/generate")
+        monkeypatch.setitem(compartido.CONFIG, "local_model", "llama3")
+        m.check()
+        compartido.pensar_con_local("p")
+        s = m.stats()[ollama.url]
+        assert s["cold_calls"] == 0 and s["warm_calls"] == 1
@@ -1,123 +1,69 @@
 """Tests for agents/reviewer.py — Reviewer Quality Agent"""
-import pytest
 from unittest.mock import patch
-from db.connection import set_connection, reset_connection
+from db import queries
+from tests.conftest import idea_row
+
+APROBADO = ("VEREDICTO: APROBADO\nSCORE: 9\nRESUMEN: Documento completo y profesional\n"
+            "DETALLES:\n- Completo\n- Bien estructurado")
+RECHAZADO = "VEREDICTO: RECHAZADO\nSCORE: 4\nRESUMEN: Falta detalle\nDETALLES:\n- Sin numeros\n- Generico"
 
 
 class TestReviewerCiclo:
-    def test_approves_good_document(self, db_with_ideas):
+    def test_approves_good_document(self, agent_db):
         from agents.reviewer import ciclo
-        set_connection(db_with_ideas)
-        try:
-            review_text = (
-                "VEREDICTO: APROBADO\n"
-                "SCORE: 9\n"
-                "RESUMEN: Documento completo y profesional\n"
-                "DETALLES:\n- Completo\n- Bien estructurado"
-            )
-            with patch('agents.reviewer.pensar_con_claude', return_value=review_text):
-                result = ciclo()
-            assert result >= 1
-            row = db_with_ideas.execute(
-                "SELECT execution_status, code_stage FROM ideas WHERE id=7"
-            ).fetchone()
-            assert row['execution_status'] == 'completed'
-            assert row['code_stage'] == 'expressed'
-        finally:
-            reset_connection()
+        with patch('agents.reviewer.pensar_streaming', return_value=APROBADO):
+            assert ciclo() == 1
+        row = idea_row(agent_db, 7, "execution_status, code_stage")
+        assert row['execution_status'] == 'completed'
+        assert row['code_stage'] == 'expressed'
 
-    def test_rejects_incomplete_document(self, db_with_ideas):
+    def test_review_streams_with_early_stop(self, agent_db):
         from agents.reviewer import ciclo
-        set_connection(db_with_ideas)
-        try:
-            review_text = (
-                "VEREDICTO: RECHAZADO\n"
-                "SCORE: 4\n"
-                "RESUMEN: Falta detalle\n"
-                "DETALLES:\n- Sin numeros\n- Generico"
-            )
-            with patch('agents.reviewer.pensar_con_claude', return_value=review_text):
-                result = ciclo()
-            assert result >= 1
-            row = db_with_ideas.execute(
-                "SELECT execution_status, execution_error FROM ideas WHERE id=7"
-            ).fetchone()
-            assert row['execution_status'] == 'queued_consulting'
-            assert 'RECHAZADO' in row['execution_error']
-        finally:
-            reset_connection()
+        with patch('agents.reviewer.pensar_streaming', return_value=APROBADO) as pensar:
+            ciclo()
+        kwargs = pensar.call_args.kwargs
+        assert kwargs['agente'] == 'REVIEWER' and kwargs['idea_id'] == 7
+        assert kwargs['fallback'] == 'claude'
+        assert kwargs['parar']("VEREDICTO: APROBADO\nSCORE: 8\nRESUMEN: OK\n")
+        assert "Plan de Capacitacion" in pensar.call_args.args[0]
 
-    def test_fallback_to_gemini_when_claude_fails(self, db_with_ideas):
+    def test_rejection_goes_back_to_consulting_as_rejected_event(self, agent_db):
         from agents.reviewer import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.reviewer.pensar_con_claude', return_value=""), \
-                 patch('agents.reviewer.pensar_con_gemini', return_value="VEREDICTO: APROBADO\nSCORE: 8\nRESUMEN: OK\nDETALLES:\n- Bien"):
-                result = ciclo()
-            assert result >= 1
-            row = db_with_ideas.execute(
-                "SELECT execution_status, execution_output FROM ideas WHERE id=7"
-            ).fetchone()
-            assert row['execution_status'] == 'completed'
-            assert 'Gemini' in row['execution_output']
-        finally:
-            reset_connection()
+        with patch('agents.reviewer.pensar_streaming', return_value=RECHAZADO):
+            assert ciclo() == 1
+        row = idea_row(agent_db, 7, "execution_status, execution_error, rejection_count")
+        assert row['execution_status'] == 'queued_consulting'
+        assert 'REVIEWER RECHAZADO' in row['execution_error']
+        assert row['rejection_count'] == 1
+        assert queries.count_execution_events(agent_db, 7, 'rejected', agent='REVIEWER') == 1
+        assert 'Sin numeros' in queries.get_recent_feedback(agent_db, 7)
 
-    def test_marks_failed_when_no_model_responds(self, db_with_ideas):
+    def test_marks_failed_when_no_model_responds(self, agent_db):
         from agents.reviewer import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.reviewer.pensar_con_claude', return_value=""), \
-                 patch('agents.reviewer.pensar_con_gemini', return_value=""), \
-                 patch('agents.reviewer.pensar_con_local', return_value=""):
-                result = ciclo()
-            assert result == 0
-            row = db_with_ideas.execute(
-                "SELECT execution_status, execution_error FROM ideas WHERE id=7"
-            ).fetchone()
-            assert row['execution_status'] == 'failed'
-            assert 'Ningún modelo de IA respondió' in (row['execution_error'] or '')
-        finally:
-            reset_connection()
+        with patch('agents.reviewer.pensar_streaming', return_value=""):
+            assert ciclo() == 0
+        row = idea_row(agent_db, 7)
+        assert row['execution_status'] == 'failed'
+        assert 'Ningún modelo de IA respondió' in (row['execution_error'] or '')
 
-    def test_returns_zero_when_no_tasks(self, test_db):
+    def test_returns_zero_when_no_tasks(self, agent_db):
         from agents.reviewer import ciclo
-        set_connection(test_db)
-        try:
+        agent_db.execute("DELETE FROM ideas")
+        with patch('agents.reviewer.pensar_streaming') as pensar:
             assert ciclo() == 0
-        finally:
-            reset_connection()
+        pensar.assert_not_called()
 
-    def test_appends_review_to_output(self, db_with_ideas):
+    def test_appends_review_to_output(self, agent_db):
         from agents.reviewer import ciclo
-        set_connection(db_with_ideas)
-        try:
-            review_text = (
-                "VEREDICTO: APROBADO\n"
-                "SCORE: 8\n"
-                "RESUMEN: Bien\n"
-                "DETALLES:\n- OK"
-            )
-            with patch('agents.reviewer.pensar_con_claude', return_value=review_text):
-                ciclo()
-            row = db_with_ideas.execute(
-                "SELECT execution_output FROM ideas WHERE id=7"
-            ).fetchone()
-            assert "Quality Review (Reviewer" in row['execution_output']
-            assert "APROBADO" in row['execution_output']
-        finally:
-            reset_connection()
+        with patch('agents.reviewer.pensar_streaming', return_value=APROBADO):
+            ciclo()
+        output = idea_row(agent_db, 7)['execution_output']
+        assert output.startswith('## Plan de Capacitacion')
+        assert "Quality Review (Reviewer — Ollama/Cloud)" in output
+        assert "APROBADO" in output
 
-    def test_handles_exception_gracefully(self, db_with_ideas):
+    def test_handles_exception_gracefully(self, agent_db):
         from agents.reviewer import ciclo
-        set_connection(db_with_ideas)
-        try:
-            with patch('agents.reviewer.pensar_con_claude', side_effect=Exception("API error")):
-                result = ciclo()
-            assert result == 0
-            row = db_with_ideas.execute(
-                "SELECT execution_status FROM ideas WHERE id=7"
-            ).fetchone()
-            assert row['execution_status'] == 'reviewing'
-        finally:
-            reset_connection()
+        with patch('agents.reviewer.pensar_streaming', side_effect=Exception("API down")):
+            assert ciclo() == 0
+        assert idea_row(agent_db, 7)['execution_status'] == 'reviewing'
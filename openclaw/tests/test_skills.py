@@ -2,7 +2,9 @@
 import os
 import tempfile
 import pytest
-from skills.loader import load_skill, load_skills, list_available_skills, set_skills_dir, reset_skills_dir
+from skills.index import SkillsIndex, parse_skill
+from skills.loader import (_get_skills_dir, get_index, list_available_skills, load_skill, load_skills,
+                           reset_skills_dir, set_skills_dir)
 
 
 @pytest.fixture
@@ -62,3 +64,102 @@ class TestSkillLoader:
         # May or may not exist depending on test environment
         if content:
             assert len(content) > 0
+
+
+SOP = """# Analyze Reliability
+
+## Trigger
+
+Run with `/analyze-reliability` or its alias:
+
+```
+/weibull-analysis data.csv
+```
+
+## Inputs
+
+### Required Inputs
+
+| Input | Type | Description |
+|-------|------|-------------|
+| failure_data | CSV | Times to failure |
+
+### Optional Inputs
+
+| Input | Type | Description |
+|-------|------|-------------|
+| `confidence` | float | Confidence level |
+
+## Outputs
+
+| Deliverable | Format |
+|-------------|--------|
+| Reliability report | Markdown |
+
+## Related
+
+See `/create-staffing-plan` for the staffing side.
+"""
+
+
+@pytest.fixture
+def indexed_dir(tmp_path):
+    """Skills directory with two SOPs; the index cache file lives next to it."""
+    skills = tmp_path / "skills"
+    (skills / "core").mkdir(parents=True)
+    (skills / "core" / "analyze-reliability.md").write_text(SOP, encoding="utf-8")
+    (skills / "core" / "other.md").write_text("# Other\n\nPlain SOP.", encoding="utf-8")
+    set_skills_dir(str(skills))
+    yield skills, str(tmp_path / "index.json")
+    reset_skills_dir()
+
+
+class TestSkillsIndex:
+    def test_parse_skill_metadata(self):
+        meta = parse_skill(SOP)
+        assert meta["title"] == "Analyze Reliability"
+        assert meta["commands"] == ["/analyze-reliability", "/weibull-analysis"]
+        assert meta["mentions"] == ["/create-staffing-plan"]
+        assert [(r["section"], r["input"]) for r in meta["inputs"]] == [
+            ("Required Inputs", "failure_data"), ("Optional Inputs", "confidence")]
+        assert meta["outputs"] == [{"section": "Outputs", "deliverable": "Reliability report", "format": "Markdown"}]
+        assert meta["bytes"] == len(SOP.encode("utf-8")) and meta["tokens"] == len(SOP) // 4
+        assert [2, "Required Inputs"] not in meta["headings"] and [3, "Required Inputs"] in meta["headings"]
+
+    def test_cache_is_reused_across_instances(self, indexed_dir):
+        skills, cache = indexed_dir
+        assert SkillsIndex(str(skills), cache).refresh()["parsed"] == 2
+        again = SkillsIndex(str(skills), cache).refresh()
+        assert again["parsed"] == 0 and again["reused"] == 2
+
+    def test_only_changed_and_removed_files_are_touched(self, indexed_dir):
+        skills, cache = indexed_dir
+        SkillsIndex(str(skills), cache).refresh()
+        sop = skills / "core" / "analyze-reliability.md"
+        sop.write_text(SOP.replace("Analyze Reliability", "Reliability Analysis"), encoding="utf-8")
+        os.utime(sop, ns=(sop.stat().st_atime_ns, sop.stat().st_mtime_ns + 1_000_000))
+        (skills / "core" / "other.md").unlink()
+        index = SkillsIndex(str(skills), cache)
+        r = index.refresh()
+        assert (r["files"], r["parsed"], r["removed"]) == (1, 1, 1)
+        assert index.get("core/analyze-reliability.md")["title"] == "Reliability Analysis"
+
+    def test_new_skill_is_listed(self, indexed_dir):
+        skills, _ = indexed_dir
+        assert list_available_skills() == ["core/analyze-reliability.md", "core/other.md"]
+        (skills / "customizable").mkdir()
+        (skills / "customizable" / "new.md").write_text("# New", encoding="utf-8")
+        assert "customizable/new.md" in list_available_skills()
+
+    def test_by_command(self, indexed_dir):
+        index = get_index()
+        assert index.by_command("/weibull-analysis") == "core/analyze-reliability.md"
+        assert index.by_command("analyze-reliability") == "core/analyze-reliability.md"
+        assert index.by_command("/create-staffing-plan") is None
+
+    def test_real_skills_dir_commands(self):
+        reset_skills_dir()
+        index = SkillsIndex(_get_skills_dir())
+        if not index.paths():
+            pytest.skip("core/skills not available")
+        assert index.by_command("/weibull-analysis") == "core/analyze-reliability.md"
@@ -0,0 +1,90 @@
+"""Tests for db/slowlog.py — slow-query log, plans and per-query histograms."""
+import json
+
+import pytest
+from db import queries
+from db.slowlog import query_log, redact, statement_shape
+
+
+@pytest.fixture
+def registro():
+    """query_log activo con umbral 0 (todo es lento); se restaura al final."""
+    antes = (query_log.enabled, query_log.threshold_ms)
+    query_log.reset()
+    query_log.configure(enabled=True, threshold_ms=0)
+    yield query_log
+    query_log.configure(enabled=antes[0], threshold_ms=antes[1])
+    query_log.reset()
+
+
+def _ideas(db):
+    db.execute("INSERT INTO ideas (text, execution_status, priority) VALUES ('script secreto', 'queued_software', 'alta')")
+    db.commit()
+
+
+class TestShapes:
+    def test_literals_and_lists_collapse(self):
+        sql = "SELECT *  FROM ideas\n WHERE id IN (?, ?, ?) AND status = 'active' LIMIT 10"
+        assert statement_shape(sql) == "SELECT * FROM ideas WHERE id IN (?...) AND status = ? LIMIT ?"
+
+    def test_redaction_keeps_numbers_only(self):
+        assert redact([5, None, 1.5, "texto largo", b"\x00\x01"]) == [5, None, 1.5, "<str:11>", "<bytes:2>"]
+        assert redact({"section": "Build Report"}) == {"section": "<str:12>"}
+
+
+class TestQueryLog:
+    def test_statements_are_named_after_the_query_function(self, backend_db, registro):
+        _ideas(backend_db)
+        queries.get_ideas_in_status(backend_db, "queued_software")
+        assert queries.claim_next(backend_db, "queued_software", "dev-1") is not None
+        nombres = registro.stats()
+        assert nombres["get_ideas_in_status"]["count"] == 1
+        assert "claim_next" in nombres and "_claim" not in nombres
+
+    def test_slow_statement_keeps_shape_and_redacted_params(self, backend_db, registro):
+        _ideas(backend_db)
+        queries.save_context_item(backend_db, "clave privada", "contenido sensible")
+        texto = json.dumps(registro.slow())
+        assert "contenido sensible" not in texto and "clave privada" not in texto
+        lenta = next(e for e in registro.slow() if e["name"] == "save_context_item")
+        assert "<str:" in json.dumps(lenta["params"])
+
+    def test_plan_is_captured_once_per_shape(self, backend_db, registro, caplog):
+        _ideas(backend_db)
+        with caplog.at_level("WARNING", logger="OpenClaw.slowlog"):
+            queries.get_ideas_in_status(backend_db, "queued_software")
+            queries.get_ideas_in_status(backend_db, "queued_software")
+        planes = [plan for shape, plan in registro.dump()["plans"].items() if "FROM ideas" in shape]
+        assert planes and all(plan for plan in planes)
+        avisos = [r for r in caplog.records if "get_ideas_in_status" in r.getMessage()]
+        assert len(avisos) == 1 and "plan:" in avisos[0].getMessage()
+
+    def test_plan_does_not_break_the_callers_transaction(self, backend_db, registro):
+        backend_db.execute("INSERT INTO context_items (key, content) VALUES ('a', 'b')")
+        backend_db.execute("UPDATE context_items SET content = 'c' WHERE key = 'a'")
+        backend_db.commit()
+        assert backend_db.execute("SELECT content FROM context_items WHERE key = 'a'").fetchone()[0] == 'c'
+
+    def test_below_threshold_only_feeds_the_histogram(self, registro):
+        registro.configure(threshold_ms=10_000)
+        from db.connection import _create_connection
+        db = _create_connection(":memory:")
+        db.execute("SELECT 1").fetchone()
+        db.close()
+        assert registro.slow() == [] and registro.dump()["plans"] == {}
+        assert sum(s["count"] for s in registro.stats().values()) >= 1
+
+    def test_disabled_records_nothing(self, registro):
+        registro.configure(enabled=False)
+        from db.connection import _create_connection
+        db = _create_connection(":memory:")
+        db.execute("SELECT 1")
+        db.close()
+        assert registro.stats() == {}
+
+    def test_dump_to_file(self, backend_db, registro, tmp_path):
+        queries.get_ideas_in_status(backend_db, "queued_software")
+        path = tmp_path / "slow.json"
+        registro.dump(str(path))
+        data = json.loads(path.read_text(encoding="utf-8"))
+        assert data["threshold_ms"] == 0 and "get_ideas_in_status" in data["queries"]
@@ -0,0 +1,215 @@
+"""Tests for llm/streaming.py and the streaming variants in compartido.py"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from llm.streaming import Cancelado, Progreso, consumir, debe_parar, hasta_fin_archivos, hasta_veredicto
+
+
+def _trozos(texto, n=7):
+    return [texto[i:i + n] for i in range(0, len(texto), n)]
+
+
+class TestHastaFinArchivos:
+    def test_not_while_block_open(self):
+        assert not hasta_fin_archivos()("=== FILE: main.py ===\nprint(1)\n")
+
+    def test_prose_between_files_keeps_going(self):
+        texto = ("=== FILE: main.py ===\nx\n=== ENDFILE ===\n" + "Ahora explico el segundo archivo. " * 20
+                 + "\n=== FILE: util.py ===\ny\n=== ENDFILE ===\n")
+        assert not hasta_fin_archivos()(texto)
+
+    def test_stops_on_end_marker_line(self):
+        cond = hasta_fin_archivos()
+        assert not cond("=== FILE: main.py ===\nx\n=== ENDFILE ===\n=== END")
+        assert cond("=== FILE: main.py ===\nx\n=== ENDFILE ===\n=== END ===\n")
+
+    def test_only_scans_from_the_unfinished_line(self):
+        cond = hasta_fin_archivos()
+        texto = "=== END ===\n" + "x" * 50 + "\n"
+        assert cond(texto, desde=0)
+        assert not cond(texto, desde=len("=== END ===\n") + 10)
+
+    def test_consumir_keeps_every_file(self):
+        texto = ("=== FILE: a.py ===\na\n=== ENDFILE ===\n" + "Explicacion larga del siguiente. " * 30 + "\n"
+                 "=== FILE: b.py ===\nb\n=== ENDFILE ===\n=== END ===\n" + "Resumen final. " * 30)
+        res = consumir(iter(_trozos(texto, 5)), parar=hasta_fin_archivos())
+        assert res.detenido
+        assert "=== FILE: b.py ===" in res.texto and "Resumen final" not in res.texto
+
+
+class TestHastaVeredicto:
+    def test_approved_stops_after_resumen(self):
+        cond = hasta_veredicto()
+        assert not cond("VEREDICTO: APROBADO\nSCORE: 8\n")
+        assert cond("VEREDICTO: APROBADO\nSCORE: 8\nRESUMEN: bien\n")
+
+    def test_rejected_keeps_generating_details(self):
+        cond = hasta_veredicto()
+        assert not cond("VEREDICTO: RECHAZADO\nSCORE: 3\nRESUMEN: mal\nDETALLES:\n- x\n")
+
+    def test_rejected_can_stop_too(self):
+        cond = hasta_veredicto(campos=(), seguir_si_rechazado=False)
+        assert cond("VEREDICTO: RECHAZADO\n")
+
+    def test_incomplete_line_does_not_stop(self):
+        assert not hasta_veredicto(campos=())("VEREDICTO: APRO")
+
+    def test_debe_parar_accepts_list_or_callable(self):
+        assert not debe_parar(None, "x")
+        assert debe_parar(lambda t, desde: True, "x")
+        assert debe_parar([lambda t, desde: False, lambda t, desde: True], "x")
+
+
+class TestConsumir:
+    def test_collects_all_chunks(self):
+        res = consumir(iter(["a", "b", "", "c"]))
+        assert res.texto == "abc"
+        assert res.chunks == 3
+        assert not res.detenido
+
+    def test_stops_and_closes_generator(self):
+        cerrado = []
+
+        def gen():
+            try:
+                for t in _trozos("VEREDICTO: APROBADO\nSCORE: 9\nRESUMEN: ok\nDETALLES:\n" + "x" * 500):
+                    yield t
+            finally:
+                cerrado.append(True)
+
+        res = consumir(gen(), parar=hasta_veredicto())
+        assert res.detenido
+        assert "RESUMEN: ok" in res.texto
+        assert "x" * 100 not in res.texto
+        assert cerrado == [True]
+
+    def test_error_mid_stream_reported(self):
+        def gen():
+            yield "parcial"
+            raise ConnectionResetError("reset")
+
+        res = consumir(gen())
+        assert res.texto == "parcial"
+        assert isinstance(res.error, ConnectionResetError)
+
+
+class TestProgreso:
+    def test_throttled_flush(self):
+        t = [0.0]
+        vistos = []
+        p = Progreso(vistos.append, intervalo=5, clock=lambda: t[0])
+        p.update("a")
+        t[0] = 6
+        p.update("ab")
+        p.update("abc")
+        p.final("abcd")
+        assert vistos == ["ab", "abcd"]
+
+    def test_callback_errors_swallowed(self):
+        def boom(_):
+            raise RuntimeError("db locked")
+        p = Progreso(boom, intervalo=0)
+        p.update("x")  # no lanza
+        assert p.flushes == 0
+
+
+class _NdjsonHandler(BaseHTTPRequestHandler):
+    tokens = ["Hola", " mundo", "!"]
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for tok in self.tokens:
+            self.wfile.write((json.dumps({"response": tok, "done": False}) + "\n").encode())
+            self.wfile.flush()
+        self.wfile.write((json.dumps({"response": "", "done": True}) + "\n").encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def ollama_stream(monkeypatch):
+    import compartido
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _NdjsonHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(compartido.CONFIG, "ollama_url",
+                        f"http://127.0.0.1:{server.server_address[1]}/api/generate")
+    yield
+    server.shutdown()
+    server.server_close()
+
+
+class TestPensarStreaming:
+    def test_ollama_ndjson_stream(self, ollama_stream):
+        import compartido
+        assert list(compartido.stream_con_local("p")) == ["Hola", " mundo", "!"]
+        assert compartido.health.snapshot()["local"]["samples"] == 1
+
+    def test_pensar_streaming_against_ollama_server(self, ollama_stream):
+        import compartido
+        parciales = []
+        assert compartido.pensar_streaming("p", on_progress=parciales.append) == "Hola mundo!"
+        assert parciales[-1] == "Hola mundo!"
+
+    def test_falls_back_when_local_fails(self, monkeypatch):
+        import compartido
+        monkeypatch.setitem(compartido.CONFIG, "ollama_url", "http://127.0.0.1:1/api/generate")
+        chunk = MagicMock(text="desde gemini")
+        with patch.object(compartido.cliente_gemini.models, "generate_content_stream",
+                          return_value=iter([chunk])):
+            assert compartido.pensar_streaming("p") == "desde gemini"
+        assert compartido.health.snapshot()["local"]["consecutive_failures"] == 1
+
+    def test_progress_and_early_stop(self, monkeypatch):
+        import compartido
+        monkeypatch.setitem(compartido.CONFIG, "stream_flush_s", 0)
+        texto = "VEREDICTO: APROBADO\nSCORE: 9\nRESUMEN: ok\nDETALLES:\n" + "relleno " * 200
+        vistos = []
+        with patch('compartido._stream_backend', side_effect=lambda *a, **kw: iter(_trozos(texto))):
+            out = compartido.pensar_streaming("p", parar=hasta_veredicto(), on_progress=vistos.append)
+        assert out.startswith("VEREDICTO: APROBADO")
+        assert "relleno relleno" not in out
+        assert vistos and vistos[-1] == out
+
+    def test_cancelled_progress_stops_without_fallback(self, monkeypatch):
+        import compartido
+        monkeypatch.setitem(compartido.CONFIG, "stream_flush_s", 0)
+        llamados, cerrados = [], []
+
+        def backend(nombre, *a, **kw):
+            llamados.append(nombre)
+
+            def gen():
+                try:
+                    yield from _trozos("linea\n" * 200)
+                finally:
+                    cerrados.append(nombre)
+            return gen()
+
+        def _progreso(parcial):
+            raise Cancelado("lease perdido")
+
+        with patch('compartido._stream_backend', side_effect=backend), pytest.raises(Cancelado):
+            compartido.pensar_streaming("p", on_progress=_progreso)
+        assert llamados == ["local"] and cerrados == ["local"]
+
+    def test_mid_stream_failure_tries_next_backend(self):
+        import compartido
+
+        def backend(nombre, *a, **kw):
+            if nombre == "local":
+                def roto():
+                    yield "medio"
+                    raise ConnectionResetError("reset")
+                return roto()
+            return iter(["completo"])
+
+        with patch('compartido._stream_backend', side_effect=backend):
+            assert compartido.pensar_streaming("p") == "completo"
@@ -0,0 +1,107 @@
+"""Tests for llm/transport.py — Pooled keep-alive HTTP transport"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from llm.transport import HttpTransport, _host_key
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) or b"{}"
+        payload = json.dumps({"echo": json.loads(body)}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _EchoHandler)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestHostKey:
+    def test_default_ports(self):
+        assert _host_key("https://api.telegram.org/bot1/send") == "https://api.telegram.org:443"
+        assert _host_key("http://localhost:11434/api/generate") == "http://localhost:11434"
+
+
+class TestHttpTransport:
+    def test_reuses_connection_across_requests(self, local_server):
+        t = HttpTransport(connect_timeout=2, read_timeout=5)
+        for i in range(5):
+            r = t.post(local_server + "/api/generate", json={"i": i})
+            assert r.json() == {"echo": {"i": i}}
+        stats = t.stats()[_host_key(local_server)]
+        assert stats["requests"] == 5
+        assert stats["new_connections"] == 1
+        assert stats["reused"] == 4
+        t.close()
+
+    def test_one_session_per_host(self, local_server):
+        t = HttpTransport()
+        assert t.session_for(local_server + "/a") is t.session_for(local_server + "/b")
+        assert t.session_for(local_server) is not t.session_for("http://127.0.0.2:1")
+        t.close()
+
+    def test_thread_safe_with_connection_limit(self, local_server):
+        t = HttpTransport(max_per_host=2)
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(5):
+                    t.post(local_server, json={})
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        assert not errors
+        stats = t.stats()[_host_key(local_server)]
+        assert stats["requests"] == 30
+        assert stats["new_connections"] <= 2
+        t.close()
+
+    def test_connection_error_counted_and_raised(self):
+        t = HttpTransport(connect_timeout=0.5)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            t.post("http://127.0.0.1:1/x", json={})
+        assert t.stats()["http://127.0.0.1:1"]["errors"] == 1
+
+    def test_timeout_tuple(self):
+        t = HttpTransport(connect_timeout=3, read_timeout=30)
+        assert t.timeout() == (3, 30)
+        assert t.timeout(300) == (3, 300)
+
+    def test_httpx_client_counts_reuse(self, local_server):
+        httpx = pytest.importorskip("httpx")
+        t = HttpTransport(connect_timeout=2, read_timeout=5)
+        client = t.httpx_client(local_server)
+        assert isinstance(client, httpx.Client)
+        for _ in range(3):
+            client.post(local_server + "/v1/messages", json={})
+        stats = t.stats()[_host_key(local_server)]
+        assert stats["requests"] == 3
+        assert stats["new_connections"] == 1
+        assert stats["reused"] == 2
+        t.close()
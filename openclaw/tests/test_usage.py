@@ -0,0 +1,135 @@
+"""Tests for the LLM usage ledger (db/queries.py + compartido)."""
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from db import queries
+from db.connection import reset_connection, set_connection
+
+
+def _uso(**kw):
+    base = {"agent": "QA", "idea_id": 7, "backend": "local", "model": "llama3.2",
+            "prompt_tokens": 100, "system_tokens": 20, "output_tokens": 50,
+            "token_source": "provider", "wall_ms": 1000, "ttft_ms": 200, "outcome": "ok"}
+    base.update(kw)
+    return base
+
+
+class TestLedgerQueries:
+    def test_table_created_on_first_record(self, test_db):
+        queries.record_llm_usage(test_db, _uso(skills=["a.md", "b.md"]))
+        row = test_db.execute("SELECT * FROM llm_usage").fetchone()
+        assert row["backend"] == "local"
+        assert row["skills"] == "a.md,b.md"
+        assert row["created_at"]
+
+    def test_stats_without_table_is_empty(self, test_db):
+        assert queries.get_llm_usage_stats(test_db) == {}
+        assert queries.get_idea_llm_usage(test_db, 1) == []
+
+    def test_percentiles_and_throughput_per_backend(self, test_db):
+        for ms in range(100, 1100, 100):   # 100..1000 ms, 10 llamadas
+            queries.record_llm_usage(test_db, _uso(wall_ms=ms, output_tokens=10))
+        queries.record_llm_usage(test_db, _uso(backend="gemini", outcome="error",
+                                               error_kind="quota", output_tokens=0))
+        queries.record_llm_usage(test_db, _uso(outcome="cache", wall_ms=1))
+
+        stats = queries.get_llm_usage_stats(test_db, "backend")
+        local = stats["local"]
+        assert local["calls"] == 11
+        assert local["ok"] == 10
+        assert local["cache_hits"] == 1
+        assert local["p50_ms"] == 500
+        assert local["p95_ms"] == 1000
+        assert local["ttft_p50_ms"] == 200
+        # Sin los 200 ms hasta el primer token quedan 100+200+...+800 = 3600 ms de
+        # decodificacion (las llamadas de 100 y 200 ms no aportan ni restan)
+        assert local["tokens_per_s"] == pytest.approx(100 * 1000 / 3600, abs=0.1)
+        assert stats["gemini"]["errors"] == 1
+        assert stats["gemini"]["p50_ms"] is None
+
+    def test_throughput_uses_wall_time_without_ttft(self, test_db):
+        queries.record_llm_usage(test_db, _uso(wall_ms=1000, ttft_ms=None, output_tokens=50))
+        assert queries.get_llm_usage_stats(test_db)["local"]["tokens_per_s"] == 50.0
+
+    def test_prefix_reuse_metrics(self, test_db):
+        # Frio: 10000 tokens evaluados en 2000 ms -> 0.2 ms/token
+        queries.record_llm_usage(test_db, _uso(prompt_tokens=9000, system_tokens=1000,
+                                               cached_tokens=0, prompt_eval_ms=2000))
+        # Caliente: 9900 de 10000 tokens salieron del KV cache
+        queries.record_llm_usage(test_db, _uso(prompt_tokens=9000, system_tokens=1000,
+                                               cached_tokens=9900, prompt_eval_ms=20))
+        local = queries.get_llm_usage_stats(test_db)["local"]
+        assert local["prefix_hit_rate"] == 0.5
+        assert local["cached_share"] == 0.495
+        assert local["prefill_saved_ms"] == int(9900 * 2020 / 10100)
+
+    def test_group_by_agent_and_whitelist(self, test_db):
+        queries.record_llm_usage(test_db, _uso(agent="QA"))
+        queries.record_llm_usage(test_db, _uso(agent="DEV"))
+        assert set(queries.get_llm_usage_stats(test_db, "agent")) == {"QA", "DEV"}
+        with pytest.raises(ValueError):
+            queries.get_llm_usage_stats(test_db, "wall_ms; DROP TABLE ideas")
+
+    def test_idea_usage_in_order(self, test_db):
+        queries.record_llm_usage(test_db, _uso(agent="DEV", idea_id=3))
+        queries.record_llm_usage(test_db, _uso(agent="QA", idea_id=3))
+        queries.record_llm_usage(test_db, _uso(agent="QA", idea_id=4))
+        assert [r["agent"] for r in queries.get_idea_llm_usage(test_db, 3)] == ["DEV", "QA"]
+
+
+class TestLedgerFromPensar:
+    @pytest.fixture(autouse=True)
+    def ledger_db(self, test_db, monkeypatch):
+        import compartido
+        monkeypatch.setitem(compartido.CONFIG, "llm_ledger", True)
+        set_connection(test_db)
+        yield test_db
+        reset_connection()
+
+    def test_provider_tokens_from_ollama(self, ledger_db):
+        import compartido
+        data = {"response": "hola", "prompt_eval_count": 120, "eval_count": 9}
+        with patch("compartido.transport.post") as post:
+            post.return_value = MagicMock(status_code=200, json=MagicMock(return_value=data))
+            assert compartido.pensar("p" * 300, sistema="s" * 100, agente="QA", idea_id=10) == "hola"
+
+        row = ledger_db.execute("SELECT * FROM llm_usage").fetchone()
+        assert row["agent"] == "QA" and row["idea_id"] == 10
+        assert row["token_source"] == "provider"
+        assert row["prompt_tokens"] + row["system_tokens"] == 120
+        assert row["system_tokens"] == 30   # 100 de 400 chars
+        assert row["output_tokens"] == 9
+        assert row["outcome"] == "ok"
+
+    def test_failed_backend_gets_its_own_row(self, ledger_db):
+        import compartido
+        with patch("compartido.transport.post", side_effect=ConnectionError("refused")), \
+             patch.object(compartido, "cliente_gemini", None), \
+             patch.object(compartido, "cliente_claude", None):
+            assert compartido.pensar("p", agente="DEV") == ""
+
+        row = ledger_db.execute("SELECT * FROM llm_usage").fetchone()
+        assert row["backend"] == "local"
+        assert row["outcome"] == "error"
+        assert row["error_kind"] == "connection"
+        assert row["token_source"] == "estimate"
+
+    def test_stream_records_ttft_and_stop(self, ledger_db):
+        import compartido
+        trozos = ["VEREDICTO: APROBADO\n", "SCORE: 9\n", "RESUMEN: ok\n", "DETALLES: " + "x" * 50]
+        with patch("compartido._stream_backend", side_effect=lambda *a, **kw: iter(trozos)):
+            from llm.streaming import hasta_veredicto
+            compartido.pensar_streaming("p", agente="QA", idea_id=10, parar=hasta_veredicto())
+
+        row = ledger_db.execute("SELECT * FROM llm_usage").fetchone()
+        assert row["outcome"] == "stopped"
+        assert row["ttft_ms"] is not None
+        assert row["ttft_ms"] <= row["wall_ms"]
+
+    def test_ledger_disabled(self, ledger_db, monkeypatch):
+        import compartido
+        monkeypatch.setitem(compartido.CONFIG, "llm_ledger", False)
+        with patch("compartido.pensar_con_local", return_value="x"):
+            compartido.pensar("p")
+        assert queries.get_llm_usage_stats(ledger_db) == {}
@@ -0,0 +1,135 @@
+"""Tests for db/watcher.py — wake-ups when ideas enter a queue."""
+import sqlite3
+import threading
+import time
+
+import pytest
+from db import connection, migrations, queries
+from db.watcher import ChangeWatcher
+from tests.conftest import SCHEMA_SQL
+
+
+def _esperar(condicion, timeout=3.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicion():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    path = tmp_path / "watch.db"
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA_SQL)
+    db.close()
+    monkeypatch.setenv("DB_PATH", str(path))
+    connection.reset_connection()
+    db = connection._create_connection(str(path))
+    migrations.migrate(db)
+    yield db
+    db.close()
+    connection.reset_connection()
+
+
+@pytest.fixture
+def shutdown():
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+class TestStatusVersions:
+    def test_versions_bump_when_ideas_enter_a_status(self, test_db):
+        queries.ensure_execution_schema(test_db)
+        assert queries.ensure_change_tracking(test_db) is True
+        assert queries.ensure_change_tracking(test_db) is False
+        test_db.execute("INSERT INTO ideas (id, text, code_stage) VALUES (1, 'a', 'organized')")
+        test_db.commit()
+        assert queries.get_status_versions(test_db) == {"pending": 1}
+        queries.update_execution_status(test_db, 1, "queued_software", agent_name="PM")
+        queries.update_execution_progress(test_db, 1, "parcial")      # no cambia de estado
+        test_db.execute("UPDATE ideas SET priority = 'alta' WHERE id = 1")
+        test_db.commit()
+        assert queries.get_status_versions(test_db) == {"pending": 1, "queued_software": 1}
+
+    def test_missing_table_reads_empty(self, test_db):
+        assert queries.get_status_versions(test_db) == {}
+
+
+class TestChangeWatcher:
+    def test_wakes_only_subscribers_of_the_changed_status(self, db_file, shutdown):
+        watcher = ChangeWatcher(interval=0.01)
+        dev = watcher.subscribe(("queued_software",))
+        qa = watcher.subscribe(("built",))
+        watcher.start(shutdown)
+        assert _esperar(lambda: watcher.stats()["checks"] > 0)
+        db_file.execute("INSERT INTO ideas (text, code_stage, execution_status) "
+                        "VALUES ('script', 'organized', 'queued_software')")
+        db_file.commit()
+        assert dev.wait(3)
+        assert not qa.is_set()
+        assert watcher.stats()["wakeups"] == {"queued_software": 1}
+
+    def test_unrelated_commits_do_not_wake(self, db_file, shutdown):
+        watcher = ChangeWatcher(interval=0.01)
+        dev = watcher.subscribe(("queued_software",))
+        watcher.start(shutdown)
+        assert _esperar(lambda: watcher.stats()["checks"] > 0)
+        queries.save_context_item(db_file, "kpi", "margen")
+        assert _esperar(lambda: watcher.stats()["checks"] > 5)
+        assert not dev.is_set() and watcher.stats()["changes"] == 0
+
+    def test_shutdown_wakes_everyone(self, db_file, shutdown):
+        watcher = ChangeWatcher(interval=0.01)
+        dev = watcher.subscribe(("queued_software",))
+        hilo = watcher.start(shutdown)
+        shutdown.set()
+        hilo.join(2)
+        assert dev.is_set() and not hilo.is_alive()
+
+    def test_agent_loop_runs_as_soon_as_work_arrives(self, db_file, shutdown, monkeypatch):
+        import main
+        watcher = ChangeWatcher(interval=0.01)
+        monkeypatch.setattr(main, "watcher", watcher)
+        monkeypatch.setattr(main, "_shutdown", shutdown)
+        ciclos = []
+        hilo = threading.Thread(target=main._hilo_agente,
+                                args=("DEV", lambda: lambda: ciclos.append(1) or 0, "dev", 60))
+        hilo.start()
+        watcher.start(shutdown)
+        assert _esperar(lambda: len(ciclos) == 1 and watcher.stats()["checks"] > 0)
+        db_file.execute("INSERT INTO ideas (text, code_stage, execution_status) "
+                        "VALUES ('script', 'organized', 'queued_software')")
+        db_file.commit()
+        assert _esperar(lambda: len(ciclos) == 2)      # sin esperar los 60s del intervalo
+        shutdown.set()
+        watcher.wake_all()
+        hilo.join(2)
+        assert not hilo.is_alive()
+
+
+class TestPostgresNotify:
+    def test_listen_notify_wakes_subscriber(self, pg_pool, monkeypatch, shutdown):
+        monkeypatch.setattr(connection, "PROFILE", dict(connection.PROFILE))
+        monkeypatch.setenv("PG_DSN", pg_pool.conninfo)
+        connection.reset_connection()
+        connection.configure(backend="postgres")
+        db = pg_pool.acquire()
+        try:
+            migrations.migrate(db)
+            watcher = ChangeWatcher(interval=0.05)
+            consulting = watcher.subscribe(("queued_consulting",))
+            watcher.start(shutdown)
+            assert _esperar(lambda: watcher.stats()["checks"] > 0)
+            db.execute("INSERT INTO ideas (text, code_stage, execution_status) "
+                       "VALUES (?, 'organized', 'queued_consulting')", ["plan"])
+            db.commit()
+            assert consulting.wait(3)
+            assert queries.get_status_versions(db) == {"queued_consulting": 1}
+        finally:
+            shutdown.set()
+            db.close()
+            connection.close_all()
+            connection.reset_connection()
@@ -0,0 +1,183 @@
+"""Tests for db/writer.py — single-writer commit queue for SQLite."""
+import sqlite3
+import threading
+
+import pytest
+from db import connection, migrations, queries, writer
+from db.metrics import Histogram
+from db.writer import CommitQueue
+from tests.conftest import SCHEMA_SQL, SEED_SQL
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """BD en archivo sembrada y migrada, apuntada por DB_PATH."""
+    path = tmp_path / "writer.db"
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA_SQL)
+    db.executescript(SEED_SQL)
+    db.executemany("INSERT INTO ideas (id, text, execution_status, priority) VALUES (?, ?, ?, ?)",
+                   [(i, f"idea {i}", 'queued_software' if i > 5 else None, 'media') for i in range(1, 11)])
+    db.commit()
+    db.close()
+    monkeypatch.setenv("DB_PATH", str(path))
+    connection.reset_connection()
+    db = connection._create_connection(str(path))
+    migrations.migrate(db)
+    db.close()
+    yield str(path)
+    writer.stop()
+    connection.close_all()
+    connection.reset_connection()
+
+
+@pytest.fixture
+def cola(db_path):
+    return writer.start(db_path, max_batch=32, max_delay_ms=5)
+
+
+def _insertar(db, texto):
+    db.execute("INSERT INTO ideas (text) VALUES (?)", [texto])
+    db.commit()
+    return texto
+
+
+def _en_hilos(n, fn):
+    hilos = [threading.Thread(target=fn, args=(i,)) for i in range(n)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+
+class TestHistogram:
+    def test_percentiles_use_bucket_bounds(self):
+        h = Histogram((1, 10, 100))
+        for v in [0.5] * 90 + [50] * 9 + [400]:
+            h.add(v)
+        s = h.snapshot()
+        assert (s["count"], s["p50"], s["p95"], s["max"]) == (100, 1, 100, 400)
+        assert s["buckets"] == {"<=1": 90, "<=100": 9, ">100": 1}
+
+
+class TestCommitQueue:
+    def test_submit_returns_result_once_committed(self, cola, db_path):
+        assert cola.submit(_insertar, "encolada").result(timeout=5) == "encolada"
+        otra = sqlite3.connect(db_path)
+        assert otra.execute("SELECT COUNT(*) FROM ideas WHERE text = 'encolada'").fetchone()[0] == 1
+        otra.close()
+
+    def test_concurrent_writes_share_transactions(self, cola):
+        def escribir(i):
+            for j in range(10):
+                cola.submit(_insertar, f"h{i}-{j}").result(timeout=5)
+        _en_hilos(8, escribir)
+        s = cola.stats()
+        assert s["ops"] == 80 and s["errors"] == 0
+        assert s["batches"] < s["ops"]
+        assert s["batch_size"]["max"] > 1
+
+    def test_failing_operation_rolls_back_alone(self, cola, db_path):
+        def fallar(db):
+            db.execute("INSERT INTO ideas (text) VALUES ('a medias')")
+            raise ValueError("boom")
+        cola.max_delay = 0.05        # que las tres caigan en el mismo lote
+        futuros = [cola.submit(_insertar, "antes"), cola.submit(fallar), cola.submit(_insertar, "despues")]
+        assert futuros[0].result(timeout=5) == "antes" and futuros[2].result(timeout=5) == "despues"
+        with pytest.raises(ValueError):
+            futuros[1].result(timeout=5)
+        otra = sqlite3.connect(db_path)
+        textos = {r[0] for r in otra.execute("SELECT text FROM ideas")}
+        otra.close()
+        assert {"antes", "despues"} <= textos and "a medias" not in textos
+        assert cola.stats()["errors"] == 1
+
+    def test_rollback_inside_operation_keeps_the_batch(self, cola):
+        def deshacer(db):
+            db.execute("INSERT INTO ideas (text) VALUES ('deshecha')")
+            db.rollback()
+            return db.execute("SELECT COUNT(*) FROM ideas WHERE text = 'deshecha'").fetchone()[0]
+        assert cola.submit(deshacer).result(timeout=5) == 0
+        assert cola.submit(_insertar, "sigue").result(timeout=5) == "sigue"
+
+    def test_stop_drains_the_queue(self, db_path):
+        cola = CommitQueue(db_path, max_delay_ms=50).start()
+        futuros = [cola.submit(_insertar, f"pendiente {i}") for i in range(20)]
+        cola.stop()
+        assert all(f.result(timeout=0) for f in futuros)
+        assert not cola.running
+        with pytest.raises(sqlite3.OperationalError):
+            cola.submit(_insertar, "tarde").result(timeout=0)
+
+
+class TestRouting:
+    def test_decorated_write_goes_through_the_queue(self, cola):
+        db = connection.get_connection()
+        queries.update_execution_status(db, 2, 'in_progress', agent_name='DEV')
+        assert cola.stats()["ops"] == 1
+        fila = db.execute("SELECT execution_status FROM ideas WHERE id = 2").fetchone()
+        assert fila[0] == 'in_progress'                                     # read-your-writes
+
+    def test_claim_through_the_queue(self, cola):
+        db = connection.get_connection()
+        idea = queries.claim_next(db, 'queued_software', 'dev-1')
+        assert idea is not None and cola.stats()["ops"] == 1
+        assert queries.claim_next(db, 'queued_software', 'dev-2')["id"] != idea["id"]
+
+    def test_progress_does_not_wait_but_keeps_order(self, cola):
+        db = connection.get_connection()
+        queries.update_execution_status(db, 2, 'in_progress', agent_name='DEV')
+        futuro = queries.update_execution_progress(db, 2, "generando...")
+        queries.update_execution_status(db, 2, 'developed', output="final", agent_name='DEV')
+        assert futuro.done()
+        assert queries.get_execution_output(db, 2)[0] == "final"
+
+    def test_in_memory_and_mid_transaction_write_directly(self, cola, test_db):
+        queries.update_execution_status(test_db, 1, 'in_progress', agent_name='DEV')
+        db = connection.get_connection()
+        db.execute("BEGIN IMMEDIATE")
+        queries.save_context_item(db, "kpi", "dentro de la transaccion")
+        db.commit()
+        assert cola.stats()["ops"] == 0
+
+    def test_without_queue_writes_directly(self, db_path):
+        db = connection.get_connection()
+        assert writer.active() is None
+        queries.update_execution_status(db, 2, 'in_progress', agent_name='DEV')
+        assert db.execute("SELECT execution_status FROM ideas WHERE id = 2").fetchone()[0] == 'in_progress'
+
+
+class TestContention:
+    """Muchos hilos cambiando estados: cada uno con su commit vs el escritor unico."""
+
+    HILOS = 8
+    CAMBIOS = 25
+
+    def _carga(self, i):
+        db = connection.get_connection()
+        for j in range(self.CAMBIOS):
+            queries.save_context_item(db, f"hilo-{i}-{j}", "x" * 200)
+            queries.update_execution_status(db, 1 + (i + j) % 10, 'queued_software', agent_name=f"W{i}")
+
+    def _espera_total(self):
+        return sum(c["busy_wait_s"] for c in connection.connection_stats())
+
+    def test_queue_cuts_lock_waits(self, db_path, monkeypatch):
+        # Sin cola: cada escritura toma el lock por su cuenta (BEGIN IMMEDIATE medido)
+        original = queries.save_context_item.__wrapped__
+
+        def con_lock(db, *args, **kwargs):
+            db.execute("BEGIN IMMEDIATE")
+            return original(db, *args, **kwargs)
+        with monkeypatch.context() as m:
+            m.setattr(queries, "save_context_item", con_lock)
+            _en_hilos(self.HILOS, self._carga)
+        espera_directa = self._espera_total()
+        connection.close_all()
+
+        cola = writer.start(db_path)
+        _en_hilos(self.HILOS, self._carga)
+        s = cola.stats()
+        assert s["errors"] == 0 and s["ops"] == self.HILOS * self.CAMBIOS * 2
+        assert s["batches"] < s["ops"]
+        assert self._espera_total() <= espera_directa